@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# resource accounting of a process tree, read from /proc directly and
+# collect final resource usage by os.wait4
+
+import os, time, resource
+
+from threading import Thread, Event
+
+
+CLOCK_TICKS = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
+PAGE_SIZE = resource.getpagesize()
+
+
+def read_proc_io(pid):
+    ''' return {rchar, wchar, read_bytes, write_bytes, ...} of /proc/<pid>/io '''
+    try:
+        io = {}
+        with open("/proc/%s/io" % pid, 'r') as io_file:
+            for line in io_file:
+                key, value = line.split(':', 1)
+                io[key] = int(value)
+        return io
+    except (IOError, OSError, ValueError):
+        return None
+
+def read_proc_stat(pid):
+    ''' return {ppid, utime, stime, rss} of /proc/<pid>/stat,
+        utime and stime in seconds, rss in bytes.
+    '''
+    try:
+        with open("/proc/%s/stat" % pid, 'r') as stat_file:
+            data = stat_file.read()
+        # command name may contain space, fields start after last ')'
+        fields = data[data.rindex(')') + 2:].split()
+        stat = {}
+        stat['ppid'] = int(fields[1])
+        stat['utime'] = float(fields[11]) / CLOCK_TICKS
+        stat['stime'] = float(fields[12]) / CLOCK_TICKS
+        stat['rss'] = int(fields[21]) * PAGE_SIZE
+        return stat
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+def read_proc_status(pid):
+    ''' return {VmRSS, VmHWM, ...} of /proc/<pid>/status in bytes '''
+    try:
+        status = {}
+        with open("/proc/%s/status" % pid, 'r') as status_file:
+            for line in status_file:
+                if not line.startswith('Vm'):
+                    continue
+                key, value = line.split(':', 1)
+                status[key] = int(value.split()[0]) * 1024
+        return status
+    except (IOError, OSError, ValueError):
+        return None
+
+def get_child_pids(pid):
+    ''' return pid of direct children, use /proc/<pid>/task/*/children if
+        kernel provides it, otherwise scan ppid of all processes.
+    '''
+    task_path = "/proc/%s/task" % pid
+    try:
+        child_pids = []
+        for tid in os.listdir(task_path):
+            with open(os.path.join(task_path, tid, 'children'), 'r') as children_file:
+                child_pids.extend([int(child) for child in children_file.read().split()])
+        return child_pids
+    except (IOError, OSError):
+        pass
+
+    child_pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        stat = read_proc_stat(name)
+        if stat is not None and stat['ppid'] == int(pid):
+            child_pids.append(int(name))
+    return child_pids
+
+def get_process_tree(pid):
+    ''' return pid of the process and all its descendants '''
+    pids = [int(pid)]
+    i = 0
+    while i < len(pids):
+        pids.extend(get_child_pids(pids[i]))
+        i += 1
+    return pids
+
+def wait_process(p):
+    ''' reap a subprocess.Popen process by os.wait4, return (return code, rusage).
+        the stdout of the process must be read before.
+    '''
+    pid, status, rusage = os.wait4(p.pid, 0)
+    if os.WIFSIGNALED(status):
+        p.returncode = -os.WTERMSIG(status)
+    else:
+        p.returncode = os.WEXITSTATUS(status)
+    return p.returncode, rusage
+
+
+# sample /proc of a process tree in background until stopped.
+# io counters of a process are lost when it exits, so last sampled value of
+# each process is kept and final block io is taken from rusage of wait4.
+class ProcessAccount(Thread):
+    def __init__(self, pid, interval=1.0, callback=None):
+        Thread.__init__(self)
+        self.daemon = True
+
+        self.pid = pid
+        self.interval = interval
+        self.callback = callback    # called with usage dict after each sample
+
+        self.io = {}           # {pid: io dict, ...} last sampled io of each process
+        self.cpu = {}          # {pid: cpu seconds, ...}
+        self.peak_rss = 0      # peak of rss sum of the process tree
+        self.pids = [pid]      # processes seen in the tree
+        self.sample_count = 0
+
+        self.stop_event = Event()
+
+    def sample(self):
+        rss = 0
+        for pid in get_process_tree(self.pid):
+            if pid not in self.pids:
+                self.pids.append(pid)
+
+            io = read_proc_io(pid)
+            if io is not None:
+                self.io[pid] = io
+
+            stat = read_proc_stat(pid)
+            if stat is not None:
+                self.cpu[pid] = stat['utime'] + stat['stime']
+                rss += stat['rss']
+
+        self.peak_rss = max(self.peak_rss, rss)
+        self.sample_count += 1
+
+        if self.callback is not None:
+            self.callback(self.get_usage())
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def _sum_io(self, key):
+        return sum([io.get(key, 0) for io in self.io.values()])
+
+    def get_usage(self, rusage=None):
+        usage = {}
+        usage['pids'] = list(self.pids)
+        usage['read_chars'] = self._sum_io('rchar')
+        usage['write_chars'] = self._sum_io('wchar')
+        usage['read_bytes'] = self._sum_io('read_bytes')
+        usage['write_bytes'] = self._sum_io('write_bytes')
+        usage['cpu_seconds'] = sum(self.cpu.values())
+        usage['peak_rss_bytes'] = self.peak_rss
+        usage['sample_count'] = self.sample_count
+
+        # rusage of wait4 covers the process and its waited descendants
+        if rusage is not None:
+            usage['cpu_user_seconds'] = rusage.ru_utime
+            usage['cpu_system_seconds'] = rusage.ru_stime
+            usage['cpu_seconds'] = rusage.ru_utime + rusage.ru_stime
+            usage['read_bytes'] = max(usage['read_bytes'], rusage.ru_inblock * 512)
+            usage['write_bytes'] = max(usage['write_bytes'], rusage.ru_oublock * 512)
+            usage['peak_rss_bytes'] = max(usage['peak_rss_bytes'], rusage.ru_maxrss * 1024)
+        return usage
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from Common.Constant import *
+
+# resolve backup files of a RBD image in backup directory.
+# the layout is {cluster path}/{pool}/{rbd}/{generation}/{files}, a generation
+# is named by snapshot name of its full backup. files in a generation are
+#   {generation}                 full backup file
+#   {from snap}_to_{to snap}     incremental backup file
+class BackupChain(object):
+    def __init__(self, log, backup_path, pool_name, rbd_name):
+        self.log = log
+        self.backup_path = backup_path
+        self.pool_name = pool_name
+        self.rbd_name = rbd_name
+
+        self.rbd_path = os.path.join(backup_path, pool_name, rbd_name)
+
+    def _split_diff_name(self, filename):
+        # incomplete backup file, checkpoint and manifest are not in chain
+        if os.path.splitext(filename)[1] in [SYNTHETIC_TEMP_SUFFIX,
+                                             EXPORT_PARTIAL_SUFFIX,
+                                             EXPORT_CHECKPOINT_SUFFIX,
+                                             MANIFEST_SUFFIX]:
+            return None
+        names = filename.split(DIFF_FILENAME_SEPARATOR)
+        if len(names) != 2:
+            return None
+        return names[0], names[1]
+
+    def get_generation_path(self, generation):
+        return os.path.join(self.rbd_path, generation)
+
+    def get_diff_filename(self, from_snap, to_snap):
+        return ''.join([from_snap, DIFF_FILENAME_SEPARATOR, to_snap])
+
+    def get_chain(self, generation, to_snap=None):
+        ''' return file paths to restore the image to to_snap,
+            [full backup file, incremental file, ...]
+            if to_snap is None, return the chain up to latest incremental file.
+        '''
+        try:
+            generation_path = self.get_generation_path(generation)
+            full_path = os.path.join(generation_path, generation)
+            if not os.path.isfile(full_path):
+                self.log.warning("full backup file %s not exist." % full_path)
+                return False
+
+            diff_files = {}
+            for filename in os.listdir(generation_path):
+                names = self._split_diff_name(filename)
+                if names is None:
+                    continue
+                diff_files[names[0]] = (names[1], os.path.join(generation_path, filename))
+
+            chain = [full_path]
+            snap_name = generation
+            while snap_name != to_snap and diff_files.has_key(snap_name):
+                snap_name, diff_path = diff_files.pop(snap_name)
+                chain.append(diff_path)
+
+            if to_snap is not None and snap_name != to_snap:
+                self.log.warning("snapshot %s not found in backup chain of generation %s."
+                                 % (to_snap, generation))
+                return False
+
+            return chain
+        except Exception as e:
+            self.log.error("unable to get backup chain of generation %s. %s" % (generation, e))
+            return False
+
+    def get_chain_snapshots(self, chain):
+        ''' return snapshot name of each file in the chain '''
+        snapshots = []
+        for path in chain:
+            names = self._split_diff_name(os.path.basename(path))
+            if names is None:
+                snapshots.append(os.path.basename(path))
+            else:
+                snapshots.append(names[1])
+        return snapshots
+
+    def get_last_snapshot(self, generation):
+        chain = self.get_chain(generation)
+        if chain is False:
+            return False
+        return self.get_chain_snapshots(chain)[-1]
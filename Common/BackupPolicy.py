@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+
+from Common.Constant import *
+
+
+# decide full or incremental backup of a RBD image from its backup chain of
+# last generation instead of weekday. a full backup is done if
+#   - number of incremental files reaches max chain length
+#   - bytes of incremental files exceed max diff ratio of full backup file,
+#     full backup file is used as used size of the image
+#   - estimated time to restore the chain exceeds max restore seconds
+# otherwise incremental backup is done. decide() returns backup type and
+# the reason.
+class BackupPolicy(object):
+    def __init__(self, log, max_chain_length=POLICY_MAX_CHAIN_LENGTH,
+                            max_diff_ratio=POLICY_MAX_DIFF_RATIO,
+                            max_restore_seconds=0,
+                            restore_bandwidth=POLICY_RESTORE_BANDWIDTH):
+        self.log = log
+        self.max_chain_length = int(max_chain_length)
+        self.max_diff_ratio = float(max_diff_ratio)
+        self.max_restore_seconds = int(max_restore_seconds)     # 0 is no limit
+        self.restore_bandwidth = int(restore_bandwidth)         # bytes per second
+
+    def _get_allocated(self, path):
+        return os.stat(path).st_blocks * 512
+
+    def get_chain_info(self, chain):
+        ''' chain is [full backup file, incremental file, ...] '''
+        full_bytes = self._get_allocated(chain[0])
+        diff_bytes = sum([self._get_allocated(path) for path in chain[1:]])
+        restore_seconds = 0
+        if self.restore_bandwidth > 0:
+            restore_seconds = (full_bytes + diff_bytes) / float(self.restore_bandwidth)
+        return {'chain_length': len(chain) - 1,
+                'full_bytes': full_bytes,
+                'diff_bytes': diff_bytes,
+                'restore_seconds': restore_seconds}
+
+    def decide(self, chain):
+        try:
+            chain_info = self.get_chain_info(chain)
+
+            if self.max_chain_length > 0 and chain_info['chain_length'] >= self.max_chain_length:
+                return FULL, ("chain length %s reaches limit %s"
+                              % (chain_info['chain_length'], self.max_chain_length))
+
+            diff_ratio = 0
+            if chain_info['full_bytes'] > 0:
+                diff_ratio = chain_info['diff_bytes'] / float(chain_info['full_bytes'])
+            if self.max_diff_ratio > 0 and diff_ratio >= self.max_diff_ratio:
+                return FULL, ("incremental bytes %s are %.2f of full backup bytes %s, "
+                              "limit %.2f" % (chain_info['diff_bytes'], diff_ratio,
+                                              chain_info['full_bytes'], self.max_diff_ratio))
+
+            if self.max_restore_seconds > 0 and chain_info['restore_seconds'] >= self.max_restore_seconds:
+                return FULL, ("estimated restore time %.0f seconds reaches limit %s"
+                              % (chain_info['restore_seconds'], self.max_restore_seconds))
+
+            return DIFF, ("chain length %s, incremental ratio %.2f, "
+                          "estimated restore time %.0f seconds"
+                          % (chain_info['chain_length'], diff_ratio, chain_info['restore_seconds']))
+        except Exception as e:
+            self.log.warning("unable to decide backup type by policy. %s" % e)
+            return FULL, "unable to read backup chain. %s" % e
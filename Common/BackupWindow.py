@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import datetime
+
+from Common.Constant import *
+
+
+# deadline of backup window. an export is started only if it is expected to
+# finish before the deadline less the margin. export time is estimated from
+# used bytes of the snapshot and export throughput of the RBD measured in
+# last backups, average throughput of all RBDs or the configured bandwidth
+# is used if the RBD has no record.
+#
+# throughput is {rbd id: bytes per second, ...}, updated by update_throughput()
+# after each completed export.
+def update_throughput(throughput, rbd_id, used_bytes, elapsed_time):
+    ''' moving average of throughput of completed export '''
+    if not elapsed_time or used_bytes <= 0:
+        return False
+    value = used_bytes / float(elapsed_time)
+    if throughput.has_key(rbd_id):
+        value = (WINDOW_THROUGHPUT_WEIGHT * value +
+                 (1 - WINDOW_THROUGHPUT_WEIGHT) * throughput[rbd_id])
+    throughput[rbd_id] = value
+    return True
+
+
+class BackupWindow(object):
+    def __init__(self, log, end_time, margin=0, bandwidth=WINDOW_DEFAULT_BANDWIDTH,
+                 throughput=None, now=None):
+        self.log = log
+        self.end_time = end_time              # HH:MM of local time
+        self.margin = int(margin)             # seconds reserved before deadline
+        self.bandwidth = float(bandwidth)     # bytes per second if no record
+        self.throughput = throughput          # shared, updated after exports
+        if self.throughput is None:
+            self.throughput = {}
+
+        self.deadline = self._get_deadline(end_time, now)
+        self.log.info("backup window ends at %s"
+                      % datetime.datetime.fromtimestamp(self.deadline))
+
+    def _get_deadline(self, end_time, now=None):
+        ''' next time of HH:MM after now '''
+        if now is None:
+            now = time.time()
+        hour, minute = [int(value) for value in end_time.split(':')]
+        start = datetime.datetime.fromtimestamp(now)
+        end = start.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if end <= start:
+            end += datetime.timedelta(days=1)
+        return time.mktime(end.timetuple())
+
+    def get_remaining_seconds(self, now=None):
+        if now is None:
+            now = time.time()
+        return self.deadline - self.margin - now
+
+    def is_passed(self, now=None):
+        if now is None:
+            now = time.time()
+        return now >= self.deadline
+
+    def get_throughput(self, rbd_id):
+        if self.throughput.has_key(rbd_id):
+            return self.throughput[rbd_id]
+        if len(self.throughput) != 0:
+            return sum(self.throughput.values()) / float(len(self.throughput))
+        return self.bandwidth
+
+    def estimate(self, rbd_info):
+        ''' estimated seconds to export the RBD '''
+        throughput = self.get_throughput(rbd_info['id'])
+        if throughput <= 0:
+            return 0
+        return rbd_info['rbd_used_size'] / throughput
+
+    def fits(self, rbd_info, now=None):
+        return self.estimate(rbd_info) <= self.get_remaining_seconds(now)
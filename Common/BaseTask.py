@@ -1,13 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import time, datetime, subprocess, os, sys, traceback
+import time, datetime, os, sys, traceback
 
 
 from Common.Constant import *
+from Common.Accounting import ProcessAccount
+from Common.CommandRunner import Command, command_line
 
 
 class BaseTask(object):
+    # attributes of subclass changed by execute(), sent back in TaskResult
+    result_attrs = ()
+
     def __init__(self, exec_class=None, method_name=''):
         #self.a = 10
         #self.b = 10
@@ -16,10 +21,13 @@ class BaseTask(object):
         self.method_name = method_name
 
         self.init_timestamp = time.time()
+        self.submit_timestamp = 0
+        self.trace_parent = None
         self.start_timestamp = 0
         self.complete_timestamp = 0
         self.elapsed_time = 0
 
+        self.task_id = 0    # set by manager
         self.cmd = None
         self.name = "BaseTask"
         self.worker_name = None
@@ -28,9 +36,25 @@ class BaseTask(object):
         self.error = None
 
         self.output = None
+        self.output_spill_path = None
+        self.stderr = None
         self.result = dict()
         self.cmd_pid = int()
 
+        # resource usage of command process tree
+        self.resource = dict()
+        self.account_interval = 1.0
+
+        # set by worker, called with bytes read or written by the command
+        self.progress_callback = None
+
+        # seconds to wait the command, 0 is no limit. applied by executor
+        self.timeout = 0
+
+        # 'kind:name' of resources used by the task, e.g. 'pool:rbd'. manager
+        # limits running tasks of each tag
+        self.resource_tags = []
+
     def __call__(self):
         time.sleep(1)
         return self.name
@@ -40,38 +64,74 @@ class BaseTask(object):
         return self.name
         #return '%s * %s = %s' % (self.a, self.b, self.a * self.b)
 
-    def _set_cmd_pid(self, ppid):
-        try:
-            cmd = "ps -elf | grep %s | grep -v ' grep\| /bin/sh' | awk '{print $4}'" % ppid
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-            result = p.communicate()[0]
-            if result != '':
-                self.cmd_pid = result
-            #print cmd
-            #print result
-        except Exception as e:
-            print e
-            exc_type,exc_value,exc_traceback = sys.exc_info()
-            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
-            self.error = traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+    def reset(self):
+        ''' clear result of last execution to submit the task again '''
+        self.submit_timestamp = 0
+        self.start_timestamp = 0
+        self.complete_timestamp = 0
+        self.elapsed_time = 0
+        self.worker_name = None
+        self.task_status = INITIAL
+        self.return_code = None
+        self.error = None
+        self.output = None
+        self.output_spill_path = None
+        self.stderr = None
+        self.result = dict()
+        self.cmd_pid = int()
+        self.resource = dict()
 
-    def _exec_cmd(self, cmd):
-        try:
-            self.start_timestamp = time.time()
-            self.cmd = cmd
+    def _report_progress(self, usage):
+        if self.progress_callback is not None:
+            self.progress_callback(max(usage['read_chars'], usage['write_chars']))
 
-            self.task_status = EXECUTE
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-            self._set_cmd_pid(p.pid)
-            #print("cmd pid = %s" % cmd_pid)
-            result = p.communicate()[0], p.returncode
+    def get_command(self):
+        ''' return argv of the task if the task executes a single command
+            without input, otherwise None. executor which runs commands by
+            itself uses it instead of execute().
+        '''
+        return None
 
-            self.output = result
+    def _start_cmd(self, cmd):
+        self.start_timestamp = time.time()
+        self.cmd = command_line(cmd)
+        self.task_status = EXECUTE
 
-            self.elapsed_time = self._get_elapsed_time_()
-            self._verify_result(result)
+    def _finish_cmd(self, output, return_code, resource=None):
+        if resource is not None:
+            self.resource = resource
+        result = output, return_code
 
-            return result
+        self.output = result
+
+        self.elapsed_time = self._get_elapsed_time_()
+        self._verify_result(result)
+
+        return result
+
+    def _exec_cmd(self, cmd, stdin_writer=None):
+        ''' cmd is argv list of the command, it is executed without shell.
+            stdin_writer is a function to write input data of the command,
+            it is called with stdin file object of the command.
+        '''
+        try:
+            self._start_cmd(cmd)
+            command = Command(cmd, stdin=stdin_writer is not None)
+            self.cmd_pid = command.start()
+            account = ProcessAccount(command.pid, interval=self.account_interval,
+                                     callback=self._report_progress)
+            account.start()
+
+            try:
+                command.communicate(stdin_writer)
+            finally:
+                return_code = command.wait()
+                account.stop()
+                self.resource = account.get_usage(command.rusage)
+                self.resource['spawn_seconds'] = command.spawn_latency
+
+            self.stderr = command.stderr
+            return self._finish_cmd(command.stdout, return_code)
         except Exception as e:
             self.task_status = ERROR
             exc_type,exc_value,exc_traceback = sys.exc_info()
@@ -110,23 +170,26 @@ class BaseTask(object):
                 self.task_status = COMPLETE
             if result[1] is not 0:
                 self.task_status = ERROR
-                self.error = self.output[0]
-
-            #print("%s, %s" % (self.cmd, result))
-            self.result['Task_Type'] = self.__class__.__name__
-            self.result['Task_Name'] = self.name
-            self.result['Task_Worker'] = self.worker_name
-            self.result['Task_Status'] = self.task_status
-            self.result['Task_Command'] = self.cmd
-            self.result['Task_Error'] = self.error
-            self.result['Task_Time'] = {'Began': self._convert_datetime(self.start_timestamp),
-                                        'Completed': self._convert_datetime(self.complete_timestamp),
-                                        'Elapsed': self._convert_seconds(self.elapsed_time)}
+                self.error = self.stderr or self.output[0]
+
+            self._set_result()
         except Exception as e:
             self.task_status = ERROR
             exc_type,exc_value,exc_traceback = sys.exc_info()
             traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
 
+    def _set_result(self):
+        self.result['Task_Type'] = self.__class__.__name__
+        self.result['Task_Name'] = self.name
+        self.result['Task_Worker'] = self.worker_name
+        self.result['Task_Status'] = self.task_status
+        self.result['Task_Command'] = self.cmd
+        self.result['Task_Error'] = self.error
+        self.result['Task_Resource'] = self.resource
+        self.result['Task_Time'] = {'Began': self._convert_datetime(self.start_timestamp),
+                                    'Completed': self._convert_datetime(self.complete_timestamp),
+                                    'Elapsed': self._convert_seconds(self.elapsed_time)}
+
     def execute(self):
         if self.exec_class is not None and self.method_name != '':
             self.output = getattr(self.exec_class, self.method_name)()
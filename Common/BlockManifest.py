@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# hash of each fixed size block of a RBD image at a snapshot. it is stored
+# as {snapshot name}.manifest next to the backup file of the snapshot, so
+# an incremental backup can be made by comparing block hashes when the
+# snapshot of last backup is gone from the cluster.
+#
+# the file is:
+#   magic, u32 block size, u64 image size, sha1 digest of each block
+# a block is hashed with zero padding to block size, so all zero blocks
+# and holes have the same hash.
+
+import os
+import struct
+import hashlib
+
+from Common.Constant import *
+from Common.DiffFile import iterate_data_extents
+
+
+MANIFEST_MAGIC  = 'RBDMANI1'
+MANIFEST_HEADER = '<8sIQ'
+MANIFEST_HEADER_SIZE = struct.calcsize(MANIFEST_HEADER)
+DIGEST_SIZE = 20
+
+
+def get_manifest_path(backup_dir, snap_name):
+    return os.path.join(backup_dir, "%s%s" % (snap_name, MANIFEST_SUFFIX))
+
+
+class BlockManifest(object):
+    def __init__(self, block_size=MANIFEST_BLOCK_SIZE, image_size=0):
+        self.block_size = int(block_size)
+        self.image_size = 0
+        self.zero_hash = hashlib.sha1('\0' * self.block_size).digest()
+        self.hashes = []
+        self.resize(image_size)
+
+    def get_block_count(self, image_size=None):
+        if image_size is None:
+            image_size = self.image_size
+        return (image_size + self.block_size - 1) / self.block_size
+
+    def get_block_range(self, index):
+        ''' return (offset, length) of the block in image '''
+        offset = index * self.block_size
+        return offset, min(self.block_size, self.image_size - offset)
+
+    def hash_data(self, data):
+        if len(data) < self.block_size:
+            data = data + '\0' * (self.block_size - len(data))
+        return hashlib.sha1(data).digest()
+
+    def resize(self, image_size):
+        ''' new blocks are zero. if the last block is cut, its hash is
+            unknown (None) and it is treated as changed.
+        '''
+        block_count = self.get_block_count(image_size)
+        if image_size < self.image_size and image_size % self.block_size != 0:
+            self.hashes = self.hashes[:block_count]
+            self.hashes[-1] = None
+        else:
+            del self.hashes[block_count:]
+            self.hashes.extend([self.zero_hash] * (block_count - len(self.hashes)))
+        self.image_size = image_size
+
+    def get_blocks(self, offset, length):
+        ''' indexes of blocks overlapping the range '''
+        if length <= 0:
+            return xrange(0)
+        return xrange(offset / self.block_size,
+                      min((offset + length - 1) / self.block_size + 1, len(self.hashes)))
+
+    def build_from_raw(self, raw_path):
+        ''' hash data blocks of a raw image file, holes are not read '''
+        with open(raw_path, 'rb') as raw_file:
+            self.hashes = []
+            self.image_size = 0
+            self.resize(os.fstat(raw_file.fileno()).st_size)
+
+            hashed = set()
+            for offset, length in iterate_data_extents(raw_file, self.image_size):
+                for index in self.get_blocks(offset, length):
+                    if index in hashed:
+                        continue
+                    block_offset, block_length = self.get_block_range(index)
+                    raw_file.seek(block_offset)
+                    self.hashes[index] = self.hash_data(raw_file.read(block_length))
+                    hashed.add(index)
+        return True
+
+    def save(self, path):
+        temp_path = "%s.tmp" % path
+        with open(temp_path, 'wb') as manifest_file:
+            manifest_file.write(struct.pack(MANIFEST_HEADER, MANIFEST_MAGIC,
+                                            self.block_size, self.image_size))
+            for digest in self.hashes:
+                # unknown hash never matches
+                manifest_file.write(digest or '\0' * DIGEST_SIZE)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.rename(temp_path, path)
+        return True
+
+    def load(self, path):
+        with open(path, 'rb') as manifest_file:
+            magic, block_size, image_size = struct.unpack(
+                MANIFEST_HEADER, manifest_file.read(MANIFEST_HEADER_SIZE))
+            if magic != MANIFEST_MAGIC:
+                raise IOError("%s is not a block manifest" % path)
+            self.block_size = block_size
+            self.image_size = image_size
+            self.zero_hash = hashlib.sha1('\0' * block_size).digest()
+
+            data = manifest_file.read()
+            block_count = self.get_block_count()
+            if len(data) != block_count * DIGEST_SIZE:
+                raise IOError("block manifest %s is incomplete" % path)
+            self.hashes = [data[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]
+                           for i in xrange(block_count)]
+        return self
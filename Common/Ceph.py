@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 #
 
-import subprocess
+import json
+
+from Common.CommandRunner import run_command
 
 class Ceph(object):
     def __init__(self, log=None, cluster_name=None, conffile=None):
@@ -11,25 +13,55 @@ class Ceph(object):
         self.conffile = conffile
 
     def _exec_cmd(self, cmd):
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        output = p.communicate()[0]
-        return_code = p.returncode
-        if return_code == 0:
-            return str(output).rstrip()
+        try:
+            command = run_command(cmd)
+        except OSError as e:
+            if self.log is not None:
+                self.log.error("unable to run %s. %s" % (cmd[0], e))
+            return ''
+        if self.log is not None:
+            self.log.debug((str(command),
+                            "error = %s" % command.stderr.strip(),
+                            "return code = %s" % command.return_code,
+                            "spawn seconds = %.6f" % command.spawn_latency))
+        if command.return_code == 0:
+            return command.stdout.rstrip()
         return ''
 
     def get_fsid(self):
-        cmd = "ceph fsid --cluster %s" % self.cluster_name
+        cmd = ['ceph', 'fsid', '--cluster', self.cluster_name]
         return self._exec_cmd(cmd)
 
     def get_health(self):
-        cmd = "ceph health detail --cluster %s" % self.cluster_name
+        cmd = ['ceph', 'health', 'detail', '--cluster', self.cluster_name]
         return self._exec_cmd(cmd)
 
     def get_mon_status(self):
-        cmd = "ceph mon_status --cluster %s" % self.cluster_name
+        cmd = ['ceph', 'mon_status', '--cluster', self.cluster_name]
         return self._exec_cmd(cmd)
 
     def get_version(self):
-        cmd = "ceph version --cluster %s" % self.cluster_name
+        cmd = ['ceph', 'version', '--cluster', self.cluster_name]
         return self._exec_cmd(cmd)
+
+    def get_pool_device_class(self, pool_name):
+        ''' device class taken by crush rule of the pool, e.g. 'hdd' or 'ssd'.
+            return '' if the rule takes no device class or unable to get it.
+        '''
+        try:
+            cmd = ['ceph', 'osd', 'pool', 'get', pool_name, 'crush_rule',
+                   '--format', 'json', '--cluster', self.cluster_name]
+            rule_name = json.loads(self._exec_cmd(cmd))['crush_rule']
+
+            cmd = ['ceph', 'osd', 'crush', 'rule', 'dump', rule_name,
+                   '--format', 'json', '--cluster', self.cluster_name]
+            for step in json.loads(self._exec_cmd(cmd))['steps']:
+                # shadow root of device class is named {root}~{class}
+                item_name = step.get('item_name', '')
+                if step['op'] == 'take' and '~' in item_name:
+                    return item_name.split('~', 1)[1]
+            return ''
+        except Exception as e:
+            if self.log is not None:
+                self.log.warning("unable to get device class of pool %s. %s" % (pool_name, e))
+            return ''
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# run a command from argv list without shell. the command is spawned by
+# posix_spawn if the os module has it, otherwise by subprocess without
+# closing fds or preexec function, both avoid copying page tables of
+# the parent more than needed. stdout and stderr are captured separately.
+# command started in new session can be killed with its children by killpg.
+
+import os
+import time
+import errno
+import fcntl
+import pipes
+import select
+import subprocess
+
+from threading import Thread
+
+
+def command_line(argv):
+    ''' printable command line of argv, for logging only '''
+    if isinstance(argv, basestring):
+        return argv
+    return ' '.join([pipes.quote(str(arg)) for arg in argv])
+
+
+def _pipe():
+    ''' pipe fds are not inherited by other commands spawned meanwhile,
+        dup2 to stdio of the command clears the flag.
+    '''
+    read_fd, write_fd = os.pipe()
+    for fd in [read_fd, write_fd]:
+        flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+        fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    return read_fd, write_fd
+
+
+class Command(object):
+    def __init__(self, argv, stdin=False, env=None, new_session=False):
+        self.argv = [str(arg) for arg in argv]
+        self.stdin = stdin      # open a pipe to stdin of the command
+        self.env = env
+        self.new_session = new_session  # pid of command is its process group id
+
+        self.pid = None
+        self.process = None     # subprocess.Popen if posix_spawn unavailable
+        self.stdin_fd = None
+        self.stdout_fd = None
+        self.stderr_fd = None
+
+        self.spawn_latency = 0  # seconds to create process and exec command
+        self.start_timestamp = 0
+        self.elapsed_time = 0
+
+        self.return_code = None
+        self.rusage = None
+        self.stdout = ''
+        self.stderr = ''
+
+    def __str__(self):
+        return command_line(self.argv)
+
+    def _spawn(self, stdin_fd, stdout_fd, stderr_fd):
+        if hasattr(os, 'posix_spawnp'):
+            file_actions = [(os.POSIX_SPAWN_DUP2, stdout_fd, 1),
+                            (os.POSIX_SPAWN_DUP2, stderr_fd, 2)]
+            if stdin_fd is not None:
+                file_actions.append((os.POSIX_SPAWN_DUP2, stdin_fd, 0))
+            env = self.env if self.env is not None else os.environ
+            return os.posix_spawnp(self.argv[0], self.argv, env,
+                                   file_actions=file_actions,
+                                   setsid=self.new_session)
+
+        preexec_fn = None
+        if self.new_session:
+            preexec_fn = os.setsid
+        self.process = subprocess.Popen(self.argv,
+                                        stdin=stdin_fd,
+                                        stdout=stdout_fd,
+                                        stderr=stderr_fd,
+                                        close_fds=False,
+                                        preexec_fn=preexec_fn,
+                                        env=self.env)
+        return self.process.pid
+
+    def start(self):
+        stdin_fd = None
+        if self.stdin:
+            stdin_fd, self.stdin_fd = _pipe()
+        self.stdout_fd, stdout_fd = _pipe()
+        self.stderr_fd, stderr_fd = _pipe()
+
+        try:
+            self.start_timestamp = time.time()
+            self.pid = self._spawn(stdin_fd, stdout_fd, stderr_fd)
+            self.spawn_latency = time.time() - self.start_timestamp
+        except Exception:
+            self.close()
+            raise
+        finally:
+            for fd in [stdin_fd, stdout_fd, stderr_fd]:
+                if fd is not None:
+                    os.close(fd)
+        return self.pid
+
+    def communicate(self, stdin_writer=None):
+        ''' read stdout and stderr until both are closed. stdin_writer is a
+            function called with stdin file object of the command, it runs
+            in a thread while output is read.
+        '''
+        writer = None
+        if self.stdin_fd is not None:
+            stdin = os.fdopen(self.stdin_fd, 'wb')
+            self.stdin_fd = None
+
+            def write_stdin():
+                try:
+                    if stdin_writer is not None:
+                        stdin_writer(stdin)
+                except IOError as e:
+                    if e.errno != errno.EPIPE:
+                        raise
+                finally:
+                    try:
+                        stdin.close()
+                    except IOError:
+                        pass
+            writer = Thread(target=write_stdin)
+            writer.daemon = True
+            writer.start()
+
+        stdout_fd, stderr_fd = self.stdout_fd, self.stderr_fd
+        output = {stdout_fd: [], stderr_fd: []}
+        poller = select.poll()
+        for fd in output.keys():
+            poller.register(fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+
+        try:
+            open_count = len(output)
+            while open_count > 0:
+                try:
+                    events = poller.poll()
+                except select.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    raise
+                for fd, event in events:
+                    data = os.read(fd, 65536)
+                    if data == '':
+                        poller.unregister(fd)
+                        open_count -= 1
+                    else:
+                        output[fd].append(data)
+        finally:
+            self.close()
+
+        if writer is not None:
+            writer.join()
+
+        self.stdout = ''.join(output[stdout_fd])
+        self.stderr = ''.join(output[stderr_fd])
+        return self.stdout, self.stderr
+
+    def wait(self, options=0):
+        ''' reap the command by os.wait4, return return code or None if
+            options is os.WNOHANG and the command is running.
+        '''
+        while True:
+            try:
+                pid, status, rusage = os.wait4(self.pid, options)
+                break
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+        if pid == 0:
+            return None
+
+        if os.WIFSIGNALED(status):
+            self.return_code = -os.WTERMSIG(status)
+        else:
+            self.return_code = os.WEXITSTATUS(status)
+        self.rusage = rusage
+        self.elapsed_time = time.time() - self.start_timestamp
+
+        # tell subprocess the process is reaped already
+        if self.process is not None:
+            self.process.returncode = self.return_code
+        return self.return_code
+
+    def close(self):
+        for name in ['stdin_fd', 'stdout_fd', 'stderr_fd']:
+            fd = getattr(self, name)
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+                setattr(self, name, None)
+
+    def run(self, stdin_writer=None):
+        self.start()
+        try:
+            self.communicate(stdin_writer)
+        finally:
+            self.wait()
+        return self
+
+
+def run_command(argv, stdin_writer=None):
+    ''' run the command to completion, return the Command '''
+    command = Command(argv, stdin=stdin_writer is not None)
+    return command.run(stdin_writer)
@@ -144,6 +144,194 @@ class RBDConfig(object):
         print("Error, snapshot options invalid.")
         return False
 
+    @_has_section_name
+    def read_restore_config(self):
+        options=['restore_yaml_filepath',
+                 'restore_yaml_section_name',
+                 'restore_concurrent_worker_count',
+                 'restore_pool_concurrency',
+                 'restore_pool_bandwidth',
+                 'restore_import_bandwidth',
+                 'restore_rollback_bandwidth',
+                 'restore_clone_seconds']
+        if self._has_options(options):
+            # todo: option value verify
+            if self._set_options(options):
+                return True
+        print("Error, restore options invalid.")
+        return False
+
+    @_has_section_name
+    def read_synthetic_full_config(self):
+        options=['synthetic_full_enable',
+                 'synthetic_full_reflink']
+        if self._has_options(options):
+            value = self.config.get(self.section_name, 'synthetic_full_reflink')
+            if value not in ['auto', 'always', 'never']:
+                print("synthetic_full_reflink is invalid")
+                return False
+            if self._set_options(options):
+                return True
+        print("Error, synthetic full backup options invalid.")
+        return False
+
+    @_has_section_name
+    def read_metrics_config(self):
+        options=['metrics_textfile_path',
+                 'metrics_json_path',
+                 'metrics_interval']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, metrics options invalid.")
+        return False
+
+    @_has_section_name
+    def read_trace_config(self):
+        options=['trace_file_path']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, trace options invalid.")
+        return False
+
+    @_has_section_name
+    def read_executor_config(self):
+        options=['backup_executor',
+                 'backup_task_timeout']
+        if self._has_options(options):
+            value = self.config.get(self.section_name, 'backup_executor')
+            if value not in ['process', 'eventloop']:
+                print("backup_executor is invalid")
+                return False
+            if self._set_options(options):
+                return True
+        print("Error, executor options invalid.")
+        return False
+
+    @_has_section_name
+    def read_health_check_config(self):
+        options=['health_check_enable',
+                 'health_check_interval',
+                 'health_reduced_workers',
+                 'health_latency_reduce_ms',
+                 'health_latency_pause_ms']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, health check options invalid.")
+        return False
+
+    @_has_section_name
+    def read_dispatch_config(self):
+        options=['dispatch_limits']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, dispatch options invalid.")
+        return False
+
+    @_has_section_name
+    def read_resumable_export_config(self):
+        options=['resumable_export_enable',
+                 'export_checkpoint_interval',
+                 'export_chunk_size']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, resumable export options invalid.")
+        return False
+
+    @_has_section_name
+    def read_retry_config(self):
+        options=['retry_max_attempts',
+                 'retry_base_delay',
+                 'retry_max_delay',
+                 'retry_isolate_count']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, retry options invalid.")
+        return False
+
+    @_has_section_name
+    def read_backup_window_config(self):
+        options=['backup_window_end',
+                 'backup_window_margin',
+                 'backup_window_bandwidth']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, backup window options invalid.")
+        return False
+
+    @_has_section_name
+    def read_policy_config(self):
+        options=['backup_policy',
+                 'policy_max_chain_length',
+                 'policy_max_diff_ratio',
+                 'policy_max_restore_seconds',
+                 'policy_restore_bandwidth',
+                 'policy_full_weekdays']
+        if self._has_options(options):
+            value = self.config.get(self.section_name, 'backup_policy')
+            if value not in ['weekday', 'threshold', 'stagger']:
+                print("backup_policy is invalid")
+                return False
+            if self._set_options(options):
+                return True
+        print("Error, backup policy options invalid.")
+        return False
+
+    @_has_section_name
+    def read_unchanged_config(self):
+        options=['skip_unchanged_enable']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, unchanged RBD options invalid.")
+        return False
+
+    @_has_section_name
+    def read_hash_manifest_config(self):
+        options=['hash_manifest_enable']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, hash manifest options invalid.")
+        return False
+
+    @_has_section_name
+    def read_admission_config(self):
+        options=['admission_safety_factor',
+                 'admission_reserve_bytes',
+                 'admission_history_count']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, admission options invalid.")
+        return False
+
+    @_has_section_name
+    def read_trash_config(self):
+        options=['trash_reclaim_rate',
+                 'trash_truncate_step',
+                 'trash_finalize_wait']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, trash options invalid.")
+        return False
+
+    @_has_section_name
+    def read_status_board_config(self):
+        options=['status_board_path']
+        if self._has_options(options):
+            if self._set_options(options):
+                return True
+        print("Error, status board options invalid.")
+        return False
+
     @_has_section_name
     def read_monitor_config(self):
         options=['monitor_interval',
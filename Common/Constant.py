@@ -15,6 +15,12 @@ INITIAL  = 1
 EXECUTE  = 2
 COMPLETE = 3
 ERROR    = 4
+TASK_STAT = ['', 'initial', 'execute', 'complete', 'error']
+
+# task result sent from worker, longer output is written to a file in
+# directory of task output under log path
+MAX_TASK_OUTPUT_BYTES = 4096
+TASK_OUTPUT_DIRNAME   = 'task_output'
 
 # worker status
 # ------------------------------------------------------------------------------
@@ -23,6 +29,32 @@ WAIT     = 2
 STOP     = 3
 RUN      = 4
 REST     = 5
+WORKER_STAT = ['', 'ready', 'wait', 'stop', 'run', 'rest']
+
+# seconds between heartbeat of idle worker on status board
+STATUS_HEARTBEAT_INTERVAL = 5
+
+# task executor
+# ------------------------------------------------------------------------------
+EXECUTOR_PROCESS   = 'process'
+EXECUTOR_EVENTLOOP = 'eventloop'
+EXECUTOR_TYPE = [EXECUTOR_PROCESS, EXECUTOR_EVENTLOOP]
+
+# seconds between dispatch of pending tasks while waiting finished task,
+# concurrency of workers may be changed meanwhile
+DISPATCH_CHECK_INTERVAL = 5
+
+# backup policy, decide backup type by weekday or by backup chain of each RBD
+# ------------------------------------------------------------------------------
+POLICY_WEEKDAY   = 'weekday'
+POLICY_THRESHOLD = 'threshold'
+POLICY_STAGGER   = 'stagger'
+POLICY_TYPE = [POLICY_WEEKDAY, POLICY_THRESHOLD, POLICY_STAGGER]
+POLICY_MAX_CHAIN_LENGTH  = 14
+POLICY_MAX_DIFF_RATIO    = 0.5
+POLICY_RESTORE_BANDWIDTH = 104857600    # bytes per second to estimate restore time
+PLAN_WEEKDAYS            = [1, 2, 3, 4, 5, 6, 7]
+PLAN_BALANCE_TOLERANCE   = 0.1          # bytes of a day may exceed average by it
 
 # rbd export type
 # ------------------------------------------------------------------------------
@@ -32,14 +64,36 @@ EXPORT_TYP = ['full', 'diff']
 
 # snapshot operation type
 # ------------------------------------------------------------------------------
-CREATE = 0
-REMOVE = 1
-PURGE  = 2
-SNAP_ACT = ['create', 'remove', 'purge']
+CREATE   = 0
+REMOVE   = 1
+PURGE    = 2
+ROLLBACK = 3
+CLONE    = 4
+SNAP_ACT = ['create', 'remove', 'purge', 'rollback', 'clone']
 
-# shared memory for metafile, unused
+# restore method
+# ------------------------------------------------------------------------------
+RESTORE_ROLLBACK = 0
+RESTORE_CLONE    = 1
+RESTORE_IMPORT   = 2
+RESTORE_METHOD = ['rollback', 'clone', 'import']
+
+# RBD image features to create image for restore if source image is gone,
+# layering, exclusive-lock, object-map, fast-diff and deep-flatten.
+DEFAULT_RESTORE_FEATURES = 61
+RBD_FEATURE_FAST_DIFF    = 16
+
+# pool import progress status
+# ------------------------------------------------------------------------------
+IMPORT_PENDING  = 'pending'
+IMPORT_CREATED  = 'created'
+IMPORT_COMPLETE = 'complete'
+IMPORT_FAILED   = 'failed'
+
+# shared memory for metafile (unused) and worker status board
 # ------------------------------------------------------------------------------
 METAFILE_SHM_PATH = '/run/shm'
+STATUS_BOARD_FILE = 'rbd_backup_status'
 
 # metadata filenames
 # ------------------------------------------------------------------------------
@@ -47,3 +101,94 @@ BACKUP_INFO                 = 'meta.backup_info'
 RBD_INFO_LIST               = 'meta.rbd_info_list'
 RBD_SNAPSHOT_MAINTAIN_LIST  = 'meta.rbd_snapshot_maintain_list'
 RBD_BACKUP_CIRCULATION_LIST = 'meta.rbd_backup_circulation_list'
+POOL_IMPORT_PROGRESS        = 'meta.pool_import_progress'
+RBD_SPACE_USAGE             = 'meta.rbd_space_usage'
+RBD_EXPORT_HISTORY          = 'meta.rbd_export_history'
+RBD_FULL_BACKUP_PLAN        = 'meta.rbd_full_backup_plan'
+RBD_UNCHANGED_LIST          = 'meta.rbd_unchanged_list'
+RBD_PENDING_EXPORT_LIST     = 'meta.rbd_pending_export_list'
+RBD_RETRY_HISTORY           = 'meta.rbd_retry_history'
+RBD_EXPORT_THROUGHPUT       = 'meta.rbd_export_throughput'
+RBD_DEFERRED_LIST           = 'meta.rbd_deferred_list'
+RBD_FULL_EXPORT_LIST        = 'meta.rbd_full_export_list'
+
+# trash of expired backup
+# ------------------------------------------------------------------------------
+TRASH_DIRNAME          = '.trash'
+TRASH_TRUNCATE_STEP    = 1073741824    # bytes truncated from a file at a time
+TRASH_UNLINK_BATCH     = 64
+TRASH_RECLAIM_INTERVAL = 10            # seconds to check trash again
+
+# space admission of backup
+# ------------------------------------------------------------------------------
+ADMISSION_SAFETY_FACTOR = 1.2   # predicted bytes are multiplied by it
+ADMISSION_HISTORY_COUNT = 10    # export records kept for each RBD
+
+# backup filename
+# ------------------------------------------------------------------------------
+DIFF_FILENAME_SEPARATOR = '_to_'
+SYNTHETIC_TEMP_SUFFIX   = '.synthetic'
+EXPORT_PARTIAL_SUFFIX   = '.partial'       # export not completed yet
+EXPORT_CHECKPOINT_SUFFIX = '.checkpoint'
+
+# block hash manifest of backup
+# ------------------------------------------------------------------------------
+MANIFEST_SUFFIX     = '.manifest'
+MANIFEST_BLOCK_SIZE = 4194304   # bytes of a hashed block
+
+# resumable export
+# ------------------------------------------------------------------------------
+EXPORT_CHECKPOINT_INTERVAL = 60          # seconds between checkpoints
+EXPORT_CHUNK_SIZE          = 67108864    # bytes of image exported at a time
+
+# retry of failed task
+# ------------------------------------------------------------------------------
+FAILURE_FATAL     = 'fatal'
+FAILURE_RETRYABLE = 'retryable'
+RETRY_MAX_ATTEMPTS  = 3
+RETRY_BASE_DELAY    = 30      # seconds before first retry, doubled each attempt
+RETRY_MAX_DELAY     = 600
+RETRY_ISOLATE_COUNT = 3       # consecutive failed backups to isolate a RBD
+RETRY_HISTORY_COUNT = 20      # attempt records kept for each RBD
+
+# stderr of failure which retrying does not help
+RETRY_FATAL_PATTERNS = ['No such file or directory',
+                        'Permission denied',
+                        'Operation not permitted',
+                        'Invalid argument']
+# stderr of transient failure
+RETRY_TRANSIENT_PATTERNS = ['timed out',
+                            'command timeout',
+                            'No space left on device',
+                            'Resource temporarily unavailable',
+                            'Device or resource busy',
+                            'Connection refused',
+                            'error connecting to the cluster',
+                            'Broken pipe']
+
+# backup window
+# ------------------------------------------------------------------------------
+WINDOW_DEFAULT_BANDWIDTH = 104857600   # bytes per second to estimate export time
+WINDOW_THROUGHPUT_WEIGHT = 0.5         # weight of last export in throughput average
+WINDOW_PRIORITY_BOOST    = 10          # priority added per deferred backup
+
+# cluster health check
+# ------------------------------------------------------------------------------
+HEALTH_NORMAL = 0   # run tasks by all workers
+HEALTH_REDUCE = 1   # run tasks by reduced workers
+HEALTH_PAUSE  = 2   # start no new task
+HEALTH_ACTION = {0: 'normal', 1: 'reduce', 2: 'pause'}
+
+# pg states of recovery or backfill, backup competes with them for osds
+HEALTH_REDUCE_PG_STATES = ['degraded',
+                           'undersized',
+                           'recovering',
+                           'recovery_wait',
+                           'backfilling',
+                           'backfill_wait']
+# pg states of unavailable data
+HEALTH_PAUSE_PG_STATES = ['down',
+                          'incomplete',
+                          'stale']
+HEALTH_RECOVER_SAMPLES = 2     # better samples in a row to raise concurrency
+HEALTH_WAIT_INTERVAL   = 60    # seconds to check pause and backup window while waiting tasks
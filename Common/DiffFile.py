@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# read, write and apply rbd export-diff stream (format v1) locally.
+#
+# the format is:
+#   "rbd diff v1\n"
+#   'f' + u32 length + from snapshot name  (optional)
+#   't' + u32 length + to snapshot name    (optional)
+#   's' + u64 image size                   (optional)
+#   'w' + u64 offset + u64 length + data   (updated data)
+#   'z' + u64 offset + u64 length          (zeroed data)
+#   'e'                                    (end of stream)
+# all integers are little endian.
+
+import os, errno, struct, ctypes, ctypes.util
+
+
+DIFF_HEADER_V1 = 'rbd diff v1\n'
+
+FALLOC_FL_KEEP_SIZE  = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+
+SEEK_DATA = 3
+SEEK_HOLE = 4
+
+
+def _get_fallocate():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fallocate = libc.fallocate
+        fallocate.argtypes = [ctypes.c_int, ctypes.c_int,
+                              ctypes.c_int64, ctypes.c_int64]
+        fallocate.restype = ctypes.c_int
+        return fallocate
+    except Exception:
+        return None
+
+_fallocate = _get_fallocate()
+
+
+class DiffFile(object):
+    ''' represent an export-diff file in backup directory '''
+
+    def __init__(self, path, chunk_size=4194304):
+        self.path = path
+        self.chunk_size = chunk_size
+
+        self.from_snap = None
+        self.to_snap = None
+        self.image_size = None
+
+        self.write_bytes = 0
+        self.zero_bytes = 0
+
+    def _read_exact(self, diff_file, length):
+        data = diff_file.read(length)
+        if len(data) != length:
+            raise IOError("unexpected end of diff file %s" % self.path)
+        return data
+
+    def _read_name(self, diff_file):
+        length = struct.unpack('<I', self._read_exact(diff_file, 4))[0]
+        return self._read_exact(diff_file, length)
+
+    def iterate(self):
+        ''' yield records of the diff file.
+            ('f', name), ('t', name), ('s', size), ('z', offset, length),
+            ('w', offset, length, data_position), ('e', )
+            data of 'w' record is located at data_position in the diff file.
+        '''
+        with open(self.path, 'rb') as diff_file:
+            header = self._read_exact(diff_file, len(DIFF_HEADER_V1))
+            if header != DIFF_HEADER_V1:
+                raise IOError("unsupported diff file header %r in %s" % (header, self.path))
+
+            while True:
+                tag = diff_file.read(1)
+                if tag == '' or tag == 'e':
+                    yield ('e', )
+                    return
+                elif tag == 'f':
+                    self.from_snap = self._read_name(diff_file)
+                    yield ('f', self.from_snap)
+                elif tag == 't':
+                    self.to_snap = self._read_name(diff_file)
+                    yield ('t', self.to_snap)
+                elif tag == 's':
+                    self.image_size = struct.unpack('<Q', self._read_exact(diff_file, 8))[0]
+                    yield ('s', self.image_size)
+                elif tag == 'w':
+                    offset, length = struct.unpack('<QQ', self._read_exact(diff_file, 16))
+                    position = diff_file.tell()
+                    yield ('w', offset, length, position)
+                    diff_file.seek(position + length)
+                elif tag == 'z':
+                    offset, length = struct.unpack('<QQ', self._read_exact(diff_file, 16))
+                    yield ('z', offset, length)
+                else:
+                    raise IOError("unknown diff record tag %r in %s" % (tag, self.path))
+
+    def read_header(self):
+        ''' read from/to snapshot name and image size only '''
+        for record in self.iterate():
+            if record[0] in ['w', 'z', 'e']:
+                break
+        return self.from_snap, self.to_snap, self.image_size
+
+    def apply_to(self, target_path):
+        ''' apply the diff to a raw image file, the file is kept sparse '''
+        with open(self.path, 'rb') as src_file:
+            with open(target_path, 'r+b') as dst_file:
+                for record in self.iterate():
+                    tag = record[0]
+                    if tag == 's':
+                        dst_file.truncate(record[1])
+                    elif tag == 'w':
+                        offset, length, position = record[1:]
+                        src_file.seek(position)
+                        dst_file.seek(offset)
+                        left = length
+                        while left > 0:
+                            data = self._read_exact(src_file, min(left, self.chunk_size))
+                            dst_file.write(data)
+                            left -= len(data)
+                        self.write_bytes += length
+                    elif tag == 'z':
+                        offset, length = record[1:]
+                        dst_file.flush()
+                        zero_range(dst_file, offset, length, self.chunk_size)
+                        self.zero_bytes += length
+                dst_file.flush()
+                os.fsync(dst_file.fileno())
+        return True
+
+
+class DiffWriter(object):
+    ''' write an export-diff stream (format v1) to a file object '''
+
+    def __init__(self, diff_file, write_header=True):
+        ''' write_header is False to append records to a partial stream '''
+        self.diff_file = diff_file
+        if write_header:
+            self.diff_file.write(DIFF_HEADER_V1)
+
+        self.write_bytes = 0
+        self.zero_bytes = 0
+
+    def _write_name(self, tag, name):
+        self.diff_file.write(tag)
+        self.diff_file.write(struct.pack('<I', len(name)))
+        self.diff_file.write(name)
+
+    def write_from_snap(self, snap_name):
+        self._write_name('f', snap_name)
+
+    def write_to_snap(self, snap_name):
+        self._write_name('t', snap_name)
+
+    def write_size(self, size):
+        self.diff_file.write('s')
+        self.diff_file.write(struct.pack('<Q', size))
+
+    def write_data(self, offset, data):
+        self.diff_file.write('w')
+        self.diff_file.write(struct.pack('<QQ', offset, len(data)))
+        self.diff_file.write(data)
+        self.write_bytes += len(data)
+
+    def write_zero(self, offset, length):
+        self.diff_file.write('z')
+        self.diff_file.write(struct.pack('<QQ', offset, length))
+        self.zero_bytes += length
+
+    def write_end(self):
+        self.diff_file.write('e')
+        self.diff_file.flush()
+
+
+def zero_range(dst_file, offset, length, chunk_size=4194304):
+    ''' punch a hole in the file, write zero if file system not support it '''
+    if _fallocate is not None:
+        mode = FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE
+        if _fallocate(dst_file.fileno(), mode, offset, length) == 0:
+            return True
+
+    end = offset + length
+    dst_file.seek(0, os.SEEK_END)
+    file_size = dst_file.tell()
+    dst_file.seek(offset)
+    left = min(end, file_size) - offset
+    while left > 0:
+        size = min(left, chunk_size)
+        dst_file.write('\0' * size)
+        left -= size
+    return True
+
+
+def iterate_data_extents(raw_file, size=None):
+    ''' yield (offset, length) of data extents in a sparse raw file,
+        the whole file is one extent if file system not support SEEK_DATA.
+    '''
+    fd = raw_file.fileno()
+    if size is None:
+        size = os.fstat(fd).st_size
+
+    offset = 0
+    while offset < size:
+        try:
+            data_offset = os.lseek(fd, offset, SEEK_DATA)
+            hole_offset = os.lseek(fd, data_offset, SEEK_HOLE)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return    # no more data after offset
+            yield (offset, size - offset)
+            return
+        yield (data_offset, min(hole_offset, size) - data_offset)
+        offset = hole_offset
+
+
+def write_raw_as_diff(raw_path, diff_writer, to_snap=None, throttle=None,
+                      chunk_size=4194304):
+    ''' write data extents of a raw image file as export-diff stream,
+        so full backup file can be imported to an existing RBD image.
+    '''
+    with open(raw_path, 'rb') as raw_file:
+        size = os.fstat(raw_file.fileno()).st_size
+        if to_snap is not None:
+            diff_writer.write_to_snap(to_snap)
+        diff_writer.write_size(size)
+
+        for offset, length in iterate_data_extents(raw_file, size):
+            raw_file.seek(offset)
+            end = offset + length
+            while offset < end:
+                data = raw_file.read(min(end - offset, chunk_size))
+                if data == '':
+                    break
+                diff_writer.write_data(offset, data)
+                offset += len(data)
+                if throttle is not None:
+                    throttle.consume(len(data))
+
+        diff_writer.write_end()
+    return True
+
+
+def copy_stream(src_path, dst_file, throttle=None, chunk_size=4194304):
+    ''' copy a file to file object, the rate is limited by throttle '''
+    with open(src_path, 'rb') as src_file:
+        while True:
+            data = src_file.read(chunk_size)
+            if data == '':
+                break
+            dst_file.write(data)
+            if throttle is not None:
+                throttle.consume(len(data))
+    dst_file.flush()
+    return True
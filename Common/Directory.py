@@ -1,9 +1,11 @@
-import os, subprocess, datetime, time
+import os, datetime, time
 
 # for manage directory that rbd export to
-# require command: du, find, awk
+# size and file list are read from file system directly, see SpaceAccount
 
-import os, sys, subprocess, traceback
+import os, sys, shutil, traceback
+
+from Common import SpaceAccount
 
 class Directory(object):
     def __init__(self, log, path):
@@ -13,6 +15,7 @@ class Directory(object):
         self.available_bytes = 0
         self.used_bytes = 0
         self.retain_count = 1
+        self.space_account = None   # usage of backup files kept in metafile
 
         # verify and create the path
         if os.path.isfile(path):
@@ -40,41 +43,31 @@ class Directory(object):
     def _set_path(self, path):
         if not os.path.isdir(path):
             self.log.info("create the directory %s." % path)
-            #os.system("mkdir -p %s" % path)
-            cmd = "mkdir -p %s" % path
-            result = self._exec_cmd(cmd)
+            os.makedirs(path)
 
         self.path = path
 
-    def _exec_cmd(self, cmd):
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        output = p.communicate()[0]
-        return_code = p.returncode
-
-        self.log.debug((cmd,
-                        "output = %s" %result.strip(),
-                        "return code = %s" %return_code))
-
-        if return_code == 0:
-            return output
-        return ''
+    def set_space_account(self, space_account):
+        self.space_account = space_account
 
     def get_available_size(self):
         try:
-            cmd = "df -k --output=avail %s | tail -1" % self.path
-            self.available_bytes = int(self._exec_cmd(cmd)) * 1024
+            self.available_bytes = SpaceAccount.get_available_size(self.path)
             return self.available_bytes
-        except:
-            self.log.error("unable to get available bytes of %s" % self.path)
+        except Exception as e:
+            self.log.error("unable to get available bytes of %s. %s" % (self.path, e))
             return False
 
     def get_used_size(self):
         try:
-            cmd = "du -sk %s | awk '{print $1}'" % self.path
-            self.used_bytes = int(self._exec_cmd(cmd)) * 1024
+            # walk the directory only if usage is not accounted
+            if self.space_account is not None:
+                self.used_bytes = self.space_account.get_used_size()
+            else:
+                self.used_bytes = SpaceAccount.get_allocated_size(self.path)
             return self.used_bytes
-        except:
-            self.log.error("unable to get used bytes of %s" % self.path)
+        except Exception as e:
+            self.log.error("unable to get used bytes of %s. %s" % (self.path, e))
             return False
 
     def get_file_list(self, path=None, get_count=False):
@@ -84,13 +77,12 @@ class Directory(object):
             else:
                 f_path = path
 
-            cmd = "find %s -type f" % self.path
+            file_list = [entry_path for entry_path, is_dir, entry_stat
+                         in SpaceAccount.walk(f_path) if not is_dir]
             if get_count:
-                cmd = "%s %s" % (cmd, '| wc -l')
-                return int(self._exec_cmd(cmd))
+                return len(file_list)
 
-            return_str = str(self._exec_cmd(cmd))
-            self.file_list = return_str.splitlines()
+            self.file_list = file_list
             return self.file_list
         except Exception as e:
             self.log.error("unable to get file list in %s. %s" % (self.path, e))
@@ -98,13 +90,12 @@ class Directory(object):
 
     def get_directory_list(self, get_count=False):
         try:
-            cmd = "find %s -type d -not -path %s" % (self.path, self.path)
+            directory_list = [entry_path for entry_path, is_dir, entry_stat
+                              in SpaceAccount.walk(self.path) if is_dir]
             if get_count:
-                cmd = "%s %s" % (cmd, '| wc -l')
-                return int(self._exec_cmd(cmd))
+                return len(directory_list)
 
-            return_str = str(self._exec_cmd(cmd))
-            self.directory_list = return_str.splitlines()
+            self.directory_list = directory_list
             return self.directory_list
         except Exception as e:
             self.log.error("unable to get sub directory list in %s. %s" % (self.path, e))
@@ -127,8 +118,7 @@ class Directory(object):
 
             if not os.path.isdir(full_path):
                 self.log.info("create sub-path %s in %s" %(sub_path, self.path))
-                cmd = "mkdir -p %s" %(full_path)
-                self._exec_cmd(cmd)
+                os.makedirs(full_path)
 
             if not os.path.isdir(full_path):
                 return False
@@ -171,8 +161,7 @@ class Directory(object):
                     self.log.warning("path to be deleted is equal to base directory")
                     return False
 
-                cmd = "rm -rf %s" %(full_path)
-                self._exec_cmd(cmd)
+                shutil.rmtree(full_path, ignore_errors=True)
 
             if os.path.isdir(full_path):
                 return False
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+import fcntl
+import errno
+import select
+import signal
+
+from threading import Thread
+from Queue import Queue, Empty
+
+from Common.Constant import *
+from Common.BaseTask import BaseTask
+from Common.CommandRunner import Command
+from Common.Manager import Manager
+
+
+# a command of task running in event loop
+class RunningCommand(object):
+    def __init__(self, task, slot_name, dequeue_timestamp, timeout):
+        self.task = task
+        self.slot_name = slot_name
+        self.dequeue_timestamp = dequeue_timestamp
+        self.deadline = time.time() + timeout if timeout > 0 else None
+
+        self.command = None
+        self.thread = None           # thread of task which is not a single command
+        self.stdout = []
+        self.stderr = []
+        self.output_bytes = 0
+        self.open_fds = {}           # {fd: stdout or stderr list, ...}
+        self.timed_out = False
+
+
+# run commands of tasks from one event loop thread instead of worker
+# processes. a command is spawned from its argv, stdout and stderr are read
+# by poll as they arrive. number of running commands is
+# bounded by worker count. a task without single command (get_command()
+# returns None) is executed by a thread in a slot.
+#
+# add_task and get_finished_task works as Manager, tasks are not copied
+# between processes, finished task is the same task object with result set.
+class EventLoopManager(Manager):
+    def __init__(self, log, worker_count=1, rest_time=0, tracer=None,
+                 task_timeout=0, max_output_bytes=1048576, resource_limits=None):
+        super(EventLoopManager, self).__init__(log, worker_count=worker_count,
+                                               rest_time=rest_time, tracer=tracer,
+                                               resource_limits=resource_limits)
+        self.task_timeout = int(task_timeout)
+        self.max_output_bytes = int(max_output_bytes)
+
+        # event loop runs in this process, queues are thread queues
+        self.task_queue = Queue()
+        self.finish_queue = Queue()
+        self.thread_done_queue = Queue()
+
+        self.loop_thread = None
+        self.poller = select.poll()
+        self.running = {}          # {slot name: RunningCommand, ...}
+        self.fd_commands = {}      # {fd: RunningCommand, ...}
+        self.stopping = False
+
+        self.slot_names = ["EventLoop-%s" % (i + 1) for i in xrange(self.worker_count)]
+        for slot_name in self.slot_names:
+            self.workers_status[slot_name] = READY
+
+    def _check_worker(self):
+        for slot_name in self.slot_names:
+            if self.loop_thread is None:
+                continue
+            if not self.loop_thread.is_alive():
+                self.workers_status[slot_name] = STOP
+            elif self.running.has_key(slot_name):
+                self.workers_status[slot_name] = RUN
+            else:
+                self.workers_status[slot_name] = WAIT
+
+    def run_worker(self):
+        try:
+            self.log.debug("start event loop with %s slots." % self.worker_count)
+            self.loop_thread = Thread(target=self._run_loop, name='EventLoop')
+            self.loop_thread.daemon = True
+            self.loop_thread.start()
+
+            # running commands are monitored instead of worker processes
+            self.workers_pid = {}
+            self._check_worker()
+            return True
+        except Exception as e:
+            self.log.error("unable to run event loop. %s" % e)
+            return False
+
+    def stop_worker(self, count=0):
+        try:
+            self.log.debug("sent stop signal to event loop.")
+            self.task_queue.put(self.stop_task)
+
+            if self.monitor is not None:
+                self.log.info(("command resource usage:", self.monitor.usage))
+                self.monitor = None
+
+            self._check_worker()
+        except Exception as e:
+            self.log.error("unable to stop event loop. %s" % e)
+            return False
+
+    def add_task(self, task, method_name=None):
+        if method_name is not None:
+            self.log.info("pack task into bask task.")
+            mgr_task = BaseTask(task, method_name)
+        else:
+            mgr_task = task
+
+        self.task_add_count += 1
+        mgr_task.task_id = self.task_add_count
+        mgr_task.submit_timestamp = time.time()
+        if self.tracer is not None:
+            mgr_task.trace_parent = self.tracer.current_span_id()
+        self.tasks[mgr_task.task_id] = mgr_task
+        self.dispatcher.add(mgr_task)
+        self._dispatch()
+
+        self.log.debug("added new task. name = %s" % task.name)
+
+    def get_finished_task(self, timeout=None):
+        ''' tasks run in this process, finished task is the task object.
+            return None if no task finished within timeout seconds, unknown
+            task is logged and skipped as Manager does.
+        '''
+        if len(self.cancelled_tasks) != 0:
+            self.task_finish_count += 1
+            return self.cancelled_tasks.pop(0)
+
+        if timeout is not None:
+            end_timestamp = time.time() + timeout
+        while True:
+            task = self._wait_finished(timeout)
+            if task is None:
+                return None
+
+            self.dispatcher.release(task.task_id)
+            self._dispatch()
+
+            if self.tasks.pop(task.task_id, None) is task:
+                self.task_finish_count += 1
+                return task
+
+            self.log.error("received unknown task %s, task id %s." % (task.name, task.task_id))
+            if timeout is not None:
+                timeout = max(end_timestamp - time.time(), 0)
+
+    def _get_cmd_pid(self):
+        return [running.command.pid for running in self.running.values()
+                if running.command is not None]
+
+    # event loop
+    # --------------------------------------------------------------------------
+    def _free_slot(self):
+        for slot_name in self.slot_names:
+            if not self.running.has_key(slot_name):
+                return slot_name
+        return None
+
+    def _set_nonblocking(self, fd):
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def _start(self, task, slot_name, dequeue_timestamp):
+        timeout = task.timeout or self.task_timeout
+        running = RunningCommand(task, slot_name, dequeue_timestamp, timeout)
+        self.running[slot_name] = running
+        task.worker_name = slot_name
+
+        cmd = task.get_command()
+        if cmd is None:
+            def execute():
+                try:
+                    task.execute(slot_name)
+                finally:
+                    self.thread_done_queue.put(slot_name)
+            running.thread = Thread(target=execute, name=slot_name)
+            running.thread.daemon = True
+            running.thread.start()
+            return True
+
+        task._start_cmd(cmd)
+        # own session, timeout kills the command with its children
+        running.command = Command(cmd, new_session=True)
+        try:
+            running.command.start()
+        except OSError as e:
+            self.log.error("unable to start command of %s. %s" % (task.name, e))
+            task.stderr = str(e)
+            task._finish_cmd('', -1)
+            self._finish(running)
+            return False
+
+        for fd, data in [(running.command.stdout_fd, running.stdout),
+                         (running.command.stderr_fd, running.stderr)]:
+            self._set_nonblocking(fd)
+            running.open_fds[fd] = data
+            self.fd_commands[fd] = running
+            self.poller.register(fd, select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR)
+        return True
+
+    def _read(self, fd):
+        running = self.fd_commands[fd]
+        try:
+            data = os.read(fd, 65536)
+        except OSError as e:
+            if e.errno in [errno.EAGAIN, errno.EINTR]:
+                return
+            data = ''
+
+        if data == '':
+            self.poller.unregister(fd)
+            del self.fd_commands[fd]
+            del running.open_fds[fd]
+            return
+
+        # keep head of output, rest is counted only
+        if running.output_bytes < self.max_output_bytes:
+            running.open_fds[fd].append(data[:self.max_output_bytes - running.output_bytes])
+        running.output_bytes += len(data)
+
+    def _reap(self, running):
+        ''' reap command if its pipes are closed, return True if reaped '''
+        if len(running.open_fds) != 0:
+            return False
+        command = running.command
+        return_code = command.wait(os.WNOHANG)
+        if return_code is None:
+            return False
+        command.close()
+
+        task = running.task
+        task.stderr = ''.join(running.stderr)
+        if running.timed_out:
+            task.stderr = "command timeout after %s seconds. %s" % (
+                task.timeout or self.task_timeout, task.stderr)
+        rusage = command.rusage
+        resource = {'pids': [command.pid],
+                    'cpu_user_seconds': rusage.ru_utime,
+                    'cpu_system_seconds': rusage.ru_stime,
+                    'cpu_seconds': rusage.ru_utime + rusage.ru_stime,
+                    'read_bytes': rusage.ru_inblock * 512,
+                    'write_bytes': rusage.ru_oublock * 512,
+                    'peak_rss_bytes': rusage.ru_maxrss * 1024,
+                    'spawn_seconds': command.spawn_latency}
+        task._finish_cmd(''.join(running.stdout), return_code, resource)
+        self._finish(running)
+        return True
+
+    def _finish(self, running):
+        task = running.task
+        del self.running[running.slot_name]
+        if self.tracer is not None:
+            self.tracer.record_task(task, running.slot_name, running.dequeue_timestamp,
+                                    time.time(), TASK_STAT[task.task_status])
+        self.finish_queue.put(task)
+
+    def _check_timeout(self, now):
+        for running in self.running.values():
+            if running.deadline is None or running.timed_out or running.command is None:
+                continue
+            if now >= running.deadline:
+                self.log.warning("%s timeout, kill command process group %s."
+                                 % (running.task.name, running.command.pid))
+                running.timed_out = True
+                try:
+                    os.killpg(running.command.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+    def _next_poll_timeout(self, now):
+        ''' milliseconds to wait for events '''
+        timeout = 1.0
+        for running in self.running.values():
+            if running.command is not None and len(running.open_fds) == 0:
+                timeout = 0.05    # pipes closed, wait process exit
+            elif running.thread is not None:
+                timeout = min(timeout, 0.1)
+            if running.deadline is not None:
+                timeout = min(timeout, max(running.deadline - now, 0))
+        return int(timeout * 1000)
+
+    def _run_loop(self):
+        while True:
+            try:
+                # start tasks until all slots are used
+                while not self.stopping:
+                    slot_name = self._free_slot()
+                    if slot_name is None:
+                        break
+                    try:
+                        # block for new task only if nothing is running
+                        if len(self.running) == 0:
+                            task = self.task_queue.get(timeout=1)
+                        else:
+                            task = self.task_queue.get_nowait()
+                    except Empty:
+                        break
+                    if task is self.stop_task:
+                        self.stopping = True
+                        break
+                    self._start(task, slot_name, time.time())
+
+                if self.stopping and len(self.running) == 0:
+                    break
+                if len(self.running) == 0:
+                    continue
+
+                now = time.time()
+                for fd, event in self.poller.poll(self._next_poll_timeout(now)):
+                    if self.fd_commands.has_key(fd):
+                        self._read(fd)
+
+                while True:
+                    try:
+                        slot_name = self.thread_done_queue.get_nowait()
+                    except Empty:
+                        break
+                    self._finish(self.running[slot_name])
+
+                for running in self.running.values():
+                    if running.command is not None:
+                        self._reap(running)
+
+                self._check_timeout(time.time())
+
+            except Exception as e:
+                self.log.error("event loop error. %s" % e)
+
+        self.log.info("event loop stopped running.")
+        return True
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+
+from Common.Constant import *
+
+
+# progress of a resumable export, stored as {export destpath}.checkpoint
+# next to the partial file {export destpath}.partial. image is exported from
+# offset 0 in order, so completed range is [0, offset). position is size of
+# partial file at offset, data after it is discarded when export is resumed.
+# checkpoint is written after partial file is synced, so it never claims
+# data which is not on disk.
+class ExportCheckpoint(object):
+    def __init__(self, export_destpath):
+        self.path = "%s%s" % (export_destpath, EXPORT_CHECKPOINT_SUFFIX)
+        self.partial_path = "%s%s" % (export_destpath, EXPORT_PARTIAL_SUFFIX)
+
+        self.info = {}      # export type, from snap, to snap and image size
+        self.offset = 0
+        self.position = 0
+
+    def load(self, **info):
+        ''' return True if checkpoint exists and it is checkpoint of same
+            export, otherwise checkpoint is reset to start from offset 0.
+        '''
+        self.offset = 0
+        self.position = 0
+        self.info = info
+
+        if not os.path.exists(self.path) or not os.path.exists(self.partial_path):
+            return False
+        with open(self.path, 'r') as checkpoint_file:
+            data = json.load(checkpoint_file)
+
+        for key, value in info.iteritems():
+            if data.get(key) != value:
+                return False
+        if os.path.getsize(self.partial_path) < data['position']:
+            return False
+
+        self.offset = data['offset']
+        self.position = data['position']
+        return True
+
+    def save(self, offset, position):
+        data = dict(self.info)
+        data['offset'] = offset
+        data['position'] = position
+        data['timestamp'] = time.time()
+
+        temp_path = "%s.tmp" % self.path
+        with open(temp_path, 'w') as checkpoint_file:
+            json.dump(data, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.rename(temp_path, self.path)
+
+        self.offset = offset
+        self.position = position
+        return True
+
+    def remove(self):
+        for path in [self.path, self.partial_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        return True
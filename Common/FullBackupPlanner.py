@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import hashlib
+
+from Common.Constant import *
+
+
+# spread full backup of RBD images over weekdays so bytes of full backup
+# per day are about equal. images are placed from the largest one on the
+# day with least bytes. an image in last plan stays on its day unless the
+# day would exceed average bytes per day by the tolerance, so the plan is
+# stable between runs and changes only when images are added, removed or
+# grown. image of unknown size is placed on a day hashed from its rbd id.
+#
+# plan is {rbd id: weekday, ...}, weekday is 1 (monday) to 7 (sunday)
+class FullBackupPlanner(object):
+    def __init__(self, log, weekdays=PLAN_WEEKDAYS, tolerance=PLAN_BALANCE_TOLERANCE):
+        self.log = log
+        self.weekdays = [int(weekday) for weekday in weekdays]
+        self.tolerance = float(tolerance)
+
+    def get_hash_weekday(self, rbd_id):
+        ''' stable weekday of rbd id, not changed by python hash seed '''
+        index = int(hashlib.md5(rbd_id).hexdigest(), 16) % len(self.weekdays)
+        return self.weekdays[index]
+
+    def plan(self, rbd_bytes, last_plan=None):
+        ''' rbd_bytes is {rbd id: bytes of full backup, ...} '''
+        if last_plan is None:
+            last_plan = {}
+
+        day_bytes = dict([(weekday, 0) for weekday in self.weekdays])
+        limit = sum(rbd_bytes.values()) / float(len(self.weekdays)) * (1 + self.tolerance)
+
+        plan = {}
+        for rbd_id in sorted(rbd_bytes.keys(), key=lambda k: (-rbd_bytes[k], k)):
+            full_bytes = rbd_bytes[rbd_id]
+            hash_weekday = self.get_hash_weekday(rbd_id)
+            weekday = last_plan.get(rbd_id)
+
+            if full_bytes == 0:
+                # size unknown, new RBD
+                if weekday not in day_bytes:
+                    weekday = hash_weekday
+            elif weekday not in day_bytes or day_bytes[weekday] + full_bytes > limit:
+                # day with least bytes, hashed day first if bytes are equal
+                weekday = min(self.weekdays,
+                              key=lambda k: (day_bytes[k], k != hash_weekday, k))
+
+            plan[rbd_id] = weekday
+            day_bytes[weekday] += full_bytes
+
+        for weekday in self.weekdays:
+            self.log.info("planned full backup on weekday %s, %s images, %s bytes"
+                          % (weekday,
+                             len([k for k, v in plan.iteritems() if v == weekday]),
+                             day_bytes[weekday]))
+        return plan
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import time
+
+from threading import Thread, Event
+
+import rados
+
+from Common.Constant import *
+
+
+# sample cluster health, pg states and osd commit/apply latencies by mon
+# commands over one rados connection kept during backup, instead of forking
+# ceph command each time. concurrency of manager is lowered when the cluster
+# is degraded:
+#   pause:  HEALTH_ERR, pg of unavailable data, or latency over pause limit
+#   reduce: pg in recovery or backfill, or latency over reduce limit
+# concurrency is lowered at once, and raised back only after the cluster is
+# better in HEALTH_RECOVER_SAMPLES samples in a row. running tasks are not
+# interrupted, pending tasks wait until concurrency allows.
+class HealthSampler(object):
+    def __init__(self, log, manager, cluster_name, conffile='', interval=60,
+                 reduced_workers=1, latency_reduce_ms=200, latency_pause_ms=1000):
+        self.log = log
+        self.manager = manager
+        self.cluster_name = cluster_name
+        self.conffile = conffile
+        self.interval = int(interval)
+        self.reduced_workers = int(reduced_workers)
+        self.latency_reduce_ms = int(latency_reduce_ms)
+        self.latency_pause_ms = int(latency_pause_ms)
+
+        self.cluster = None
+        self.thread = None
+        self.stop_event = Event()
+
+        self.action = HEALTH_NORMAL
+        self.better_count = 0
+        self.pause_timestamp = None
+        self.last_sample = None
+
+    def connect(self):
+        if self.cluster is not None:
+            return True
+        try:
+            cluster = rados.Rados(conffile=self.conffile, clustername=self.cluster_name)
+            cluster.connect(timeout=self.interval)
+            self.cluster = cluster
+            return True
+        except Exception as e:
+            self.log.warning("unable to connect cluster for health check. %s" % e)
+            return False
+
+    def shutdown(self):
+        if self.cluster is not None:
+            self.cluster.shutdown()
+            self.cluster = None
+
+    def _mon_command(self, prefix, **kwargs):
+        ''' return json output of the mon command '''
+        cmd = dict(kwargs)
+        cmd['prefix'] = prefix
+        cmd['format'] = 'json'
+        return_code, output, status = self.cluster.mon_command(json.dumps(cmd), '',
+                                                               timeout=self.interval)
+        if return_code != 0:
+            raise Exception("mon command %s failed, %s. %s" % (prefix, return_code, status))
+        return json.loads(output)
+
+    def sample(self):
+        ''' return {'health': status, 'pg_states': {state: pg count, ...},
+                    'max_latency_ms': max commit or apply latency of osds}
+        '''
+        status = self._mon_command('status')
+        health = status.get('health', {})
+        pg_states = {}
+        for pg_state in status.get('pgmap', {}).get('pgs_by_state', []):
+            for state in pg_state['state_name'].split('+'):
+                pg_states[state] = pg_states.get(state, 0) + pg_state['count']
+
+        # osd perf output is nested in osdstats since nautilus
+        perf = self._mon_command('osd perf')
+        perf_infos = perf.get('osdstats', perf).get('osd_perf_infos', [])
+        max_latency_ms = 0
+        for perf_info in perf_infos:
+            perf_stats = perf_info['perf_stats']
+            max_latency_ms = max(max_latency_ms,
+                                 perf_stats.get('commit_latency_ms', 0),
+                                 perf_stats.get('apply_latency_ms', 0))
+
+        return {'health': health.get('status', health.get('overall_status')),
+                'pg_states': pg_states,
+                'max_latency_ms': max_latency_ms}
+
+    def evaluate(self, sample):
+        ''' return (HEALTH_NORMAL, HEALTH_REDUCE or HEALTH_PAUSE, reason) '''
+        if sample['health'] == 'HEALTH_ERR':
+            return HEALTH_PAUSE, "cluster health is HEALTH_ERR"
+        for state in HEALTH_PAUSE_PG_STATES:
+            if sample['pg_states'].get(state, 0) != 0:
+                return HEALTH_PAUSE, "%s pgs %s" % (sample['pg_states'][state], state)
+        if self.latency_pause_ms != 0 and sample['max_latency_ms'] >= self.latency_pause_ms:
+            return HEALTH_PAUSE, "osd latency %s ms" % sample['max_latency_ms']
+
+        for state in HEALTH_REDUCE_PG_STATES:
+            if sample['pg_states'].get(state, 0) != 0:
+                return HEALTH_REDUCE, "%s pgs %s" % (sample['pg_states'][state], state)
+        if self.latency_reduce_ms != 0 and sample['max_latency_ms'] >= self.latency_reduce_ms:
+            return HEALTH_REDUCE, "osd latency %s ms" % sample['max_latency_ms']
+
+        return HEALTH_NORMAL, "cluster is healthy"
+
+    def get_concurrency(self, action):
+        if action == HEALTH_PAUSE:
+            return 0
+        if action == HEALTH_REDUCE:
+            return min(self.reduced_workers, self.manager.worker_count)
+        return self.manager.worker_count
+
+    def check(self):
+        ''' sample cluster once and apply the concurrency to manager '''
+        if not self.connect():
+            return False
+        try:
+            sample = self.sample()
+        except Exception as e:
+            # reconnect next time, concurrency is kept as it is
+            self.log.warning("unable to sample cluster health. %s" % e)
+            self.shutdown()
+            return False
+        self.last_sample = sample
+
+        action, reason = self.evaluate(sample)
+        self.log.debug(("cluster health sample:", sample))
+        if self.action == HEALTH_PAUSE:
+            # tasks waiting for workers show no progress, log every sample
+            self.log.warning("new tasks paused by cluster health for %.0f seconds, %s."
+                             % (time.time() - self.pause_timestamp, reason))
+        if action > self.action:
+            self.better_count = 0
+        elif action < self.action:
+            self.better_count += 1
+            if self.better_count < HEALTH_RECOVER_SAMPLES:
+                return True
+            self.better_count = 0
+        else:
+            self.better_count = 0
+            return True
+
+        self.log.warning("cluster health changed, %s workers, %s."
+                         % (HEALTH_ACTION[action], reason))
+        self.action = action
+        if action == HEALTH_PAUSE:
+            self.pause_timestamp = time.time()
+        self.manager.set_concurrency(self.get_concurrency(action))
+        return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.check()
+            self.stop_event.wait(self.interval)
+        self.shutdown()
+
+    def start(self):
+        self.log.info("start cluster health check every %s seconds." % self.interval)
+        self.thread = Thread(target=self.run, name='HealthSampler')
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        if self.thread is None:
+            return True
+        self.stop_event.set()
+        self.thread.join(self.interval)
+        self.thread = None
+        return True
@@ -3,9 +3,59 @@
 
 import os, sys
 import logging.handlers
-import inspect
+
+from threading import Thread
+from multiprocessing import Queue
+
+
+# put records to a queue instead of writing file, used in worker processes.
+# message is formatted before put, args of record may not be picklable.
+class LogQueueHandler(logging.Handler):
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+# the only writer of log file, receive records of workers in parent process
+class LogQueueListener(Thread):
+    def __init__(self, queue, handler):
+        Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue
+        self.handler = handler
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            self.handler.handle(record)
+
+
+# write raw line without format, used by blank and start line
+class LineFormatter(logging.Formatter):
+    def format(self, record):
+        if getattr(record, 'raw_line', False):
+            return record.getMessage()
+        return logging.Formatter.format(self, record)
+
 
 # A wrapper class of logging
+#
+# log file is written by the process which set the logger. a forked worker
+# process switches to send records to the process through a queue on its
+# first log call, so rotation and lines are not mixed by processes.
 class Logger(object):
     def __init__(self, cfg):
         '''
@@ -21,6 +71,10 @@ class Logger(object):
         self.delay = cfg.log_delay
 
         self.logger = None
+        self.handler = None         # file handler, or queue handler in worker
+        self.queue = None
+        self.listener = None
+        self.pid = None             # pid of process writing log file
         self.file_path = os.path.join(cfg.log_path, cfg.log_file)
         self.formats = {'0': '[%(asctime)s] [%(levelname)s] %(message)s',
                         '1': '[%(asctime)s] [%(levelname)s] %(message)s',
@@ -46,7 +100,8 @@ class Logger(object):
     def set_logger(self, name='logger'):
         try:
             # initialize logging directory
-            os.system("mkdir -p %s" % self.path)
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
 
             # create logger
             logger = logging.getLogger(name)
@@ -62,33 +117,61 @@ class Logger(object):
 
             # create formatter
             log_format = self.formats[self.format_type]
-            formatter = logging.Formatter(log_format)
+            formatter = LineFormatter(log_format)
 
             # set formatter to handler and add handler to logger
             log_handler.setFormatter(formatter)
             logger.addHandler(log_handler)
 
             self.logger = logger
+            self.handler = log_handler
+            self.pid = os.getpid()
 
-            self.info(("Logger initialized.", self.log_option_dict))
+            # receive records of worker processes
+            self.queue = Queue()
+            self.listener = LogQueueListener(self.queue, log_handler)
+            self.listener.start()
             return True
         except Exception as e:
             print e
             return False
 
+    def _check_process(self):
+        ''' switch handler to queue in forked process '''
+        if self.pid == os.getpid() or self.queue is None:
+            return
+        self.logger.removeHandler(self.handler)
+        self.handler = LogQueueHandler(self.queue)
+        self.handler.setLevel(self.level)
+        self.logger.addHandler(self.handler)
+        self.pid = os.getpid()
+
+    def close(self):
+        ''' stop listener after workers stopped '''
+        if self.listener is not None and self.pid == os.getpid():
+            self.queue.put(None)
+            self.listener.join()
+            self.listener = None
+            self.handler.close()
+
     def get_logger(self):
         return self.logger
 
+    def _write_line(self, line):
+        self._check_process()
+        record = logging.LogRecord(self.logger.name, logging.INFO, '', 0, line, None, None)
+        record.raw_line = True
+        self.handler.handle(record)
+
     def blank_line(self, line_count=1):
-        cmd = "echo '' >> %s" % self.file_path
         for i in range(line_count):
-            os.system(cmd)
+            self._write_line('')
         return True
 
     def start_line(self, title='', symbol='*', symbol_count=16):
         symbol_str = symbol * symbol_count
         start_line = "%s%s%s" % (symbol_str, title, symbol_str)
-        os.system("echo '%s' >> %s" %(start_line, self.file_path))
+        self._write_line(start_line)
         return True
 
     def _convert_msg(self, msg):
@@ -133,8 +216,8 @@ class Logger(object):
             n_space_count = space_count
 
         if self.format_type == '0':
-            frame = inspect.stack()[2]
-            module = inspect.getmodulename(frame[1])
+            frame = sys._getframe(3)
+            module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
 
             n_msg = ''.join(['[', module, '] ', n_msg])
             n_space_count += len(module)+4
@@ -151,18 +234,25 @@ class Logger(object):
 
         return "".join(line_list)
 
-    def info(self, log_msg):
-        indent_msg = self._indent_msg(log_msg, space_count=32)
-        self.logger.info(indent_msg)
+    def _log(self, level, log_msg, args, space_count):
+        ''' message is converted and formatted only if level is enabled,
+            args are formatted into the message lazily as logging does.
+        '''
+        if not self.logger.isEnabledFor(level):
+            return
+        self._check_process()
+        if args:
+            log_msg = log_msg % args
+        self.logger.log(level, self._indent_msg(log_msg, space_count=space_count))
+
+    def info(self, log_msg, *args):
+        self._log(logging.INFO, log_msg, args, 32)
 
-    def error(self, log_msg):
-        indent_msg = self._indent_msg(log_msg, space_count=33)
-        self.logger.error(indent_msg)
+    def error(self, log_msg, *args):
+        self._log(logging.ERROR, log_msg, args, 33)
 
-    def warning(self, log_msg):
-        indent_msg = self._indent_msg(log_msg, space_count=35)
-        self.logger.warning(indent_msg)
+    def warning(self, log_msg, *args):
+        self._log(logging.WARNING, log_msg, args, 35)
 
-    def debug(self, log_msg):
-        indent_msg = self._indent_msg(log_msg, space_count=33)
-        self.logger.debug(indent_msg)
+    def debug(self, log_msg, *args):
+        self._log(logging.DEBUG, log_msg, args, 33)
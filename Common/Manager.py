@@ -6,17 +6,25 @@ import sys
 import thread
 
 from threading import Thread
+from Queue import Empty
 from multiprocessing import Queue, JoinableQueue
 
+from Common.Constant import *
 from Common.BaseTask import BaseTask
 from Common.Worker import Worker
+from Common.StatusBoard import StatusBoard
 from Common.Monitor import Monitor
+from Common.Accounting import get_process_tree
+from Common.ResourceDispatcher import ResourceDispatcher
 
 
 # manage rbd export tasks
 class Manager(Thread):
-    def __init__(self, log, worker_count=1, rest_time=2):
+    def __init__(self, log, worker_count=1, rest_time=2, tracer=None, output_spill_path=None,
+                 status_board_path=None, resource_limits=None):
         self.log = log
+        self.tracer = tracer
+        self.output_spill_path = output_spill_path
         self.worker_count = int(worker_count)
         self.rest_time = rest_time
 
@@ -24,51 +32,98 @@ class Manager(Thread):
         self.workers_pid = {}
         self.workers_status = {}
 
+        # workers publish live status to the board, a slot per worker
+        self.status_board = None
+        self.status_board_path = status_board_path
+
         self.task_queue = JoinableQueue()
         self.finish_queue = Queue()
 
         self.monitor_pid_queue = Queue()
+        self.monitor = None
+        self.monitor_interval = 60
 
         self.task_add_count = 0
         self.task_finish_count = 0
 
+        # workers return TaskResult, it is applied to the task added
+        self.tasks = {}    # {task id: task, ...} unfinished tasks
+        self.cancelled_tasks = []   # returned by get_finished_task first
+
+        # tasks are queued to workers only when a worker is free and running
+        # tasks of their resource tags are under limits
+        self.dispatcher = ResourceDispatcher(resource_limits)
+        # workers allowed to run tasks, lowered by health check of cluster
+        self.concurrency = self.worker_count
+
         self.stop_task = None   # tell worker to stop
 
         self.log.info("worker manager initialized, set %s workers." % worker_count)
 
-    def initialize_monitor(self):
+    def initialize_monitor(self, interval=60):
         self.log.info("initializing worker monitoring.")
 
         worker_pid = []
         for name, pid in self.workers_pid.iteritems():
-            print("monitoring worker %s" % name)
+            self.log.debug("monitoring worker %s, pid = %s" % (name, pid))
             worker_pid.append(pid)
 
-        #monitor = Monitor(self.monitor_pid_queue, worker_pid)
+        self.monitor = Monitor(self.monitor_pid_queue, worker_pid)
+        self.monitor_interval = int(interval)
 
         self.log.info("monitoring workers.")
 
-        #thread.start_new_thread(self.monitoring, (self.monitor_pid_queue))
+        thread.start_new_thread(self.monitoring, (self.monitor_pid_queue,))
 
         return True
 
     def monitoring(self, monitor_pid_queue):
-        count = 100
-        while count < 1:
+        while self.monitor is not None:
             monitor_pid_queue.put(self._get_cmd_pid())
-            time.sleep(1)
+            time.sleep(self.monitor_interval)
+        monitor_pid_queue.put(None)
 
     def _get_cmd_pid(self):
+        ''' monitor samples process tree of workers, it includes the commands '''
+        return self.workers_pid.values()
 
-        cmd_pid = []
-        for worker in self.workers:
-            cmd_pid.append(worker.cmd_pid)
-        return cmd_pid
+    def get_monitor_usage(self):
+        if self.monitor is None:
+            return {}
+        return self.monitor.usage
 
     def _check_worker(self):
         # check worker stopped or not...
+        # status of worker object is the copy in this process, read status
+        # published by worker from the board.
+        for worker in self.workers:
+            status = worker.status
+            if self.status_board is not None:
+                slot_status = self.status_board.read(worker.slot)
+                if slot_status is not None and slot_status['state'] != 0:
+                    status = slot_status['state']
+            if worker.pid is not None and not worker.is_alive():
+                status = STOP
+            self.workers_status[worker.name] = status
+
+    def get_command_pids(self):
+        ''' pid of running commands of tasks and their children '''
+        pids = []
+        for pid in self._get_cmd_pid():
+            pids.extend(get_process_tree(pid))
+        worker_pids = self.workers_pid.values()
+        return [pid for pid in pids if pid not in worker_pids]
+
+    def get_workers_progress(self):
+        ''' return {worker name: slot status dict, ...} read from board '''
+        progress = {}
+        if self.status_board is None:
+            return progress
         for worker in self.workers:
-            self.workers_status[worker.name] = worker.status
+            slot_status = self.status_board.read(worker.slot)
+            if slot_status is not None:
+                progress[worker.name] = slot_status
+        return progress
 
     def run_worker(self):
         try:
@@ -77,7 +132,16 @@ class Manager(Thread):
             # todo: change to create new logger for worker processes.
             # ...
 
-            workers = [ Worker(self.log, self.task_queue, self.finish_queue, self.rest_time, self.stop_task)
+            try:
+                self.status_board = StatusBoard(self.worker_count, self.status_board_path)
+            except Exception as e:
+                self.log.warning("unable to create status board at %s, use anonymous "
+                                 "shared memory. %s" % (self.status_board_path, e))
+                self.status_board = StatusBoard(self.worker_count)
+
+            workers = [ Worker(self.log, self.task_queue, self.finish_queue, self.rest_time,
+                               self.stop_task, self.tracer, self.output_spill_path,
+                               self.status_board, i)
                         for i in xrange(self.worker_count) ]
 
             for worker in workers:
@@ -109,6 +173,10 @@ class Manager(Thread):
                 self.log.debug("sent stop singal to workers. %s." % count)
                 self.task_queue.put(self.stop_task)
 
+            if self.monitor is not None:
+                self.log.info(("worker resource usage:", self.monitor.usage))
+                self.monitor = None
+
             self._check_worker()
         except Exception as e:
             self.log.error("unable to stop worker. %s" % e)
@@ -122,11 +190,37 @@ class Manager(Thread):
         else:
             mgr_task = task
 
-        self.task_queue.put(mgr_task)
         self.task_add_count += 1
+        mgr_task.task_id = self.task_add_count
+        mgr_task.submit_timestamp = time.time()
+        if self.tracer is not None:
+            # task span is child of current stage span
+            mgr_task.trace_parent = self.tracer.current_span_id()
+        self.tasks[mgr_task.task_id] = mgr_task
+        self.dispatcher.add(mgr_task)
+        self._dispatch()
 
         self.log.debug("added new task. name = %s" % task.name)
 
+    def set_concurrency(self, count):
+        ''' number of running tasks, pending tasks are dispatched by next
+            add_task or get_finished_task. 0 starts no new task.
+        '''
+        count = max(0, min(int(count), self.worker_count))
+        if count != self.concurrency:
+            self.log.info("set concurrency of workers from %s to %s." % (self.concurrency, count))
+            self.concurrency = count
+
+    def _dispatch(self):
+        ''' queue pending tasks to workers while a worker is free '''
+        while self.dispatcher.get_running_count() < self.concurrency:
+            task = self.dispatcher.pop_ready()
+            if task is None:
+                if len(self.dispatcher) != 0:
+                    self.log.debug("%s tasks wait for resource limits." % len(self.dispatcher))
+                break
+            self.task_queue.put(task)
+
     def get_workers_status(self):
         self._check_worker()
         return self.workers_status
@@ -137,5 +231,61 @@ class Manager(Thread):
         '''
         return self.workers_pid
 
-    def get_finished_task(self):
-        return self.finish_queue.get()
+    def _wait_finished(self, timeout=None):
+        ''' get from finish queue, pending tasks are dispatched meanwhile in
+            case concurrency is raised. return None if timeout.
+        '''
+        if timeout is not None:
+            end_timestamp = time.time() + timeout
+        while True:
+            self._dispatch()
+            wait_time = DISPATCH_CHECK_INTERVAL
+            if timeout is not None:
+                wait_time = min(wait_time, max(end_timestamp - time.time(), 0))
+            try:
+                return self.finish_queue.get(timeout=wait_time)
+            except Empty:
+                if timeout is not None and time.time() >= end_timestamp:
+                    return None
+
+    def cancel_pending_tasks(self, reason):
+        ''' finish tasks not dispatched to workers yet with error, they are
+            returned by get_finished_task. return number of cancelled tasks.
+        '''
+        tasks = self.dispatcher.cancel()
+        for task in tasks:
+            self.tasks.pop(task.task_id, None)
+            task.task_status = ERROR
+            task.error = reason
+            task._set_result()
+            self.cancelled_tasks.append(task)
+        if len(tasks) != 0:
+            self.log.warning("cancelled %s pending tasks, %s." % (len(tasks), reason))
+        return len(tasks)
+
+    def get_finished_task(self, timeout=None):
+        ''' return None if no task finished within timeout seconds. result of
+            unknown task id is logged and skipped, waiting goes on.
+        '''
+        if len(self.cancelled_tasks) != 0:
+            self.task_finish_count += 1
+            return self.cancelled_tasks.pop(0)
+
+        if timeout is not None:
+            end_timestamp = time.time() + timeout
+        while True:
+            task_result = self._wait_finished(timeout)
+            if task_result is None:
+                return None
+
+            self.dispatcher.release(task_result.task_id)
+            self._dispatch()
+
+            task = self.tasks.pop(task_result.task_id, None)
+            if task is not None:
+                self.task_finish_count += 1
+                return task_result.apply_to(task)
+
+            self.log.error("received result of unknown task id %s." % task_result.task_id)
+            if timeout is not None:
+                timeout = max(end_timestamp - time.time(), 0)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, time, json
+
+from collections import OrderedDict
+
+from Common.Constant import *
+
+METRIC_PREFIX = 'rbd_backup_'
+
+# histogram buckets
+SECONDS_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200, 14400]
+BYTES_BUCKETS = [1<<20, 16<<20, 256<<20, 1<<30, 16<<30, 256<<30, 1<<40, 4<<40]
+SPAWN_BUCKETS = [0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5]
+THROUGHPUT_BUCKETS = [1<<20, 10<<20, 50<<20, 100<<20, 200<<20, 500<<20, 1<<30]
+
+METRIC_HELP = {
+    'tasks_total': ('counter', 'finished tasks by stage and status'),
+    'failures_total': ('counter', 'failed tasks and operations by stage'),
+    'export_bytes_total': ('counter', 'bytes written to backup directory by export'),
+    'retention_deletions_total': ('counter', 'snapshots and backups removed by retention'),
+    'admission_rejected_total': ('counter', 'RBD backups skipped for insufficient space'),
+    'unchanged_skips_total': ('counter', 'RBD backups skipped for no change since last backup'),
+    'retries_total': ('counter', 'failed tasks submitted again by stage'),
+    'deferred_total': ('counter', 'RBD exports deferred to next backup by backup window'),
+    'task_duration_seconds': ('histogram', 'task execution time by stage'),
+    'queue_wait_seconds': ('histogram', 'time from task submitted to task started by stage'),
+    'command_spawn_seconds': ('histogram', 'time to create process of task command by stage'),
+    'snapshot_latency_seconds': ('histogram', 'time to create a RBD snapshot'),
+    'export_size_bytes': ('histogram', 'bytes of each export'),
+    'export_throughput_bytes_per_second': ('histogram', 'throughput of each export'),
+    'image_bytes': ('gauge', 'bytes exported of the RBD image in this run'),
+    'image_predicted_bytes': ('gauge', 'predicted bytes of the RBD image backup by space admission'),
+    'isolated_images': ('gauge', 'RBD images exported last without retry for failures in last backups'),
+    'image_duration_seconds': ('gauge', 'export time of the RBD image in this run'),
+    'image_throughput_bytes_per_second': ('gauge', 'export throughput of the RBD image in this run'),
+    'worker_state': ('gauge', 'state of worker read from status board, 1 ready 2 wait 3 stop 4 run 5 rest'),
+    'worker_bytes_done': ('gauge', 'bytes read or written by command of current task of worker'),
+    'worker_heartbeat_timestamp_seconds': ('gauge', 'last time the worker updated status board'),
+    'tasks_in_flight': ('gauge', 'submitted but unfinished tasks by stage'),
+    'stage_end_timestamp_seconds': ('gauge', 'time the backup stage ended'),
+    'stage_duration_seconds': ('gauge', 'duration of the backup stage'),
+    'run_start_timestamp_seconds': ('gauge', 'time the backup run started'),
+    'run_duration_seconds': ('gauge', 'duration of the backup run'),
+}
+
+
+# collect counters, gauges and histograms of a backup run and write them to
+# node_exporter textfile and a JSON summary. files are replaced atomically.
+class Metrics(object):
+    def __init__(self, log, cluster_name, textfile_path='', json_path='', interval=60):
+        self.log = log
+        self.cluster_name = cluster_name
+        self.textfile_path = textfile_path
+        self.json_path = json_path
+        self.interval = int(interval)
+
+        self.counters = OrderedDict()      # {(name, labels): value, ...}
+        self.gauges = OrderedDict()        # {(name, labels): value, ...}
+        self.histograms = OrderedDict()    # {(name, labels): [buckets, counts, sum, count], ...}
+
+        self.start_timestamp = time.time()
+        self.stage_start_timestamp = self.start_timestamp
+        self.last_write_timestamp = 0
+
+        self.set('run_start_timestamp_seconds', self.start_timestamp)
+
+    def _key(self, name, labels):
+        labels['cluster'] = self.cluster_name
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = self._key(name, labels)
+        if not self.histograms.has_key(key):
+            self.histograms[key] = [buckets, [0] * len(buckets), 0, 0]
+        histogram = self.histograms[key]
+        for i, bound in enumerate(histogram[0]):
+            if value <= bound:
+                histogram[1][i] += 1
+        histogram[2] += value
+        histogram[3] += 1
+
+    def record_task(self, task, stage):
+        ''' record a finished task from time and status collected by BaseTask '''
+        status = 'complete' if task.task_status == COMPLETE else 'error'
+        self.inc('tasks_total', stage=stage, status=status)
+        if task.task_status != COMPLETE:
+            self.inc('failures_total', stage=stage)
+
+        if task.elapsed_time:
+            self.observe('task_duration_seconds', task.elapsed_time, stage=stage)
+        submit_timestamp = getattr(task, 'submit_timestamp', 0)
+        if submit_timestamp and task.start_timestamp:
+            self.observe('queue_wait_seconds',
+                         max(task.start_timestamp - submit_timestamp, 0), stage=stage)
+        if task.resource.has_key('spawn_seconds'):
+            self.observe('command_spawn_seconds', task.resource['spawn_seconds'],
+                         buckets=SPAWN_BUCKETS, stage=stage)
+
+    def record_snapshot(self, task):
+        self.record_task(task, 'snapshot')
+        if task.task_status == COMPLETE and task.elapsed_time:
+            self.observe('snapshot_latency_seconds', task.elapsed_time)
+
+    def record_export(self, task, export_type):
+        self.record_task(task, 'export')
+        if task.task_status != COMPLETE or not os.path.exists(task.export_destpath):
+            return
+
+        # allocated size, export file of full backup is sparse
+        export_bytes = os.stat(task.export_destpath).st_blocks * 512
+        labels = {'pool': task.pool_name, 'rbd': task.rbd_name, 'type': export_type}
+        self.inc('export_bytes_total', export_bytes, type=export_type)
+        self.observe('export_size_bytes', export_bytes, buckets=BYTES_BUCKETS, type=export_type)
+        self.set('image_bytes', export_bytes, **labels)
+
+        if task.elapsed_time:
+            throughput = export_bytes / task.elapsed_time
+            self.set('image_duration_seconds', task.elapsed_time, **labels)
+            self.set('image_throughput_bytes_per_second', throughput, **labels)
+            self.observe('export_throughput_bytes_per_second', throughput,
+                         buckets=THROUGHPUT_BUCKETS, type=export_type)
+
+    def record_workers(self, progress):
+        ''' progress is {worker name: slot status, ...} of status board '''
+        for name, slot_status in progress.iteritems():
+            self.set('worker_state', slot_status['state'], worker=name)
+            self.set('worker_bytes_done', slot_status['bytes_done'], worker=name)
+            self.set('worker_heartbeat_timestamp_seconds', slot_status['heartbeat'], worker=name)
+
+    def stage_end(self, stage):
+        now = time.time()
+        self.set('stage_end_timestamp_seconds', now, stage=stage)
+        self.set('stage_duration_seconds', now - self.stage_start_timestamp, stage=stage)
+        self.stage_start_timestamp = now
+        return self.write()
+
+    def run_end(self):
+        self.set('run_duration_seconds', time.time() - self.start_timestamp)
+        return self.write()
+
+    def write_if_due(self):
+        if time.time() - self.last_write_timestamp < self.interval:
+            return True
+        return self.write()
+
+    def _format_labels(self, labels, extra=None):
+        labels = list(labels)
+        if extra is not None:
+            labels.append(extra)
+        if len(labels) == 0:
+            return ''
+        label_str = ','.join(['%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in labels])
+        return '{%s}' % label_str
+
+    def _format_textfile(self):
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name in described:
+                return
+            described.add(name)
+            metric_type, metric_help = METRIC_HELP.get(name, ('untyped', name))
+            lines.append("# HELP %s%s %s" % (METRIC_PREFIX, name, metric_help))
+            lines.append("# TYPE %s%s %s" % (METRIC_PREFIX, name, metric_type))
+
+        for metrics in [self.counters, self.gauges]:
+            for (name, labels), value in metrics.iteritems():
+                describe(name)
+                lines.append("%s%s%s %s" % (METRIC_PREFIX, name,
+                                            self._format_labels(labels), value))
+
+        for (name, labels), (buckets, counts, total, count) in self.histograms.iteritems():
+            describe(name)
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append("%s%s_bucket%s %s" % (METRIC_PREFIX, name,
+                                                   self._format_labels(labels, ('le', bound)),
+                                                   bucket_count))
+            lines.append("%s%s_bucket%s %s" % (METRIC_PREFIX, name,
+                                               self._format_labels(labels, ('le', '+Inf')),
+                                               count))
+            lines.append("%s%s_sum%s %s" % (METRIC_PREFIX, name, self._format_labels(labels), total))
+            lines.append("%s%s_count%s %s" % (METRIC_PREFIX, name, self._format_labels(labels), count))
+
+        return '\n'.join(lines) + '\n'
+
+    def _format_json(self):
+        def pack(metrics):
+            data = []
+            for (name, labels), value in metrics.iteritems():
+                data.append({'name': METRIC_PREFIX + name, 'labels': dict(labels), 'value': value})
+            return data
+
+        histograms = []
+        for (name, labels), (buckets, counts, total, count) in self.histograms.iteritems():
+            histograms.append({'name': METRIC_PREFIX + name,
+                               'labels': dict(labels),
+                               'buckets': dict(zip([str(b) for b in buckets], counts)),
+                               'sum': total,
+                               'count': count})
+
+        summary = OrderedDict()
+        summary['cluster'] = self.cluster_name
+        summary['start_timestamp'] = self.start_timestamp
+        summary['write_timestamp'] = time.time()
+        summary['counters'] = pack(self.counters)
+        summary['gauges'] = pack(self.gauges)
+        summary['histograms'] = histograms
+        return json.dumps(summary, indent=2)
+
+    def _write_atomic(self, path, data):
+        directory = os.path.dirname(path)
+        if directory != '' and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(temp_path, 'w') as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.rename(temp_path, path)
+
+    def write(self):
+        try:
+            self.last_write_timestamp = time.time()
+            if self.textfile_path:
+                self._write_atomic(self.textfile_path, self._format_textfile())
+            if self.json_path:
+                self._write_atomic(self.json_path, self._format_json())
+            return True
+        except Exception as e:
+            self.log.warning("unable to write metrics. %s" % e)
+            return False
@@ -2,60 +2,73 @@
 # -*- coding: utf-8 -*-
 import os
 import time
-import subprocess
 
 from threading import Thread
 from Queue import Queue
 
+from Common.Accounting import ProcessAccount, read_proc_io
 
+
+# sample resource usage of worker process trees, pid list to sample is
+# received from request queue, None stops the monitor.
 class Monitor(Thread):
 
     def __init__(self, req_queue, pid):
 
         Thread.__init__(self)
+        self.daemon = True
 
         self.req_queue = req_queue
         self.pid = pid
 
-        self.start()
-
-    def _exec_cmd(self, cmd):
-        p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        output = p.communicate()[0]
-        return_code = p.returncode
-
-        #self.log.debug((cmd, output))
+        self.accounts = {}    # {pid: ProcessAccount, ...}
+        self.usage = {}       # {pid: usage dict, ...} latest usage of each process tree
 
-        if return_code == 0:
-            return output
-        return ''
+        self.start()
 
     def run(self):
 
-        count = 0
         while True:
             try:
-                print("getting pid of command.")
-                pid = self.req_queue.get()
-                print("pid of command is %s" % pid)
-                if os.path.isdir("/proc/%s" % pid):
-                    print self.monitor_disk_io(pid)
-
-                if pid is None:
+                pid_list = self.req_queue.get()
+                if pid_list is None:
                     break
 
-                count += 1
-                if count == 100:
-                    break
+                for pid in pid_list:
+                    if os.path.isdir("/proc/%s" % pid):
+                        self.usage[pid] = self.monitor_process(pid)
 
-                time.sleep(1)
             except Exception as e:
                 print e
 
+    def monitor_process(self, pid):
+        ''' io, cpu and peak rss of the process and its descendants '''
+        if not self.accounts.has_key(pid):
+            self.accounts[pid] = ProcessAccount(pid)
+        account = self.accounts[pid]
+        account.sample()
+        return account.get_usage()
+
     def monitor_disk_io(self, pid):
-        cmd = "cat /proc/%s/io | grep write_bytes" % pid
-        return self._exec_cmd(cmd)
+        io = read_proc_io(pid)
+        if io is None:
+            return {}
+        return {'read_bytes': io['read_bytes'],
+                'write_bytes': io['write_bytes']}
 
     def monitor_network_io(self, pid):
-        cmd = "cat /proc/%s/io | grep write_bytes" % pid
-        return self._exec_cmd(cmd)
+        ''' bytes received and transmitted in network namespace of the process '''
+        try:
+            rx_bytes = 0
+            tx_bytes = 0
+            with open("/proc/%s/net/dev" % pid, 'r') as dev_file:
+                for line in dev_file.readlines()[2:]:
+                    name, data = line.split(':', 1)
+                    if name.strip() == 'lo':
+                        continue
+                    fields = data.split()
+                    rx_bytes += int(fields[0])
+                    tx_bytes += int(fields[8])
+            return {'rx_bytes': rx_bytes, 'tx_bytes': tx_bytes}
+        except (IOError, OSError, ValueError):
+            return {}
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import rados, subprocess, sys, traceback
+import rados, sys, traceback
 from rbd import RBD, Image
 
+from Common.CommandRunner import run_command
+
 class Pool(object):
 
     def __init__(self, log, cluster_name, pool_name, conffile=''):
@@ -37,20 +39,18 @@ class Pool(object):
 
     def _exec_cmd(self, cmd):
         try:
-            p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-            result = p.communicate()[0]
-            return_code = p.returncode
+            command = run_command(cmd)
 
-            self.log.debug((cmd,
-                            "output = %s" %result.strip(),
-                            "return code = %s" %return_code))
+            self.log.debug("%s, return code = %s, spawn seconds = %.6f, error = %s",
+                           command, command.return_code, command.spawn_latency,
+                           command.stderr.strip())
 
-            if return_code != 0:
+            if command.return_code != 0:
                 return False
 
-            return result.strip()
+            return command.stdout.strip()
         except Exception as e:
-            self.log.error("command (%s) execution failed" % cmd)
+            self.log.error("command (%s) execution failed. %s" % (cmd, e))
 
     def _calc_size_in_bytes(self, result):
         try:
@@ -156,7 +156,8 @@ class Pool(object):
     def get_rbd_name_list(self):
         try:
             rbd_list = self.rbd.list(self.ioctx)
-            self.log.info(("RBD image name list in pool %s:" % self.pool_name, rbd_list))
+            self.log.info("%s RBD images in pool %s.", len(rbd_list), self.pool_name)
+            self.log.debug(("RBD image name list in pool %s:" % self.pool_name, rbd_list))
             return rbd_list
         except Exception as e:
             self.log.error("unable to list rbd image in pool %s, %s" %(self.pool_name, e))
@@ -173,17 +174,17 @@ class Pool(object):
             self.log.error("collect rbd info failed. %s" % e)
             return False
 
-    def get_rbd_size(self, rbd_name):
+    def get_rbd_size(self, rbd_name, snap_name=None):
         ''' get size of rbd or rbd snapshot '''
         try:
-            image = Image(self.ioctx, rbd_name)
+            image = Image(self.ioctx, rbd_name, snapshot=snap_name, read_only=True)
             size = image.size()
             image.close()
 
             if size is False:
                 return False
 
-            self.log.info("%s has image size %s bytes in pool %s." %(str(rbd_name), size, self.pool_name))
+            self.log.debug("%s has image size %s bytes in pool %s.", rbd_name, size, self.pool_name)
             return int(size)
         except Exception as e:
             self.log.error("unable to get size of rbd image (%s). %s" %(rbd_name, e))
@@ -203,25 +204,29 @@ class Pool(object):
             if snap_name is not None:
                 rbd_name = "%s@%s" % (rbd_name, snap_name)
 
-            from_snap_str = ''
+            cmd = ['rbd', 'diff',
+                   '--cluster', self.cluster_name,
+                   '-p', self.pool_name]
             if from_snap is not None:
-                from_snap_str = "--from-snap %s" % from_snap
+                cmd.extend(['--from-snap', from_snap])
+            cmd.append(rbd_name)
+            output = self._exec_cmd(cmd)
 
-            cmd = "rbd diff --cluster %s -p %s %s %s" % (self.cluster_name,
-                                                          self.pool_name,
-                                                          from_snap_str,
-                                                          rbd_name)
-            cmd = "%s | awk '{ SUM += $2} END { print SUM }'" % cmd
-            size = self._exec_cmd(cmd)
+            # sum length column of extents, skip the header line
+            size = False
+            if output is not None and output is not False:
+                size = 0
+                for line in output.splitlines():
+                    fields = line.split()
+                    if len(fields) > 1 and fields[1].isdigit():
+                        size += int(fields[1])
 
             if size is False:
                 self.log.error("unable to get used size of %s in pool %s." % (rbd_name,
                                                                               self.pool_name))
                 return False
-            if size == '':
-                size = 0
 
-            self.log.info("%s used %s bytes." % (rbd_name, size))
+            self.log.debug("%s used %s bytes.", rbd_name, size)
             return int(size)
         except Exception as e:
             self.log.error("unable to get used size of %s in pool %s. %s" % (rbd_name,
@@ -229,11 +234,52 @@ class Pool(object):
                                                                              e))
             return False
 
+    def get_changed_size(self, rbd_name, from_snap):
+        ''' bytes of objects changed since from_snap, whole objects are
+            compared by object map, fast-diff feature is required to avoid
+            reading objects. resize is not reported, compare size of image
+            and snapshot for it.
+        '''
+        try:
+            changed = [0]
+            def iterate_cb(offset, length, exists):
+                changed[0] += length
+
+            image = Image(self.ioctx, rbd_name, read_only=True)
+            try:
+                image.diff_iterate(0, image.size(), from_snap, iterate_cb,
+                                   whole_object=True)
+            finally:
+                image.close()
+
+            self.log.debug("%s changed %s bytes since snapshot %s.",
+                           rbd_name, changed[0], from_snap)
+            return changed[0]
+        except Exception as e:
+            self.log.error("unable to get changed size of %s since snapshot %s. %s"
+                           % (rbd_name, from_snap, e))
+            return False
+
+    def is_snap_in_use(self, rbd_name, snap_name):
+        ''' snapshot is protected or has clone children, it can not be removed '''
+        try:
+            image = Image(self.ioctx, rbd_name, snapshot=snap_name, read_only=True)
+            try:
+                if image.is_protected_snap(snap_name):
+                    return True
+                return len(list(image.list_children())) != 0
+            finally:
+                image.close()
+        except Exception as e:
+            self.log.error("unable to check snapshot %s of rbd image %s in use. %s"
+                           % (snap_name, rbd_name, e))
+            return False
+
     def get_rbd_features(self, rbd_name):
         try:
             image = Image(self.ioctx, rbd_name)
             feature = image.features()
-            self.log.info("feature of rbd image %s = %s" % (rbd_name, feature))
+            self.log.debug("feature of rbd image %s = %s", rbd_name, feature)
             image.close()
 
             return feature
@@ -261,9 +307,9 @@ class Pool(object):
             self.snap_id_list[rbd_name] = snap_id_list.sort()
 
             if len(rbd_snap_list) == 0:
-                self.log.info("no snapshot exist in rbd image %s." % rbd_name)
+                self.log.debug("no snapshot exist in rbd image %s.", rbd_name)
             else:
-                self.log.info(("snapshot list of rbd image %s:" % rbd_name, rbd_snap_list))
+                self.log.debug(("snapshot list of rbd image %s:" % rbd_name, rbd_snap_list))
 
             return rbd_snap_list
         except Exception as e:
@@ -297,12 +343,28 @@ class Pool(object):
             stat = image.stat()
             image.close()
 
-            self.log.info(("stat of rbd image %s" %rbd_name, stat))
+            self.log.debug(("stat of rbd image %s" % rbd_name, stat))
             return stat
         except Exception as e:
             self.log.error("unable to get stat of rbd image (%s). %s" % (rbd_name, e))
             return False
 
+    def create_rbd(self, rbd_name, size, features=None):
+        ''' create a sparse RBD image, no data is written '''
+        try:
+            if features is None:
+                self.rbd.create(self.ioctx, rbd_name, size, old_format=False)
+            else:
+                self.rbd.create(self.ioctx, rbd_name, size, old_format=False,
+                                features=features)
+            self.log.info("created rbd image %s in pool %s, size = %s, features = %s"
+                          % (rbd_name, self.pool_name, size, features))
+            return True
+        except Exception as e:
+            self.log.error("unable to create rbd image %s in pool %s. %s"
+                           % (rbd_name, self.pool_name, e))
+            return False
+
     def get_version(self):
         self.log.info("librbd version: %s" % self.rbd.version())
         return self.rbd.version()
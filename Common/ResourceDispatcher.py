@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+def parse_limits(text):
+    ''' parse "pool:*=2, class:hdd=1, dest:/backup=4" to
+        {'pool:*': 2, 'class:hdd': 1, 'dest:/backup': 4}
+    '''
+    limits = {}
+    for item in text.split(','):
+        item = item.strip()
+        if item == '':
+            continue
+        tag, value = item.rsplit('=', 1)
+        tag = tag.strip()
+        if ':' not in tag:
+            raise ValueError("tag %s is not in kind:name form" % tag)
+        limits[tag] = int(value)
+    return limits
+
+
+# hold tasks submitted to manager until they can be dispatched to workers.
+# a task carries resource tags, e.g.
+#   ['cluster:ceph', 'pool:rbd', 'class:hdd', 'dest:/backup/ceph']
+# and the number of running tasks of each tag is limited,
+#   {'pool:rbd': 1, 'class:*': 2, ...}
+# 'kind:*' limits every tag of the kind separately. a task is dispatched when
+# all its tags are under limit, otherwise the task behind it is tried, so
+# workers are kept busy with tasks of other resources.
+class ResourceDispatcher(object):
+    def __init__(self, limits=None):
+        self.limits = {}
+        if limits is not None:
+            self.limits = dict(limits)
+
+        self.pending = []       # tasks in submitted order
+        self.running = {}       # {task id: tags, ...}
+        self.counts = {}        # {tag: running tasks, ...}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get_limit(self, tag):
+        ''' limit of the tag, None if unlimited '''
+        if self.limits.has_key(tag):
+            return self.limits[tag]
+        kind = tag.split(':', 1)[0]
+        return self.limits.get("%s:*" % kind)
+
+    def _is_available(self, tags):
+        for tag in tags:
+            limit = self.get_limit(tag)
+            if limit is not None and self.counts.get(tag, 0) >= limit:
+                return False
+        return True
+
+    def add(self, task):
+        self.pending.append(task)
+
+    def pop_ready(self):
+        ''' return first pending task whose tags are all under limit and count
+            it as running, None if no task can be dispatched.
+        '''
+        for i, task in enumerate(self.pending):
+            tags = getattr(task, 'resource_tags', [])
+            if not self._is_available(tags):
+                continue
+            del self.pending[i]
+            self.running[task.task_id] = tags
+            for tag in tags:
+                self.counts[tag] = self.counts.get(tag, 0) + 1
+            return task
+        return None
+
+    def cancel(self):
+        ''' remove and return all pending tasks '''
+        tasks = self.pending
+        self.pending = []
+        return tasks
+
+    def release(self, task_id):
+        ''' the task is finished, its tags are available again '''
+        tags = self.running.pop(task_id, None)
+        if tags is None:
+            return False
+        for tag in tags:
+            self.counts[tag] -= 1
+            if self.counts[tag] == 0:
+                del self.counts[tag]
+        return True
+
+    def get_running_count(self):
+        return len(self.running)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, sys, traceback
+
+from collections import OrderedDict
+
+from Common.Constant import *
+from Common.BackupChain import BackupChain
+
+# RBD image feature bit of layering, required by clone
+RBD_FEATURE_LAYERING = 1
+
+
+# plan how to restore a RBD image to a restore point.
+# snapshots retained in cluster are restored by rollback or clone in seconds,
+# backup files in backup directory are imported only if the snapshot is gone.
+# rollback overwrites the source RBD image, it is planned only if allowed
+# explicitly. import never overwrites an existing RBD image.
+class RestorePlanner(object):
+    def __init__(self, log, backup_path, meta_snapshot_list, meta_backup_list,
+                       import_bandwidth, rollback_bandwidth, clone_seconds):
+        self.log = log
+        self.backup_path = backup_path
+        self.meta_snapshot_list = meta_snapshot_list
+        self.meta_backup_list = meta_backup_list
+
+        # bytes per second
+        self.import_bandwidth = float(import_bandwidth)
+        self.rollback_bandwidth = float(rollback_bandwidth)
+        self.clone_seconds = float(clone_seconds)
+
+    def _get_restore_point(self, rbd_id, backup_chain):
+        ''' latest snapshot tracked in metafile, or latest backup file '''
+        if self.meta_snapshot_list.has_key(rbd_id):
+            snap_list = self.meta_snapshot_list[rbd_id]
+            if isinstance(snap_list, list) and len(snap_list) != 0:
+                return snap_list[-1]
+
+        if self.meta_backup_list.has_key(rbd_id):
+            backup_list = self.meta_backup_list[rbd_id]
+            if isinstance(backup_list, list) and len(backup_list) != 0:
+                return backup_chain.get_last_snapshot(backup_list[-1])
+
+        return None
+
+    def _get_backup_chain(self, rbd_id, backup_chain, restore_point):
+        ''' find the generation which contains the restore point, latest first '''
+        if not self.meta_backup_list.has_key(rbd_id):
+            return False
+
+        for generation in reversed(self.meta_backup_list[rbd_id]):
+            chain = backup_chain.get_chain(generation)
+            if chain is False:
+                continue
+            if restore_point in backup_chain.get_chain_snapshots(chain):
+                return backup_chain.get_chain(generation, to_snap=restore_point)
+        return False
+
+    def _plan_rollback(self, pool, rbd_name, restore_point, in_place, allow_rollback):
+        candidate = OrderedDict()
+        candidate['method'] = RESTORE_METHOD[RESTORE_ROLLBACK]
+        candidate['available'] = False
+        candidate['bytes'] = 0
+        candidate['estimated_seconds'] = None
+
+        if not in_place:
+            candidate['reason'] = "restore target is not the source RBD image"
+            return candidate
+
+        if not allow_rollback:
+            candidate['reason'] = "rollback of the source RBD image is not allowed"
+            return candidate
+
+        used_size = pool.get_used_size(rbd_name, snap_name=restore_point)
+        if used_size is False:
+            candidate['reason'] = "unable to get used size of snapshot"
+            return candidate
+
+        candidate['available'] = True
+        candidate['bytes'] = used_size
+        candidate['estimated_seconds'] = used_size / self.rollback_bandwidth
+        candidate['reason'] = "snapshot %s retained in cluster" % restore_point
+        return candidate
+
+    def _plan_clone(self, pool, rbd_name, restore_point, in_place, flatten):
+        candidate = OrderedDict()
+        candidate['method'] = RESTORE_METHOD[RESTORE_CLONE]
+        candidate['available'] = False
+        candidate['bytes'] = 0
+        candidate['estimated_seconds'] = None
+
+        if in_place:
+            candidate['reason'] = "restore target is the source RBD image"
+            return candidate
+
+        features = pool.get_rbd_features(rbd_name)
+        if features is False or not features & RBD_FEATURE_LAYERING:
+            candidate['reason'] = "RBD image has no layering feature"
+            return candidate
+
+        # clone shares data with the snapshot, only flatten copies it
+        candidate['available'] = True
+        candidate['estimated_seconds'] = self.clone_seconds
+        if flatten:
+            used_size = pool.get_used_size(rbd_name, snap_name=restore_point)
+            if used_size is False:
+                candidate['available'] = False
+                candidate['estimated_seconds'] = None
+                candidate['reason'] = "unable to get used size of snapshot"
+                return candidate
+            candidate['bytes'] = used_size
+            candidate['estimated_seconds'] += used_size / self.rollback_bandwidth
+        candidate['reason'] = "snapshot %s retained in cluster" % restore_point
+        return candidate
+
+    def _plan_import(self, rbd_id, backup_chain, restore_point, target_exists):
+        candidate = OrderedDict()
+        candidate['method'] = RESTORE_METHOD[RESTORE_IMPORT]
+        candidate['available'] = False
+        candidate['bytes'] = 0
+        candidate['estimated_seconds'] = None
+        candidate['chain'] = []
+
+        if target_exists:
+            candidate['reason'] = "restore target RBD image exists, import requires a new RBD image"
+            return candidate
+
+        chain = self._get_backup_chain(rbd_id, backup_chain, restore_point)
+        if chain is False:
+            candidate['reason'] = "no backup file of snapshot %s" % restore_point
+            return candidate
+
+        chain_bytes = 0
+        for path in chain:
+            chain_bytes += os.path.getsize(path)
+
+        candidate['available'] = True
+        candidate['bytes'] = chain_bytes
+        candidate['estimated_seconds'] = chain_bytes / self.import_bandwidth
+        candidate['reason'] = "%s backup files in backup directory" % len(chain)
+        candidate['chain'] = chain
+        return candidate
+
+    def plan(self, pool, rbd_id, rbd_name, restore_point=None,
+                   target_pool_name=None, target_rbd_name=None, allow_rollback=False,
+                   flatten=False):
+        ''' return restore plan of the RBD image, the plan contains every
+            restore method with its estimated time and the selected one.
+            target is the source RBD image if not given, it is restored only
+            by rollback if allow_rollback, or by import if the image is gone.
+        '''
+        try:
+            backup_chain = BackupChain(self.log, self.backup_path, pool.pool_name, rbd_name)
+
+            if restore_point is None:
+                restore_point = self._get_restore_point(rbd_id, backup_chain)
+                if restore_point is None or restore_point is False:
+                    self.log.error("no restore point of RBD image. rbd_id = %s" % rbd_id)
+                    return False
+
+            if target_pool_name is None:
+                target_pool_name = pool.pool_name
+            if target_rbd_name is None:
+                target_rbd_name = rbd_name
+            in_place = (target_pool_name == pool.pool_name and target_rbd_name == rbd_name)
+            rbd_name_list = pool.get_rbd_name_list()
+            target_exists = (target_pool_name == pool.pool_name and
+                             rbd_name_list is not False and target_rbd_name in rbd_name_list)
+
+            candidates = []
+            snapshot_list = pool.get_snap_name_list(rbd_name)
+            if snapshot_list is not False and restore_point in snapshot_list:
+                candidates.append(self._plan_rollback(pool, rbd_name, restore_point, in_place,
+                                                      allow_rollback))
+                candidates.append(self._plan_clone(pool, rbd_name, restore_point, in_place,
+                                                   flatten))
+            else:
+                self.log.info("snapshot %s not exist in cluster." % restore_point)
+            candidates.append(self._plan_import(rbd_id, backup_chain, restore_point,
+                                                target_exists))
+
+            selected = None
+            for candidate in candidates:
+                if not candidate['available']:
+                    continue
+                if selected is None or candidate['estimated_seconds'] < selected['estimated_seconds']:
+                    selected = candidate
+
+            plan = OrderedDict()
+            plan['rbd_id'] = rbd_id
+            plan['pool_name'] = pool.pool_name
+            plan['rbd_name'] = rbd_name
+            plan['restore_point'] = restore_point
+            plan['target_pool_name'] = target_pool_name
+            plan['target_rbd_name'] = target_rbd_name
+            plan['candidates'] = candidates
+            plan['selected'] = selected
+
+            summary = []
+            for candidate in candidates:
+                summary.append("%s: available = %s, estimated seconds = %s, %s"
+                               % (candidate['method'],
+                                  candidate['available'],
+                                  candidate['estimated_seconds'],
+                                  candidate['reason']))
+            self.log.info(("restore plan of %s to %s:" % (rbd_id, restore_point), summary))
+
+            if selected is None:
+                self.log.error("no restore method available. rbd_id = %s" % rbd_id)
+                if in_place and target_exists:
+                    self.log.error("restore to a new RBD image by target pool or rbd name, "
+                                   "or allow rollback of the source RBD image.")
+            else:
+                self.log.info("selected restore method %s" % selected['method'])
+
+            return plan
+        except Exception as e:
+            self.log.error("unable to plan restore of %s. %s" % (rbd_id, e))
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
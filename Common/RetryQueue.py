@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+import random
+
+from Common.Constant import *
+
+
+# retry failed tasks of a stage. failure of a task is classified from return
+# code and stderr of its command:
+#   fatal:     retrying does not help, e.g. image or snapshot not found
+#   retryable: transient, e.g. timeout, OSD or monitor unavailable, no space
+# unknown failure is retryable. retryable task is delayed by exponential
+# backoff with jitter and submitted again behind the remaining tasks, until
+# max attempts is reached.
+#
+# history of each RBD is kept across backups,
+#   {rbd id: {'failures': consecutive failed backups,
+#             'attempts': [[timestamp, stage, attempt, return code, class, reason], ...]}}
+# RBD failed in last isolate count backups is isolated, its task is submitted
+# after all other tasks and not retried, so it does not delay the others.
+class RetryQueue(object):
+    def __init__(self, log, history=None,
+                            max_attempts=RETRY_MAX_ATTEMPTS,
+                            base_delay=RETRY_BASE_DELAY,
+                            max_delay=RETRY_MAX_DELAY,
+                            isolate_count=RETRY_ISOLATE_COUNT):
+        self.log = log
+        self.max_attempts = int(max_attempts)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.isolate_count = int(isolate_count)     # 0 is never isolate
+
+        self.history = {}
+        if history is not None:
+            for rbd_id, record in history.iteritems():
+                self.history[rbd_id] = {'failures': record.get('failures', 0),
+                                        'attempts': list(record.get('attempts', []))}
+
+        self.attempts = {}      # {rbd id: attempts in this backup, ...}
+        self.delayed = []       # [[due timestamp, task], ...]
+
+    def __len__(self):
+        return len(self.delayed)
+
+    def classify(self, task):
+        ''' return (FAILURE_FATAL or FAILURE_RETRYABLE, reason) '''
+        return_code = None
+        if isinstance(task.output, tuple) and len(task.output) == 2:
+            return_code = task.output[1]
+        message = "%s %s" % (task.stderr or '', task.error or '')
+
+        if return_code is not None and return_code < 0:
+            return FAILURE_RETRYABLE, "killed by signal %s" % -return_code
+        for pattern in RETRY_FATAL_PATTERNS:
+            if pattern in message:
+                return FAILURE_FATAL, pattern
+        for pattern in RETRY_TRANSIENT_PATTERNS:
+            if pattern in message:
+                return FAILURE_RETRYABLE, pattern
+        return FAILURE_RETRYABLE, "unknown failure, return code %s" % return_code
+
+    def is_isolated(self, rbd_id):
+        if self.isolate_count == 0 or not self.history.has_key(rbd_id):
+            return False
+        return self.history[rbd_id]['failures'] >= self.isolate_count
+
+    def get_delay(self, attempt):
+        ''' exponential backoff, jitter spreads retries of tasks failed at
+            the same time, e.g. by a monitor election.
+        '''
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _record(self, rbd_id, stage, failure_class, return_code, reason):
+        record = self.history.setdefault(rbd_id, {'failures': 0, 'attempts': []})
+        record['attempts'].append([time.time(), stage, self.attempts.get(rbd_id, 0),
+                                   return_code, failure_class, reason])
+        del record['attempts'][:-RETRY_HISTORY_COUNT]
+        return record
+
+    def succeed(self, rbd_id, stage):
+        ''' record completed task of the RBD, failures are reset '''
+        self.attempts[rbd_id] = self.attempts.get(rbd_id, 0) + 1
+        if self.history.has_key(rbd_id):
+            self._record(rbd_id, stage, 'complete', 0, '')
+            self.history[rbd_id]['failures'] = 0
+
+    def fail(self, task, stage):
+        ''' schedule the failed task to retry. return True if it is scheduled,
+            False if the task is given up.
+        '''
+        rbd_id = task.rbd_id
+        attempt = self.attempts.get(rbd_id, 0) + 1
+        self.attempts[rbd_id] = attempt
+
+        failure_class, reason = self.classify(task)
+        return_code = None
+        if isinstance(task.output, tuple) and len(task.output) == 2:
+            return_code = task.output[1]
+        record = self._record(rbd_id, stage, failure_class, return_code, reason)
+
+        if failure_class == FAILURE_FATAL:
+            self.log.warning("%s failed, %s. not retry." % (task.name, reason))
+        elif self.is_isolated(rbd_id):
+            self.log.warning("%s failed, %s. not retry isolated RBD %s, failed in last %s backups."
+                             % (task.name, reason, rbd_id, record['failures']))
+        elif attempt >= self.max_attempts:
+            self.log.warning("%s failed, %s. %s attempts reach max attempts."
+                             % (task.name, reason, attempt))
+        else:
+            delay = self.get_delay(attempt)
+            self.delayed.append([time.time() + delay, task])
+            self.log.warning("%s failed, %s. retry attempt %s after %.1f seconds."
+                             % (task.name, reason, attempt + 1, delay))
+            return True
+
+        record['failures'] += 1
+        return False
+
+    def get_wait_time(self, now=None):
+        ''' seconds until next retry is due, None if nothing to retry '''
+        if len(self.delayed) == 0:
+            return None
+        if now is None:
+            now = time.time()
+        return max(min([due for due, task in self.delayed]) - now, 0)
+
+    def pop_due(self, now=None):
+        ''' return tasks due to retry, they are reset to submit again '''
+        if now is None:
+            now = time.time()
+        due_tasks = [task for due, task in self.delayed if due <= now]
+        self.delayed = [[due, task] for due, task in self.delayed if due > now]
+        for task in due_tasks:
+            task.reset()
+        return due_tasks
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# space usage of backup directory without du, df and find commands.
+# allocated bytes of a file is st_blocks * 512, so sparse export file is
+# counted as its real usage. usage is kept per generation of each RBD and
+# stored in metafile, it is updated when a generation is exported or
+# deleted, the whole backup tree is walked only if the metafile is missing.
+
+import os
+import stat
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # pip install scandir
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def _scan(path):
+    ''' yield (entry path, is directory, lstat of entry or None for directory) '''
+    if scandir is not None:
+        for entry in scandir(path):
+            if entry.is_dir(follow_symlinks=False):
+                yield entry.path, True, None
+            else:
+                yield entry.path, False, entry.stat(follow_symlinks=False)
+    else:
+        for name in os.listdir(path):
+            entry_path = os.path.join(path, name)
+            entry_stat = os.lstat(entry_path)
+            if stat.S_ISDIR(entry_stat.st_mode):
+                yield entry_path, True, None
+            else:
+                yield entry_path, False, entry_stat
+
+
+def walk(path):
+    ''' yield (entry path, is directory, lstat) of all entries under path '''
+    pending = [path]
+    while len(pending) != 0:
+        for entry_path, is_dir, entry_stat in _scan(pending.pop()):
+            if is_dir:
+                pending.append(entry_path)
+            yield entry_path, is_dir, entry_stat
+
+
+def get_allocated_size(path):
+    ''' allocated bytes of files under path, or of the file '''
+    if os.path.isfile(path):
+        return os.lstat(path).st_blocks * 512
+    if not os.path.isdir(path):
+        return 0
+    allocated = 0
+    for entry_path, is_dir, entry_stat in walk(path):
+        if not is_dir:
+            allocated += entry_stat.st_blocks * 512
+    return allocated
+
+
+def get_available_size(path):
+    ''' bytes available to unprivileged user in file system of path '''
+    fs_stat = os.statvfs(path)
+    return fs_stat.f_bavail * fs_stat.f_frsize
+
+
+# usage of backup files in cluster directory of backup path
+# {pool name: {rbd name: {generation: allocated bytes, ...}, ...}, ...}
+class SpaceAccount(object):
+    def __init__(self, log, path):
+        self.log = log
+        self.path = path
+        self.usage = {}
+
+    def load(self, usage):
+        ''' set usage read from metafile '''
+        try:
+            self.usage = {}
+            for pool_name, rbd_usage in usage.iteritems():
+                self.usage[pool_name] = {}
+                for rbd_name, generation_usage in rbd_usage.iteritems():
+                    self.usage[pool_name][rbd_name] = dict(generation_usage)
+            return True
+        except Exception as e:
+            self.log.error("unable to load space usage. %s" % e)
+            return False
+
+    def scan(self):
+        ''' walk the whole backup tree, {path}/{pool}/{rbd}/{generation} '''
+        try:
+            self.log.info("scan space usage of backup files in %s" % self.path)
+            self.usage = {}
+            for pool_path, is_dir, entry_stat in _scan(self.path):
+                # skip trash and other hidden directory
+                if not is_dir or os.path.basename(pool_path).startswith('.'):
+                    continue
+                pool_name = os.path.basename(pool_path)
+                for rbd_path, is_dir, entry_stat in _scan(pool_path):
+                    if not is_dir:
+                        continue
+                    rbd_name = os.path.basename(rbd_path)
+                    for generation_path, is_dir, entry_stat in _scan(rbd_path):
+                        if not is_dir:
+                            continue
+                        self._set(pool_name, rbd_name,
+                                  os.path.basename(generation_path),
+                                  get_allocated_size(generation_path))
+            return True
+        except Exception as e:
+            self.log.error("unable to scan space usage of %s. %s" % (self.path, e))
+            return False
+
+    def _set(self, pool_name, rbd_name, generation, allocated):
+        rbd_usage = self.usage.setdefault(pool_name, {}).setdefault(rbd_name, {})
+        rbd_usage[generation] = allocated
+
+    def update_generation(self, pool_name, rbd_name, generation):
+        ''' recount a generation after its backup files changed,
+            return allocated bytes of the generation
+        '''
+        try:
+            generation_path = os.path.join(self.path, pool_name, rbd_name, generation)
+            if not os.path.isdir(generation_path):
+                return self.remove_generation(pool_name, rbd_name, generation)
+
+            allocated = get_allocated_size(generation_path)
+            self._set(pool_name, rbd_name, generation, allocated)
+            self.log.debug("space usage of %s/%s/%s = %s bytes",
+                           pool_name, rbd_name, generation, allocated)
+            return allocated
+        except Exception as e:
+            self.log.error("unable to update space usage of %s/%s/%s. %s"
+                           % (pool_name, rbd_name, generation, e))
+            return False
+
+    def remove_generation(self, pool_name, rbd_name, generation):
+        ''' return allocated bytes of the removed generation '''
+        try:
+            if not self.usage.has_key(pool_name):
+                return 0
+            rbd_usage = self.usage[pool_name].get(rbd_name, {})
+            allocated = rbd_usage.pop(generation, 0)
+            if len(rbd_usage) == 0:
+                self.usage[pool_name].pop(rbd_name, None)
+            if len(self.usage[pool_name]) == 0:
+                self.usage.pop(pool_name)
+            return allocated
+        except Exception as e:
+            self.log.error("unable to remove space usage of %s/%s/%s. %s"
+                           % (pool_name, rbd_name, generation, e))
+            return False
+
+    def get_rbd_usage(self, pool_name, rbd_name):
+        ''' return {generation: allocated bytes, ...} of the RBD '''
+        return dict(self.usage.get(pool_name, {}).get(rbd_name, {}))
+
+    def get_rbd_used_size(self, pool_name, rbd_name):
+        if not self.usage.has_key(pool_name):
+            return 0
+        return sum(self.usage[pool_name].get(rbd_name, {}).values())
+
+    def get_used_size(self):
+        used = 0
+        for pool_name, rbd_usage in self.usage.iteritems():
+            for rbd_name in rbd_usage.keys():
+                used += self.get_rbd_used_size(pool_name, rbd_name)
+        return used
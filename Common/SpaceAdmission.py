@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+from Common.Constant import *
+
+
+# decide which RBD images to backup with the space available in backup
+# directory. output bytes of an image is predicted from its export history
+# instead of provisioned size:
+#   full backup: last full backup bytes
+#   incremental: highest change rate (bytes per second) of recent
+#                incrementals multiplied by seconds since last backup
+#   synthetic full: incremental plus full backup bytes
+# provisioned size is used if there is no history. if predicted bytes of
+# all images exceed the space, images are admitted by priority and the
+# rest is skipped instead of refusing the whole backup.
+#
+# history is {rbd id: [[timestamp, 'full' or 'diff', bytes], ...], ...}
+class SpaceAdmission(object):
+    def __init__(self, log, history=None,
+                            safety_factor=ADMISSION_SAFETY_FACTOR,
+                            reserve_bytes=0,
+                            history_count=ADMISSION_HISTORY_COUNT):
+        self.log = log
+        self.history = {}
+        self.safety_factor = float(safety_factor)
+        self.reserve_bytes = int(reserve_bytes)
+        self.history_count = int(history_count)
+
+        if history is not None:
+            for rbd_id, records in history.iteritems():
+                self.history[rbd_id] = [list(record) for record in records]
+
+    def record(self, rbd_id, export_type, output_bytes, timestamp=None):
+        ''' add output bytes of a completed export or synthetic full '''
+        if timestamp is None:
+            timestamp = time.time()
+        records = self.history.setdefault(rbd_id, [])
+        records.append([timestamp, export_type, int(output_bytes)])
+        del records[:-self.history_count]
+
+    def get_full_bytes(self, rbd_id):
+        ''' bytes of last full backup in history, None if no full backup '''
+        for timestamp, export_type, output_bytes in reversed(self.history.get(rbd_id, [])):
+            if export_type == EXPORT_TYP[FULL]:
+                return output_bytes
+        return None
+
+    def _get_diff_bytes(self, rbd_info, now):
+        records = self.history.get(rbd_info['id'], [])
+        if len(records) == 0:
+            return None
+
+        rates = []
+        for i in xrange(1, len(records)):
+            interval = records[i][0] - records[i - 1][0]
+            if records[i][1] == EXPORT_TYP[DIFF] and interval > 0:
+                rates.append(records[i][2] / float(interval))
+        if len(rates) != 0:
+            return int(max(rates) * max(now - records[-1][0], 0))
+
+        diff_bytes = [record[2] for record in records if record[1] == EXPORT_TYP[DIFF]]
+        if len(diff_bytes) != 0:
+            return max(diff_bytes)
+        return None
+
+    def predict(self, rbd_info, now=None):
+        ''' predicted bytes written to backup directory by backup of the RBD '''
+        if now is None:
+            now = time.time()
+        full_size = rbd_info['rbd_full_size']
+
+        full_bytes = self.get_full_bytes(rbd_info['id'])
+        if full_bytes is None:
+            full_bytes = full_size
+
+        if rbd_info['backup_type'] == FULL and rbd_info.get('synthetic_full_base') is None:
+            predicted = full_bytes
+        else:
+            diff_bytes = self._get_diff_bytes(rbd_info, now)
+            if diff_bytes is None:
+                diff_bytes = full_bytes
+            # change can not be larger than the image
+            predicted = min(diff_bytes, full_size)
+            if rbd_info['backup_type'] == FULL:
+                predicted += full_bytes
+
+        return int(predicted * self.safety_factor)
+
+    def admit(self, rbd_info_list, available_bytes, reclaimable_bytes=0, now=None):
+        ''' return (admitted rbd info list, rejected rbd info list).
+            rbd_info['predicted_bytes'] is set to each RBD info.
+        '''
+        if now is None:
+            now = time.time()
+        budget = available_bytes + reclaimable_bytes - self.reserve_bytes
+
+        for rbd_info in rbd_info_list:
+            rbd_info['predicted_bytes'] = self.predict(rbd_info, now)
+        total_predicted = sum([rbd_info['predicted_bytes'] for rbd_info in rbd_info_list])
+
+        self.log.info("space admission, predicted = %s bytes, available = %s bytes, "
+                      "reclaimable = %s bytes, reserve = %s bytes"
+                      % (total_predicted, available_bytes, reclaimable_bytes, self.reserve_bytes))
+        if total_predicted <= budget:
+            return list(rbd_info_list), []
+
+        # higher priority first, then incremental, then smaller output first,
+        # so most images can be admitted within the space.
+        ranked = sorted(rbd_info_list,
+                        key=lambda k: (-k.get('priority', 0),
+                                       k['backup_type'] != DIFF,
+                                       k['predicted_bytes']))
+        admitted = []
+        rejected = []
+        for rbd_info in ranked:
+            if rbd_info['predicted_bytes'] <= budget:
+                budget -= rbd_info['predicted_bytes']
+                admitted.append(rbd_info)
+            else:
+                rejected.append(rbd_info)
+
+        # keep order of the list
+        admitted_ids = [rbd_info['id'] for rbd_info in admitted]
+        admitted = [rbd_info for rbd_info in rbd_info_list if rbd_info['id'] in admitted_ids]
+        return admitted, rejected
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import mmap
+import time
+import struct
+
+from Common.Constant import *
+
+
+# header: magic, slot count, pid of manager process, created timestamp
+HEADER_FORMAT = '<8sIId'
+HEADER_SIZE = 32
+BOARD_MAGIC = 'RBDSTAT1'
+
+# slot: sequence, pid, state, task id, bytes done, tasks done,
+#       heartbeat timestamp, task start timestamp, worker name
+SLOT_FORMAT = '<IiiqqIdd16s'
+SLOT_SIZE = 64
+SLOT_FIELDS = ['pid', 'state', 'task_id', 'bytes_done', 'tasks_done',
+               'heartbeat', 'task_start', 'name']
+
+
+# fixed size board in shared memory, a slot per worker. each worker is the
+# only writer of its slot, a sequence number makes read of a slot
+# consistent without lock (seqlock): writer sets it odd before and even
+# after the update, reader retries if it is odd or changed during read.
+# the board is a file under /run/shm if path is given so other processes
+# can read it, otherwise anonymous memory shared with forked workers.
+class StatusBoard(object):
+    def __init__(self, slot_count, path=None, create=True):
+        self.slot_count = int(slot_count)
+        self.path = path
+        self.size = HEADER_SIZE + SLOT_SIZE * self.slot_count
+
+        if path is None:
+            self.mm = mmap.mmap(-1, self.size, mmap.MAP_SHARED)
+        elif create:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0644)
+            try:
+                os.ftruncate(fd, self.size)
+                self.mm = mmap.mmap(fd, self.size, mmap.MAP_SHARED)
+            finally:
+                os.close(fd)
+        else:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                self.mm = mmap.mmap(fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+            finally:
+                os.close(fd)
+
+        if create:
+            struct.pack_into(HEADER_FORMAT, self.mm, 0, BOARD_MAGIC,
+                             self.slot_count, os.getpid(), time.time())
+        else:
+            magic, self.slot_count, pid, created = self.get_header()
+            if magic != BOARD_MAGIC:
+                raise ValueError("%s is not a status board" % path)
+
+    def get_header(self):
+        return struct.unpack_from(HEADER_FORMAT, self.mm, 0)
+
+    def _offset(self, slot):
+        if slot < 0 or slot >= self.slot_count:
+            raise IndexError("status board slot %s out of range" % slot)
+        return HEADER_SIZE + SLOT_SIZE * slot
+
+    def _read_slot(self, offset):
+        values = struct.unpack_from(SLOT_FORMAT, self.mm, offset)
+        return values[0], list(values[1:])
+
+    def update(self, slot, **fields):
+        ''' called by the worker of the slot only '''
+        offset = self._offset(slot)
+        seq, values = self._read_slot(offset)
+        for name, value in fields.iteritems():
+            values[SLOT_FIELDS.index(name)] = value
+        if not fields.has_key('heartbeat'):
+            values[SLOT_FIELDS.index('heartbeat')] = time.time()
+
+        struct.pack_into('<I', self.mm, offset, (seq + 1) & 0xffffffff)
+        struct.pack_into(SLOT_FORMAT, self.mm, offset, (seq + 1) & 0xffffffff, *values)
+        struct.pack_into('<I', self.mm, offset, (seq + 2) & 0xffffffff)
+
+    def read(self, slot, retry=100):
+        ''' return dict of slot fields, None if the slot kept changing '''
+        offset = self._offset(slot)
+        for i in xrange(retry):
+            seq, values = self._read_slot(offset)
+            if seq % 2 == 1:
+                continue
+            if struct.unpack_from('<I', self.mm, offset)[0] != seq:
+                continue
+            slot_status = dict(zip(SLOT_FIELDS, values))
+            slot_status['name'] = slot_status['name'].rstrip('\0')
+            return slot_status
+        return None
+
+    def read_all(self):
+        return [self.read(slot) for slot in xrange(self.slot_count)]
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
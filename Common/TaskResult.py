@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+
+from Common.Constant import *
+
+
+def _truncate(value, max_bytes):
+    if isinstance(value, basestring) and len(value) > max_bytes:
+        return value[:max_bytes]
+    return value
+
+
+# result of a finished task sent from worker to manager instead of the task
+# object. fields are fixed, task class lists its own changed attributes in
+# result_attrs. output larger than max bytes is truncated, and written to
+# a file under spill path if the path is given.
+class TaskResult(object):
+    __slots__ = ['task_id',
+                 'worker_name',
+                 'task_status',
+                 'start_timestamp',
+                 'complete_timestamp',
+                 'elapsed_time',
+                 'cmd',
+                 'cmd_pid',
+                 'output',
+                 'return_code',
+                 'output_size',
+                 'spill_path',
+                 'stderr',
+                 'error',
+                 'resource',
+                 'has_result',
+                 'attrs']
+
+    def __init__(self, task=None, max_bytes=MAX_TASK_OUTPUT_BYTES, spill_path=None):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        if task is not None:
+            self._read_task(task, max_bytes, spill_path)
+
+    def __getstate__(self):
+        return tuple([getattr(self, name) for name in self.__slots__])
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def _spill(self, task_id, output, spill_path):
+        if not os.path.isdir(spill_path):
+            os.makedirs(spill_path)
+        path = os.path.join(spill_path, "task-%s.out" % task_id)
+        with open(path, 'wb') as f:
+            f.write(output)
+        return path
+
+    def _read_task(self, task, max_bytes, spill_path):
+        self.task_id = task.task_id
+        self.worker_name = task.worker_name
+        self.task_status = task.task_status
+        self.start_timestamp = task.start_timestamp
+        self.complete_timestamp = task.complete_timestamp
+        self.elapsed_time = task.elapsed_time
+        self.cmd = _truncate(task.cmd, max_bytes)
+        self.cmd_pid = task.cmd_pid
+        self.resource = task.resource
+        self.has_result = len(task.result) != 0
+        self.attrs = tuple([getattr(task, name, None) for name in task.result_attrs])
+
+        # output of command task is (stdout, return code)
+        output = task.output
+        if isinstance(output, tuple) and len(output) == 2:
+            output, self.return_code = output
+        if not isinstance(output, (basestring, bool, int, long, float, type(None))):
+            output = str(output)
+        if isinstance(output, basestring):
+            self.output_size = len(output)
+            if len(output) > max_bytes and spill_path is not None:
+                self.spill_path = self._spill(task.task_id, output, spill_path)
+        self.output = _truncate(output, max_bytes)
+
+        self.stderr = _truncate(task.stderr, max_bytes)
+        error = task.error
+        if error is not None and not isinstance(error, basestring):
+            error = str(error)
+        self.error = _truncate(error, max_bytes)
+
+    def apply_to(self, task):
+        ''' set result to the task object of manager '''
+        task.worker_name = self.worker_name
+        task.task_status = self.task_status
+        task.start_timestamp = self.start_timestamp
+        task.complete_timestamp = self.complete_timestamp
+        task.elapsed_time = self.elapsed_time
+        task.cmd = self.cmd
+        task.cmd_pid = self.cmd_pid
+        task.stderr = self.stderr
+        task.error = self.error
+        task.resource = self.resource
+        task.output_spill_path = self.spill_path
+        if self.return_code is not None:
+            task.output = (self.output, self.return_code)
+        else:
+            task.output = self.output
+
+        for name, value in zip(task.result_attrs, self.attrs):
+            setattr(task, name, value)
+        if self.has_result:
+            task._set_result()
+        return task
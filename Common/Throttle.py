@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+# limit rate of bytes processed, caller reports processed bytes and
+# is put to sleep when it runs ahead of the rate.
+class Throttle(object):
+    def __init__(self, bytes_per_second=0):
+        self.bytes_per_second = float(bytes_per_second)
+
+        self.start_timestamp = None
+        self.total_bytes = 0
+
+    def set_rate(self, bytes_per_second):
+        # restart accounting, so the new rate apply from now on
+        self.bytes_per_second = float(bytes_per_second)
+        self.start_timestamp = None
+        self.total_bytes = 0
+
+    def consume(self, size):
+        if self.bytes_per_second <= 0:
+            return 0
+
+        now = time.time()
+        if self.start_timestamp is None:
+            self.start_timestamp = now
+
+        self.total_bytes += size
+        expected_time = self.total_bytes / self.bytes_per_second
+        sleep_time = expected_time - (now - self.start_timestamp)
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+            return sleep_time
+        return 0
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+
+from collections import OrderedDict
+
+
+# analyze spans of a backup run written by Tracer.
+#   critical path, chain of stages and tasks that determined run duration
+#   worker utilization, busy time of each worker in stages having tasks
+#   idle gaps, time a worker waited or rested while tasks of the stage remain
+class TraceAnalyzer(object):
+    def __init__(self, trace_file_path):
+        self.trace_file_path = trace_file_path
+
+        self.trace_ids = []    # trace id in order of appearance in file
+        self.spans = {}        # {trace id: [span record, ...], ...}
+
+    def read(self):
+        try:
+            with open(self.trace_file_path, 'r') as trace_file:
+                for line in trace_file:
+                    line = line.strip()
+                    if line == '':
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # last line may be partially written if run was killed
+                        continue
+                    trace_id = record.get('trace')
+                    if not self.spans.has_key(trace_id):
+                        self.trace_ids.append(trace_id)
+                        self.spans[trace_id] = []
+                    self.spans[trace_id].append(record)
+            return True
+        except Exception as e:
+            print("Error, unable to read trace file %s. %s" % (self.trace_file_path, e))
+            return False
+
+    def get_run(self, trace_id=None):
+        ''' return (run span, [stage span, ...], {stage span id: [task span, ...]})
+            of the trace, last trace in file if trace_id is None.
+        '''
+        if trace_id is None:
+            if len(self.trace_ids) == 0:
+                return False
+            trace_id = self.trace_ids[-1]
+        if not self.spans.has_key(trace_id):
+            return False
+
+        spans = self.spans[trace_id]
+        run = None
+        stages = []
+        tasks = {}
+        for span in spans:
+            if span['kind'] == 'run':
+                run = span
+            elif span['kind'] == 'stage':
+                stages.append(span)
+
+        # task is child of stage span or step span inside the stage
+        stage_ids = set([stage['span'] for stage in stages])
+        parents = dict([(span['span'], span.get('parent')) for span in spans])
+        for span in spans:
+            if span['kind'] != 'task':
+                continue
+            parent = span.get('parent')
+            while parent is not None and parent not in stage_ids:
+                parent = parents.get(parent)
+            tasks.setdefault(parent, []).append(span)
+
+        stages.sort(key=lambda span: span['start'])
+        for stage_tasks in tasks.values():
+            stage_tasks.sort(key=lambda span: span['dequeue'])
+
+        # run span is missing if backup process was killed
+        if run is None and len(stages) != 0:
+            run = {'trace': trace_id, 'name': 'backup_run', 'kind': 'run',
+                   'start': stages[0]['start'],
+                   'end': max([span['end'] for span in spans]),
+                   'status': 'unfinished'}
+        return run, stages, tasks
+
+    def get_critical_path(self, stages, tasks):
+        ''' stages run one after another, the critical path of a stage is the
+            task ended last and tasks that kept its worker busy before it
+            was dequeued. return list of (segment, name, start, end).
+        '''
+        path = []
+        for stage in stages:
+            stage_tasks = tasks.get(stage['span'], [])
+            if len(stage_tasks) == 0:
+                path.append(('stage', stage['name'], stage['start'], stage['end']))
+                continue
+
+            chain = []
+            task = max(stage_tasks, key=lambda span: span['end'])
+            while task is not None:
+                chain.insert(0, task)
+                blocker = None
+                # task waited in queue, it was blocked by previous task of its worker
+                if task['dequeue'] > task['enqueue']:
+                    for other in stage_tasks:
+                        if other['worker'] != task['worker'] or other is task:
+                            continue
+                        if other['end'] > task['dequeue']:
+                            continue
+                        if other['end'] < task['enqueue']:
+                            continue
+                        if blocker is None or other['end'] > blocker['end']:
+                            blocker = other
+                task = blocker
+
+            name = stage['name']
+            path.append(('submit', name, stage['start'], chain[0]['enqueue']))
+            previous = None
+            for task in chain:
+                if previous is None:
+                    path.append(('queue', task['name'], task['enqueue'], task['dequeue']))
+                else:
+                    path.append(('rest', task['worker'], previous['end'], task['dequeue']))
+                path.append(('setup', task['name'], task['dequeue'], task['start']))
+                path.append(('execute', task['name'], task['start'], task['end']))
+                previous = task
+            path.append(('collect', name, chain[-1]['end'], stage['end']))
+
+        return [segment for segment in path if segment[3] - segment[2] > 0]
+
+    def get_worker_usage(self, stages, tasks):
+        ''' return {worker: {busy, window, utilization, task_count}} where
+            window is total duration of stages which have tasks.
+        '''
+        window = sum([stage['end'] - stage['start'] for stage in stages
+                      if len(tasks.get(stage['span'], [])) != 0])
+        usage = OrderedDict()
+        for stage in stages:
+            for task in tasks.get(stage['span'], []):
+                worker = usage.setdefault(task['worker'], {'busy': 0, 'task_count': 0})
+                worker['busy'] += task['end'] - task['dequeue']
+                worker['task_count'] += 1
+
+        for worker in usage.values():
+            worker['window'] = window
+            worker['utilization'] = worker['busy'] / window if window > 0 else 0
+        return usage
+
+    def get_idle_gaps(self, stages, tasks, min_gap=1.0):
+        ''' return list of (gap seconds, worker, stage name, start, end) of
+            idle time of workers within stages having tasks.
+        '''
+        gaps = []
+        for stage in stages:
+            stage_tasks = tasks.get(stage['span'], [])
+            if len(stage_tasks) == 0:
+                continue
+            workers = OrderedDict()
+            for task in stage_tasks:
+                workers.setdefault(task['worker'], []).append(task)
+
+            for worker, worker_tasks in workers.iteritems():
+                idle_start = stage['start']
+                for task in worker_tasks:
+                    gaps.append((task['dequeue'] - idle_start, worker, stage['name'],
+                                 idle_start, task['dequeue']))
+                    idle_start = task['end']
+                gaps.append((stage['end'] - idle_start, worker, stage['name'],
+                             idle_start, stage['end']))
+
+        gaps = [gap for gap in gaps if gap[0] >= min_gap]
+        gaps.sort(reverse=True)
+        return gaps
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os, time, json
+
+from contextlib import contextmanager
+from threading import Lock
+
+
+# span tracing of backup run, each finished span is appended as one JSON line
+# to trace file. workers are forked from the backup process and append their
+# task spans to the same file, a line is written with a single write() on a
+# O_APPEND file descriptor so lines of processes are not interleaved.
+#
+# span record:
+#   {"trace": trace id, "span": span id, "parent": parent span id,
+#    "kind": "run" | "stage" | "step" | "task", "name": span name,
+#    "start": timestamp, "end": timestamp, "pid": process id, ...attributes}
+#
+# task span has additional "enqueue", "dequeue" and "worker" attributes.
+class Tracer(object):
+    def __init__(self, trace_id, path=None):
+        self.trace_id = trace_id
+        self.path = None
+        self.fd = None
+        self.fd_pid = None
+        self.lock = Lock()
+
+        self.pid = os.getpid()
+        self.span_count = 0
+        self.stack = []       # open spans of this process, [(span id, record), ...]
+        self.pending = []     # finished spans before trace file is set
+
+        if path is not None:
+            self.set_path(path)
+
+    def set_path(self, path):
+        ''' set trace file path, spans finished before are written to it.
+            empty path disables tracing.
+        '''
+        self.path = path if path else None
+        pending = self.pending
+        self.pending = []
+        if self.path is not None and os.getpid() == self.pid:
+            for record in pending:
+                self._write(record)
+        return True
+
+    def _open(self):
+        # reopen file descriptor in forked worker process
+        if self.fd is None or self.fd_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory != '' and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+            self.fd_pid = os.getpid()
+        return self.fd
+
+    def _write(self, record):
+        if self.path is None:
+            if os.getpid() == self.pid:
+                self.pending.append(record)
+            return
+        try:
+            line = json.dumps(record, sort_keys=True) + '\n'
+            with self.lock:
+                os.write(self._open(), line)
+        except Exception as e:
+            # tracing must not break backup
+            print("unable to write trace record. %s" % e)
+
+    def _new_span_id(self):
+        with self.lock:
+            self.span_count += 1
+            return "%s-%s" % (os.getpid(), self.span_count)
+
+    def current_span_id(self):
+        if len(self.stack) == 0:
+            return None
+        return self.stack[-1][0]
+
+    def start_span(self, name, kind='stage', **attributes):
+        span_id = self._new_span_id()
+        record = dict(attributes)
+        record.update({'trace': self.trace_id,
+                       'span': span_id,
+                       'parent': self.current_span_id(),
+                       'kind': kind,
+                       'name': name,
+                       'start': time.time(),
+                       'pid': os.getpid()})
+        self.stack.append((span_id, record))
+        return span_id
+
+    def end_span(self, span_id=None, **attributes):
+        ''' end the span and spans opened after it, end the latest span if
+            span_id is None.
+        '''
+        if len(self.stack) == 0:
+            return False
+        if span_id is None:
+            span_id = self.stack[-1][0]
+        if span_id not in [open_span_id for open_span_id, record in self.stack]:
+            return False
+
+        now = time.time()
+        while len(self.stack) != 0:
+            open_span_id, record = self.stack.pop()
+            record['end'] = now
+            if open_span_id == span_id:
+                record.update(attributes)
+                self._write(record)
+                break
+            record['status'] = 'unfinished'
+            self._write(record)
+        return True
+
+    def end_all(self, **attributes):
+        if len(self.stack) != 0:
+            return self.end_span(self.stack[0][0], **attributes)
+        return True
+
+    @contextmanager
+    def span(self, name, kind='step', **attributes):
+        span_id = self.start_span(name, kind=kind, **attributes)
+        try:
+            yield span_id
+        finally:
+            self.end_span(span_id)
+
+    def record_task(self, task, worker_name, dequeue_timestamp, end_timestamp, status):
+        ''' write span of a task executed by worker. task start time is set
+            when its command starts, use dequeue time if it is not set.
+        '''
+        start_timestamp = task.start_timestamp or dequeue_timestamp
+        enqueue_timestamp = getattr(task, 'submit_timestamp', 0) or dequeue_timestamp
+        self._write({'trace': self.trace_id,
+                     'span': self._new_span_id(),
+                     'parent': getattr(task, 'trace_parent', None),
+                     'kind': 'task',
+                     'name': task.name,
+                     'type': task.__class__.__name__,
+                     'worker': worker_name,
+                     'enqueue': enqueue_timestamp,
+                     'dequeue': dequeue_timestamp,
+                     'start': start_timestamp,
+                     'end': end_timestamp,
+                     'status': status,
+                     'pid': os.getpid()})
+
+    def close(self):
+        self.end_all()
+        if self.fd is not None and self.fd_pid == os.getpid():
+            os.close(self.fd)
+        self.fd = None
+        return True
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from threading import Thread, Event, Lock
+
+from Common.Constant import *
+from Common import SpaceAccount
+
+
+# expired backup generation is renamed into trash directory at once, a
+# background thread reclaims its space later. a large file is truncated
+# down step by step before unlink, so file system frees extents in small
+# transactions, small files are unlinked in batches. freed bytes per
+# second are limited to not compete with running exports.
+# trash left by previous run is reclaimed when the thread starts.
+class Trash(object):
+    def __init__(self, log, path, reclaim_rate=0,
+                                  truncate_step=TRASH_TRUNCATE_STEP,
+                                  unlink_batch=TRASH_UNLINK_BATCH):
+        self.log = log
+        self.path = os.path.join(path, TRASH_DIRNAME)
+        self.reclaim_rate = int(reclaim_rate)      # bytes per second, 0 is no limit
+        self.truncate_step = int(truncate_step)
+        self.unlink_batch = int(unlink_batch)
+
+        self.thread = None
+        self.stopping = Event()
+        self.wakeup = Event()
+        self.lock = Lock()
+
+        self.moved_count = 0
+        self.reclaimed_count = 0
+        self.reclaimed_bytes = 0
+
+        # start time and bytes freed of rate limit window
+        self.window_start = 0
+        self.window_bytes = 0
+
+    def move(self, path, name):
+        ''' rename path into trash, return path in trash '''
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            trash_path = os.path.join(self.path, "%s.%s" % (name, time.time()))
+            os.rename(path, trash_path)
+
+            with self.lock:
+                self.moved_count += 1
+            self.wakeup.set()
+            self.log.info("moved %s to trash %s" % (path, trash_path))
+            return trash_path
+        except Exception as e:
+            self.log.error("unable to move %s to trash. %s" % (path, e))
+            return False
+
+    def start(self):
+        try:
+            self.thread = Thread(target=self._run, name='TrashReclaimer')
+            self.thread.daemon = True
+            self.thread.start()
+            self.log.info("start trash reclaimer, path = %s, rate = %s bytes/s"
+                          % (self.path, self.reclaim_rate))
+            return True
+        except Exception as e:
+            self.log.error("unable to start trash reclaimer. %s" % e)
+            return False
+
+    def stop(self, wait_seconds=0):
+        ''' wait reclaimer to empty the trash for wait seconds, then stop it.
+            rest of trash is reclaimed by next run.
+        '''
+        try:
+            if self.thread is None:
+                return True
+
+            deadline = time.time() + float(wait_seconds)
+            while self.thread.is_alive() and time.time() < deadline:
+                if self.get_pending_count() == 0:
+                    break
+                time.sleep(0.5)
+
+            self.stopping.set()
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+
+            self.log.info("stop trash reclaimer, reclaimed %s entries, %s bytes, "
+                          "%s entries pending." % (self.reclaimed_count,
+                                                   self.reclaimed_bytes,
+                                                   self.get_pending_count()))
+            return True
+        except Exception as e:
+            self.log.error("unable to stop trash reclaimer. %s" % e)
+            return False
+
+    def get_pending_bytes(self):
+        ''' allocated bytes in trash, freed while backup is running '''
+        return SpaceAccount.get_allocated_size(self.path)
+
+    def get_reclaimable_bytes(self, seconds):
+        ''' pending bytes which can be freed in the seconds at reclaim rate '''
+        pending_bytes = self.get_pending_bytes()
+        if self.reclaim_rate <= 0:
+            return pending_bytes
+        return min(pending_bytes, int(self.reclaim_rate * max(seconds, 0)))
+
+    def get_pending_count(self):
+        if not os.path.isdir(self.path):
+            return 0
+        return len(os.listdir(self.path))
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.wakeup.clear()
+            try:
+                if os.path.isdir(self.path):
+                    for name in sorted(os.listdir(self.path)):
+                        if self.stopping.is_set():
+                            break
+                        self._reclaim(os.path.join(self.path, name))
+            except Exception as e:
+                self.log.error("trash reclaimer error. %s" % e)
+            self.wakeup.wait(TRASH_RECLAIM_INTERVAL)
+
+    def _throttle(self, freed_bytes):
+        ''' sleep so freed bytes per second does not exceed reclaim rate '''
+        if self.reclaim_rate <= 0:
+            return
+        now = time.time()
+        if now - self.window_start >= 1:
+            self.window_start = now
+            self.window_bytes = 0
+        self.window_bytes += freed_bytes
+        ahead = self.window_bytes / float(self.reclaim_rate) - (now - self.window_start)
+        if ahead > 0:
+            self.stopping.wait(ahead)
+
+    def _truncate(self, path, allocated):
+        ''' truncate file down by steps, return False if stopping '''
+        with open(path, 'r+b') as f:
+            size = os.fstat(f.fileno()).st_size
+            while size > self.truncate_step:
+                if self.stopping.is_set():
+                    return False
+                size -= self.truncate_step
+                f.truncate(size)
+                # sparse file frees allocated extents only
+                freed = min(self.truncate_step, allocated)
+                allocated -= freed
+                self._throttle(freed)
+        return True
+
+    def _reclaim(self, trash_path):
+        ''' delete files of an entry in trash, deepest directory first '''
+        if not os.path.isdir(trash_path):
+            file_list = [(trash_path, os.lstat(trash_path))]
+            directory_list = []
+        else:
+            file_list = []
+            directory_list = []
+            for root, dirs, files in os.walk(trash_path, topdown=False):
+                for name in files:
+                    file_path = os.path.join(root, name)
+                    file_list.append((file_path, os.lstat(file_path)))
+                directory_list.append(root)
+
+        # rate is checked once per batch of unlink
+        batch_bytes = 0
+        for i, (file_path, file_stat) in enumerate(file_list):
+            if self.stopping.is_set():
+                return False
+            allocated = file_stat.st_blocks * 512
+            if file_stat.st_size > self.truncate_step:
+                if not self._truncate(file_path, allocated):
+                    return False
+                allocated = min(allocated, self.truncate_step)
+            os.unlink(file_path)
+            self.reclaimed_bytes += file_stat.st_blocks * 512
+
+            batch_bytes += allocated
+            if (i + 1) % self.unlink_batch == 0:
+                self._throttle(batch_bytes)
+                batch_bytes = 0
+        self._throttle(batch_bytes)
+
+        for directory_path in directory_list:
+            os.rmdir(directory_path)
+
+        self.reclaimed_count += 1
+        self.log.debug("reclaimed trash %s, %s files", trash_path, len(file_list))
+        return True
@@ -5,13 +5,16 @@ import subprocess
 import signal
 import time
 
+from Queue import Empty
 from multiprocessing import Process, Queue, JoinableQueue
 from Common.Constant import *
+from Common.TaskResult import TaskResult
 
 
 # worker to execute rbd export task
 class Worker(Process):
-    def __init__(self, log, task_queue, finish_queue, rest_time, stop_task=None):
+    def __init__(self, log, task_queue, finish_queue, rest_time, stop_task=None, tracer=None,
+                 output_spill_path=None, status_board=None, slot=0):
 
         Process.__init__(self)
         self.log = log
@@ -20,6 +23,10 @@ class Worker(Process):
 
         self.rest_time = rest_time
         self.stop_task = stop_task
+        self.tracer = tracer
+        self.output_spill_path = output_spill_path
+        self.status_board = status_board    # publish status to the slot of board
+        self.slot = slot
         self.stage = None
         self.task_get_count = 0
         self.task_done_count = 0
@@ -29,38 +36,79 @@ class Worker(Process):
         self.log.info("%s initialized, rest time %s seconds, status %s." %
                       (self.name, self.rest_time, self.status))
 
+    def _set_status(self, status, **fields):
+        self.status = status
+        if self.status_board is not None:
+            self.status_board.update(self.slot, state=status, **fields)
+
+    def _set_progress(self, bytes_done):
+        ''' progress callback of task '''
+        if self.status_board is not None:
+            self.status_board.update(self.slot, bytes_done=bytes_done)
+
+    def _get_task(self):
+        ''' wait for new task, heartbeat is updated while waiting '''
+        while True:
+            try:
+                return self.task_queue.get(timeout=STATUS_HEARTBEAT_INTERVAL)
+            except Empty:
+                self._set_status(WAIT)
+
     def run(self):
         pid = str(self.pid)
+        self._set_status(READY, pid=self.pid, name=self.name[:16])
 
         while True:
             #self.log.set_stage(self.stage)
 
+            task = None
+            dequeue_timestamp = 0
+            task_done = False       # task_done() of the task is called
+            result_put = False      # result of the task is in finish queue
             try:
-                self.status = WAIT
+                self._set_status(WAIT)
                 self.log.debug("%s (pid = %s) is waiting for new task." % (self.name, pid))
-                task = self.task_queue.get()
+                task = self._get_task()
+                dequeue_timestamp = time.time()
 
                 if task is self.stop_task:
-                    self.status = STOP
+                    self._set_status(STOP)
                     self.task_queue.task_done()
                     break
 
-                self.status = RUN
+                self._set_status(RUN, task_id=task.task_id, bytes_done=0,
+                                 task_start=dequeue_timestamp)
                 self.task_get_count += 1
                 self.log.debug("%s is executing task. task name = %s" % (self.name, task))
+                task.progress_callback = self._set_progress
                 result = task.execute(self.name)
+                task.progress_callback = None
 
                 self.log.debug("%s completed task. task name = %s" %(self.name, task))
+                if self.tracer is not None:
+                    self.tracer.record_task(task, self.name, dequeue_timestamp,
+                                            time.time(), TASK_STAT[task.task_status])
                 self.task_queue.task_done()
-                self.finish_queue.put(task)
+                task_done = True
+                self.finish_queue.put(TaskResult(task, spill_path=self.output_spill_path))
+                result_put = True
 
                 self.task_done_count += 1
-                self.status = REST
+                self._set_status(REST, tasks_done=self.task_done_count)
                 time.sleep(self.rest_time)
 
             except Exception as e:
                 self.log.error("%s could not execute task. task name = %s, %s" %(self.name, task, e))
-                self.finish_queue.put(task)
+                if self.tracer is not None and task is not None:
+                    self.tracer.record_task(task, self.name, dequeue_timestamp,
+                                            time.time(), 'exception')
+                if task is not None and not task_done:
+                    self.task_queue.task_done()
+                if task is not None and not result_put:
+                    # failure is classified and retried by manager side
+                    task.task_status = ERROR
+                    task.error = "worker exception. %s" % e
+                    self.finish_queue.put(TaskResult(task, spill_path=self.output_spill_path))
                 # move on next task...
                 continue
 
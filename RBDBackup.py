@@ -21,15 +21,51 @@ from Common.Pool import Pool
 from Common.Config import RBDConfig
 from Common.Logger import Logger
 from Common.Manager import Manager
+from Common.EventLoopManager import EventLoopManager
 from Common.Directory import Directory
+from Common.SpaceAccount import SpaceAccount
+from Common.Trash import Trash
+from Common.SpaceAdmission import SpaceAdmission
+from Common.BackupPolicy import BackupPolicy
+from Common.FullBackupPlanner import FullBackupPlanner
+from Common.RetryQueue import RetryQueue
+from Common.BackupWindow import BackupWindow, update_throughput
+from Common.CommandRunner import run_command
+from Common.ResourceDispatcher import parse_limits
+from Common.HealthSampler import HealthSampler
 from Common.Metafile import Metafile
 from Common.Yaml import Yaml
 from Common.OpenStack import OpenStack
+from Common.BackupChain import BackupChain
+from Common.BlockManifest import get_manifest_path
+from Common.DiffFile import DiffFile
+from Common.ExportCheckpoint import ExportCheckpoint
+from Common.Metrics import Metrics
+from Common.Tracer import Tracer
 
 
 from Task.RBDExportTask import RBDExportTask
 from Task.RBDSnapshotTask import RBDSnapshotTask
 from Task.RBDDiffTask import RBDDiffTask
+from Task.RBDSyntheticFullTask import RBDSyntheticFullTask
+from Task.RBDHashDiffTask import RBDHashDiffTask
+from Task.RBDManifestTask import RBDManifestTask
+from Task.RBDResumableExportTask import RBDResumableExportTask
+
+# metafiles written by backup, description is used in log
+METAFILE_DESCRIPTION = {BACKUP_INFO:                 "RBD backup info",
+                        RBD_INFO_LIST:               "RBD backup info list",
+                        RBD_SNAPSHOT_MAINTAIN_LIST:  "RBD snapshot maintain list",
+                        RBD_BACKUP_CIRCULATION_LIST: "RBD backup circulation list",
+                        RBD_SPACE_USAGE:             "RBD space usage",
+                        RBD_EXPORT_HISTORY:          "RBD export history",
+                        RBD_FULL_BACKUP_PLAN:        "RBD full backup plan",
+                        RBD_UNCHANGED_LIST:          "unchanged RBD list",
+                        RBD_PENDING_EXPORT_LIST:     "pending export list",
+                        RBD_RETRY_HISTORY:           "RBD retry history",
+                        RBD_EXPORT_THROUGHPUT:       "RBD export throughput",
+                        RBD_DEFERRED_LIST:           "deferred RBD list",
+                        RBD_FULL_EXPORT_LIST:        "full export RBD list"}
 
 
 class RBDBackup(object):
@@ -57,6 +93,8 @@ class RBDBackup(object):
         self.create_snapshot_tasks = {}
         self.diff_tasks = {}    # currently not used.
         self.export_tasks = {}
+        self.synthetic_full_tasks = {}
+        self.deferred_snapshot_tasks = []   # snapshot remove tasks of deferred exports
 
         self.removed_snapshots = []
         self.deleted_backup = []
@@ -67,6 +105,10 @@ class RBDBackup(object):
         self.meta_rbd_backup_list = {}
 
         self.meta_rbd_info_list = {}
+        self.meta_rbd_pending_export_list = {}
+        self.meta_rbd_export_throughput = {}
+        self.meta_rbd_deferred_list = {}
+        self.meta_rbd_full_export_list = {}
 
         self.meta_network_usage = {}
         self.meta_disk_io_usage = {}
@@ -74,12 +116,59 @@ class RBDBackup(object):
 
         self.ceph = Ceph()
         self.manager = None
+        self.metrics = None
         self.backup_directory = None
         self.metafile = None
+        self.space_account = None
+        self.trash = None
+        self.admission = None
+        self.backup_policy = POLICY_WEEKDAY
+        self.policy = None
+        self.planner = None
+        self.full_backup_plan = None
+        self.retry_queue = None
+        self.backup_window = None
+
+        # spans of backup stages, written after trace file path is read
+        self.tracer = Tracer("%s-%s" % (self.backup_time.replace(' ', 'T'), os.getpid()))
+        self.stage_span_id = None
 
         self.openstck_mapping_enabled = False
         self.cache_clean_enabled = False
         self.monitor_enabled = False
+        self.backup_executor = EXECUTOR_PROCESS
+        self.dispatch_limits = {}
+        self.health_check_enabled = False
+        self.health_sampler = None
+        self.pool_device_class = {}
+        self.backup_task_timeout = 0
+        self.status_board_path = None
+        self.synthetic_full_enabled = False
+        self.skip_unchanged_enabled = False
+        self.hash_manifest_enabled = False
+        self.resumable_export_enabled = False
+        self.export_checkpoint_interval = EXPORT_CHECKPOINT_INTERVAL
+        self.export_chunk_size = EXPORT_CHUNK_SIZE
+        self.retry_max_attempts = RETRY_MAX_ATTEMPTS
+        self.retry_base_delay = RETRY_BASE_DELAY
+        self.retry_max_delay = RETRY_MAX_DELAY
+        self.retry_isolate_count = RETRY_ISOLATE_COUNT
+        self.backup_window_end = ''
+        self.backup_window_margin = 0
+        self.backup_window_bandwidth = WINDOW_DEFAULT_BANDWIDTH
+        self.unchanged_rbd_info_list = []
+        self.trash_reclaim_rate = 0
+        self.trash_truncate_step = TRASH_TRUNCATE_STEP
+        self.trash_finalize_wait = 0
+        self.admission_safety_factor = ADMISSION_SAFETY_FACTOR
+        self.admission_reserve_bytes = 0
+        self.admission_history_count = ADMISSION_HISTORY_COUNT
+
+    def trace_stage(self, stage_name):
+        ''' end span of previous stage and start span of the stage '''
+        if self.stage_span_id is not None:
+            self.tracer.end_span(self.stage_span_id)
+        self.stage_span_id = self.tracer.start_span(stage_name, kind='stage')
 
     def _get_rbd_id(self, pool_name, rbd_name):
         return "%s_%s_%s" % (self.ceph.cluster_name, pool_name, rbd_name)
@@ -103,12 +192,13 @@ class RBDBackup(object):
     def _initialize_logging(self, cfg, start_log_title='Start RBD Backup'):
         try:
             self.log = Logger(cfg)
+            self.log.set_logger(name='RBDBackup')
             self.log.blank_line(4)
             log_begin_line = " %s %s " %(start_log_title, self.backup_time)
             self.log.start_line(title="", symbol_count=40)
             self.log.start_line(title=log_begin_line, symbol_count=21)
             self.log.start_line(title="", symbol_count=40)
-            self.log.set_logger(name='RBDBackup')
+            self.log.info(("Logger initialized.", self.log.log_option_dict))
             return True
         except Exception as e:
             print("Error, fail to initialize logging. %s" % e)
@@ -134,7 +224,8 @@ class RBDBackup(object):
             # perform export diff between snapshots. check this snapshot exist
             # in cluster will performed later. if not found in cluster, do full backup
             self.log.info("read snapshot list from metafile %s" % RBD_SNAPSHOT_MAINTAIN_LIST)
-            meta_snapshot_list = self.metafile.read(RBD_SNAPSHOT_MAINTAIN_LIST)
+            with self.tracer.span('read_metafile', metafile=RBD_SNAPSHOT_MAINTAIN_LIST):
+                meta_snapshot_list = self.metafile.read(RBD_SNAPSHOT_MAINTAIN_LIST)
             if meta_snapshot_list is False:
                 self.log.warning("unable to read metafile %s. do full backup."
                                  % RBD_SNAPSHOT_MAINTAIN_LIST)
@@ -147,7 +238,8 @@ class RBDBackup(object):
             # in order to maintain continuous incremental backup file from a full backup
             # will check all incremental backup later
             self.log.info("read backup list from metafile %s" % RBD_BACKUP_CIRCULATION_LIST)
-            meta_backup_list = self.metafile.read(RBD_BACKUP_CIRCULATION_LIST)
+            with self.tracer.span('read_metafile', metafile=RBD_BACKUP_CIRCULATION_LIST):
+                meta_backup_list = self.metafile.read(RBD_BACKUP_CIRCULATION_LIST)
             if meta_backup_list is False:
                 self.log.warning("unable to read metafile %s. do full backup."
                                  % RBD_BACKUP_CIRCULATION_LIST)
@@ -159,6 +251,12 @@ class RBDBackup(object):
             if backup_type == FULL:
                 return backup_type
 
+            # backup type of each RBD is decided by policy later
+            if self.backup_policy in [POLICY_THRESHOLD, POLICY_STAGGER]:
+                self.log.info("backup type is decided by %s policy of each RBD."
+                              % self.backup_policy)
+                return DIFF
+
             # verifying backup type by weekdays
             if weekday in full_weekdays:
                 backup_type = FULL
@@ -189,7 +287,8 @@ class RBDBackup(object):
 
         def __set_pool(pool_name):
             try:
-                pool = Pool(self.log, self.ceph.cluster_name, pool_name, self.ceph.conffile)
+                with self.tracer.span('connect_pool', pool_name=pool_name):
+                    pool = Pool(self.log, self.ceph.cluster_name, pool_name, self.ceph.conffile)
                 if pool.connected is False:
                     self.log.error("unable to connect cluster pool %s" % pool_name)
                     return False
@@ -201,45 +300,111 @@ class RBDBackup(object):
                 self.log.error("unable to set pool %s" % (pool_name, e))
                 return False
 
+        def __get_synthetic_full_base(rbd_id, pool_name, rbd_name, snapshot_list):
+            ''' verify last snapshot and backup chain of last generation for
+                synthetic full backup. return (last snapshot name,
+                last backup name, backup chain) or False.
+            '''
+            if not self.meta_rbd_backup_list.has_key(rbd_id):
+                return False
+            if not self.meta_rbd_snapshot_list.has_key(rbd_id):
+                return False
+
+            backup_list = self.meta_rbd_backup_list[rbd_id]
+            snap_list = self.meta_rbd_snapshot_list[rbd_id]
+            if len(backup_list) == 0 or len(snap_list) == 0:
+                return False
+
+            last_backup_name = backup_list[-1]
+            last_snapshot_name = snap_list[-1]
+            if last_snapshot_name not in snapshot_list:
+                self.log.warning("last snapshot name %s not exist in cluster."
+                                 % last_snapshot_name)
+                return False
+
+            backup_chain = BackupChain(self.log, self.backup_directory.path, pool_name, rbd_name)
+            chain = backup_chain.get_chain(last_backup_name)
+            if chain is False:
+                return False
+
+            # the latest file of the chain must be backup of last snapshot,
+            # otherwise the incremental could not apply on top of the chain.
+            chain_snapshot = backup_chain.get_chain_snapshots(chain)[-1]
+            if chain_snapshot != last_snapshot_name:
+                self.log.warning("backup chain of %s ends at snapshot %s, "
+                                 "not last snapshot %s."
+                                 % (last_backup_name, chain_snapshot, last_snapshot_name))
+                return False
+
+            return last_snapshot_name, last_backup_name, chain
+
+        def __get_hash_manifest_base(pool_name, rbd_name, last_backup_name, last_snapshot_name):
+            ''' verify backup chain of last generation ends at last snapshot
+                and block manifest of last snapshot exists. return path of
+                the manifest or False.
+            '''
+            if last_backup_name is None:
+                return False
+
+            backup_chain = BackupChain(self.log, self.backup_directory.path, pool_name, rbd_name)
+            chain = backup_chain.get_chain(last_backup_name)
+            if chain is False:
+                return False
+            if backup_chain.get_chain_snapshots(chain)[-1] != last_snapshot_name:
+                return False
+
+            manifest_path = get_manifest_path(os.path.dirname(chain[-1]), last_snapshot_name)
+            if not os.path.exists(manifest_path):
+                self.log.warning("block manifest %s not exist." % manifest_path)
+                return False
+            return manifest_path
+
         def __pack_rbd_info(pool_name, rbd_name, volume_name=None):
-            self.log.info("\npacking RBD info, pool_name = %s"
-                          ", rbd_name= %s"
-                          ", volume_name = %s"
-                          % (pool_name, rbd_name, volume_name))
+            self.log.debug("packing RBD info, pool_name = %s, rbd_name = %s, volume_name = %s",
+                           pool_name, rbd_name, volume_name)
 
             # get ID to identify the RBD image cross entire backup process.
             # this ID is used to identify the RBD during entire backup states.
             # ----------------------------------------
             rbd_id = self._get_rbd_id(pool_name, rbd_name)
-            self.log.info("RBD ID is %s" % rbd_id)
 
             # generate RBD info, get size of rbd, snapshot list and features from cluster.
             # ----------------------------------------
-            self.log.info("get RBD info from cluster.")
             pool = self.pool_list[pool_name]
             rbd_info = {}
-            try:
-                # in beginning, we dont calculate rbd used size of the RBD.
-                # we calculate it after completed its snapshot and get used size of the
-                # snapshot, so set to 0 first
-                #rbd_info['rbd_used_size'] = pool.get_used_size(rbd_name, from_snap=None)
-                rbd_info['rbd_used_size'] = 0
-                rbd_info['rbd_full_size'] = pool.get_rbd_size(rbd_name)
-                rbd_info['features'] = pool.get_rbd_features(rbd_name)
-                rbd_info['snapshot_list'] = pool.get_snap_name_list(rbd_name)
-
-                if rbd_info['features'] is False:
-                    return False
-                if rbd_info['rbd_full_size'] is False:
-                    return False
-                if rbd_info['rbd_used_size'] is False:
-                    return False
-                if rbd_info['snapshot_list'] is False:
+            with self.tracer.span('probe_rbd_info', rbd_id=rbd_id):
+                try:
+                    # in beginning, we dont calculate rbd used size of the RBD.
+                    # we calculate it after completed its snapshot and get used size of the
+                    # snapshot, so set to 0 first
+                    #rbd_info['rbd_used_size'] = pool.get_used_size(rbd_name, from_snap=None)
+                    rbd_info['rbd_used_size'] = 0
+                    rbd_info['rbd_full_size'] = pool.get_rbd_size(rbd_name)
+                    rbd_info['features'] = pool.get_rbd_features(rbd_name)
+                    rbd_info['snapshot_list'] = pool.get_snap_name_list(rbd_name)
+
+                    if rbd_info['features'] is False:
+                        return False
+                    if rbd_info['rbd_full_size'] is False:
+                        return False
+                    if rbd_info['rbd_used_size'] is False:
+                        return False
+                    if rbd_info['snapshot_list'] is False:
+                        return False
+                except Exception as e:
+                    self.log.error("unable to get info from ceph cluster. "
+                                   "skip this RBD backup.")
                     return False
-            except Exception as e:
-                self.log.error("unable to get info from ceph cluster. "
-                               "skip this RBD backup.")
-                return False
+
+            # one record per RBD instead of a record per probe
+            self.log.info("\nRBD %s, volume = %s, size = %s bytes, features = %s, %s snapshots",
+                          rbd_id, volume_name, rbd_info['rbd_full_size'],
+                          rbd_info['features'], len(rbd_info['snapshot_list']))
+
+            # export interrupted in last backup is continued with its
+            # snapshots, it overrides backup type decided below.
+            # ----------------------------------------
+            resume_export = self._get_resume_export(rbd_id, rbd_info['snapshot_list'])
 
             # when backup type is incremental (export diff), do additional check.
             #   check last snappshot name exist in ceph cluster
@@ -248,7 +413,13 @@ class RBDBackup(object):
             # ----------------------------------------
             last_snapshot_name = None
             last_backup_name = None
+            hash_manifest_base = None
             backup_type = self.backup_type
+            if backup_type == FULL:
+                backup_reason = "full backup of this run"
+            else:
+                backup_reason = "incremental backup of this run"
+
             if backup_type == DIFF:
                 self.log.info("verify last snapsho name, full backup file and "
                               "completeness of incremental backup file for "
@@ -261,33 +432,143 @@ class RBDBackup(object):
                     backup_list = self.meta_rbd_backup_list[rbd_id]
                     if len(backup_list) == 0:
                         backup_type = FULL
+                        backup_reason = "no backup in metafile"
                     else:
                         last_backup_name = backup_list[-1]
                         self.log.info("last full backup file name is %s" % last_backup_name)
                 else:
                     self.log.warning("unable to get last full backup file name.")
                     backup_type = FULL
+                    backup_reason = "no backup in metafile"
 
                 # verify the last snapshot exist in cluster
                 if self.meta_rbd_snapshot_list.has_key(rbd_id):
                     snap_list = self.meta_rbd_snapshot_list[rbd_id]
                     if len(snap_list) == 0:
                         backup_type = FULL
+                        backup_reason = "no snapshot in metafile"
                     else:
                         last_snapshot_name = snap_list[-1]
                         self.log.info("set snapshot name of last backup = %s" % last_snapshot_name)
 
                         if last_snapshot_name not in rbd_info['snapshot_list']:
-                            self.log.warning("last snapshot name not exist in cluster. "
-                                             "set to full backup.")
-                            backup_type = FULL
-                            last_snapshot_name = None
+                            hash_manifest_base = False
+                            if self.hash_manifest_enabled:
+                                hash_manifest_base = __get_hash_manifest_base(pool_name,
+                                                                              rbd_name,
+                                                                              last_backup_name,
+                                                                              last_snapshot_name)
+                            if hash_manifest_base is not False:
+                                self.log.warning("last snapshot name not exist in cluster. "
+                                                 "incremental backup by block manifest %s."
+                                                 % hash_manifest_base)
+                                backup_reason = ("last snapshot %s not exist in cluster, "
+                                                 "incremental by hash manifest" % last_snapshot_name)
+                            else:
+                                self.log.warning("last snapshot name not exist in cluster. "
+                                                 "set to full backup.")
+                                backup_type = FULL
+                                backup_reason = "last snapshot not exist in cluster"
+                                last_snapshot_name = None
+                                hash_manifest_base = None
                         # todo: check the last incrmental backup file name has last snapshot name
                         # ????
                 else:
                     self.log.warning("unable to get last snapshot name. "
                                      "set to full backup.")
                     backup_type = FULL
+                    backup_reason = "no snapshot in metafile"
+
+            # decide backup type by backup chain of last generation
+            # ----------------------------------------
+            if backup_type == DIFF and self.policy is not None:
+                backup_chain = BackupChain(self.log, self.backup_directory.path, pool_name, rbd_name)
+                chain = backup_chain.get_chain(last_backup_name)
+                if chain is False:
+                    backup_type = FULL
+                    backup_reason = "backup chain of %s is broken" % last_backup_name
+                else:
+                    backup_type, backup_reason = self.policy.decide(chain)
+                if backup_type == FULL:
+                    last_snapshot_name = None
+                    last_backup_name = None
+
+            # full backup on planned weekday of the RBD
+            # ----------------------------------------
+            if backup_type == DIFF and self.full_backup_plan is not None:
+                weekday = datetime.datetime.today().weekday() + 1
+                if self.full_backup_plan.get(rbd_id) == weekday:
+                    backup_type = FULL
+                    backup_reason = "planned full backup on weekday %s" % weekday
+                    last_snapshot_name = None
+                    last_backup_name = None
+
+            # files of synthetic full in last backup were not cleaned up, the
+            # backup chain of last generation is not reliable.
+            # ----------------------------------------
+            full_export_required = self.meta_rbd_full_export_list.has_key(rbd_id)
+            if full_export_required:
+                backup_type = FULL
+                backup_reason = ("synthetic full failed in last backup, %s"
+                                 % self.meta_rbd_full_export_list[rbd_id]['reason'])
+                last_snapshot_name = None
+                last_backup_name = None
+
+            # skip backup of the RBD if nothing changed since last backup,
+            # backup chain of last generation is still backup of its data.
+            # changes are read from object map, fast-diff is required. resize
+            # is not a change of objects, size of last snapshot is compared.
+            # ----------------------------------------
+            unchanged = False
+            if self.skip_unchanged_enabled and not full_export_required and \
+               rbd_info['features'] & RBD_FEATURE_FAST_DIFF:
+                chain_base = __get_synthetic_full_base(rbd_id,
+                                                       pool_name,
+                                                       rbd_name,
+                                                       rbd_info['snapshot_list'])
+                if chain_base is not False and \
+                   pool.get_rbd_size(rbd_name, snap_name=chain_base[0]) == rbd_info['rbd_full_size'] and \
+                   pool.get_changed_size(rbd_name, chain_base[0]) == 0:
+                    unchanged = True
+                    last_snapshot_name, last_backup_name = chain_base[0], chain_base[1]
+                    backup_reason = ("no change since snapshot %s, keep backup generation %s"
+                                     % (last_snapshot_name, last_backup_name))
+
+            if backup_type != DIFF:
+                hash_manifest_base = None
+
+            # when backup type is full and synthetic full backup is enabled,
+            # export incremental from last snapshot and build full backup file
+            # from backup chain of last generation. if verifying failed, do
+            # regular full backup.
+            # ----------------------------------------
+            synthetic_full_base = None
+            if backup_type == FULL and self.synthetic_full_enabled and not unchanged and \
+               not full_export_required:
+                synthetic_base = __get_synthetic_full_base(rbd_id,
+                                                           pool_name,
+                                                           rbd_name,
+                                                           rbd_info['snapshot_list'])
+                if synthetic_base is False:
+                    self.log.info("unable to use synthetic full backup, "
+                                  "do regular full backup.")
+                else:
+                    last_snapshot_name, last_backup_name, synthetic_full_base = synthetic_base
+                    self.log.info("synthetic full backup from generation %s, "
+                                  "last snapshot name = %s"
+                                  % (last_backup_name, last_snapshot_name))
+
+            if resume_export is not None:
+                backup_type = resume_export['backup_type']
+                last_snapshot_name = resume_export['from_snap']
+                last_backup_name = None
+                if backup_type == DIFF:
+                    last_backup_name = resume_export['generation']
+                unchanged = False
+                synthetic_full_base = None
+                hash_manifest_base = None
+                backup_reason = ("continue interrupted export to snapshot %s"
+                                 % resume_export['to_snap'])
 
             # add additional info to rbd_info
             # ----------------------------------------
@@ -297,9 +578,15 @@ class RBDBackup(object):
             rbd_info['pool_name'] = pool_name
             rbd_info['volume_name'] = volume_name
             rbd_info['backup_type'] = backup_type
+            rbd_info['backup_reason'] = backup_reason
+            rbd_info['unchanged'] = unchanged
+            self.log.info("%s backup of %s, %s", EXPORT_TYP[backup_type], rbd_id, backup_reason)
 
             rbd_info['last_snapshot_name'] = last_snapshot_name
-            rbd_info['last_backup_name'] = last_backup_name    # None if backup type is Full
+            rbd_info['last_backup_name'] = last_backup_name    # None if regular full backup
+            rbd_info['synthetic_full_base'] = synthetic_full_base  # None if not synthetic full
+            rbd_info['hash_manifest_base'] = hash_manifest_base    # None if not hash diff
+            rbd_info['resume_export'] = resume_export              # None if new export
             rbd_info['snapshot_retain_count'] = 0  # todo: get from config
             rbd_info['backup_retain_count'] = 0  # todo: get from config
 
@@ -316,6 +603,8 @@ class RBDBackup(object):
         try:
             # store all backup RBD image information
             rbd_list = []
+            backup_targets = []     # [(pool name, rbd name, volume name), ...]
+            backup_priority = {}    # {(pool name, rbd name): priority, ...}
 
             openstack_mapping = self.cfg.openstack_enable_mapping
             self.log.info("\nopenstack enable mapping is %s" % openstack_mapping)
@@ -355,11 +644,7 @@ class RBDBackup(object):
                     return False
 
                 for volume_name, volume_id in volumes.iteritems():
-                    rbd_info = __pack_rbd_info(pool_name, volume_id, volume_name)
-                    if rbd_info is False:
-                        self.log.warning("unable to pack RBD info. skip backup of it")
-                    else:
-                        rbd_list.append(rbd_info)
+                    backup_targets.append((pool_name, volume_id, volume_name))
 
             else:
                 yaml_path = self.cfg.backup_yaml_filepath
@@ -373,34 +658,85 @@ class RBDBackup(object):
                     self.log.error("unable to read RBD list.")
                     return False
 
+                # rbd name in the yaml can be a name or {name: priority}
                 for pool_name, rbd_name_list in yaml_data.iteritems():
 
                     if not __set_pool(pool_name):
                         return False
 
                     for rbd_name in rbd_name_list:
-                        rbd_info = __pack_rbd_info(pool_name, rbd_name)
-                        if rbd_info is False:
-                            self.log.warning("unable to pack RBD info. skip backup of it")
+                        if isinstance(rbd_name, dict):
+                            for name, value in rbd_name.iteritems():
+                                backup_targets.append((pool_name, name, None))
+                                backup_priority[(pool_name, name)] = int(value)
                         else:
-                            rbd_list.append(rbd_info)
+                            backup_targets.append((pool_name, rbd_name, None))
+
+            # plan full backup weekday of all RBDs before packing RBD info
+            # ----------------------------------------
+            if self.planner is not None:
+                self.full_backup_plan = self._plan_full_backup(backup_targets)
+
+            for pool_name, rbd_name, volume_name in backup_targets:
+                rbd_info = __pack_rbd_info(pool_name, rbd_name, volume_name)
+                if rbd_info is False:
+                    self.log.warning("unable to pack RBD info. skip backup of it")
+                else:
+                    rbd_info['priority'] = backup_priority.get((pool_name, rbd_name), 0)
+                    rbd_list.append(rbd_info)
+
+            # unchanged RBDs have no snapshot and export, record them only
+            # ----------------------------------------
+            if self.skip_unchanged_enabled:
+                rbd_list = self._skip_unchanged(rbd_list)
+
+            # RBDs deferred by backup window in last backups go first
+            # ----------------------------------------
+            for rbd_info in rbd_list:
+                if self.meta_rbd_deferred_list.has_key(rbd_info['id']):
+                    deferred_count = self.meta_rbd_deferred_list[rbd_info['id']]['count']
+                    rbd_info['priority'] = (rbd_info.get('priority', 0) +
+                                            WINDOW_PRIORITY_BOOST * deferred_count)
 
             # if no RBD image get, nothing to do next, return false.
             if self.total_backup_rbd_count == 0:
                 self.log.info("no RBD image to backup.")
                 return False
 
-            # verify sufficient spaces size for backup, if not, return false.
-            # we use full RBD image size rather than actually used size.
-            # if self.backup_directory.available_bytes <= self.total_backup_used_size:
-            if self.backup_directory.available_bytes <= self.total_backup_full_size:
+            # verify sufficient spaces size for backup by predicted output
+            # bytes of each RBD, skip low priority RBDs if space is not enough.
+            # trash is being deleted in background at reclaim rate, only bytes
+            # freed within expected run time of exports count as available.
+            available_bytes = self.backup_directory.get_available_size()
+            if available_bytes is False:
+                available_bytes = self.backup_directory.available_bytes
+            reclaimable_bytes = 0
+            if self.trash is not None:
+                predicted_bytes = sum([self.admission.predict(rbd_info) for rbd_info in rbd_list])
+                run_seconds = self._estimate_export_seconds(predicted_bytes)
+                reclaimable_bytes = self.trash.get_reclaimable_bytes(run_seconds)
+                self.log.info("expected export time %.0f seconds, %s bytes of trash "
+                              "reclaimable" % (run_seconds, reclaimable_bytes))
+
+            rbd_list, rejected_list = self.admission.admit(rbd_list,
+                                                           available_bytes,
+                                                           reclaimable_bytes)
+            for rbd_info in rbd_list:
+                self.metrics.set('image_predicted_bytes', rbd_info['predicted_bytes'],
+                                 pool=rbd_info['pool_name'], rbd=rbd_info['rbd_name'])
+            for rbd_info in rejected_list:
+                self.log.warning("no enough space size for backup of %s, "
+                                 "predicted %s bytes. skip this RBD backup."
+                                 % (rbd_info['id'], rbd_info['predicted_bytes']))
+                self.metrics.inc('admission_rejected_total')
+                self.total_backup_full_size -= rbd_info['rbd_full_size']
+                self.total_backup_rbd_count -= 1
+
+            if len(rbd_list) == 0:
                 self.log.info("no enough space size for backup.\n"
-                              "total RBD image size to backup = %s bytes\n"
-                              "available backup space size    = %s bytes\n"
-                              "need %s bytes more space size."
-                              % (self.total_backup_full_size,
-                                 self.backup_directory.available_bytes,
-                                (self.total_backup_full_size - self.backup_directory.available_bytes)))
+                              "available backup space size = %s bytes\n"
+                              "reclaimable space size      = %s bytes"
+                              % (available_bytes, reclaimable_bytes))
                 return False
 
             return rbd_list
@@ -410,6 +746,238 @@ class RBDBackup(object):
             traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
             return False
 
+    def _estimate_export_seconds(self, output_bytes):
+        ''' seconds to write output bytes by concurrent workers, by average
+            export throughput of last backups or the backup window bandwidth
+        '''
+        throughput = float(self.backup_window_bandwidth)
+        if len(self.meta_rbd_export_throughput) != 0:
+            throughput = (sum(self.meta_rbd_export_throughput.values()) /
+                          float(len(self.meta_rbd_export_throughput)))
+        throughput *= max(int(self.cfg.backup_concurrent_worker_count), 1)
+        if throughput <= 0:
+            return 0
+        return output_bytes / throughput
+
+    def _skip_unchanged(self, rbd_list):
+        ''' remove unchanged RBDs from backup list and record them in metafile '''
+        unchanged_list = self.metafile.read(RBD_UNCHANGED_LIST)
+        if not isinstance(unchanged_list, dict):
+            unchanged_list = {}
+
+        backup_list = []
+        for rbd_info in rbd_list:
+            rbd_id = rbd_info['id']
+            if not rbd_info['unchanged']:
+                unchanged_list.pop(rbd_id, None)
+                backup_list.append(rbd_info)
+                continue
+
+            self.log.info("skip backup of unchanged RBD %s. %s"
+                          % (rbd_id, rbd_info['backup_reason']))
+            record = unchanged_list.get(rbd_id, {'since': self.backup_time, 'count': 0})
+            record['snapshot'] = rbd_info['last_snapshot_name']
+            record['generation'] = rbd_info['last_backup_name']
+            record['last'] = self.backup_time
+            record['count'] += 1
+            unchanged_list[rbd_id] = record
+
+            self.unchanged_rbd_info_list.append(rbd_info)
+            self.metrics.inc('unchanged_skips_total')
+            self.total_backup_full_size -= rbd_info['rbd_full_size']
+            self.total_backup_rbd_count -= 1
+
+        self._write_metafile(RBD_UNCHANGED_LIST, unchanged_list)
+        return backup_list
+
+    def _get_resume_export(self, rbd_id, snapshot_list):
+        ''' return pending export of the RBD if it can be continued, the
+            snapshots of the export must still exist in cluster. otherwise
+            partial file of the export is deleted.
+        '''
+        if not self.meta_rbd_pending_export_list.has_key(rbd_id):
+            return None
+
+        pending_export = self.meta_rbd_pending_export_list[rbd_id]
+        if not self.resumable_export_enabled:
+            reason = "resumable export is disabled"
+        elif pending_export['to_snap'] not in snapshot_list:
+            reason = "snapshot %s not exist in cluster" % pending_export['to_snap']
+        elif pending_export['from_snap'] is not None and \
+             pending_export['from_snap'] not in snapshot_list:
+            reason = "snapshot %s not exist in cluster" % pending_export['from_snap']
+        else:
+            self.log.info("continue interrupted export of %s to %s"
+                          % (rbd_id, pending_export['export_destpath']))
+            return pending_export
+
+        self.log.warning("unable to continue interrupted export of %s, %s. "
+                         "delete partial file." % (rbd_id, reason))
+        self._drop_pending_export(rbd_id)
+        return None
+
+    def _drop_pending_export(self, rbd_id):
+        ''' delete partial file and checkpoint of pending export, and the
+            generation of interrupted full backup.
+        '''
+        try:
+            pending_export = self.meta_rbd_pending_export_list.pop(rbd_id)
+            ExportCheckpoint(pending_export['export_destpath']).remove()
+
+            if pending_export['backup_type'] == FULL:
+                generation = pending_export['generation']
+                backup_list = self.meta_rbd_backup_list.get(rbd_id, [])
+                if generation in backup_list:
+                    backup_list.remove(generation)
+                generation_path = os.path.dirname(pending_export['export_destpath'])
+                if os.path.isdir(generation_path) and len(os.listdir(generation_path)) == 0:
+                    os.rmdir(generation_path)
+
+            self._update_space_usage(pending_export['export_destpath'])
+            return self._write_metafile(RBD_PENDING_EXPORT_LIST, self.meta_rbd_pending_export_list)
+        except Exception as e:
+            self.log.warning("unable to delete pending export of %s. %s" % (rbd_id, e))
+            return False
+
+    def _get_pinned_snapshots(self, rbd_id):
+        ''' snapshots used by pending export, they are not removed by retention '''
+        pending_export = self.meta_rbd_pending_export_list.get(rbd_id)
+        if pending_export is None:
+            return []
+        return [pending_export['from_snap'], pending_export['to_snap']]
+
+    def _get_resource_tags(self, pool_name=None):
+        ''' resource tags of task reading the pool and writing backup directory,
+            task without pool name works on backup directory only.
+        '''
+        tags = ['dest:%s' % self.cfg.backup_path]
+        if pool_name is None:
+            return tags
+
+        if not self.pool_device_class.has_key(pool_name):
+            self.pool_device_class[pool_name] = self.ceph.get_pool_device_class(pool_name)
+        tags.append('cluster:%s' % self.ceph.cluster_name)
+        tags.append('pool:%s' % pool_name)
+        if self.pool_device_class[pool_name] != '':
+            tags.append('class:%s' % self.pool_device_class[pool_name])
+        return tags
+
+    def _defer_export(self, rbd_info, reason):
+        ''' carry export of the RBD to next backup with higher priority '''
+        rbd_id = rbd_info['id']
+        self.log.warning("defer export of %s to next backup, %s." % (rbd_id, reason))
+        self.metrics.inc('deferred_total')
+
+        record = self.meta_rbd_deferred_list.get(rbd_id, {'since': self.backup_time, 'count': 0})
+        record['count'] += 1
+        record['last'] = self.backup_time
+        record['reason'] = reason
+        self.meta_rbd_deferred_list[rbd_id] = record
+
+        # pending resumable export is continued with its snapshot next time
+        if self.meta_rbd_pending_export_list.has_key(rbd_id):
+            return True
+
+        # otherwise drop the snapshot and generation of this backup, so next
+        # backup is still based on last backup. the snapshot is removed by
+        # workers after the export loop, not to hold submitting exports.
+        snap_name = rbd_info['new_snapshot_name']
+        snapshot_task = self.create_snapshot_tasks[rbd_id]
+        snapshot_task.action = REMOVE
+        snapshot_task.snap_name = snap_name
+        self.deferred_snapshot_tasks.append(snapshot_task)
+
+        snap_list = self.meta_rbd_snapshot_list.get(rbd_id, [])
+        if snap_name in snap_list:
+            snap_list.remove(snap_name)
+
+        if rbd_info['backup_type'] == FULL:
+            backup_list = self.meta_rbd_backup_list.get(rbd_id, [])
+            if snap_name in backup_list:
+                backup_list.remove(snap_name)
+            generation_path = os.path.dirname(self.export_tasks[rbd_id].export_destpath)
+            if os.path.isdir(generation_path) and len(os.listdir(generation_path)) == 0:
+                os.rmdir(generation_path)
+        return True
+
+    def _remove_deferred_snapshots(self):
+        ''' submit snapshot remove tasks of deferred exports and wait them '''
+        submitted_task_count = 0
+        for snapshot_task in self.deferred_snapshot_tasks:
+            try:
+                self.manager.add_task(snapshot_task)
+                submitted_task_count += 1
+            except Exception as e:
+                self.log.warning("unable to submit snapshot remove task of deferred RBD %s. %s"
+                                 % (snapshot_task.rbd_id, e))
+        self.deferred_snapshot_tasks = []
+
+        for i in xrange(submitted_task_count):
+            task = self._get_finished_task()
+            if task.task_status != COMPLETE:
+                self.log.warning("unable to remove snapshot %s of deferred RBD %s."
+                                 % (task.snap_name, task.rbd_id))
+        return True
+
+    def _get_finished_task(self):
+        ''' wait a finished task of a stage. if new tasks are paused by cluster
+            health when backup window is passed, pending tasks are cancelled,
+            the stage ends with the tasks already running.
+        '''
+        while True:
+            timeout = HEALTH_WAIT_INTERVAL
+            if self.backup_window is not None and not self.backup_window.is_passed():
+                timeout = min(timeout, max(self.backup_window.deadline - time.time(), 0))
+            task = self.manager.get_finished_task(timeout=timeout)
+            if task is not None:
+                return task
+
+            if self.manager.concurrency == 0 and self.backup_window is not None and \
+               self.backup_window.is_passed():
+                self.manager.cancel_pending_tasks("backup window is passed while cluster "
+                                                  "health pauses new tasks")
+
+    def _throttle_running_export(self):
+        ''' lower cpu and io priority of running export commands '''
+        for pid in self.manager.get_command_pids():
+            self.log.info("throttle export command at deadline of backup window, pid = %s" % pid)
+            for argv in [['ionice', '-c', '3', '-p', pid],
+                         ['renice', '-n', '19', '-p', pid]]:
+                command = run_command(argv)
+                if command.return_code != 0:
+                    self.log.warning("unable to throttle export command, pid = %s. %s"
+                                     % (pid, command.stderr))
+
+    def _plan_full_backup(self, backup_targets):
+        ''' plan full backup weekday of RBDs by bytes of their last full backup,
+            the plan is written to metafile and shown by RBDBackupPlan.py
+        '''
+        try:
+            last_plan = self.metafile.read(RBD_FULL_BACKUP_PLAN, 'weekday')
+            if not isinstance(last_plan, dict):
+                last_plan = {}
+
+            rbd_bytes = {}
+            for pool_name, rbd_name, volume_name in backup_targets:
+                rbd_id = self._get_rbd_id(pool_name, rbd_name)
+                full_bytes = self.admission.get_full_bytes(rbd_id)
+                if full_bytes is None:
+                    # largest generation in backup directory, 0 if new RBD
+                    generation_usage = self.space_account.get_rbd_usage(pool_name, rbd_name)
+                    full_bytes = max(generation_usage.values() + [0])
+                rbd_bytes[rbd_id] = full_bytes
+
+            plan = self.planner.plan(rbd_bytes, last_plan)
+            self._write_metafile(RBD_FULL_BACKUP_PLAN, {'time': self.backup_time,
+                                                        'weekday': plan,
+                                                        'bytes': rbd_bytes})
+            return plan
+        except Exception as e:
+            self.log.error("unable to plan full backup weekday. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return None
+
     def _sort_backup_list(self, backup_rbd_info_list, sort_key):
         ''' sort backup list by size '''
         try:
@@ -438,32 +1006,59 @@ class RBDBackup(object):
 
     def _write_metafile(self, metafile_name, metadata, overwrite=True):
         try:
-            if metafile_name == RBD_SNAPSHOT_MAINTAIN_LIST:
-                if not self.metafile.write(RBD_SNAPSHOT_MAINTAIN_LIST, metadata, overwrite=overwrite):
-                    self.log.error("unable to write RBD snapshot maintain list to metafile")
-                    return False
-            elif metafile_name == RBD_BACKUP_CIRCULATION_LIST:
-                if not self.metafile.write(RBD_BACKUP_CIRCULATION_LIST, metadata, overwrite=overwrite):
-                    self.log.error("unable to write RBD backup circulation list to metafile")
-                    return False
-            elif metafile_name == BACKUP_INFO:
-                if not self.metafile.write(BACKUP_INFO, metadata, overwrite=overwrite):
-                    self.log.error("unable to write RBD backup info to metafile")
-                    return False
-            elif metafile_name == RBD_INFO_LIST:
-                if not self.metafile.write(RBD_INFO_LIST, metadata, overwrite=overwrite):
-                    self.log.error("unable to write RBD backup info list to metafile")
-                    return False
-            else:
+            if not METAFILE_DESCRIPTION.has_key(metafile_name):
                 self.log.error("unknown metafile name %s" % metafile_name)
                 return False
+            with self.tracer.span('write_metafile', metafile=metafile_name):
+                if not self.metafile.write(metafile_name, metadata, overwrite=overwrite):
+                    self.log.error("unable to write %s to metafile"
+                                   % METAFILE_DESCRIPTION[metafile_name])
+                    return False
             return True
         except Exception as e:
-            self.log.error("unable to remove exceed snapshot of RBD. %s" % e)
+            self.log.error("unable to write metafile %s. %s" % (metafile_name, e))
             exc_type,exc_value,exc_traceback = sys.exc_info()
             traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
             return False
 
+    def _update_space_usage(self, backup_path):
+        ''' recount space usage of the generation of a backup file path '''
+        if self.space_account is None:
+            return False
+        generation_path = os.path.dirname(backup_path)
+        rbd_path = os.path.dirname(generation_path)
+        return self.space_account.update_generation(os.path.basename(os.path.dirname(rbd_path)),
+                                                    os.path.basename(rbd_path),
+                                                    os.path.basename(generation_path))
+
+    def _write_space_usage(self):
+        if self.space_account is None:
+            return False
+        return self._write_metafile(RBD_SPACE_USAGE, self.space_account.usage)
+
+    def _record_export_history(self, rbd_id, export_type, backup_path, timestamp):
+        ''' record allocated bytes of backup file for space admission '''
+        try:
+            output_bytes = os.stat(backup_path).st_blocks * 512
+            self.admission.record(rbd_id, export_type, output_bytes, timestamp)
+            return True
+        except Exception as e:
+            self.log.warning("unable to record export history of %s. %s" % (rbd_id, e))
+            return False
+
+    def _delete_backup(self, pool_name, rbd_name, generation):
+        ''' move backup generation to trash, or delete it if trash is unavailable '''
+        if self.trash is None:
+            return self.backup_directory.del_directory(pool_name, rbd_name, generation)
+
+        backup_path = os.path.join(self.backup_directory.path, pool_name, rbd_name, generation)
+        if not os.path.isdir(backup_path):
+            self.log.error("backup path %s is not a directory" % backup_path)
+            return False
+        if self.trash.move(backup_path, "%s_%s_%s" % (pool_name, rbd_name, generation)) is False:
+            return False
+        return backup_path
+
     def read_argument_list(self, argument_list):
         try:
             parser = ArgumentParser(add_help=False)
@@ -533,12 +1128,123 @@ class RBDBackup(object):
             self.log.error("unable to read openstack config.")
             return False
 
+        # read backup policy config, decide backup type by weekday if
+        # config is unavailable
+        if not cfg.read_policy_config():
+            self.log.warning("unable to read backup policy config.")
+        elif cfg.backup_policy == POLICY_THRESHOLD:
+            self.backup_policy = POLICY_THRESHOLD
+            self.policy = BackupPolicy(self.log,
+                                       max_chain_length=cfg.policy_max_chain_length,
+                                       max_diff_ratio=cfg.policy_max_diff_ratio,
+                                       max_restore_seconds=cfg.policy_max_restore_seconds,
+                                       restore_bandwidth=cfg.policy_restore_bandwidth)
+        elif cfg.backup_policy == POLICY_STAGGER:
+            self.backup_policy = POLICY_STAGGER
+            full_weekdays = cfg.policy_full_weekdays.split(',')
+            self.planner = FullBackupPlanner(self.log, weekdays=full_weekdays)
+
+        # read unchanged RBD config, backup all RBDs if config is unavailable
+        if not cfg.read_unchanged_config():
+            self.log.warning("unable to read unchanged RBD config.")
+        elif cfg.skip_unchanged_enable == 'True':
+            self.skip_unchanged_enabled = True
+
+        # read hash manifest config, do full backup if snapshot of last
+        # backup is gone and config is unavailable
+        if not cfg.read_hash_manifest_config():
+            self.log.warning("unable to read hash manifest config.")
+        elif cfg.hash_manifest_enable == 'True':
+            self.hash_manifest_enabled = True
+
+        # read synthetic full backup config
+        if not cfg.read_synthetic_full_config():
+            self.log.warning("unable to read synthetic full backup config.")
+        elif cfg.synthetic_full_enable == 'True':
+            self.synthetic_full_enabled = True
+
         # read monitor config
         if not cfg.read_monitor_config():
             self.log.warning("unable to read monitor config.")
         else:
             self.monitor_enabled = True
 
+        # read executor config, use worker processes if config is unavailable
+        if not cfg.read_executor_config():
+            self.log.warning("unable to read executor config.")
+        else:
+            self.backup_executor = cfg.backup_executor
+
+        # read health check config, concurrency of workers is not changed by
+        # cluster health if config is unavailable
+        if not cfg.read_health_check_config():
+            self.log.warning("unable to read health check config.")
+        elif cfg.health_check_enable == 'True':
+            self.health_check_enabled = True
+
+        # read dispatch config, running tasks are not limited per resource
+        # if config is unavailable
+        if not cfg.read_dispatch_config():
+            self.log.warning("unable to read dispatch config.")
+        else:
+            try:
+                self.dispatch_limits = parse_limits(cfg.dispatch_limits)
+            except Exception as e:
+                self.log.warning("invalid dispatch limits %s. %s" % (cfg.dispatch_limits, e))
+            self.backup_task_timeout = int(cfg.backup_task_timeout)
+
+        # read resumable export config, export by rbd command if config is
+        # unavailable
+        if not cfg.read_resumable_export_config():
+            self.log.warning("unable to read resumable export config.")
+        elif cfg.resumable_export_enable == 'True':
+            self.resumable_export_enabled = True
+            self.export_checkpoint_interval = int(cfg.export_checkpoint_interval)
+            self.export_chunk_size = int(cfg.export_chunk_size)
+
+        # read retry config, use default retry if config is unavailable
+        if not cfg.read_retry_config():
+            self.log.warning("unable to read retry config.")
+        else:
+            self.retry_max_attempts = int(cfg.retry_max_attempts)
+            self.retry_base_delay = float(cfg.retry_base_delay)
+            self.retry_max_delay = float(cfg.retry_max_delay)
+            self.retry_isolate_count = int(cfg.retry_isolate_count)
+
+        # read backup window config, backup runs until all exports finished
+        # if config is unavailable
+        if not cfg.read_backup_window_config():
+            self.log.warning("unable to read backup window config.")
+        else:
+            self.backup_window_end = cfg.backup_window_end
+            self.backup_window_margin = int(cfg.backup_window_margin)
+            self.backup_window_bandwidth = int(cfg.backup_window_bandwidth)
+
+        # read admission config, use default prediction if config is unavailable
+        if not cfg.read_admission_config():
+            self.log.warning("unable to read admission config.")
+        else:
+            self.admission_safety_factor = float(cfg.admission_safety_factor)
+            self.admission_reserve_bytes = int(cfg.admission_reserve_bytes)
+            self.admission_history_count = int(cfg.admission_history_count)
+
+        # read trash config, expired backups are deleted with no rate limit
+        # if config is unavailable
+        if not cfg.read_trash_config():
+            self.log.warning("unable to read trash config.")
+        else:
+            self.trash_reclaim_rate = int(cfg.trash_reclaim_rate)
+            self.trash_truncate_step = int(cfg.trash_truncate_step)
+            self.trash_finalize_wait = int(cfg.trash_finalize_wait)
+
+        # read status board config, board is not readable by other process
+        # if config is unavailable
+        if not cfg.read_status_board_config():
+            self.log.warning("unable to read status board config.")
+        elif cfg.status_board_path != '':
+            self.status_board_path = "%s.%s" % (cfg.status_board_path,
+                                                self.ceph.cluster_name or cfg.ceph_cluster_name)
+
         # read cache clean config
         if not cfg.read_cache_config():
             self.log.warning("unable to read clean cache config.")
@@ -551,6 +1257,26 @@ class RBDBackup(object):
         if self.ceph.cluster_name is None:
             self.ceph.cluster_name = cfg.ceph_cluster_name
 
+        # read metrics config, metrics are not written if config is unavailable
+        if not cfg.read_metrics_config():
+            self.log.warning("unable to read metrics config.")
+            self.metrics = Metrics(self.log, self.ceph.cluster_name)
+        else:
+            self.metrics = Metrics(self.log,
+                                   self.ceph.cluster_name,
+                                   textfile_path=cfg.metrics_textfile_path,
+                                   json_path=cfg.metrics_json_path,
+                                   interval=cfg.metrics_interval)
+
+        # read trace config, spans are discarded if config is unavailable
+        if not cfg.read_trace_config():
+            self.log.warning("unable to read trace config.")
+            self.tracer.set_path('')
+        else:
+            self.tracer.set_path(cfg.trace_file_path)
+            self.log.info("trace id = %s, trace file = %s"
+                          % (self.tracer.trace_id, cfg.trace_file_path))
+
         # assign cfg to self.cfg
         self.cfg = cfg
 
@@ -619,7 +1345,6 @@ class RBDBackup(object):
                 self.log.info("initialize the backup directory.")
                 cluster_path = directory.add_directory(self.ceph.cluster_name,
                                                        set_path=True,
-                                                       check_size=True,
                                                        full_path=True)
                 if cluster_path is False:
                     self.log.error("unable to add %s in %s" % (self.ceph.cluster_name,
@@ -639,14 +1364,79 @@ class RBDBackup(object):
                 self.log.info("initialize metafile in %s" % cluster_path)
                 metafile = Metafile(self.log, self.ceph.cluster_name, cluster_path)
 
-                metafiles = [BACKUP_INFO,
-                             RBD_INFO_LIST,
-                             RBD_SNAPSHOT_MAINTAIN_LIST,
-                             RBD_BACKUP_CIRCULATION_LIST]
+                metafiles = METAFILE_DESCRIPTION.keys()
 
                 if metafile.initialize(self.ceph.cluster_name, metafiles):
                     self.metafile = metafile
 
+                # used size of backup directory is from space usage in metafile,
+                # walk the backup files only if the metafile does not exist.
+                self.space_account = SpaceAccount(self.log, cluster_path)
+                space_usage = metafile.read(RBD_SPACE_USAGE)
+                if space_usage is False or not self.space_account.load(space_usage):
+                    self.log.warning("unable to read metafile %s. scan backup files."
+                                     % RBD_SPACE_USAGE)
+                    self.space_account.scan()
+                    self._write_space_usage()
+                self.backup_directory.set_space_account(self.space_account)
+                self.backup_directory.check_size()
+
+                # reclaim space of expired backups in background, it also
+                # deletes trash left by last backup.
+                self.trash = Trash(self.log, cluster_path,
+                                   reclaim_rate=self.trash_reclaim_rate,
+                                   truncate_step=self.trash_truncate_step)
+                self.trash.start()
+
+                # export history to predict backup size, empty in first backup
+                export_history = metafile.read(RBD_EXPORT_HISTORY)
+                if export_history is False:
+                    self.log.info("no export history in metafile %s." % RBD_EXPORT_HISTORY)
+                    export_history = {}
+                self.admission = SpaceAdmission(self.log, export_history,
+                                                safety_factor=self.admission_safety_factor,
+                                                reserve_bytes=self.admission_reserve_bytes,
+                                                history_count=self.admission_history_count)
+
+                # exports interrupted in last backup, continued in this backup
+                pending_export_list = metafile.read(RBD_PENDING_EXPORT_LIST)
+                if isinstance(pending_export_list, dict):
+                    self.meta_rbd_pending_export_list = pending_export_list
+
+                # failures of last backups to retry and isolate failed RBDs
+                retry_history = metafile.read(RBD_RETRY_HISTORY)
+                if not isinstance(retry_history, dict):
+                    retry_history = {}
+                self.retry_queue = RetryQueue(self.log, retry_history,
+                                              max_attempts=self.retry_max_attempts,
+                                              base_delay=self.retry_base_delay,
+                                              max_delay=self.retry_max_delay,
+                                              isolate_count=self.retry_isolate_count)
+
+                # export throughput to estimate export time in backup window,
+                # and RBDs deferred by backup window in last backups
+                export_throughput = metafile.read(RBD_EXPORT_THROUGHPUT)
+                if isinstance(export_throughput, dict):
+                    self.meta_rbd_export_throughput = export_throughput
+                deferred_list = metafile.read(RBD_DEFERRED_LIST)
+                if isinstance(deferred_list, dict):
+                    self.meta_rbd_deferred_list = deferred_list
+
+                # RBDs of which synthetic full failed and left files behind
+                full_export_list = metafile.read(RBD_FULL_EXPORT_LIST)
+                if isinstance(full_export_list, dict):
+                    self.meta_rbd_full_export_list = full_export_list
+
+                if self.backup_window_end != '':
+                    try:
+                        self.backup_window = BackupWindow(self.log, self.backup_window_end,
+                                                          margin=self.backup_window_margin,
+                                                          bandwidth=self.backup_window_bandwidth,
+                                                          throughput=self.meta_rbd_export_throughput)
+                    except Exception as e:
+                        self.log.warning("invalid backup window end %s, backup window is not "
+                                         "applied. %s" % (self.backup_window_end, e))
+
                 # store backup info
                 self.log.info("write initial backup info to metafile %s" % BACKUP_INFO)
                 self.meta_rbd_backup_info['time'] = self.backup_time
@@ -677,7 +1467,20 @@ class RBDBackup(object):
 
         try:
             worker_count = self.cfg.backup_concurrent_worker_count
-            manager = Manager(self.log, worker_count=worker_count)
+            if self.backup_executor == EXECUTOR_EVENTLOOP:
+                manager = EventLoopManager(self.log, worker_count=worker_count,
+                                           tracer=self.tracer,
+                                           task_timeout=self.backup_task_timeout,
+                                           resource_limits=self.dispatch_limits)
+            else:
+                output_spill_path = os.path.join(self.cfg.log_path, TASK_OUTPUT_DIRNAME)
+                manager = Manager(self.log, worker_count=worker_count, tracer=self.tracer,
+                                  output_spill_path=output_spill_path,
+                                  status_board_path=self.status_board_path,
+                                  resource_limits=self.dispatch_limits)
+            self.log.info("task executor = %s" % self.backup_executor)
+            if len(self.dispatch_limits) != 0:
+                self.log.info(("running task limits:", self.dispatch_limits))
             manager.run_worker()
 
             self.manager = manager
@@ -685,7 +1488,17 @@ class RBDBackup(object):
             time.sleep(1)
 
             if self.monitor_enabled:
-                self.manager.initialize_monitor()
+                self.manager.initialize_monitor(interval=self.cfg.monitor_interval)
+
+            if self.health_check_enabled:
+                self.health_sampler = HealthSampler(self.log, self.manager,
+                                                    self.ceph.cluster_name,
+                                                    conffile=self.ceph.conffile,
+                                                    interval=self.cfg.health_check_interval,
+                                                    reduced_workers=self.cfg.health_reduced_workers,
+                                                    latency_reduce_ms=self.cfg.health_latency_reduce_ms,
+                                                    latency_pause_ms=self.cfg.health_latency_pause_ms)
+                self.health_sampler.start()
 
             return True
         except Exception as e:
@@ -707,7 +1520,6 @@ class RBDBackup(object):
 
             for rbd_info in self.backup_rbd_info_list:
                 rbd_id = rbd_info['id']
-                self.log.info("\ncreating RBD snapshot create task. rbd_id = %s" % rbd_id)
 
                 # logging input parameters of RBDSnapshotTask
                 task_info = dict()
@@ -716,20 +1528,25 @@ class RBDBackup(object):
                 task_info['rbd'] = rbd_info['rbd_name']
                 task_info['action'] = SNAP_ACT[CREATE]
                 task_info['protect'] = snap_protect
-                self.log.info(("RBD snapshot task setting:", task_info))
+                self.log.debug(("RBD snapshot task setting:", task_info))
 
-                # create RBDSnapshotTask
+                # create RBDSnapshotTask. snapshot of interrupted export is
+                # reused, the task is not submitted.
+                snap_name = None
+                if rbd_info['resume_export'] is not None:
+                    snap_name = rbd_info['resume_export']['to_snap']
                 snapshot_task = RBDSnapshotTask(self.ceph.cluster_name,
                                                 rbd_info['pool_name'],
                                                 rbd_info['rbd_name'],
                                                 action=CREATE,
+                                                snap_name=snap_name,
                                                 protect=snap_protect,
                                                 rbd_id=rbd_id)
 
                 # store created snapshot task
                 self.create_snapshot_tasks[rbd_id] = snapshot_task
-                self.log.info("created RBD snapshot create task. "
-                              "task_name = %s" % snapshot_task)
+                self.log.info("created RBD snapshot create task %s, rbd_id = %s",
+                              snapshot_task, rbd_id)
 
             if len(self.create_snapshot_tasks) == 0:
                 self.log.warning("there is no any snapshot task initialized.")
@@ -751,12 +1568,18 @@ class RBDBackup(object):
         submitted_task_count = 0
         completed_task_count = 0
         uncompleted_task_count = 0
+        resumed_task_count = 0
 
         # Submit snapshot task to workers
         # ---------------------------------------------------------------------
         for rbd_info in self.backup_rbd_info_list:
             try:
                 rbd_id = rbd_info['id']
+                if rbd_info['resume_export'] is not None:
+                    self.log.info("reuse snapshot %s of interrupted export. rbd id = %s"
+                                  % (rbd_info['resume_export']['to_snap'], rbd_id))
+                    resumed_task_count += 1
+                    continue
                 self.manager.add_task(self.create_snapshot_tasks[rbd_id])
                 submitted_task_count += 1
             except Exception as e:
@@ -765,6 +1588,10 @@ class RBDBackup(object):
                 continue
 
         if submitted_task_count == 0:
+            if resumed_task_count != 0:
+                self.log.info("no new snapshot, %s interrupted exports to continue."
+                              % resumed_task_count)
+                return True
             self.log.error("no any RBD snapshot create task submitted.")
             return False
 
@@ -778,10 +1605,13 @@ class RBDBackup(object):
                 task = None
                 # retrieve finished task
                 # ----------------------------------------
-                task = self.manager.get_finished_task()
+                task = self._get_finished_task()
                 self.create_snapshot_tasks[task.rbd_id] = task
 
-                self.log.info(("receive finished task %s" % task.name, task.result))
+                self.log.info("receive finished task %s, status = %s, elapsed = %s seconds",
+                              task.name, TASK_STAT[task.task_status], task.elapsed_time)
+                self.log.debug(("task result of %s" % task.name, task.result))
+                self.metrics.record_snapshot(task)
 
                 if task.task_status == COMPLETE:
                     self.log.info("%s is completed." % task.name)
@@ -804,7 +1634,7 @@ class RBDBackup(object):
                     # remove this backup item from backup list if snapshot failed
                     # todo: use better way to remove the item in list
                     self.log.warning("%s is not completed. remove it from backup list." % task.name)
-                    self.backup_rbd_info_list = [i for i in self.backup_rbd_info_list if i.rbd_id != task.rbd_id]
+                    self.backup_rbd_info_list = [i for i in self.backup_rbd_info_list if i['id'] != task.rbd_id]
                     '''
                     backup_rbd_info_list = []
                     for i in self.backup_rbd_info_list:
@@ -828,6 +1658,7 @@ class RBDBackup(object):
         if self._write_metafile(RBD_SNAPSHOT_MAINTAIN_LIST, self.meta_rbd_snapshot_list) is False:
             return False
 
+        self.metrics.stage_end('snapshot')
         self.log.info("\n%s submitted snapshot task.\n"
                       "%s completed snapshot task.\n"
                       "%s uncompleted snapshot task."
@@ -880,16 +1711,13 @@ class RBDBackup(object):
             # create RBD export tasks
             # ==================================================================
             for rbd_info in self.backup_rbd_info_list:
-                self.log.info("\ncreating RBD export task.\n"
-                              "rbd_id = %s\n"
-                              "backup type = %s" % (rbd_info['id'], rbd_info['backup_type']))
-
                 rbd_id = rbd_info['id']
                 pool_name = rbd_info['pool_name']
                 rbd_name = rbd_info['rbd_name']
                 backup_type = rbd_info['backup_type']
                 last_backup_name = rbd_info['last_backup_name']
                 from_snap = rbd_info['last_snapshot_name']
+                hash_manifest_base = rbd_info['hash_manifest_base']
 
                 # 1. get snapshot name from the snapshot tasks
                 # this snapshot was created in previous stage
@@ -901,34 +1729,48 @@ class RBDBackup(object):
                                      "skip this RBD backup")
                     continue
                 rbd_info['new_snapshot_name'] = new_snapshot_name
-                self.log.info("snapshot name to export is %s" % new_snapshot_name)
 
                 # 2. calculate used size of the created snapshot
                 # ----------------------------------------
-                self.log.info("calculate used size of the snapshot %s" % new_snapshot_name)
                 pool = self.pool_list[pool_name]
                 #snap_id = pool.get_rbd_snap_id(rbd_name, new_snapshot_name)
-                rbd_info['rbd_used_size'] = pool.get_used_size(rbd_name,
-                                                               snap_name=new_snapshot_name,
-                                                               from_snap=from_snap)
+                # snapshot of hash diff base is gone, whole snapshot is read
+                probe_from_snap = from_snap
+                if hash_manifest_base is not None:
+                    probe_from_snap = None
+                with self.tracer.span('probe_used_size', rbd_id=rbd_id):
+                    rbd_info['rbd_used_size'] = pool.get_used_size(rbd_name,
+                                                                   snap_name=new_snapshot_name,
+                                                                   from_snap=probe_from_snap)
                 self.total_backup_used_size += rbd_info['rbd_used_size']
 
                 # 3. produce export destination file path
                 # ----------------------------------------
+                export_type = backup_type
                 if backup_type == DIFF:
-                    export_filename = ''.join([from_snap, '_to_', new_snapshot_name])
+                    export_filename = ''.join([from_snap, DIFF_FILENAME_SEPARATOR, new_snapshot_name])
                     incremental_group_dir = last_backup_name
                 elif backup_type == FULL:
                     export_filename = new_snapshot_name
                     incremental_group_dir = new_snapshot_name
 
+                    # synthetic full backup only export incremental to the new
+                    # generation, full backup file is built after export completed.
+                    if rbd_info['synthetic_full_base'] is not None:
+                        self.log.info("synthetic full backup, export incremental "
+                                      "from snapshot %s" % from_snap)
+                        export_type = DIFF
+                        export_filename = ''.join([from_snap, DIFF_FILENAME_SEPARATOR, new_snapshot_name])
+
                     #self.meta_last_full_backup_name[task.rbd_id] = full_backup_file_name
                     #if not self.metafile.update(LAST_FULL_BACKUP_NAME, {task.rbd_id: full_backup_file_name}):
                     #    self.log.error("unable to write full backup file name to metafile")
-                    self.log.info("backup type is full backup, update full backup filename")
+                    self.log.debug("backup type is full backup, update full backup filename")
                     if self.meta_rbd_backup_list.has_key(rbd_id):
                         backup_list = self.meta_rbd_backup_list[rbd_id]
-                        backup_list.append(new_snapshot_name)
+                        # generation of interrupted export may be in the list
+                        if new_snapshot_name not in backup_list:
+                            backup_list.append(new_snapshot_name)
                     else:
                         backup_list = [new_snapshot_name]
 
@@ -936,10 +1778,6 @@ class RBDBackup(object):
                 else:
                     return False
 
-                self.log.info("creating export file path in backup directory.\n"
-                              "pool_name = %s, rbd_name = %s, incremental_group_dir = %s"
-                              % (pool_name, rbd_name, incremental_group_dir))
-
                 rbd_path = self.backup_directory.add_directory(pool_name,
                                                                rbd_name,
                                                                incremental_group_dir,
@@ -959,26 +1797,68 @@ class RBDBackup(object):
                 task_info['rbd'] = rbd_name
                 task_info['export_destpath'] = export_destpath
                 task_info['backup_type'] = EXPORT_TYP[backup_type]
+                task_info['export_type'] = EXPORT_TYP[export_type]
                 task_info['from_snap'] = from_snap
                 task_info['to_snap'] = new_snapshot_name
-                self.log.info(("RBD export task setting:", task_info))
+                self.log.debug(("RBD export task setting:", task_info))
 
-                # 4. create RBDExportTask
+                # 4. create RBDExportTask, or RBDHashDiffTask if snapshot of
+                # last backup is gone and its block manifest is used
                 # ----------------------------------------
-                export_task = RBDExportTask(self.ceph.cluster_name,
-                                            pool_name,
-                                            rbd_name,
-                                            export_destpath,
-                                            export_type=backup_type,
-                                            from_snap=from_snap,
-                                            to_snap=new_snapshot_name,
-                                            rbd_id=rbd_id)
+                if hash_manifest_base is not None:
+                    export_task = RBDHashDiffTask(self.ceph.cluster_name,
+                                                  pool_name,
+                                                  rbd_name,
+                                                  export_destpath,
+                                                  hash_manifest_base,
+                                                  from_snap,
+                                                  new_snapshot_name,
+                                                  conffile=self.ceph.conffile,
+                                                  rbd_id=rbd_id)
+                elif self.resumable_export_enabled and rbd_info['synthetic_full_base'] is None:
+                    export_task = RBDResumableExportTask(self.ceph.cluster_name,
+                                                         pool_name,
+                                                         rbd_name,
+                                                         export_destpath,
+                                                         export_type=export_type,
+                                                         from_snap=from_snap,
+                                                         to_snap=new_snapshot_name,
+                                                         conffile=self.ceph.conffile,
+                                                         checkpoint_interval=self.export_checkpoint_interval,
+                                                         chunk_size=self.export_chunk_size,
+                                                         rbd_id=rbd_id)
+
+                    # record the export until it is completed, it is continued
+                    # by next backup if this backup is interrupted.
+                    pending_export = dict()
+                    pending_export['backup_type'] = backup_type
+                    pending_export['generation'] = incremental_group_dir
+                    pending_export['from_snap'] = from_snap
+                    pending_export['to_snap'] = new_snapshot_name
+                    pending_export['export_destpath'] = export_destpath
+                    pending_export['time'] = self.backup_time
+                    self.meta_rbd_pending_export_list[rbd_id] = pending_export
+                else:
+                    export_task = RBDExportTask(self.ceph.cluster_name,
+                                                pool_name,
+                                                rbd_name,
+                                                export_destpath,
+                                                export_type=export_type,
+                                                from_snap=from_snap,
+                                                to_snap=new_snapshot_name,
+                                                rbd_id=rbd_id)
 
                 # 5. store created export tasks
                 # ----------------------------------------
+                export_task.resource_tags = self._get_resource_tags(pool_name)
                 self.export_tasks[rbd_id] = export_task
-                self.log.info("created RBD export task. "
-                              "task name = %s" % export_task.name)
+                self.log.info("\ncreated RBD export task %s, rbd_id = %s, %s from %s to %s, "
+                              "used size = %s bytes, path = %s",
+                              export_task.name, rbd_id, EXPORT_TYP[export_type], from_snap,
+                              new_snapshot_name, rbd_info['rbd_used_size'], export_destpath)
+
+            if self._write_metafile(RBD_PENDING_EXPORT_LIST, self.meta_rbd_pending_export_list) is False:
+                return False
 
             # ----------------------------------------
             # sorting RBD backup list again by rbd used size
@@ -1015,65 +1895,445 @@ class RBDBackup(object):
         completed_task_count = 0
         uncompleted_task_count = 0
 
-        # Submit export task to workers
+        # Order export tasks, RBDs deferred in last backups go first by
+        # priority, RBDs failed in last backups are isolated and submitted last.
         # ---------------------------------------------------------------------
-        for rbd_info in self.backup_rbd_info_list:
-            try:
-                rbd_id = rbd_info['id']
-                self.manager.add_task(self.export_tasks[rbd_id])
-                submitted_task_count += 1
-            except Exception as e:
-                self.log.error("unable to submit export task to worker manager. "
-                               "rbd id = %s, %s" % (rbd_id, e))
-                continue
-
-        if submitted_task_count == 0:
-            self.log.error("no any RBD export task submitted.")
-            return False
-
-        # Collect finished RBD export tasks
+        isolated_list = [rbd_info for rbd_info in self.backup_rbd_info_list
+                         if self.retry_queue.is_isolated(rbd_info['id'])]
+        for rbd_info in isolated_list:
+            self.log.warning("RBD %s failed in last backups, export it last without retry."
+                             % rbd_info['id'])
+        self.metrics.set('isolated_images', len(isolated_list))
+
+        rbd_info_list = sorted([rbd_info for rbd_info in self.backup_rbd_info_list
+                                if rbd_info not in isolated_list],
+                               key=lambda k: -k.get('priority', 0))
+        rbd_info_map = {}
+        ready_tasks = []
+        for rbd_info in rbd_info_list + isolated_list:
+            rbd_info_map[rbd_info['id']] = rbd_info
+            ready_tasks.append(self.export_tasks[rbd_info['id']])
+
+        # without backup window all tasks are submitted at once, otherwise a
+        # task is submitted when a worker is free and only if it is expected
+        # to finish before the deadline.
+        max_in_flight = len(ready_tasks)
+        if self.backup_window is not None:
+            max_in_flight = self.manager.worker_count
+        in_flight = 0
+        submitted_rbd_ids = set()
+        deferred_task_count = 0
+        throttled = False
+
+        # Submit export tasks and collect finished export tasks
         # get and update backup file name for full backup task
         # ----------------------------------------------------------------------
         new_full_export_filename = {}
         while True:
             try:
                 task = None
+                # submit failed tasks due to retry, behind remaining tasks
+                # ----------------------------------------
+                for retry_task in self.retry_queue.pop_due():
+                    self.log.info("retry task %s. rbd id = %s" % (retry_task.name, retry_task.rbd_id))
+                    ready_tasks.append(retry_task)
+                    self.metrics.inc('retries_total', stage='export')
+
+                # submit tasks to free workers
+                # ----------------------------------------
+                while len(ready_tasks) != 0 and in_flight < max_in_flight:
+                    task = ready_tasks.pop(0)
+                    rbd_id = task.rbd_id
+                    try:
+                        if self.backup_window is not None:
+                            rbd_info = rbd_info_map[rbd_id]
+                            if not self.backup_window.fits(rbd_info):
+                                self._defer_export(rbd_info, "estimated %.0f seconds exceeds "
+                                                   "remaining %.0f seconds of backup window"
+                                                   % (self.backup_window.estimate(rbd_info),
+                                                      self.backup_window.get_remaining_seconds()))
+                                deferred_task_count += 1
+                                continue
+                            if hasattr(task, 'deadline'):
+                                task.deadline = self.backup_window.deadline
+                        self.manager.add_task(task)
+                        in_flight += 1
+                        submitted_rbd_ids.add(rbd_id)
+                    except Exception as e:
+                        self.log.error("unable to submit export task to worker manager. "
+                                       "rbd id = %s, %s" % (rbd_id, e))
+                        uncompleted_task_count += 1
+                task = None
+
+                if in_flight == 0 and len(ready_tasks) == 0 and len(self.retry_queue) == 0:
+                    break
+
+                # lower priority of export commands running over the deadline,
+                # resumable exports stop at checkpoint by themselves.
+                if (self.backup_window is not None and not throttled and
+                    self.backup_window.is_passed()):
+                    self.log.warning("backup window is passed, %s export tasks running." % in_flight)
+                    self._throttle_running_export()
+                    throttled = True
+
                 # retrieve finished task
                 # ----------------------------------------
-                task = self.manager.get_finished_task()
+                # write metrics periodically during long exports
+                timeout = self.metrics.interval
+                retry_wait_time = self.retry_queue.get_wait_time()
+                if retry_wait_time is not None:
+                    timeout = min(timeout, retry_wait_time)
+                if self.backup_window is not None and not throttled:
+                    timeout = min(timeout, max(self.backup_window.deadline - time.time(), 0))
+                task = self.manager.get_finished_task(timeout=timeout)
+                if task is None:
+                    self.metrics.set('tasks_in_flight', in_flight, stage='export')
+                    self.metrics.record_workers(self.manager.get_workers_progress())
+                    self.metrics.write_if_due()
+                    continue
+                in_flight -= 1
                 self.export_tasks[task.rbd_id] = task
+                rbd_info = rbd_info_map[task.rbd_id]
 
-                self.log.info(("receive finished task %s" % task.name, task.result))
+                self.log.info("receive finished task %s, status = %s, elapsed = %s seconds",
+                              task.name, TASK_STAT[task.task_status], task.elapsed_time)
+                self.log.debug(("task result of %s" % task.name, task.result))
+                self.metrics.record_export(task, EXPORT_TYP[task.export_type])
 
+                self._update_space_usage(task.export_destpath)
                 if task.task_status == COMPLETE:
                     self.log.info("%s is completed." % task.name)
+                    self._record_export_history(task.rbd_id, EXPORT_TYP[task.export_type],
+                                                task.export_destpath, task.start_timestamp)
+                    self.meta_rbd_pending_export_list.pop(task.rbd_id, None)
+                    self.meta_rbd_deferred_list.pop(task.rbd_id, None)
+                    if task.export_type == FULL:
+                        self.meta_rbd_full_export_list.pop(task.rbd_id, None)
+                    self.retry_queue.succeed(task.rbd_id, 'export')
+                    update_throughput(self.meta_rbd_export_throughput, task.rbd_id,
+                                      rbd_info['rbd_used_size'], task.elapsed_time)
                     completed_task_count += 1
 
+                elif getattr(task, 'deadline_stopped', False):
+                    self._defer_export(rbd_info, "stopped at deadline of backup window")
+                    deferred_task_count += 1
+
+                elif self.retry_queue.fail(task, 'export'):
+                    self.log.warning("%s is not completed, scheduled to retry." % task.name)
+
                 else:
                     self.log.warning("%s is not completed" % task.name)
                     uncompleted_task_count += 1
 
-                if submitted_task_count == completed_task_count + uncompleted_task_count:
-                    break
-
             except Exception as e:
                 self.log.error("unable to check export result task. %s" % e)
                 exc_type,exc_value,exc_traceback = sys.exc_info()
                 traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
                 uncompleted_task_count += 1
 
+        if len(self.deferred_snapshot_tasks) != 0:
+            self._remove_deferred_snapshots()
+
+        submitted_task_count = len(submitted_rbd_ids)
+        if submitted_task_count == 0 and deferred_task_count == 0:
+            self.log.error("no any RBD export task submitted.")
+            return False
+
         # write backup list
         if self._write_metafile(RBD_BACKUP_CIRCULATION_LIST, self.meta_rbd_backup_list) is False:
             return False
-
+        self._write_space_usage()
+        self._write_metafile(RBD_EXPORT_HISTORY, self.admission.history)
+        self._write_metafile(RBD_PENDING_EXPORT_LIST, self.meta_rbd_pending_export_list)
+        self._write_metafile(RBD_RETRY_HISTORY, self.retry_queue.history)
+        self._write_metafile(RBD_EXPORT_THROUGHPUT, self.meta_rbd_export_throughput)
+        self._write_metafile(RBD_DEFERRED_LIST, self.meta_rbd_deferred_list)
+        self._write_metafile(RBD_FULL_EXPORT_LIST, self.meta_rbd_full_export_list)
+        if deferred_task_count != 0:
+            self._write_metafile(RBD_SNAPSHOT_MAINTAIN_LIST, self.meta_rbd_snapshot_list)
+
+        self.metrics.set('tasks_in_flight', 0, stage='export')
+        self.metrics.stage_end('export')
         self.log.info("\n%s submitted export task.\n"
                       "%s completed export task.\n"
-                      "%s uncompleted export task."
+                      "%s uncompleted export task.\n"
+                      "%s deferred export task."
                       % (submitted_task_count,
                          completed_task_count,
-                         uncompleted_task_count))
+                         uncompleted_task_count,
+                         deferred_task_count))
         return True
 
+    def synthesize_full_backup(self):
+        ''' build full backup file of new generation from full backup file of
+            last generation and the incremental backup files locally.
+            the exported incremental file is removed once the synthetic full is
+            verified. if failed, move the exported incremental file back to last
+            generation and drop the new generation, so the backup chain is still
+            continuous.
+        '''
+        self.log.start_line(title="\n(7-1). BUILD SYNTHETIC FULL BACKUP", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        submitted_task_count = 0
+        completed_task_count = 0
+        uncompleted_task_count = 0
+
+        try:
+            # Submit synthetic full task to workers
+            # ---------------------------------------------------------------------
+            for rbd_info in self.backup_rbd_info_list:
+                rbd_id = rbd_info['id']
+                chain = rbd_info['synthetic_full_base']
+                if chain is None or not self.export_tasks.has_key(rbd_id):
+                    continue
+
+                export_task = self.export_tasks[rbd_id]
+                if export_task.task_status != COMPLETE:
+                    self.log.warning("export task %s is not completed, "
+                                     "skip synthetic full backup." % export_task.name)
+                    continue
+
+                dest_path = os.path.join(os.path.dirname(export_task.export_destpath),
+                                         rbd_info['new_snapshot_name'])
+                diff_paths = chain[1:] + [export_task.export_destpath]
+
+                task_info = dict()
+                task_info['base'] = chain[0]
+                task_info['diffs'] = diff_paths
+                task_info['dest'] = dest_path
+                task_info['reflink'] = self.cfg.synthetic_full_reflink
+                self.log.info(("RBD synthetic full task setting:", task_info))
+
+                synthetic_task = RBDSyntheticFullTask(self.ceph.cluster_name,
+                                                      rbd_info['pool_name'],
+                                                      rbd_info['rbd_name'],
+                                                      chain[0],
+                                                      diff_paths,
+                                                      dest_path,
+                                                      reflink=self.cfg.synthetic_full_reflink,
+                                                      rbd_id=rbd_id)
+                synthetic_task.resource_tags = self._get_resource_tags()
+                self.synthetic_full_tasks[rbd_id] = synthetic_task
+                self.manager.add_task(synthetic_task)
+                submitted_task_count += 1
+
+            if submitted_task_count == 0:
+                self.log.info("no synthetic full backup task submitted.")
+                return True
+
+            # Collect finished synthetic full tasks
+            # ----------------------------------------------------------------------
+            while submitted_task_count != completed_task_count + uncompleted_task_count:
+                task = self._get_finished_task()
+                self.synthetic_full_tasks[task.rbd_id] = task
+
+                self.log.info("receive finished task %s, status = %s, elapsed = %s seconds",
+                              task.name, TASK_STAT[task.task_status], task.elapsed_time)
+                self.log.debug(("task result of %s" % task.name, task.result))
+                self.metrics.record_task(task, 'synthetic_full')
+
+                export_task = self.export_tasks[task.rbd_id]
+                if task.task_status == COMPLETE and \
+                   not self._verify_synthetic_full(task.dest_path, export_task.export_destpath):
+                    task.task_status = ERROR
+
+                if task.task_status == COMPLETE:
+                    self.log.info("%s is completed." % task.name)
+                    # new generation starts from the synthetic full, the
+                    # incremental file is not in its backup chain
+                    self._remove_backup_file(task.rbd_id, export_task.export_destpath)
+                    self._update_space_usage(task.dest_path)
+                    self._record_export_history(task.rbd_id, EXPORT_TYP[FULL], task.dest_path,
+                                                self.export_tasks[task.rbd_id].start_timestamp)
+                    completed_task_count += 1
+                    continue
+
+                self.log.warning("%s is not completed. move incremental backup "
+                                 "file back to last generation." % task.name)
+                uncompleted_task_count += 1
+
+                # the new generation is dropped, its directory is removed
+                # only if the incremental file is moved out of it.
+                new_generation_path = os.path.dirname(task.dest_path)
+                backup_list = self.meta_rbd_backup_list[task.rbd_id]
+                new_generation = os.path.basename(task.dest_path)
+                if new_generation in backup_list:
+                    backup_list.remove(new_generation)
+
+                if os.path.exists(task.dest_path):
+                    self._remove_backup_file(task.rbd_id, task.dest_path)
+                last_generation_path = os.path.dirname(task.base_path)
+                diff_filename = os.path.basename(export_task.export_destpath)
+                diff_path = os.path.join(last_generation_path, diff_filename)
+                try:
+                    os.rename(export_task.export_destpath, diff_path)
+                    export_task.export_destpath = diff_path
+                except OSError as e:
+                    self._require_full_export(task.rbd_id,
+                                              "unable to move %s to last generation. %s"
+                                              % (export_task.export_destpath, e))
+                else:
+                    try:
+                        os.rmdir(new_generation_path)
+                    except OSError as e:
+                        self._require_full_export(task.rbd_id,
+                                                  "unable to remove directory %s. %s"
+                                                  % (new_generation_path, e))
+                self._update_space_usage(task.dest_path)
+                self._update_space_usage(export_task.export_destpath)
+
+            # write backup list
+            if self._write_metafile(RBD_BACKUP_CIRCULATION_LIST, self.meta_rbd_backup_list) is False:
+                return False
+            self._write_space_usage()
+            self._write_metafile(RBD_EXPORT_HISTORY, self.admission.history)
+            self._write_metafile(RBD_FULL_EXPORT_LIST, self.meta_rbd_full_export_list)
+
+            self.metrics.stage_end('synthetic_full')
+            self.log.info("\n%s submitted synthetic full task.\n"
+                          "%s completed synthetic full task.\n"
+                          "%s uncompleted synthetic full task."
+                          % (submitted_task_count,
+                             completed_task_count,
+                             uncompleted_task_count))
+            return True
+        except Exception as e:
+            self.log.error("unable to build synthetic full backup. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
+
+    def _remove_backup_file(self, rbd_id, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError as e:
+            self._require_full_export(rbd_id, "unable to remove %s. %s" % (path, e))
+            return False
+
+    def _require_full_export(self, rbd_id, reason):
+        ''' backup chain of the RBD is not reliable after a failed file
+            operation of synthetic full, next backup is regular full export.
+        '''
+        self.log.error("%s, next backup of %s is regular full backup." % (reason, rbd_id))
+        self.meta_rbd_full_export_list[rbd_id] = {'time': self.backup_time, 'reason': reason}
+
+    def _verify_synthetic_full(self, full_path, diff_path):
+        ''' synthetic full is of the snapshot and size of the incremental file '''
+        try:
+            from_snap, to_snap, image_size = DiffFile(diff_path).read_header()
+            if to_snap != os.path.basename(full_path):
+                self.log.warning("synthetic full %s is not of snapshot %s."
+                                 % (full_path, to_snap))
+                return False
+            if image_size is not None and os.path.getsize(full_path) != image_size:
+                self.log.warning("synthetic full %s is %s bytes, image size is %s bytes."
+                                 % (full_path, os.path.getsize(full_path), image_size))
+                return False
+            return True
+        except Exception as e:
+            self.log.warning("unable to verify synthetic full %s. %s" % (full_path, e))
+            return False
+
+    def build_block_manifest(self):
+        ''' write block manifest of new snapshot of each completed export,
+            it is base of hash diff if the snapshot is gone in next backup.
+            hash diff export writes its manifest by itself.
+        '''
+        self.log.start_line(title="\n(7-2). BUILD BLOCK MANIFEST", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        if not self.hash_manifest_enabled:
+            self.log.info("hash manifest is disabled.")
+            return True
+
+        submitted_task_count = 0
+        completed_task_count = 0
+        uncompleted_task_count = 0
+
+        try:
+            # Submit manifest task to workers
+            # ---------------------------------------------------------------------
+            for rbd_info in self.backup_rbd_info_list:
+                rbd_id = rbd_info['id']
+                if not self.export_tasks.has_key(rbd_id):
+                    continue
+                export_task = self.export_tasks[rbd_id]
+                if export_task.task_status != COMPLETE:
+                    continue
+                if isinstance(export_task, RBDHashDiffTask):
+                    continue
+
+                raw_path = None
+                base_manifest_path = None
+                diff_path = None
+                synthetic_task = self.synthetic_full_tasks.get(rbd_id)
+                if export_task.export_type == FULL:
+                    raw_path = export_task.export_destpath
+                elif synthetic_task is not None and synthetic_task.task_status == COMPLETE:
+                    raw_path = synthetic_task.dest_path
+                else:
+                    diff_path = export_task.export_destpath
+                    base_manifest_path = get_manifest_path(os.path.dirname(diff_path),
+                                                           export_task.from_snap)
+                    if not os.path.exists(base_manifest_path):
+                        self.log.warning("block manifest of snapshot %s not exist, "
+                                         "skip block manifest of %s."
+                                         % (export_task.from_snap, rbd_id))
+                        continue
+
+                if raw_path is not None:
+                    backup_path = os.path.dirname(raw_path)
+                else:
+                    backup_path = os.path.dirname(diff_path)
+                manifest_path = get_manifest_path(backup_path, export_task.to_snap)
+
+                manifest_task = RBDManifestTask(self.ceph.cluster_name,
+                                                rbd_info['pool_name'],
+                                                rbd_info['rbd_name'],
+                                                export_task.to_snap,
+                                                manifest_path,
+                                                raw_path=raw_path,
+                                                base_manifest_path=base_manifest_path,
+                                                diff_path=diff_path,
+                                                conffile=self.ceph.conffile,
+                                                rbd_id=rbd_id)
+                manifest_task.resource_tags = self._get_resource_tags(rbd_info['pool_name'])
+                self.manager.add_task(manifest_task)
+                submitted_task_count += 1
+
+            # Collect finished manifest tasks
+            # ----------------------------------------------------------------------
+            while submitted_task_count != completed_task_count + uncompleted_task_count:
+                task = self._get_finished_task()
+
+                self.log.info("receive finished task %s, status = %s, elapsed = %s seconds",
+                              task.name, TASK_STAT[task.task_status], task.elapsed_time)
+                self.metrics.record_task(task, 'manifest')
+
+                if task.task_status == COMPLETE:
+                    self._update_space_usage(task.manifest_path)
+                    completed_task_count += 1
+                else:
+                    self.log.warning("%s is not completed." % task.name)
+                    uncompleted_task_count += 1
+
+            self._write_space_usage()
+            self.metrics.stage_end('manifest')
+            self.log.info("\n%s submitted manifest task.\n"
+                          "%s completed manifest task.\n"
+                          "%s uncompleted manifest task."
+                          % (submitted_task_count,
+                             completed_task_count,
+                             uncompleted_task_count))
+            return True
+        except Exception as e:
+            self.log.error("unable to build block manifest. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
+
     def remove_exceed_rbd_snapshot(self):
         self.log.start_line(title="\n(8) REMOVE EXCEED RBD SNAPSHOT", symbol_count=0)
         self.log.start_line(symbol="-", symbol_count=40)
@@ -1143,34 +2403,54 @@ class RBDBackup(object):
                     else:
                         self.log.info("%s exceed snapshot to be removed." % diff_count)
 
-                        remove_i = 0    # trace index for pop
-                        for i in range(0, diff_count):
-                            self.log.info("removing snapshot, name = %s" % matched_snapshot_list[remove_i])
+                        # snapshots of pending export are kept until the
+                        # export is completed.
+                        pinned_snapshot_list = self._get_pinned_snapshots(rbd_id)
+                        if len(pinned_snapshot_list) != 0:
+                            self.log.info(("snapshot pinned by pending export:", pinned_snapshot_list))
+
+                        # protected snapshot, e.g. parent of restored clone,
+                        # is kept until it is released.
+                        in_use_snapshot_list = [snap_name for snap_name in matched_snapshot_list
+                                                if snap_name not in pinned_snapshot_list and
+                                                   pool.is_snap_in_use(rbd_name, snap_name)]
+                        if len(in_use_snapshot_list) != 0:
+                            self.log.warning(("snapshot protected or cloned, not removed:",
+                                              in_use_snapshot_list))
+
+                        removable_snapshot_list = [snap_name for snap_name in matched_snapshot_list
+                                                   if snap_name not in pinned_snapshot_list and
+                                                      snap_name not in in_use_snapshot_list]
+
+                        for snap_name in removable_snapshot_list[:diff_count]:
+                            self.log.info("removing snapshot, name = %s" % snap_name)
                             rm_snapshot_task_count += 1
 
                             snapshot_task.action = REMOVE
-                            snapshot_task.snap_name = matched_snapshot_list[i]
+                            snapshot_task.snap_name = snap_name
                             task_name = snapshot_task    # just update task name
                             result = snapshot_task.execute()    # execute remove cmd
 
                             if snapshot_task.task_status == COMPLETE:
                                 self.log.info(("removed RBD snapshot, snapshot name = %s" %
-                                                matched_snapshot_list[i], snapshot_task.result))
-                                matched_snapshot_list.pop(remove_i)
+                                                snap_name, snapshot_task.result))
+                                matched_snapshot_list.remove(snap_name)
                                 removed_snap = "%s %s %s" % (snapshot_task.pool_name,
                                                              snapshot_task.rbd_name,
                                                              snapshot_task.snap_name)
                                 self.removed_snapshots.append(removed_snap)
+                                self.metrics.inc('retention_deletions_total', kind='snapshot')
                             else:
                                 self.log.info(("unable to remove RBD snapshot, snapshot_name = %s" %
-                                                matched_snapshot_list[i], snapshot_task.result))
-                                remove_i += 1
+                                                snap_name, snapshot_task.result))
+                                self.metrics.inc('failures_total', stage='snapshot_retention')
 
                     # update snapshot list of RBD
                     # ----------------------------------------
                     self.meta_rbd_snapshot_list[rbd_id] = matched_snapshot_list
 
             self.log.info("\ntotal removed %s snapshots." % rm_snapshot_task_count)
+            self.metrics.stage_end('snapshot_retention')
             return True
         except Exception as e:
             self.log.error("unable to remove exceed snapshot of RBD. %s" % e)
@@ -1221,23 +2501,32 @@ class RBDBackup(object):
                     for i in range(0, diff_count):
                         self.log.info("removing backup, name = %s" % meta_rbd_backup_list[remove_i])
 
-                        deleted_path = self.backup_directory.del_directory(pool_name,
-                                                                           rbd_name,
-                                                                           meta_rbd_backup_list[remove_i])
+                        deleted_path = self._delete_backup(pool_name,
+                                                           rbd_name,
+                                                           meta_rbd_backup_list[remove_i])
                         if deleted_path == False:
-                            self.log.info("unable to delete backup. path = %s" % del_path)
+                            self.log.info("unable to delete backup. name = %s"
+                                          % meta_rbd_backup_list[remove_i])
+                            self.metrics.inc('failures_total', stage='backup_retention')
                             remove_i += 1
                         else:
                             self.log.info("deleted backup. path = %s" % deleted_path)
+                            if self.space_account is not None:
+                                self.space_account.remove_generation(pool_name,
+                                                                     rbd_name,
+                                                                     meta_rbd_backup_list[remove_i])
                             meta_rbd_backup_list.pop(remove_i)
 
                             self.deleted_backup.append(deleted_path)
+                            self.metrics.inc('retention_deletions_total', kind='backup')
+                            rm_backup_count += 1
 
                 # update backup list
                 # ----------------------------------------
                 self.meta_rbd_backup_list[rbd_id] = meta_rbd_backup_list
 
             self.log.info("\ntotal deleted %s backups." % rm_backup_count)
+            self.metrics.stage_end('backup_retention')
             return True
         except Exception as e:
             self.log.error("unable to delete exceed backup of RBD. %s" % e)
@@ -1247,6 +2536,7 @@ class RBDBackup(object):
 
         finally:
             # write backup list
+            self._write_space_usage()
             if self._write_metafile(RBD_BACKUP_CIRCULATION_LIST, self.meta_rbd_backup_list) is False:
                 return False
 
@@ -1254,7 +2544,9 @@ class RBDBackup(object):
         self.log.start_line(title="\n(11) FINALIZE RBD BACKUP", symbol_count=0)
         self.log.start_line(symbol="-", symbol_count=40)
 
-        # stop worker processes
+        # stop health check and worker processes
+        if self.health_sampler is not None:
+            self.health_sampler.stop()
 
         if self.manager is not None:
             self.manager.stop_worker()
@@ -1262,8 +2554,8 @@ class RBDBackup(object):
             # check worker status
             # make sure all worker stopped
             countdown = 5
-            worker_count = self.manager.worker_count
             while True:
+                worker_count = self.manager.worker_count
                 workers_status = self.manager.get_workers_status()
                 for name, status in workers_status.iteritems():
                     #print name, status
@@ -1279,7 +2571,8 @@ class RBDBackup(object):
                 countdown -= 1
                 if countdown == 0:
                     break
-        else:
+        elif len(self.backup_rbd_info_list) != 0:
+            # no manager is created if no RBD to backup, e.g. all unchanged
             self.log.error("worker manager is invalid.")
 
         # close pool (rados connect)
@@ -1291,14 +2584,27 @@ class RBDBackup(object):
         if self.cache_clean_enabled:
             self._clean_cache()
 
+        # wait background deletion of expired backups
+        if self.trash is not None:
+            self.trash.stop(wait_seconds=self.trash_finalize_wait)
+
+        if self.metrics is not None:
+            self.metrics.run_end()
+
+        # stop log listener after workers stopped
+        if self.log is not None:
+            self.log.close()
+
 def main(argument_list):
     try:
         rbdbackup = RBDBackup()
+        rbdbackup.tracer.start_span('backup_run', kind='run')
         print("\nStart CEPH RBD Backup @ %s" % rbdbackup.backup_time)
         print("pid = %s" % os.getpid())
 
         # ----------------------------------------------------------------------
         print("\n1. read RBD backup argument.")
+        rbdbackup.trace_stage('read_argument')
         if rbdbackup.read_argument_list(argument_list) == False:
             return
         else:
@@ -1309,6 +2615,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n2. read config file options. (Logging will start after loging option read successfully.)")
+        rbdbackup.trace_stage('read_config')
         if rbdbackup.read_config_file() == False:
             return
         else:
@@ -1319,6 +2626,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n3. initialze backup directory.")
+        rbdbackup.trace_stage('initialize_backup_directory')
         if rbdbackup.initialize_backup_directory() == False:
             return
         else:
@@ -1328,6 +2636,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n4. read RBD list to backup.")
+        rbdbackup.trace_stage('read_rbd_list')
         if rbdbackup.read_backup_rbd_info_list() == False:
             return
         else:
@@ -1338,6 +2647,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n5. initialze worker.")
+        rbdbackup.trace_stage('initialize_worker')
         if rbdbackup.initialize_backup_worker() == False:
             return
         else:
@@ -1347,6 +2657,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n6. initialze RBD snapshot task.")
+        rbdbackup.trace_stage('initialize_snapshot_task')
         if rbdbackup.initialize_snapshot_task() == False:
             return
         else:
@@ -1356,6 +2667,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n7. start RBD snapshot create task.")
+        rbdbackup.trace_stage('snapshot')
         if rbdbackup.start_snapshot() == False:
             return
         else:
@@ -1373,6 +2685,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n8. initialize RBD export RBD task.")
+        rbdbackup.trace_stage('initialize_export_task')
         if rbdbackup.initialize_export_task() == False:
             return
         else:
@@ -1382,6 +2695,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n9. start RBD export task.")
+        rbdbackup.trace_stage('export')
         if rbdbackup.start_export() == False:
             return
         else:
@@ -1391,8 +2705,27 @@ def main(argument_list):
                                                                         task,
                                                                         task.task_status))
 
+        # ----------------------------------------------------------------------
+        print("\n9-1. build synthetic full backup.")
+        rbdbackup.trace_stage('synthetic_full')
+        if rbdbackup.synthesize_full_backup() == False:
+            return
+        else:
+            synthetic_tasks = rbdbackup.synthetic_full_tasks
+            for rbd_id, task in synthetic_tasks.iteritems():
+                print("  - rbd id = %s, task name = %s, status = %s" % (rbd_id,
+                                                                        task,
+                                                                        task.task_status))
+
+        # ----------------------------------------------------------------------
+        print("\n9-2. build block manifest.")
+        rbdbackup.trace_stage('manifest')
+        if rbdbackup.build_block_manifest() == False:
+            return
+
         # ----------------------------------------------------------------------
         print("\n10, remove exceed RBD snapshot.")
+        rbdbackup.trace_stage('snapshot_retention')
         if rbdbackup.remove_exceed_rbd_snapshot() == False:
             return
         else:
@@ -1402,6 +2735,7 @@ def main(argument_list):
 
         # ----------------------------------------------------------------------
         print("\n11. remove exceed RBD backup file.")
+        rbdbackup.trace_stage('backup_retention')
         if rbdbackup.remove_exceed_backup() == False:
             return
         else:
@@ -1416,7 +2750,9 @@ def main(argument_list):
 
     finally:
         print("\n12. finalizing RBD backup.")
+        rbdbackup.trace_stage('finalize')
         rbdbackup.finalize()
+        rbdbackup.tracer.close()
 
 
 if "__main__" == __name__:
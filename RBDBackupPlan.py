@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This module plan full backup weekday of each RBD image by the stagger
+# backup policy offline, so the plan can be checked before a backup run.
+#
+# RBD images are read from the backup yaml of the backup config. bytes of
+# an image are taken as the backup does, from last full backup in export
+# history or largest generation in space usage metafile, and from used size
+# of the image in the cluster if it has no backup yet. last plan in metafile
+# {cluster}.meta.rbd_full_backup_plan is kept where the balance allows.
+#
+# with --plan_file_path the plan stored by last backup is shown instead.
+
+import os
+import sys
+import yaml
+import datetime
+import traceback
+
+from argparse import ArgumentParser
+
+from Common.Constant import *
+from Common.Config import RBDConfig
+from Common.Logger import Logger
+from Common.Metafile import Metafile
+from Common.Yaml import Yaml
+from Common.Pool import Pool
+from Common.SpaceAccount import SpaceAccount
+from Common.SpaceAdmission import SpaceAdmission
+from Common.FullBackupPlanner import FullBackupPlanner
+
+WEEKDAY_NAME = ['', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def _print_plan(plan_data, list_rbd=False):
+    plan = plan_data['weekday']
+    rbd_bytes = plan_data['bytes']
+    today = datetime.datetime.today().weekday() + 1
+
+    total_bytes = sum(rbd_bytes.values())
+    print("\nplanned at %s, %s images, %s bytes of full backup"
+          % (plan_data.get('time'), len(plan), total_bytes))
+
+    for weekday in sorted(set(plan.values())):
+        rbd_ids = sorted([k for k, v in plan.iteritems() if v == weekday],
+                         key=lambda k: -rbd_bytes.get(k, 0))
+        day_bytes = sum([rbd_bytes.get(rbd_id, 0) for rbd_id in rbd_ids])
+        print("  %s %-3s %5s images %16s bytes %6.2f %%"
+              % ('*' if weekday == today else ' ', WEEKDAY_NAME[weekday],
+                 len(rbd_ids), day_bytes,
+                 day_bytes * 100.0 / total_bytes if total_bytes > 0 else 0))
+        if list_rbd:
+            for rbd_id in rbd_ids:
+                print("        - %s, %s bytes" % (rbd_id, rbd_bytes.get(rbd_id, 0)))
+
+def _read_config(config_file, config_section):
+    if not os.path.exists(config_file):
+        print("Error, backup config file not exist.\n"
+              "config file = %s" % config_file)
+        return False
+
+    cfg = RBDConfig(config_file)
+    if not cfg.check_in_section(config_section):
+        print("Error, unable to check in config section.\n"
+              "config file = %s, section = %s" % (config_file, config_section))
+        return False
+
+    for read_config in [cfg.read_log_config,
+                        cfg.read_ceph_config,
+                        cfg.read_backup_config,
+                        cfg.read_policy_config]:
+        if not read_config():
+            print("Error, unable to read config, section = %s" % config_section)
+            return False
+    return cfg
+
+def plan_full_backup(log, cfg, cluster_name, conffile):
+    ''' return plan data {'time', 'weekday', 'bytes'} of RBDs in backup yaml '''
+    cluster_path = os.path.join(cfg.backup_path, cluster_name)
+    metafile = Metafile(log, cluster_name, cluster_path)
+
+    last_plan = metafile.read(RBD_FULL_BACKUP_PLAN, 'weekday')
+    if not isinstance(last_plan, dict):
+        last_plan = {}
+
+    export_history = metafile.read(RBD_EXPORT_HISTORY)
+    if not isinstance(export_history, dict):
+        export_history = None
+    admission = SpaceAdmission(log, export_history)
+
+    space_account = SpaceAccount(log, cluster_path)
+    space_usage = metafile.read(RBD_SPACE_USAGE)
+    if isinstance(space_usage, dict):
+        space_account.load(space_usage)
+
+    yaml_data = Yaml(log, cfg.backup_yaml_filepath).read(cfg.backup_yaml_section_name)
+    if not yaml_data:
+        print("Error, unable to read RBD list from %s, section = %s"
+              % (cfg.backup_yaml_filepath, cfg.backup_yaml_section_name))
+        return False
+
+    rbd_bytes = {}
+    for pool_name, rbd_name_list in yaml_data.iteritems():
+        pool = Pool(log, cluster_name, pool_name, conffile)
+        if pool.connected is False:
+            print("Error, unable to connect cluster pool %s" % pool_name)
+            return False
+
+        # rbd name in the yaml can be a name or {name: priority}
+        rbd_names = []
+        for rbd_name in rbd_name_list:
+            if isinstance(rbd_name, dict):
+                rbd_names.extend(rbd_name.keys())
+            else:
+                rbd_names.append(rbd_name)
+
+        for rbd_name in rbd_names:
+            rbd_id = "%s_%s_%s" % (cluster_name, pool_name, rbd_name)
+            full_bytes = admission.get_full_bytes(rbd_id)
+            if full_bytes is None:
+                generation_usage = space_account.get_rbd_usage(pool_name, rbd_name)
+                full_bytes = max(generation_usage.values() + [0])
+            if full_bytes == 0:
+                # no backup yet, bytes of full backup is used size of image
+                full_bytes = pool.get_used_size(rbd_name)
+                if full_bytes is False:
+                    print("Warning, unable to get used size of %s, "
+                          "planned by hashed weekday." % rbd_id)
+                    full_bytes = 0
+            rbd_bytes[rbd_id] = full_bytes
+        pool.close()
+
+    planner = FullBackupPlanner(log, weekdays=cfg.policy_full_weekdays.split(','))
+    plan = planner.plan(rbd_bytes, last_plan)
+    return {'time': datetime.datetime.now().strftime(DEFAULT_BACKUP_TIME_FORMAT),
+            'weekday': plan,
+            'bytes': rbd_bytes}
+
+def main(argument_list):
+    try:
+        parser = ArgumentParser(add_help=False)
+        parser.add_argument('--backup_config_file', default=DEFAULT_BACKUP_CONFIG_FILE)
+        parser.add_argument('--backup_config_section', default=DEFAULT_BACKUP_CONFIG_SECTION)
+        parser.add_argument('--ceph_conffile')
+        parser.add_argument('--ceph_cluster_name')
+        parser.add_argument('--plan_file_path')
+        parser.add_argument('--list', action='store_true')
+        args = vars(parser.parse_args(argument_list[1:]))
+
+        if args['plan_file_path'] is not None:
+            with open(args['plan_file_path'], 'r') as plan_file:
+                plan_data = yaml.load(plan_file, Loader=yaml.CLoader)
+            _print_plan(plan_data, args['list'])
+            return 0
+
+        cfg = _read_config(args['backup_config_file'], args['backup_config_section'])
+        if cfg is False:
+            return 2
+
+        log = Logger(cfg)
+        log.set_logger(name='RBDBackupPlan')
+
+        cluster_name = args['ceph_cluster_name']
+        if cluster_name is None:
+            cluster_name = cfg.ceph_cluster_name
+        conffile = args['ceph_conffile']
+        if conffile is None:
+            conffile = cfg.ceph_conffile
+
+        plan_data = plan_full_backup(log, cfg, cluster_name, conffile)
+        if plan_data is False:
+            return 1
+        _print_plan(plan_data, args['list'])
+        return 0
+    except Exception as e:
+        exc_type,exc_value,exc_traceback = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+        return 2
+
+
+if "__main__" == __name__:
+    sys.exit(main(sys.argv))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This module show live status of backup workers from the status board
+# in shared memory, no request is sent to the backup process.
+
+import sys
+import time
+import datetime
+import traceback
+
+from argparse import ArgumentParser
+
+from Common.Constant import *
+from Common.StatusBoard import StatusBoard
+
+
+def _format_time(timestamp):
+    if timestamp == 0:
+        return '-'
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%H:%M:%S')
+
+def _print_board(board):
+    magic, slot_count, pid, created = board.get_header()
+    now = time.time()
+    print("\nbackup pid = %s, started %s, %s workers"
+          % (pid, _format_time(created), slot_count))
+
+    for slot_status in board.read_all():
+        if slot_status is None:
+            print("  - (slot is being updated)")
+            continue
+        if slot_status['pid'] == 0:
+            continue
+
+        state = slot_status['state']
+        if state == RUN:
+            running = "task %s, %.1f s, %s bytes" % (slot_status['task_id'],
+                                                     now - slot_status['task_start'],
+                                                     slot_status['bytes_done'])
+        else:
+            running = ''
+        print("  - %-12s pid %-7s %-5s heartbeat %5.1f s ago, done %-6s %s"
+              % (slot_status['name'], slot_status['pid'], WORKER_STAT[state],
+                 now - slot_status['heartbeat'], slot_status['tasks_done'], running))
+
+def main(argument_list):
+    try:
+        parser = ArgumentParser(add_help=False)
+        parser.add_argument('--status_file_path', required=True)
+        parser.add_argument('--watch', type=float, default=0)
+        args = vars(parser.parse_args(argument_list[1:]))
+
+        board = StatusBoard(0, args['status_file_path'], create=False)
+        while True:
+            _print_board(board)
+            if args['watch'] <= 0:
+                break
+            time.sleep(args['watch'])
+
+        board.close()
+        return 0
+    except KeyboardInterrupt:
+        return 0
+    except Exception as e:
+        exc_type,exc_value,exc_traceback = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+        return 2
+
+
+if "__main__" == __name__:
+    sys.exit(main(sys.argv))
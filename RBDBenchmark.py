@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This module benchmark RBD backup against simulated ceph clusters and
+# compare the results with stored baseline.
+#
+# each scenario creates a simulated cluster, runs a full backup and a number
+# of incremental backups with data churn between runs. the backup runs as a
+# separate process with fake rados/rbd modules and commands, stage times are
+# read from its trace and metrics files.
+
+import sys
+import os
+import time
+import json
+import shutil
+import platform
+import subprocess
+import traceback
+
+from collections import OrderedDict
+from argparse import ArgumentParser
+from ConfigParser import ConfigParser
+
+from Common.Accounting import wait_process
+from Common.TraceAnalyzer import TraceAnalyzer
+from Simulator.ClusterState import ClusterState, SIMULATOR_PATH_ENV
+from Simulator.Workload import Workload
+
+
+DEFAULT_SCENARIO_FILE = './Config/benchmark.json'
+DEFAULT_BASELINE_FILE = './Config/benchmark_baseline.json'
+DEFAULT_WORK_PATH = '/tmp/rbd_benchmark'
+
+# lower is better unless listed in HIGHER_BETTER_METRICS
+HIGHER_BETTER_METRICS = ['export_throughput_bytes_per_second']
+# metrics recorded but not compared with baseline
+INFO_METRICS = ['export_bytes', 'changed_bytes', 'image_count', 'worker_count']
+
+SCENARIO_DEFAULTS = {'pool_name': 'rbd',
+                     'image_count': 10,
+                     'min_size': 67108864,
+                     'max_size': 4294967296,
+                     'size_skew': 1.2,
+                     'fill_ratio': 0.1,
+                     'extent_size': 4194304,
+                     'churn_rate': 0.05,
+                     'churn_image_ratio': 0.5,
+                     'incremental_runs': 1,
+                     'workers': 1,
+                     'op_latency': 0.0,
+                     'bandwidth': 0,
+                     'seed': 1,
+                     'threshold_percent': 20}
+
+
+class Benchmark(object):
+    def __init__(self, scenario_file, baseline_file, work_path, config_file):
+        self.scenario_file = scenario_file
+        self.baseline_file = baseline_file
+        self.work_path = os.path.abspath(work_path)
+        self.config_file = config_file
+        self.repo_path = os.path.dirname(os.path.abspath(__file__))
+
+        self.scenarios = []
+        self.baseline = {}
+        self.results = OrderedDict()
+        self.regressions = []
+        self.unbaselined = []       # [(scenario name, run name), ...] without baseline
+
+    def read_scenarios(self, names=None):
+        with open(self.scenario_file, 'r') as scenario_file:
+            data = json.load(scenario_file, object_pairs_hook=OrderedDict)
+
+        defaults = dict(SCENARIO_DEFAULTS)
+        defaults.update(data.get('defaults', {}))
+
+        # a scenario with list of worker counts expands to a scenario of each
+        for scenario in data['scenarios']:
+            worker_counts = scenario.get('workers', defaults['workers'])
+            if not isinstance(worker_counts, list):
+                worker_counts = [worker_counts]
+            for worker_count in worker_counts:
+                expanded = dict(defaults)
+                expanded.update(scenario)
+                expanded['workers'] = worker_count
+                if len(worker_counts) > 1:
+                    expanded['name'] = "%s_w%s" % (scenario['name'], worker_count)
+                if names and scenario['name'] not in names and expanded['name'] not in names:
+                    continue
+                self.scenarios.append(expanded)
+        return self.scenarios
+
+    def read_baseline(self):
+        if os.path.exists(self.baseline_file):
+            with open(self.baseline_file, 'r') as baseline_file:
+                self.baseline = json.load(baseline_file)
+        return self.baseline
+
+    def _write_config(self, scenario, scenario_path):
+        ''' write backup config and backup list of the scenario '''
+        list_path = os.path.join(scenario_path, 'backup_list.yaml')
+        with open(list_path, 'w') as list_file:
+            list_file.write("benchmark:\n    %s:\n" % scenario['pool_name'])
+            for image_name in self.workload.images[scenario['pool_name']]:
+                list_file.write("        - %s\n" % image_name)
+
+        config = ConfigParser()
+        config.read(self.config_file)
+        section = config.sections()[0]
+        options = {'ceph_conffile': '',
+                   'log_path': os.path.join(scenario_path, 'log'),
+                   'log_level': 'INFO',
+                   'backup_yaml_filepath': list_path,
+                   'backup_yaml_section_name': 'benchmark',
+                   'backup_path': os.path.join(scenario_path, 'backup'),
+                   'backup_concurrent_worker_count': str(scenario['workers']),
+                   'backup_retain_count': str(scenario['incremental_runs'] + 1),
+                   'snapshot_retain_count': str(scenario['incremental_runs'] + 1),
+                   # first run is full backup as no metafile exists, others incremental
+                   'backup_full_weekday': '0',
+                   'backup_incr_weekday': '1,2,3,4,5,6,7',
+                   'monitor_record_path': os.path.join(scenario_path, 'record'),
+                   'metrics_textfile_path': '',
+                   'metrics_json_path': os.path.join(scenario_path, 'metrics.json'),
+                   'trace_file_path': os.path.join(scenario_path, 'trace.jsonl'),
+                   'drop_cache_level': '0',
+                   'flush_file_system_buffer': 'False'}
+        for key, value in options.iteritems():
+            config.set(section, key, value)
+
+        for path in [options['log_path'], options['backup_path'], options['monitor_record_path']]:
+            os.makedirs(path)
+
+        config_path = os.path.join(scenario_path, 'backup.conf')
+        with open(config_path, 'w') as config_file:
+            config.write(config_file)
+        return config_path, section
+
+    def _write_command_wrappers(self):
+        ''' write rbd and ceph commands which run the fake commands with this
+            python interpreter, python in PATH may not be the same version.
+            return directory of the commands.
+        '''
+        bin_path = os.path.join(self.work_path, 'bin')
+        if not os.path.isdir(bin_path):
+            os.makedirs(bin_path)
+        for command in ['rbd', 'ceph']:
+            command_path = os.path.join(bin_path, command)
+            with open(command_path, 'w') as command_file:
+                command_file.write("#!/bin/sh\nexec '%s' '%s' \"$@\"\n"
+                                   % (sys.executable,
+                                      os.path.join(self.repo_path, 'Simulator', 'bin', command)))
+            os.chmod(command_path, 0755)
+        return bin_path
+
+    def _run_backup(self, config_path, section, scenario_path):
+        ''' run backup process, return (return code, wall seconds, rusage) '''
+        env = dict(os.environ)
+        env[SIMULATOR_PATH_ENV] = os.path.join(scenario_path, 'cluster')
+        env['PYTHONPATH'] = os.pathsep.join([os.path.join(self.repo_path, 'Simulator'),
+                                             self.repo_path])
+        env['PATH'] = os.pathsep.join([self._write_command_wrappers(),
+                                       env.get('PATH', '')])
+        cmd = [sys.executable, os.path.join(self.repo_path, 'RBDBackup.py'),
+               '--backup_config_file', config_path,
+               '--backup_config_section', section]
+
+        with open(os.path.join(scenario_path, 'backup.out'), 'a') as output:
+            start_timestamp = time.time()
+            p = subprocess.Popen(cmd, cwd=self.repo_path, env=env,
+                                 stdout=output, stderr=subprocess.STDOUT)
+            return_code, rusage = wait_process(p)
+            return return_code, time.time() - start_timestamp, rusage
+
+    def _collect(self, scenario_path, wall_seconds, rusage):
+        ''' collect metrics of the last run from trace and metrics json '''
+        analyzer = TraceAnalyzer(os.path.join(scenario_path, 'trace.jsonl'))
+        if analyzer.read() is False:
+            return False
+        run = analyzer.get_run()
+        if run is False:
+            return False
+        run, stages, tasks = run
+        trace_id = run['trace']
+
+        stage_seconds = {}
+        for stage in stages:
+            stage_seconds[stage['name']] = stage['end'] - stage['start']
+        metafile_seconds = sum([span['end'] - span['start']
+                                for span in analyzer.spans[trace_id]
+                                if span['name'] in ['read_metafile', 'write_metafile']])
+
+        export_bytes = 0
+        failures = 0
+        with open(os.path.join(scenario_path, 'metrics.json'), 'r') as metrics_file:
+            metrics = json.load(metrics_file)
+        for counter in metrics['counters']:
+            if counter['name'] == 'rbd_backup_export_bytes_total':
+                export_bytes += counter['value']
+            elif counter['name'] == 'rbd_backup_failures_total':
+                failures += counter['value']
+
+        export_seconds = stage_seconds.get('export', 0)
+        result = OrderedDict()
+        result['wall_seconds'] = wall_seconds
+        result['discovery_seconds'] = stage_seconds.get('read_rbd_list', 0)
+        result['snapshot_seconds'] = stage_seconds.get('snapshot', 0)
+        result['export_seconds'] = export_seconds
+        result['export_bytes'] = export_bytes
+        result['export_throughput_bytes_per_second'] = \
+            export_bytes / export_seconds if export_seconds > 0 else 0
+        result['metafile_seconds'] = metafile_seconds
+        result['retention_seconds'] = stage_seconds.get('snapshot_retention', 0) + \
+                                      stage_seconds.get('backup_retention', 0)
+        result['peak_rss_bytes'] = rusage.ru_maxrss * 1024
+        result['failures'] = failures
+        return result
+
+    def run_scenario(self, scenario):
+        name = scenario['name']
+        scenario_path = os.path.join(self.work_path, name)
+        if os.path.isdir(scenario_path):
+            shutil.rmtree(scenario_path)
+        os.makedirs(scenario_path)
+
+        # build simulated cluster without latency, then apply the latency
+        state = ClusterState(os.path.join(scenario_path, 'cluster'))
+        state.initialize(op_latency=0, bandwidth=0)
+        self.workload = Workload(state, seed=scenario['seed'],
+                                 extent_size=scenario['extent_size'])
+        print("  - populate %s images" % scenario['image_count'])
+        self.workload.populate(scenario['pool_name'],
+                               scenario['image_count'],
+                               scenario['min_size'],
+                               scenario['max_size'],
+                               skew=scenario['size_skew'],
+                               fill_ratio=scenario['fill_ratio'])
+        state.set_config(op_latency=scenario['op_latency'],
+                         bandwidth=scenario['bandwidth'])
+
+        config_path, section = self._write_config(scenario, scenario_path)
+
+        results = OrderedDict()
+        for run_index in range(scenario['incremental_runs'] + 1):
+            run_name = 'full' if run_index == 0 else "incremental%s" % run_index
+            changed_bytes = 0
+            if run_index != 0:
+                state.set_config(op_latency=0)
+                changed_bytes = self.workload.churn(scenario['pool_name'],
+                                                    scenario['churn_rate'],
+                                                    scenario['churn_image_ratio'])
+                state.set_config(op_latency=scenario['op_latency'])
+
+            print("  - run %s backup" % run_name)
+            return_code, wall_seconds, rusage = self._run_backup(config_path, section,
+                                                                 scenario_path)
+            result = self._collect(scenario_path, wall_seconds, rusage)
+            if return_code != 0 or result is False:
+                print("Error, backup run failed. return code = %s, see %s"
+                      % (return_code, os.path.join(scenario_path, 'backup.out')))
+                return False
+            result['changed_bytes'] = changed_bytes
+            result['image_count'] = scenario['image_count']
+            result['worker_count'] = scenario['workers']
+            results[run_name] = result
+
+        self.results[name] = results
+        return results
+
+    def compare(self, scenario):
+        ''' compare results of scenario with baseline, return regressions '''
+        name = scenario['name']
+        threshold = scenario['threshold_percent'] / 100.0
+        regressions = []
+        for run_name, result in self.results.get(name, {}).iteritems():
+            baseline = self.baseline.get(name, {}).get(run_name)
+            if baseline is None:
+                self.unbaselined.append((name, run_name))
+                continue
+            for metric, value in result.iteritems():
+                if metric in INFO_METRICS or not baseline.has_key(metric):
+                    continue
+                base = baseline[metric]
+                if metric in HIGHER_BETTER_METRICS:
+                    regressed = value < base * (1 - threshold)
+                else:
+                    # small absolute values are noise, allow 0.1 second or unit
+                    regressed = value > base * (1 + threshold) and value - base > 0.1
+                if regressed:
+                    regressions.append((name, run_name, metric, base, value))
+        self.regressions.extend(regressions)
+        return regressions
+
+    def write_results(self, result_file):
+        data = OrderedDict()
+        data['timestamp'] = time.time()
+        data['host'] = platform.node()
+        data['python'] = platform.python_version()
+        data['scenarios'] = self.results
+        data['regressions'] = [{'scenario': name, 'run': run_name, 'metric': metric,
+                                'baseline': base, 'value': value}
+                               for name, run_name, metric, base, value in self.regressions]
+        data['unbaselined'] = [{'scenario': name, 'run': run_name}
+                               for name, run_name in self.unbaselined]
+        with open(result_file, 'w') as output:
+            json.dump(data, output, indent=2)
+        return True
+
+    def update_baseline(self):
+        for name, results in self.results.iteritems():
+            self.baseline[name] = results
+        with open(self.baseline_file, 'w') as baseline_file:
+            json.dump(self.baseline, baseline_file, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+            baseline_file.write('\n')
+        return True
+
+
+def main(argument_list):
+    try:
+        parser = ArgumentParser(add_help=False)
+        parser.add_argument('--scenario_file', default=DEFAULT_SCENARIO_FILE)
+        parser.add_argument('--scenario', action='append')
+        parser.add_argument('--baseline_file', default=DEFAULT_BASELINE_FILE)
+        parser.add_argument('--backup_config_file', default='./Config/backup.conf')
+        parser.add_argument('--work_path', default=DEFAULT_WORK_PATH)
+        parser.add_argument('--result_file', default='rbd_benchmark_result.json')
+        parser.add_argument('--update_baseline', action='store_true')
+        args = vars(parser.parse_args(argument_list[1:]))
+
+        benchmark = Benchmark(args['scenario_file'],
+                              args['baseline_file'],
+                              args['work_path'],
+                              args['backup_config_file'])
+
+        # ----------------------------------------------------------------------
+        print("\n1. read benchmark scenarios.")
+        for scenario in benchmark.read_scenarios(args['scenario']):
+            print("  - %s, images = %s, workers = %s"
+                  % (scenario['name'], scenario['image_count'], scenario['workers']))
+        benchmark.read_baseline()
+
+        # ----------------------------------------------------------------------
+        print("\n2. run benchmark scenarios.")
+        failed = False
+        for scenario in benchmark.scenarios:
+            print("\n%s" % scenario['name'])
+            if benchmark.run_scenario(scenario) is False:
+                failed = True
+                continue
+            for run_name, result in benchmark.results[scenario['name']].iteritems():
+                print("  - %s: %s" % (run_name, json.dumps(result)))
+            benchmark.compare(scenario)
+
+        # ----------------------------------------------------------------------
+        print("\n3. write result to %s." % args['result_file'])
+        benchmark.write_results(args['result_file'])
+        if args['update_baseline']:
+            print("  - update baseline %s." % args['baseline_file'])
+            benchmark.update_baseline()
+
+        if failed:
+            return 2
+
+        for name, run_name, metric, base, value in benchmark.regressions:
+            print("  - regression, %s %s %s: baseline = %s, value = %s"
+                  % (name, run_name, metric, base, value))
+        # a run without baseline is not compared, it does not pass
+        for name, run_name in benchmark.unbaselined:
+            print("  - no baseline, %s %s is not compared" % (name, run_name))
+        if args['update_baseline']:
+            return 0
+        if len(benchmark.regressions) != 0 or len(benchmark.unbaselined) != 0:
+            return 1
+        return 0
+
+    except Exception as e:
+        exc_type,exc_value,exc_traceback = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+        print e
+        return 2
+
+
+if "__main__" == __name__:
+    sys.exit(main(sys.argv))
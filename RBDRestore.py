@@ -0,0 +1,581 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This module responsible for restore Ceph RBD image
+# Author: Yu-Jung Cheng
+
+import sys
+import os
+import datetime
+import time
+import traceback
+
+from collections import  OrderedDict
+from argparse import ArgumentParser
+
+from Common.Constant import *
+from Common.Ceph import Ceph
+from Common.Pool import Pool
+from Common.Config import RBDConfig
+from Common.Logger import Logger
+from Common.Metafile import Metafile
+from Common.Manager import Manager
+from Common.Yaml import Yaml
+from Common.BackupChain import BackupChain
+from Common.DiffFile import DiffFile
+from Common.RestorePlanner import RestorePlanner
+
+from Task.RBDSnapshotTask import RBDSnapshotTask
+from Task.RBDImportTask import RBDImportTask
+from Task.PoolImportTask import PoolImportTask
+
+
+class RBDRestore(object):
+
+    def __init__(self):
+        self.restore_time = datetime.datetime.now().strftime(DEFAULT_BACKUP_TIME_FORMAT)
+
+        self.cfg = None
+        self.log = None
+
+        self.backup_config_file = DEFAULT_BACKUP_CONFIG_FILE
+        self.backup_config_section = DEFAULT_BACKUP_CONFIG_SECTION
+
+        # restore source and target
+        self.pool_name = None
+        self.rbd_name = None
+        self.restore_point = None
+        self.target_pool_name = None
+        self.target_rbd_name = None
+        self.plan_only = False
+        self.pool_import = False
+        self.allow_rollback = False     # rollback overwrites the source image
+        self.flatten = False            # copy snapshot data to the clone
+
+        self.cluster_path = None
+        self.pool = None
+        self.plan = None
+        self.restore_tasks = []
+        self.pool_import_task = None
+        self.pool_list = {}
+        self.manager = None
+
+        # data of metafiles
+        self.meta_rbd_snapshot_list = {}
+        self.meta_rbd_backup_list = {}
+
+        self.ceph = Ceph()
+        self.metafile = None
+
+    def _get_rbd_id(self, pool_name, rbd_name):
+        return "%s_%s_%s" % (self.ceph.cluster_name, pool_name, rbd_name)
+
+    def _initialize_logging(self, cfg, start_log_title='Start RBD Restore'):
+        try:
+            self.log = Logger(cfg)
+            self.log.set_logger(name='RBDRestore')
+            self.log.blank_line(4)
+            log_begin_line = " %s %s " %(start_log_title, self.restore_time)
+            self.log.start_line(title="", symbol_count=40)
+            self.log.start_line(title=log_begin_line, symbol_count=21)
+            self.log.start_line(title="", symbol_count=40)
+            self.log.info(("Logger initialized.", self.log.log_option_dict))
+            return True
+        except Exception as e:
+            print("Error, fail to initialize logging. %s" % e)
+            return False
+
+    def read_argument_list(self, argument_list):
+        try:
+            parser = ArgumentParser(add_help=False)
+            parser.add_argument('--backup_config_file')
+            parser.add_argument('--backup_config_section')
+            parser.add_argument('--ceph_conffile')
+            parser.add_argument('--ceph_cluster_name')
+            parser.add_argument('--pool_name', required=True)
+            parser.add_argument('--rbd_name')
+            parser.add_argument('--restore_point')
+            parser.add_argument('--target_pool_name')
+            parser.add_argument('--target_rbd_name')
+            parser.add_argument('--plan_only', action='store_true')
+            parser.add_argument('--pool_import', action='store_true')
+            parser.add_argument('--allow_rollback', action='store_true')
+            parser.add_argument('--flatten', action='store_true')
+            args = vars(parser.parse_args(argument_list[1:]))
+
+            if args['backup_config_file'] is not None:
+                self.backup_config_file = args['backup_config_file']
+            if args['backup_config_section'] is not None:
+                self.backup_config_section = args['backup_config_section']
+
+            if args['ceph_conffile'] is not None:
+                self.ceph.conffile = args['ceph_conffile']
+            if args['ceph_cluster_name'] is not None:
+                self.ceph.cluster_name = args['ceph_cluster_name']
+
+            self.pool_name = args['pool_name']
+            self.rbd_name = args['rbd_name']
+            self.restore_point = args['restore_point']
+            self.target_pool_name = args['target_pool_name']
+            self.target_rbd_name = args['target_rbd_name']
+            self.plan_only = args['plan_only']
+            self.pool_import = args['pool_import']
+            self.allow_rollback = args['allow_rollback']
+            self.flatten = args['flatten']
+
+            if self.rbd_name is None and not self.pool_import:
+                print("missing argument --rbd_name.")
+                return False
+
+        except SystemExit:
+            print("invalid input argument.")
+            return False
+        except Exception as e:
+            print("invalid input argument. %s" % e)
+            return False
+
+        return True
+
+    def read_config_file(self):
+        cfg = RBDConfig(self.backup_config_file)
+
+        if cfg.path != self.backup_config_file:
+            print("Error, backup config file not exist.\n"
+                  "config file = %s" % self.backup_config_file)
+            return False
+
+        if not cfg.check_in_section(self.backup_config_section):
+            print("Error, unable to check in config section.\n"
+                  "config file = %s, section = %s" %
+                  (self.backup_config_file, self.backup_config_section))
+            return False
+
+        if not cfg.read_log_config():
+            print("Error, unable to read log config.")
+            return False
+
+        if not self._initialize_logging(cfg):
+            return False
+
+        if not cfg.read_ceph_config():
+            self.log.error("unable to read ceph cluster config.")
+            return False
+
+        if not cfg.read_backup_config():
+            self.log.error("unable to read RBD backup config.")
+            return False
+
+        if not cfg.read_restore_config():
+            self.log.error("unable to read RBD restore config.")
+            return False
+
+        if self.ceph.conffile is None:
+            self.ceph.conffile = cfg.ceph_conffile
+        if self.ceph.cluster_name is None:
+            self.ceph.cluster_name = cfg.ceph_cluster_name
+
+        self.cfg = cfg
+        self.cluster_path = os.path.join(cfg.backup_path, self.ceph.cluster_name)
+        return True
+
+    def read_metafile(self):
+        self.log.start_line(title="\n(1). READ BACKUP METAFILE", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        try:
+            self.metafile = Metafile(self.log, self.ceph.cluster_name, self.cluster_path)
+
+            meta_snapshot_list = self.metafile.read(RBD_SNAPSHOT_MAINTAIN_LIST)
+            if meta_snapshot_list is False:
+                self.log.warning("unable to read metafile %s." % RBD_SNAPSHOT_MAINTAIN_LIST)
+                meta_snapshot_list = {}
+            self.meta_rbd_snapshot_list = meta_snapshot_list
+
+            meta_backup_list = self.metafile.read(RBD_BACKUP_CIRCULATION_LIST)
+            if meta_backup_list is False:
+                self.log.warning("unable to read metafile %s." % RBD_BACKUP_CIRCULATION_LIST)
+                meta_backup_list = {}
+            self.meta_rbd_backup_list = meta_backup_list
+
+            return True
+        except Exception as e:
+            self.log.error("unable to read metafile. %s" % e)
+            return False
+
+    def plan_restore(self):
+        self.log.start_line(title="\n(2). PLAN RBD RESTORE", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        try:
+            pool = Pool(self.log, self.ceph.cluster_name, self.pool_name, self.ceph.conffile)
+            if pool.connected is False:
+                self.log.error("unable to connect cluster pool %s" % self.pool_name)
+                return False
+            self.pool = pool
+
+            planner = RestorePlanner(self.log,
+                                     self.cluster_path,
+                                     self.meta_rbd_snapshot_list,
+                                     self.meta_rbd_backup_list,
+                                     self.cfg.restore_import_bandwidth,
+                                     self.cfg.restore_rollback_bandwidth,
+                                     self.cfg.restore_clone_seconds)
+
+            rbd_id = self._get_rbd_id(self.pool_name, self.rbd_name)
+            plan = planner.plan(pool, rbd_id, self.rbd_name,
+                                restore_point=self.restore_point,
+                                target_pool_name=self.target_pool_name,
+                                target_rbd_name=self.target_rbd_name,
+                                allow_rollback=self.allow_rollback,
+                                flatten=self.flatten)
+            if plan is False or plan['selected'] is None:
+                return False
+
+            self.plan = plan
+            return True
+        except Exception as e:
+            self.log.error("unable to plan RBD restore. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
+
+    def start_restore(self):
+        self.log.start_line(title="\n(3). START RBD RESTORE", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        try:
+            plan = self.plan
+            selected = plan['selected']
+            rbd_id = plan['rbd_id']
+            self.log.info("restore %s to %s/%s by %s."
+                          % (rbd_id,
+                             plan['target_pool_name'],
+                             plan['target_rbd_name'],
+                             selected['method']))
+
+            if selected['method'] == RESTORE_METHOD[RESTORE_ROLLBACK]:
+                task = RBDSnapshotTask(self.ceph.cluster_name,
+                                       self.pool_name,
+                                       self.rbd_name,
+                                       action=ROLLBACK,
+                                       snap_name=plan['restore_point'],
+                                       rbd_id=rbd_id)
+                self.restore_tasks.append(task)
+
+            elif selected['method'] == RESTORE_METHOD[RESTORE_CLONE]:
+                task = RBDSnapshotTask(self.ceph.cluster_name,
+                                       self.pool_name,
+                                       self.rbd_name,
+                                       action=CLONE,
+                                       snap_name=plan['restore_point'],
+                                       protect=True,
+                                       rbd_id=rbd_id,
+                                       clone_pool_name=plan['target_pool_name'],
+                                       clone_rbd_name=plan['target_rbd_name'],
+                                       flatten=self.flatten)
+                self.restore_tasks.append(task)
+
+            elif selected['method'] == RESTORE_METHOD[RESTORE_IMPORT]:
+                target_pool = plan['target_pool_name']
+                target_rbd = plan['target_rbd_name']
+                if target_pool == self.pool_name and target_rbd in self.pool.get_rbd_name_list():
+                    self.log.error("RBD image %s exist in pool %s, import requires "
+                                   "a new RBD image name." % (target_rbd, target_pool))
+                    return False
+
+                chain = selected['chain']
+                for i, import_srcpath in enumerate(chain):
+                    if i == 0:
+                        task = RBDImportTask(self.ceph.cluster_name,
+                                             target_pool,
+                                             target_rbd,
+                                             import_srcpath,
+                                             import_type=FULL,
+                                             snap_name=os.path.basename(import_srcpath),
+                                             rbd_id=rbd_id)
+                    else:
+                        task = RBDImportTask(self.ceph.cluster_name,
+                                             target_pool,
+                                             target_rbd,
+                                             import_srcpath,
+                                             import_type=DIFF,
+                                             rbd_id=rbd_id)
+                    self.restore_tasks.append(task)
+
+            # tasks of a restore depend on previous one, execute them in order
+            for task in self.restore_tasks:
+                self.log.info("execute restore task %s" % task.name)
+                task.execute()
+                self.log.info(("restore task %s finished." % task.name, task.result))
+                if task.task_status != COMPLETE:
+                    self.log.error("restore task %s is not completed." % task.name)
+                    return False
+
+            return True
+        except Exception as e:
+            self.log.error("unable to restore RBD. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
+
+    def _read_restore_priority(self):
+        ''' read priority of RBD images from restore yaml file.
+            rbd name in the yaml can be a name or {name: priority}.
+        '''
+        priority = {}
+        yaml_path = self.cfg.restore_yaml_filepath
+        if not os.path.exists(yaml_path):
+            self.log.info("restore yaml file %s not exist, "
+                          "all RBD images have same priority." % yaml_path)
+            return priority
+
+        yaml = Yaml(self.log, yaml_path)
+        yaml_data = yaml.read(self.cfg.restore_yaml_section_name)
+        if not yaml_data:
+            return priority
+
+        for pool_name, rbd_name_list in yaml_data.iteritems():
+            for rbd_name in rbd_name_list:
+                if isinstance(rbd_name, dict):
+                    for name, value in rbd_name.iteritems():
+                        priority[self._get_rbd_id(pool_name, name)] = int(value)
+                else:
+                    priority[self._get_rbd_id(pool_name, rbd_name)] = 0
+        return priority
+
+    def _get_pool(self, pool_name):
+        if self.pool_list.has_key(pool_name):
+            return self.pool_list[pool_name]
+        pool = Pool(self.log, self.ceph.cluster_name, pool_name, self.ceph.conffile)
+        if pool.connected is False:
+            return False
+        self.pool_list[pool_name] = pool
+        return pool
+
+    def initialize_restore_worker(self):
+        self.log.start_line(title="\n(2). INITIALIZE RESTORE WORKERS (child processes)", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        try:
+            worker_count = self.cfg.restore_concurrent_worker_count
+            output_spill_path = os.path.join(self.cfg.log_path, TASK_OUTPUT_DIRNAME)
+            manager = Manager(self.log, worker_count=worker_count,
+                              output_spill_path=output_spill_path)
+            manager.run_worker()
+            self.manager = manager
+            return True
+        except Exception as e:
+            self.log.error("worker fail initialized. %s" % e )
+            return False
+
+    def plan_pool_import(self):
+        ''' collect backup chain of all RBD images of the pool in backup
+            directory, and create the pool import task.
+        '''
+        self.log.start_line(title="\n(3). PLAN POOL IMPORT", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        try:
+            target_pool_name = self.target_pool_name
+            if target_pool_name is None:
+                target_pool_name = self.pool_name
+
+            target_pool = self._get_pool(target_pool_name)
+            if target_pool is False:
+                self.log.error("unable to connect target pool %s" % target_pool_name)
+                return False
+
+            # source pool may be gone in disaster recovery
+            source_pool = self._get_pool(self.pool_name)
+            source_rbd_list = []
+            if source_pool is not False:
+                source_rbd_list = source_pool.get_rbd_name_list()
+
+            priority = self._read_restore_priority()
+
+            progress_path = "%s/%s.%s.%s" % (self.cluster_path,
+                                             self.ceph.cluster_name,
+                                             POOL_IMPORT_PROGRESS,
+                                             target_pool_name)
+            pool_import_task = PoolImportTask(self.log,
+                                              self.ceph.cluster_name,
+                                              self.manager,
+                                              progress_path,
+                                              pool_concurrency=self.cfg.restore_pool_concurrency,
+                                              pool_bandwidth=self.cfg.restore_pool_bandwidth)
+            pool_import_task.add_pool(target_pool)
+
+            rbd_id_prefix = self._get_rbd_id(self.pool_name, '')
+            for rbd_id, backup_list in self.meta_rbd_backup_list.iteritems():
+                if not rbd_id.startswith(rbd_id_prefix) or len(backup_list) == 0:
+                    continue
+                rbd_name = rbd_id[len(rbd_id_prefix):]
+
+                backup_chain = BackupChain(self.log, self.cluster_path, self.pool_name, rbd_name)
+                chain = False
+                for generation in reversed(backup_list):
+                    chain = backup_chain.get_chain(generation)
+                    if chain is not False:
+                        break
+                if chain is False:
+                    self.log.warning("no backup chain of %s, skip it." % rbd_id)
+                    continue
+
+                # image size is in last incremental backup file, or size of
+                # the full backup file
+                size = None
+                if len(chain) > 1:
+                    size = DiffFile(chain[-1]).read_header()[2]
+                if size is None:
+                    size = os.path.getsize(chain[0])
+
+                features = DEFAULT_RESTORE_FEATURES
+                if rbd_name in source_rbd_list:
+                    features = source_pool.get_rbd_features(rbd_name)
+
+                rbd_priority = 0
+                if priority.has_key(rbd_id):
+                    rbd_priority = priority[rbd_id]
+
+                pool_import_task.add_image(rbd_id,
+                                           target_pool_name,
+                                           rbd_name,
+                                           chain,
+                                           backup_chain.get_chain_snapshots(chain),
+                                           size,
+                                           features,
+                                           priority=rbd_priority)
+
+            if len(pool_import_task.jobs) == 0:
+                self.log.error("no RBD image of pool %s to import." % self.pool_name)
+                return False
+
+            estimated_seconds = pool_import_task.estimate_seconds(self.cfg.restore_import_bandwidth)
+            self.log.info("\n%s RBD images to import to pool %s.\n"
+                          "estimated seconds = %s"
+                          % (len(pool_import_task.jobs), target_pool_name, estimated_seconds))
+
+            self.pool_import_task = pool_import_task
+            return True
+        except Exception as e:
+            self.log.error("unable to plan pool import. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
+
+    def start_pool_import(self):
+        self.log.start_line(title="\n(4). START POOL IMPORT", symbol_count=0)
+        self.log.start_line(symbol="-", symbol_count=40)
+
+        if not self.pool_import_task.create_images():
+            return False
+        return self.pool_import_task.start_import()
+
+    def finalize(self):
+        if self.manager is not None:
+            self.manager.stop_worker()
+
+        if self.pool is not None:
+            self.pool.close()
+        for pool_name, pool in self.pool_list.iteritems():
+            pool.close()
+
+        if self.log is not None:
+            self.log.close()
+
+
+def main(argument_list):
+    rbdrestore = RBDRestore()
+    try:
+        print("\nStart CEPH RBD Restore @ %s" % rbdrestore.restore_time)
+        print("pid = %s" % os.getpid())
+
+        # ----------------------------------------------------------------------
+        print("\n1. read RBD restore argument.")
+        if rbdrestore.read_argument_list(argument_list) == False:
+            return
+        else:
+            print("  - pool name       = %s" % rbdrestore.pool_name)
+            print("  - rbd name        = %s" % rbdrestore.rbd_name)
+            print("  - restore point   = %s" % rbdrestore.restore_point)
+
+        # ----------------------------------------------------------------------
+        print("\n2. read config file options.")
+        if rbdrestore.read_config_file() == False:
+            return
+
+        # ----------------------------------------------------------------------
+        print("\n3. read backup metafile.")
+        if rbdrestore.read_metafile() == False:
+            return
+
+        if rbdrestore.pool_import:
+            # ------------------------------------------------------------------
+            print("\n4. initialze worker.")
+            if rbdrestore.initialize_restore_worker() == False:
+                return
+
+            # ------------------------------------------------------------------
+            print("\n5. plan pool import.")
+            if rbdrestore.plan_pool_import() == False:
+                return
+            else:
+                pool_import_task = rbdrestore.pool_import_task
+                for rbd_id, job in pool_import_task.jobs.iteritems():
+                    print("  - rbd id = %s, priority = %s, bytes = %s, files = %s"
+                          % (rbd_id, job['priority'], job['bytes'], len(job['chain'])))
+                print("  - estimated seconds = %s"
+                      % pool_import_task.estimate_seconds(rbdrestore.cfg.restore_import_bandwidth))
+
+            if rbdrestore.plan_only:
+                return
+
+            # ------------------------------------------------------------------
+            print("\n6. start pool import.")
+            if rbdrestore.start_pool_import() == False:
+                return
+            else:
+                for rbd_id, job in rbdrestore.pool_import_task.jobs.iteritems():
+                    print("  - rbd id = %s, status = %s" % (rbd_id, job['status']))
+            return
+
+        # ----------------------------------------------------------------------
+        print("\n4. plan RBD restore.")
+        if rbdrestore.plan_restore() == False:
+            return
+        else:
+            plan = rbdrestore.plan
+            print("  - restore point = %s" % plan['restore_point'])
+            print("  - target        = %s/%s" % (plan['target_pool_name'],
+                                                 plan['target_rbd_name']))
+            for candidate in plan['candidates']:
+                print("  - method = %s, available = %s, estimated seconds = %s, %s"
+                      % (candidate['method'],
+                         candidate['available'],
+                         candidate['estimated_seconds'],
+                         candidate['reason']))
+            print("  - selected method = %s" % plan['selected']['method'])
+
+        if rbdrestore.plan_only:
+            return
+
+        # ----------------------------------------------------------------------
+        print("\n5. start RBD restore.")
+        if rbdrestore.start_restore() == False:
+            return
+        else:
+            for task in rbdrestore.restore_tasks:
+                print("  - task name = %s, status = %s" % (task, task.task_status))
+
+    except Exception as e:
+        exc_type,exc_value,exc_traceback = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+        print e
+
+    finally:
+        print("\n7. finalizing RBD restore.")
+        rbdrestore.finalize()
+
+
+if "__main__" == __name__:
+    sys.exit(main(sys.argv))
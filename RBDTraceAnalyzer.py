@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This module report trace of a RBD backup run, stage durations,
+# critical path, worker utilization and idle gaps.
+
+import sys
+import traceback
+import datetime
+
+from argparse import ArgumentParser
+
+from Common.TraceAnalyzer import TraceAnalyzer
+
+
+def _format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%H:%M:%S.%f')[:-3]
+
+def _percent(seconds, total):
+    if total <= 0:
+        return 0
+    return seconds * 100.0 / total
+
+def main(argument_list):
+    try:
+        parser = ArgumentParser(add_help=False)
+        parser.add_argument('--trace_file_path', required=True)
+        parser.add_argument('--trace_id')
+        parser.add_argument('--min_gap', type=float, default=1.0)
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--list', action='store_true')
+        args = vars(parser.parse_args(argument_list[1:]))
+
+        analyzer = TraceAnalyzer(args['trace_file_path'])
+        if analyzer.read() is False:
+            return 1
+
+        if args['list']:
+            for trace_id in analyzer.trace_ids:
+                print("%s, %s spans" % (trace_id, len(analyzer.spans[trace_id])))
+            return 0
+
+        run = analyzer.get_run(args['trace_id'])
+        if run is False:
+            print("Error, trace not found.")
+            return 1
+        run, stages, tasks = run
+        run_seconds = run['end'] - run['start']
+
+        # ----------------------------------------------------------------------
+        print("\ntrace %s, started %s, duration %.3f seconds, status %s"
+              % (run['trace'], _format_time(run['start']), run_seconds, run.get('status', 'ok')))
+
+        print("\n1. stages.")
+        for stage in stages:
+            seconds = stage['end'] - stage['start']
+            print("  - %-28s %10.3f s %6.2f %%  tasks = %s"
+                  % (stage['name'], seconds, _percent(seconds, run_seconds),
+                     len(tasks.get(stage['span'], []))))
+
+        # ----------------------------------------------------------------------
+        print("\n2. critical path.")
+        for segment, name, start, end in analyzer.get_critical_path(stages, tasks):
+            print("  - %s  %-8s %-40s %10.3f s %6.2f %%"
+                  % (_format_time(start), segment, name, end - start,
+                     _percent(end - start, run_seconds)))
+
+        # ----------------------------------------------------------------------
+        print("\n3. worker utilization.")
+        usage = analyzer.get_worker_usage(stages, tasks)
+        for worker, worker_usage in usage.iteritems():
+            print("  - %-12s busy %10.3f s of %10.3f s, %6.2f %%, tasks = %s"
+                  % (worker, worker_usage['busy'], worker_usage['window'],
+                     worker_usage['utilization'] * 100, worker_usage['task_count']))
+
+        # ----------------------------------------------------------------------
+        print("\n4. idle gaps longer than %s seconds." % args['min_gap'])
+        gaps = analyzer.get_idle_gaps(stages, tasks, min_gap=args['min_gap'])
+        for seconds, worker, stage_name, start, end in gaps[:args['top']]:
+            print("  - %-12s %-24s %s - %s %10.3f s"
+                  % (worker, stage_name, _format_time(start), _format_time(end), seconds))
+        if len(gaps) > args['top']:
+            print("  ... %s more gaps." % (len(gaps) - args['top']))
+
+        return 0
+
+    except Exception as e:
+        exc_type,exc_value,exc_traceback = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+        print e
+        return 1
+
+
+if "__main__" == __name__:
+    sys.exit(main(sys.argv))
@@ -0,0 +1,448 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# state of a simulated ceph cluster, shared by fake rados/rbd modules and
+# fake rbd/ceph commands. the state is kept in files so forked workers and
+# command processes see the same cluster.
+#
+#   {path}/cluster.json                  cluster config, fsid, latency, bandwidth,
+#                                        health reported by mon commands
+#   {path}/pools/{pool}/{image}.json     image size, features, extents, snapshots
+#   {path}/pools/{pool}/{image}.data     data written by import, appended only
+#
+# image data is modeled as sparse extents [offset, length, seed, blob, blob_pos].
+# every write gets a new seed, data of an extent is a pattern generated from
+# the seed, or read from blob file at blob_pos if data was imported. snapshot
+# keeps a copy of extent list, so diff between snapshots is a comparison of
+# extent lists and never reads data.
+#
+# to run backup and restore against the simulated cluster:
+#   export RBD_SIMULATOR_PATH=/tmp/rbd_simulator
+#   export PYTHONPATH=./Simulator       # fake rados and rbd modules
+#   export PATH=./Simulator/bin:$PATH   # fake rbd and ceph commands
+
+import os, json, time, errno, fcntl, struct, zlib, shutil, bisect
+
+from contextlib import contextmanager
+
+from Common.Throttle import Throttle
+
+
+DEFAULT_SIMULATOR_PATH = '/tmp/rbd_simulator'
+SIMULATOR_PATH_ENV = 'RBD_SIMULATOR_PATH'
+
+# layering, exclusive-lock, object-map, fast-diff and deep-flatten
+DEFAULT_FEATURES = 61
+DEFAULT_ORDER = 22
+
+PATTERN_SIZE = 1048576
+
+
+class SimulatorError(Exception):
+    pass
+
+class NotFound(SimulatorError):
+    pass
+
+class Exists(SimulatorError):
+    pass
+
+class Busy(SimulatorError):
+    pass
+
+
+def _extent_key(extent, position):
+    ''' identity of data at position of an extent '''
+    offset, length, seed, blob, blob_pos = extent
+    if blob is None:
+        return (seed, None, None)
+    return (seed, blob, blob_pos + position - offset)
+
+def _extent_at(extents, starts, position):
+    ''' return extent containing position, starts is offset list of extents '''
+    i = bisect.bisect_right(starts, position) - 1
+    if i >= 0 and extents[i][0] + extents[i][1] > position:
+        return extents[i]
+    return None
+
+def _punch(extents, offset, length):
+    ''' remove range from extent list, return new list '''
+    end = offset + length
+    result = []
+    for extent in extents:
+        ext_offset, ext_length, seed, blob, blob_pos = extent
+        ext_end = ext_offset + ext_length
+        if ext_end <= offset or ext_offset >= end:
+            result.append(extent)
+            continue
+        if ext_offset < offset:
+            result.append([ext_offset, offset - ext_offset, seed, blob, blob_pos])
+        if ext_end > end:
+            cut = end - ext_offset
+            result.append([end, ext_end - end, seed, blob,
+                           blob_pos + cut if blob is not None else blob_pos])
+    return result
+
+def _segments(extents, start, end):
+    ''' yield (start, end, extent or None) covering [start, end) '''
+    position = start
+    for extent in extents:
+        ext_offset, ext_length = extent[0], extent[1]
+        ext_end = ext_offset + ext_length
+        if ext_end <= position:
+            continue
+        if ext_offset >= end:
+            break
+        if ext_offset > position:
+            yield (position, ext_offset, None)
+            position = ext_offset
+        segment_end = min(ext_end, end)
+        yield (position, segment_end, extent)
+        position = segment_end
+    if position < end:
+        yield (position, end, None)
+
+
+class ClusterState(object):
+    def __init__(self, path=None):
+        if path is None:
+            path = os.environ.get(SIMULATOR_PATH_ENV, DEFAULT_SIMULATOR_PATH)
+        self.path = path
+        self.pool_path = os.path.join(path, 'pools')
+        self.config_path = os.path.join(path, 'cluster.json')
+
+        self.config = None
+        self.throttle = None
+        self.pattern_cache = {}    # {seed: pattern data}
+
+    # cluster
+    # --------------------------------------------------------------------------
+    def initialize(self, fsid=None, op_latency=0.0, bandwidth=0, reset=False):
+        ''' create cluster state, op_latency is seconds added to each
+            operation, bandwidth is bytes per second of each data stream.
+        '''
+        if reset and os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        if not os.path.isdir(self.pool_path):
+            os.makedirs(self.pool_path)
+        if fsid is None:
+            fsid = '00000000-0000-0000-0000-%012x' % (zlib.crc32(self.path) & 0xffffffff)
+        self._write_json(self.config_path, {'fsid': fsid,
+                                            'op_latency': float(op_latency),
+                                            'bandwidth': int(bandwidth)})
+        self.config = None
+        return True
+
+    def get_config(self, reload=False):
+        ''' reload to see config changed by other processes, e.g. health '''
+        if self.config is None or reload:
+            if not os.path.exists(self.config_path):
+                raise NotFound("simulator state not initialized in %s" % self.path)
+            with open(self.config_path, 'r') as config_file:
+                self.config = json.load(config_file)
+            self.throttle = Throttle(self.config.get('bandwidth', 0))
+        return self.config
+
+    def set_config(self, **kwargs):
+        config = dict(self.get_config())
+        config.update(kwargs)
+        self._write_json(self.config_path, config)
+        self.config = None
+        return self.get_config()
+
+    def delay(self, count=1):
+        ''' simulate latency of metadata operation '''
+        latency = self.get_config().get('op_latency', 0)
+        if latency > 0:
+            time.sleep(latency * count)
+
+    def transfer(self, length):
+        ''' simulate bandwidth of data transfer '''
+        self.get_config()
+        self.throttle.consume(length)
+
+    def _write_json(self, path, data):
+        temp_path = "%s.%s.tmp" % (path, os.getpid())
+        with open(temp_path, 'w') as temp_file:
+            json.dump(data, temp_file)
+        os.rename(temp_path, path)
+
+    # pool
+    # --------------------------------------------------------------------------
+    def list_pools(self):
+        self.delay()
+        if not os.path.isdir(self.pool_path):
+            return []
+        return sorted([str(name) for name in os.listdir(self.pool_path)])
+
+    def pool_exists(self, pool_name):
+        return os.path.isdir(os.path.join(self.pool_path, pool_name))
+
+    def create_pool(self, pool_name):
+        self.delay()
+        path = os.path.join(self.pool_path, pool_name)
+        if os.path.isdir(path):
+            raise Exists("pool %s exists" % pool_name)
+        os.makedirs(path)
+        return True
+
+    # image
+    # --------------------------------------------------------------------------
+    def _image_path(self, pool_name, image_name):
+        return os.path.join(self.pool_path, pool_name, "%s.json" % image_name)
+
+    def _blob_name(self, pool_name, image_name):
+        return os.path.join(pool_name, "%s.data" % image_name)
+
+    def list_images(self, pool_name):
+        self.delay()
+        path = os.path.join(self.pool_path, pool_name)
+        if not os.path.isdir(path):
+            raise NotFound("pool %s not found" % pool_name)
+        return sorted([str(name[:-5]) for name in os.listdir(path) if name.endswith('.json')])
+
+    def image_exists(self, pool_name, image_name):
+        return os.path.exists(self._image_path(pool_name, image_name))
+
+    def create_image(self, pool_name, image_name, size, features=None,
+                     order=None, extents=None, parent=None):
+        self.delay()
+        if not self.pool_exists(pool_name):
+            raise NotFound("pool %s not found" % pool_name)
+        path = self._image_path(pool_name, image_name)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0644)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                raise Exists("image %s/%s exists" % (pool_name, image_name))
+            raise
+        image = {'name': image_name,
+                 'pool': pool_name,
+                 'size': int(size),
+                 'features': DEFAULT_FEATURES if features is None else int(features),
+                 'order': DEFAULT_ORDER if order is None else int(order),
+                 'seed_base': (zlib.crc32("%s/%s" % (pool_name, image_name)) & 0xffffffff) << 32,
+                 'next_version': 1,
+                 'next_snap_id': 1,
+                 'parent': parent,
+                 'extents': extents or [],
+                 'snapshots': []}
+        with os.fdopen(fd, 'w') as image_file:
+            json.dump(image, image_file)
+        return True
+
+    def remove_image(self, pool_name, image_name):
+        with self.image(pool_name, image_name, write=True) as image:
+            if len(image['snapshots']) != 0:
+                raise Busy("image %s/%s has snapshots" % (pool_name, image_name))
+        os.remove(self._image_path(pool_name, image_name))
+        blob_path = os.path.join(self.pool_path, self._blob_name(pool_name, image_name))
+        if os.path.exists(blob_path):
+            os.remove(blob_path)
+        return True
+
+    @contextmanager
+    def image(self, pool_name, image_name, write=False):
+        ''' lock image state and yield it, written back if write is True '''
+        self.delay()
+        path = self._image_path(pool_name, image_name)
+        try:
+            image_file = open(path, 'r+' if write else 'r')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise NotFound("image %s/%s not found" % (pool_name, image_name))
+            raise
+        try:
+            fcntl.flock(image_file, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            image = json.load(image_file)
+            yield image
+            if write:
+                image_file.seek(0)
+                image_file.truncate()
+                json.dump(image, image_file)
+                image_file.flush()
+        finally:
+            image_file.close()
+
+    # snapshot
+    # --------------------------------------------------------------------------
+    def get_snapshot(self, image, snap_name):
+        for snapshot in image['snapshots']:
+            if snapshot['name'] == snap_name:
+                return snapshot
+        raise NotFound("snapshot %s of image %s not found" % (snap_name, image['name']))
+
+    def create_snapshot(self, image, snap_name):
+        for snapshot in image['snapshots']:
+            if snapshot['name'] == snap_name:
+                raise Exists("snapshot %s exists" % snap_name)
+        image['snapshots'].append({'id': image['next_snap_id'],
+                                   'name': snap_name,
+                                   'size': image['size'],
+                                   'protected': False,
+                                   'timestamp': time.time(),
+                                   'extents': [list(extent) for extent in image['extents']]})
+        image['next_snap_id'] += 1
+        return True
+
+    def remove_snapshot(self, image, snap_name):
+        snapshot = self.get_snapshot(image, snap_name)
+        if snapshot['protected']:
+            raise Busy("snapshot %s is protected" % snap_name)
+        image['snapshots'].remove(snapshot)
+        return True
+
+    def unprotect_snapshot(self, image, snap_name):
+        snapshot = self.get_snapshot(image, snap_name)
+        children = self.list_children(image['pool'], image['name'], snap_name)
+        if len(children) != 0:
+            raise Busy("snapshot %s has %s children" % (snap_name, len(children)))
+        snapshot['protected'] = False
+        return True
+
+    def list_children(self, pool_name, image_name, snap_name):
+        ''' [(pool, image), ...] cloned from the snapshot and not flattened '''
+        parent = {'pool': pool_name, 'image': image_name, 'snapshot': snap_name}
+        children = []
+        for child_pool in self.list_pools():
+            for child_name in self.list_images(child_pool):
+                if (child_pool, child_name) == (pool_name, image_name):
+                    continue
+                with self.image(child_pool, child_name) as child:
+                    if child['parent'] == parent:
+                        children.append((child_pool, child_name))
+        return children
+
+    def flatten(self, image):
+        ''' clone has its own extents already, only parent is detached '''
+        image['parent'] = None
+        return True
+
+    def rollback_snapshot(self, image, snap_name):
+        snapshot = self.get_snapshot(image, snap_name)
+        image['size'] = snapshot['size']
+        image['extents'] = [list(extent) for extent in snapshot['extents']]
+        return True
+
+    # data
+    # --------------------------------------------------------------------------
+    def get_extents(self, image, snap_name=None):
+        if snap_name is None:
+            return image['extents']
+        return self.get_snapshot(image, snap_name)['extents']
+
+    def get_size(self, image, snap_name=None):
+        if snap_name is None:
+            return image['size']
+        return self.get_snapshot(image, snap_name)['size']
+
+    def write(self, image, offset, length, data=None):
+        ''' write data to image, pattern data is used if data is None '''
+        if offset + length > image['size']:
+            raise SimulatorError("write beyond image size")
+        seed = image['seed_base'] | image['next_version']
+        image['next_version'] += 1
+
+        blob, blob_pos = None, 0
+        if data is not None:
+            blob = self._blob_name(image['pool'], image['name'])
+            with open(os.path.join(self.pool_path, blob), 'ab') as blob_file:
+                blob_pos = blob_file.tell()
+                blob_file.write(data)
+            self.transfer(length)
+
+        extents = _punch(image['extents'], offset, length)
+        extents.append([offset, length, seed, blob, blob_pos])
+        extents.sort()
+        image['extents'] = extents
+        return True
+
+    def discard(self, image, offset, length):
+        image['extents'] = _punch(image['extents'], offset, length)
+        return True
+
+    def resize(self, image, size):
+        if size < image['size']:
+            image['extents'] = _punch(image['extents'], size, image['size'] - size)
+        image['size'] = int(size)
+        return True
+
+    def diff(self, image, snap_name=None, from_snap=None, offset=0, length=None):
+        ''' return [(offset, length, exists), ...] of changed ranges from
+            from_snap to snap_name, allocated ranges if from_snap is None.
+        '''
+        extents = self.get_extents(image, snap_name)
+        if length is None:
+            length = self.get_size(image, snap_name) - offset
+        end = offset + length
+
+        if from_snap is None:
+            from_extents = []
+        else:
+            from_extents = self.get_extents(image, from_snap)
+
+        # split both extent lists at every boundary and compare identity
+        bounds = set([offset, end])
+        for extent in extents + from_extents:
+            for bound in [extent[0], extent[0] + extent[1]]:
+                if offset < bound < end:
+                    bounds.add(bound)
+        bounds = sorted(bounds)
+
+        to_starts = [extent[0] for extent in extents]
+        from_starts = [extent[0] for extent in from_extents]
+
+        changed = []
+        for i in range(len(bounds) - 1):
+            start, stop = bounds[i], bounds[i + 1]
+            to_extent = _extent_at(extents, to_starts, start)
+            from_extent = _extent_at(from_extents, from_starts, start)
+
+            if to_extent is None and from_extent is None:
+                continue
+            if to_extent is not None and from_extent is not None and \
+               _extent_key(to_extent, start) == _extent_key(from_extent, start):
+                continue
+
+            exists = to_extent is not None
+            if len(changed) != 0 and changed[-1][2] == exists and \
+               changed[-1][0] + changed[-1][1] == start:
+                changed[-1] = (changed[-1][0], changed[-1][1] + stop - start, exists)
+            else:
+                changed.append((start, stop - start, exists))
+        return changed
+
+    def _pattern(self, seed):
+        if not self.pattern_cache.has_key(seed):
+            if len(self.pattern_cache) > 16:
+                self.pattern_cache.clear()
+            self.pattern_cache[seed] = struct.pack('<Q', seed) * (PATTERN_SIZE / 8 + 1)
+        return self.pattern_cache[seed]
+
+    def read(self, image, offset, length, snap_name=None):
+        ''' read data of image or snapshot, holes are zero '''
+        extents = self.get_extents(image, snap_name)
+        size = self.get_size(image, snap_name)
+        end = min(offset + length, size)
+
+        data = []
+        for start, stop, extent in _segments(extents, offset, end):
+            if extent is None:
+                data.append('\0' * (stop - start))
+                continue
+            ext_offset, ext_length, seed, blob, blob_pos = extent
+            if blob is not None:
+                with open(os.path.join(self.pool_path, blob), 'rb') as blob_file:
+                    blob_file.seek(blob_pos + start - ext_offset)
+                    data.append(blob_file.read(stop - start))
+                continue
+            position = start
+            while position < stop:
+                chunk = min(stop - position, PATTERN_SIZE)
+                phase = position % 8
+                data.append(self._pattern(seed)[phase:phase + chunk])
+                position += chunk
+
+        data = ''.join(data)
+        self.transfer(len(data))
+        return data
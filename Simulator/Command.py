@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# fake rbd and ceph commands backed by simulated cluster state, they accept
+# the subset of arguments and print the output format used by backup and
+# restore tasks. Simulator/bin is put in front of PATH to use them.
+
+import sys, os, time
+
+from Common.DiffFile import DiffFile, DiffWriter
+from Simulator.ClusterState import ClusterState, SimulatorError
+
+CHUNK_SIZE = 4194304
+
+RBD_FLAG_OPTIONS = ['--no-progress', '--whole-object', '--allow-shrink']
+RBD_VALUE_OPTIONS = {'--cluster': 'cluster',
+                     '-p': 'pool',
+                     '--pool': 'pool',
+                     '--from-snap': 'from_snap',
+                     '--size': 'size',
+                     '-s': 'size',
+                     '--image-feature': 'features',
+                     '--format': 'format',
+                     '-c': 'conffile',
+                     '--conf': 'conffile'}
+
+
+class CommandError(Exception):
+    pass
+
+
+def _parse_args(argv, value_options, flag_options):
+    options = {}
+    positionals = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in flag_options:
+            options[arg.lstrip('-').replace('-', '_')] = True
+        elif arg in value_options:
+            if i + 1 >= len(argv):
+                raise CommandError("option %s requires a value" % arg)
+            options[value_options[arg]] = argv[i + 1]
+            i += 1
+        elif arg.startswith('--') and '=' in arg:
+            key, value = arg.split('=', 1)
+            if key not in value_options:
+                raise CommandError("unknown option %s" % key)
+            options[value_options[key]] = value
+        else:
+            positionals.append(arg)
+        i += 1
+    return options, positionals
+
+def _parse_spec(spec, pool_name):
+    ''' parse [pool/]image[@snap], return (pool, image, snap) '''
+    snap_name = None
+    if '@' in spec:
+        spec, snap_name = spec.split('@', 1)
+    if '/' in spec:
+        pool_name, spec = spec.split('/', 1)
+    if pool_name is None:
+        pool_name = 'rbd'
+    return pool_name, spec, snap_name
+
+def _parse_size(size):
+    ''' size argument is in MB unless it has a unit suffix '''
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    size = size.upper().rstrip('B')
+    if size[-1] in units:
+        return int(size[:-1]) * units[size[-1]]
+    return int(size) << 20
+
+def _format_size(size):
+    for unit, shift in [('TiB', 40), ('GiB', 30), ('MiB', 20), ('KiB', 10)]:
+        if size >= (1 << shift) and size % (1 << shift) == 0:
+            return "%s %s" % (size >> shift, unit)
+    return "%s B" % size
+
+def _open_output(path):
+    if path == '-':
+        return sys.stdout
+    return open(path, 'wb')
+
+def _open_input(path):
+    if path == '-':
+        return sys.stdin
+    return open(path, 'rb')
+
+
+class RBDCommand(object):
+    def __init__(self, state, options):
+        self.state = state
+        self.options = options
+        self.pool_name = options.get('pool')
+
+    def spec(self, spec):
+        return _parse_spec(spec, self.pool_name)
+
+    def ls(self, args):
+        pool_name = args[0] if len(args) != 0 else (self.pool_name or 'rbd')
+        for image_name in self.state.list_images(pool_name):
+            print(image_name)
+
+    def info(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        with self.state.image(pool_name, image_name) as image:
+            size = self.state.get_size(image, snap_name)
+            print("rbd image '%s':" % image_name)
+            print("\tsize %s in %s objects" % (_format_size(size),
+                                              (size + (1 << image['order']) - 1) >> image['order']))
+            print("\torder %s" % image['order'])
+            print("\tfeatures: %s" % image['features'])
+
+    def create(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        if not self.options.has_key('size'):
+            raise CommandError("size must be specified")
+        self.state.create_image(pool_name, image_name, _parse_size(self.options['size']),
+                                features=self.options.get('features'))
+
+    def rm(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        self.state.remove_image(pool_name, image_name)
+
+    def snap(self, args):
+        action = args[0]
+        pool_name, image_name, snap_name = self.spec(args[1])
+        if action in ['ls', 'list']:
+            with self.state.image(pool_name, image_name) as image:
+                snapshots = image['snapshots']
+            if len(snapshots) != 0:
+                print("SNAPID NAME %s SIZE TIMESTAMP" % (' ' * 20))
+            for snapshot in snapshots:
+                print("%6s %-25s %s %s" % (snapshot['id'], snapshot['name'],
+                                           _format_size(snapshot['size']),
+                                           time.ctime(snapshot['timestamp'])))
+            return
+
+        with self.state.image(pool_name, image_name, write=True) as image:
+            if action in ['create', 'add']:
+                self.state.create_snapshot(image, snap_name)
+            elif action in ['rm', 'remove']:
+                self.state.remove_snapshot(image, snap_name)
+            elif action == 'purge':
+                for snapshot in list(image['snapshots']):
+                    self.state.remove_snapshot(image, snapshot['name'])
+            elif action in ['rollback', 'revert']:
+                self.state.rollback_snapshot(image, snap_name)
+            elif action == 'protect':
+                self.state.get_snapshot(image, snap_name)['protected'] = True
+            elif action == 'unprotect':
+                self.state.unprotect_snapshot(image, snap_name)
+            else:
+                raise CommandError("unknown snap command %s" % action)
+
+    def clone(self, args):
+        p_pool, p_image, p_snap = self.spec(args[0])
+        c_pool, c_image, c_snap = self.spec(args[1])
+        with self.state.image(p_pool, p_image) as parent:
+            snapshot = self.state.get_snapshot(parent, p_snap)
+            if not snapshot['protected']:
+                raise CommandError("parent snapshot must be protected")
+            self.state.create_image(c_pool, c_image, snapshot['size'],
+                                    features=parent['features'],
+                                    order=parent['order'],
+                                    extents=snapshot['extents'],
+                                    parent={'pool': p_pool, 'image': p_image,
+                                            'snapshot': p_snap})
+
+    def children(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        for child_pool, child_name in self.state.list_children(pool_name, image_name, snap_name):
+            print("%s/%s" % (child_pool, child_name))
+
+    def flatten(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        with self.state.image(pool_name, image_name, write=True) as image:
+            self.state.flatten(image)
+
+    def diff(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        with self.state.image(pool_name, image_name) as image:
+            extents = self.state.diff(image, snap_name=snap_name,
+                                      from_snap=self.options.get('from_snap'))
+        print("Offset     Length    Type")
+        for offset, length, exists in extents:
+            print("%-10s %-9s %s" % (offset, length, 'data' if exists else 'zero'))
+
+    def export(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        with self.state.image(pool_name, image_name) as image:
+            size = self.state.get_size(image, snap_name)
+            extents = self.state.diff(image, snap_name=snap_name)
+            output = _open_output(args[1])
+            position = 0
+            for offset, length, exists in extents + [(size, 0, False)]:
+                # stdout is not seekable, holes are written as zero
+                if output is sys.stdout:
+                    while position < offset:
+                        chunk = min(offset - position, CHUNK_SIZE)
+                        output.write('\0' * chunk)
+                        position += chunk
+                else:
+                    output.seek(offset)
+                position = offset
+                while position < offset + length:
+                    chunk = min(offset + length - position, CHUNK_SIZE)
+                    output.write(self.state.read(image, position, chunk, snap_name))
+                    position += chunk
+            if output is not sys.stdout:
+                output.truncate(size)
+                output.close()
+
+    def export_diff(self, args):
+        pool_name, image_name, snap_name = self.spec(args[0])
+        from_snap = self.options.get('from_snap')
+        with self.state.image(pool_name, image_name) as image:
+            extents = self.state.diff(image, snap_name=snap_name, from_snap=from_snap)
+            output = _open_output(args[1])
+            writer = DiffWriter(output)
+            if from_snap is not None:
+                writer.write_from_snap(from_snap)
+            if snap_name is not None:
+                writer.write_to_snap(snap_name)
+            writer.write_size(self.state.get_size(image, snap_name))
+            for offset, length, exists in extents:
+                if not exists:
+                    writer.write_zero(offset, length)
+                    continue
+                position = offset
+                while position < offset + length:
+                    chunk = min(offset + length - position, CHUNK_SIZE)
+                    writer.write_data(position, self.state.read(image, position, chunk, snap_name))
+                    position += chunk
+            writer.write_end()
+            if output is not sys.stdout:
+                output.close()
+
+    def import_image(self, args):
+        ''' import raw image file, data extents are found by SEEK_DATA '''
+        from Common.DiffFile import iterate_data_extents
+
+        src_path = args[0]
+        pool_name, image_name, snap_name = self.spec(args[1])
+        if src_path == '-':
+            raise CommandError("import from stdin not supported by simulator")
+        with _open_input(src_path) as src_file:
+            size = os.fstat(src_file.fileno()).st_size
+            self.state.create_image(pool_name, image_name, size,
+                                    features=self.options.get('features'))
+            with self.state.image(pool_name, image_name, write=True) as image:
+                for offset, length in iterate_data_extents(src_file, size):
+                    src_file.seek(offset)
+                    end = offset + length
+                    while offset < end:
+                        data = src_file.read(min(end - offset, CHUNK_SIZE))
+                        if data == '':
+                            break
+                        if data.count('\0') != len(data):
+                            self.state.write(image, offset, len(data), data=data)
+                        offset += len(data)
+
+    def import_diff(self, args):
+        src_path = args[0]
+        pool_name, image_name, snap_name = self.spec(args[1])
+
+        if src_path == '-':
+            # diff stream from stdin is saved to temporary file to iterate it
+            temp_path = os.path.join(self.state.path, "import-diff.%s" % os.getpid())
+            with open(temp_path, 'wb') as temp_file:
+                while True:
+                    data = sys.stdin.read(CHUNK_SIZE)
+                    if data == '':
+                        break
+                    temp_file.write(data)
+            src_path = temp_path
+        else:
+            temp_path = None
+
+        try:
+            diff_file = DiffFile(src_path)
+            with self.state.image(pool_name, image_name, write=True) as image:
+                with open(src_path, 'rb') as src_file:
+                    for record in diff_file.iterate():
+                        tag = record[0]
+                        if tag == 'f':
+                            self.state.get_snapshot(image, record[1])
+                        elif tag == 's':
+                            self.state.resize(image, record[1])
+                        elif tag == 'w':
+                            offset, length, position = record[1:]
+                            src_file.seek(position)
+                            self.state.write(image, offset, length, data=src_file.read(length))
+                        elif tag == 'z':
+                            self.state.discard(image, record[1], record[2])
+                if diff_file.to_snap is not None:
+                    self.state.create_snapshot(image, diff_file.to_snap)
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+    def execute(self, args):
+        if len(args) == 0:
+            raise CommandError("command is required")
+        command = args[0]
+        methods = {'ls': self.ls, 'list': self.ls,
+                   'info': self.info,
+                   'create': self.create,
+                   'rm': self.rm, 'remove': self.rm,
+                   'snap': self.snap,
+                   'clone': self.clone,
+                   'children': self.children,
+                   'flatten': self.flatten,
+                   'diff': self.diff,
+                   'export': self.export,
+                   'export-diff': self.export_diff,
+                   'import': self.import_image,
+                   'import-diff': self.import_diff}
+        if not methods.has_key(command):
+            raise CommandError("command %s not supported by simulator" % command)
+        return methods[command](args[1:])
+
+
+def rbd_main(argv):
+    try:
+        options, args = _parse_args(argv[1:], RBD_VALUE_OPTIONS, RBD_FLAG_OPTIONS)
+        state = ClusterState()
+        state.delay()
+        RBDCommand(state, options).execute(args)
+        return 0
+    except (CommandError, SimulatorError, IOError, OSError) as e:
+        sys.stderr.write("rbd: %s\n" % e)
+        return 2
+
+
+def ceph_main(argv):
+    try:
+        options, args = _parse_args(argv[1:], {'--cluster': 'cluster',
+                                               '-c': 'conffile',
+                                               '--conf': 'conffile',
+                                               '--format': 'format'}, [])
+        state = ClusterState()
+        config = state.get_config()
+        state.delay()
+        command = ' '.join(args)
+        if command == 'fsid':
+            print(config['fsid'])
+        elif command in ['health', 'health detail']:
+            print('HEALTH_OK')
+        elif command == 'mon_status':
+            print('{"name":"simulator","rank":0,"state":"leader","quorum":[0]}')
+        elif command == 'version':
+            print('ceph version 12.2.0 (simulator)')
+        elif command.startswith('osd pool create '):
+            state.create_pool(args[3])
+            print("pool '%s' created" % args[3])
+        elif command == 'osd pool ls':
+            for pool_name in state.list_pools():
+                print(pool_name)
+        else:
+            raise CommandError("command %s not supported by simulator" % command)
+        return 0
+    except (CommandError, SimulatorError, IOError, OSError) as e:
+        sys.stderr.write("ceph: %s\n" % e)
+        return 2
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# unittest case with a simulated cluster in a temporary directory. fake rbd
+# and ceph commands are put in front of PATH, backup runs as a process with
+# the fake rados and rbd modules, as RBDBenchmark does.
+#
+# import this module before modules which import rados or rbd, the fake
+# modules are put in front of sys.path.
+
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+import subprocess
+
+from ConfigParser import ConfigParser
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATOR_PATH = os.path.join(REPO_PATH, 'Simulator')
+
+if SIMULATOR_PATH not in sys.path:
+    sys.path.insert(0, SIMULATOR_PATH)
+
+from Simulator.ClusterState import ClusterState, SIMULATOR_PATH_ENV
+
+CLUSTER_NAME = 'ceph'
+BACKUP_CONFIG_FILE = os.path.join(REPO_PATH, 'Config', 'backup.conf')
+
+
+class SimulatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.log.addHandler(logging.NullHandler())
+
+        self.path = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ[SIMULATOR_PATH_ENV] = os.path.join(self.path, 'cluster')
+        os.environ['PATH'] = os.pathsep.join([self._write_command_wrappers(),
+                                              os.environ.get('PATH', '')])
+
+        self.state = ClusterState()
+        self.state.initialize()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.path)
+
+    def _write_command_wrappers(self):
+        ''' fake commands run by python of the test '''
+        bin_path = os.path.join(self.path, 'bin')
+        os.makedirs(bin_path)
+        for command in ['rbd', 'ceph']:
+            command_path = os.path.join(bin_path, command)
+            with open(command_path, 'w') as command_file:
+                command_file.write("#!/bin/sh\nexec '%s' '%s' \"$@\"\n"
+                                   % (sys.executable,
+                                      os.path.join(SIMULATOR_PATH, 'bin', command)))
+            os.chmod(command_path, 0755)
+        return bin_path
+
+    def create_image(self, pool_name, image_name, size, extents=()):
+        ''' create image and write [(offset, length), ...] of pattern data '''
+        if not self.state.pool_exists(pool_name):
+            self.state.create_pool(pool_name)
+        self.state.create_image(pool_name, image_name, size)
+        self.write_image(pool_name, image_name, extents)
+
+    def write_image(self, pool_name, image_name, extents):
+        with self.state.image(pool_name, image_name, write=True) as image:
+            for offset, length in extents:
+                self.state.write(image, offset, length)
+
+    def read_image(self, pool_name, image_name, snap_name=None):
+        with self.state.image(pool_name, image_name) as image:
+            size = self.state.get_size(image, snap_name)
+            return self.state.read(image, 0, size, snap_name=snap_name)
+
+    # backup
+    # --------------------------------------------------------------------------
+    def write_backup_config(self, images, **options):
+        ''' write backup config of {pool name: [image name, ...]}, options
+            override the default config. return (config path, section).
+        '''
+        list_path = os.path.join(self.path, 'backup_list.yaml')
+        with open(list_path, 'w') as list_file:
+            list_file.write("test:\n")
+            for pool_name, image_names in images.iteritems():
+                list_file.write("    %s:\n" % pool_name)
+                for image_name in image_names:
+                    list_file.write("        - %s\n" % image_name)
+
+        self.backup_path = os.path.join(self.path, 'backup')
+        config = ConfigParser()
+        config.read(BACKUP_CONFIG_FILE)
+        section = config.sections()[0]
+        config_options = {'ceph_cluster_name': CLUSTER_NAME,
+                          'ceph_conffile': '',
+                          'log_path': os.path.join(self.path, 'log'),
+                          'log_level': 'DEBUG',
+                          'backup_yaml_filepath': list_path,
+                          'backup_yaml_section_name': 'test',
+                          'backup_path': self.backup_path,
+                          'monitor_record_path': os.path.join(self.path, 'record'),
+                          'metrics_textfile_path': '',
+                          'metrics_json_path': '',
+                          'trace_file_path': '',
+                          'status_board_path': '',
+                          'drop_cache_level': '0',
+                          'flush_file_system_buffer': 'False'}
+        config_options.update(options)
+        for key, value in config_options.iteritems():
+            config.set(section, key, str(value))
+
+        for path in [config_options['log_path'], self.backup_path,
+                     config_options['monitor_record_path']]:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        config_path = os.path.join(self.path, 'backup.conf')
+        with open(config_path, 'w') as config_file:
+            config.write(config_file)
+        return config_path, section
+
+    def run_backup(self, config_path, section):
+        ''' run backup process, return its exit code '''
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([SIMULATOR_PATH, REPO_PATH])
+        cmd = [sys.executable, os.path.join(REPO_PATH, 'RBDBackup.py'),
+               '--backup_config_file', config_path,
+               '--backup_config_section', section]
+        with open(os.path.join(self.path, 'backup.out'), 'a') as output:
+            return subprocess.call(cmd, cwd=REPO_PATH, env=env,
+                                   stdout=output, stderr=subprocess.STDOUT)
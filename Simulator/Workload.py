@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# generate shape of a simulated cluster for benchmark, images of skewed size
+# distribution filled partially, and churn of data between backup runs.
+# the random generator is seeded, same arguments produce same cluster.
+
+import random
+
+
+class Workload(object):
+    def __init__(self, state, seed=1, extent_size=4194304):
+        self.state = state
+        self.random = random.Random(seed)
+        self.extent_size = int(extent_size)
+
+        self.images = {}    # {pool name: [image name, ...], ...}
+
+    def _get_size(self, min_size, max_size, skew):
+        ''' pareto distributed size, most images are small and a few are large '''
+        size = min_size * self.random.paretovariate(skew)
+        size = min(int(size), max_size)
+        return max(size / self.extent_size, 1) * self.extent_size
+
+    def _fill(self, image, ratio):
+        ''' write extents at random offsets until ratio of image is allocated '''
+        extent_count = image['size'] / self.extent_size
+        fill_count = int(extent_count * ratio)
+        for index in self.random.sample(xrange(extent_count), fill_count):
+            self.state.write(image, index * self.extent_size, self.extent_size)
+        return fill_count * self.extent_size
+
+    def populate(self, pool_name, image_count, min_size, max_size, skew=1.2,
+                 fill_ratio=0.3, name_format='image%05d'):
+        ''' create images in pool, return total allocated bytes '''
+        if not self.state.pool_exists(pool_name):
+            self.state.create_pool(pool_name)
+
+        allocated = 0
+        images = self.images.setdefault(pool_name, [])
+        for i in xrange(image_count):
+            image_name = name_format % i
+            size = self._get_size(int(min_size), int(max_size), float(skew))
+            self.state.create_image(pool_name, image_name, size)
+            with self.state.image(pool_name, image_name, write=True) as image:
+                allocated += self._fill(image, float(fill_ratio))
+            images.append(image_name)
+        return allocated
+
+    def churn(self, pool_name, churn_rate, image_ratio=1.0):
+        ''' rewrite churn_rate of extents of image_ratio of images, a part of
+            rewrites discard data. return total changed bytes.
+        '''
+        images = self.images.get(pool_name, [])
+        changed_count = int(len(images) * float(image_ratio))
+        changed = 0
+        for image_name in self.random.sample(images, changed_count):
+            with self.state.image(pool_name, image_name, write=True) as image:
+                extent_count = image['size'] / self.extent_size
+                churn_count = max(int(extent_count * float(churn_rate)), 1)
+                for index in self.random.sample(xrange(extent_count), min(churn_count, extent_count)):
+                    if self.random.random() < 0.1:
+                        self.state.discard(image, index * self.extent_size, self.extent_size)
+                    else:
+                        self.state.write(image, index * self.extent_size, self.extent_size)
+                    changed += self.extent_size
+        return changed
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# fake rados module backed by simulated cluster state, put Simulator
+# directory in front of PYTHONPATH to use it instead of python-rados.
+
+import json
+
+from Simulator.ClusterState import ClusterState, SimulatorError, NotFound, Exists
+
+
+class Error(Exception):
+    pass
+
+class ObjectNotFound(Error):
+    pass
+
+class ObjectExists(Error):
+    pass
+
+
+class Ioctx(object):
+    def __init__(self, cluster, pool_name):
+        self.cluster = cluster
+        self.name = pool_name
+        self.state = cluster.state
+        self.closed = False
+
+    def get_pool_name(self):
+        return self.name
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+
+class Rados(object):
+    def __init__(self, rados_id=None, name=None, clustername=None,
+                 conf_defaults=None, conffile=None, conf=None, flags=0):
+        self.conffile = conffile
+        self.clustername = clustername
+        self.state = ClusterState()
+        self.state_name = 'configuring'
+
+    def connect(self, timeout=0):
+        try:
+            self.state.get_config()
+            self.state.delay()
+        except NotFound as e:
+            raise ObjectNotFound(str(e))
+        self.state_name = 'connected'
+
+    def shutdown(self):
+        self.state_name = 'shutdown'
+
+    def get_fsid(self):
+        return self.state.get_config()['fsid']
+
+    def list_pools(self):
+        return self.state.list_pools()
+
+    def pool_exists(self, pool_name):
+        return self.state.pool_exists(pool_name)
+
+    def create_pool(self, pool_name, crush_rule=None):
+        try:
+            self.state.create_pool(pool_name)
+        except Exists as e:
+            raise ObjectExists(str(e))
+
+    def open_ioctx(self, pool_name):
+        if self.state_name != 'connected':
+            raise Error("cluster is not connected")
+        if not self.state.pool_exists(pool_name):
+            raise ObjectNotFound("pool %s not found" % pool_name)
+        self.state.delay()
+        return Ioctx(self, pool_name)
+
+    def mon_command(self, cmd, inbuf, timeout=0, target=None):
+        ''' return (return code, output buffer, status) of a few commands '''
+        try:
+            command = json.loads(cmd)
+            prefix = command.get('prefix')
+            self.state.delay()
+            if prefix == 'fsid':
+                return 0, self.get_fsid(), ''
+            config = self.state.get_config(reload=True)
+            health = {'status': config.get('health', 'HEALTH_OK'), 'checks': {}}
+            if prefix == 'health':
+                return 0, json.dumps(health), ''
+            if prefix == 'status':
+                pgs_by_state = config.get('pgs_by_state',
+                                          [{'state_name': 'active+clean', 'count': 128}])
+                return 0, json.dumps({'fsid': self.get_fsid(),
+                                      'health': health,
+                                      'pgmap': {'pgs_by_state': pgs_by_state}}), ''
+            if prefix == 'osd perf':
+                latency = config.get('osd_latency_ms', 0)
+                perf_stats = {'commit_latency_ms': latency, 'apply_latency_ms': latency}
+                return 0, json.dumps({'osdstats': {'osd_perf_infos': [
+                    {'id': 0, 'perf_stats': perf_stats}]}}), ''
+            if prefix == 'df':
+                return 0, json.dumps({'pools': [{'name': name, 'stats': {}}
+                                                 for name in self.list_pools()]}), ''
+            return -22, '', "command %s not supported by simulator" % prefix
+        except (ValueError, SimulatorError) as e:
+            return -22, '', str(e)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        return False
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# fake rbd module backed by simulated cluster state, put Simulator
+# directory in front of PYTHONPATH to use it instead of python-rbd.
+
+from Simulator.ClusterState import ClusterState, SimulatorError, NotFound, Exists, Busy
+
+
+class Error(Exception):
+    pass
+
+class ImageNotFound(Error):
+    pass
+
+class ImageExists(Error):
+    pass
+
+class ImageBusy(Error):
+    pass
+
+class InvalidArgument(Error):
+    pass
+
+
+def _raise(e):
+    if isinstance(e, NotFound):
+        raise ImageNotFound(str(e))
+    if isinstance(e, Exists):
+        raise ImageExists(str(e))
+    if isinstance(e, Busy):
+        raise ImageBusy(str(e))
+    raise Error(str(e))
+
+
+class RBD(object):
+    def version(self):
+        return (1, 12, 0)
+
+    def list(self, ioctx):
+        try:
+            return ioctx.state.list_images(ioctx.name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def create(self, ioctx, name, size, order=None, old_format=True,
+               features=None, *args, **kwargs):
+        try:
+            ioctx.state.create_image(ioctx.name, name, size,
+                                     features=features, order=order)
+        except SimulatorError as e:
+            _raise(e)
+
+    def remove(self, ioctx, name):
+        try:
+            ioctx.state.remove_image(ioctx.name, name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def clone(self, p_ioctx, p_name, p_snapname, c_ioctx, c_name,
+              features=None, order=None, *args, **kwargs):
+        ''' clone is flattened on creation, child has a copy of extent list '''
+        try:
+            with p_ioctx.state.image(p_ioctx.name, p_name) as parent:
+                snapshot = p_ioctx.state.get_snapshot(parent, p_snapname)
+                if not snapshot['protected']:
+                    raise InvalidArgument("snapshot %s is not protected" % p_snapname)
+                if features is None:
+                    features = parent['features']
+                c_ioctx.state.create_image(c_ioctx.name, c_name, snapshot['size'],
+                                           features=features,
+                                           order=order or parent['order'],
+                                           extents=snapshot['extents'],
+                                           parent={'pool': p_ioctx.name,
+                                                   'image': p_name,
+                                                   'snapshot': p_snapname})
+        except SimulatorError as e:
+            _raise(e)
+
+
+class Image(object):
+    def __init__(self, ioctx, name, snapshot=None, read_only=False):
+        self.ioctx = ioctx
+        self.state = ioctx.state
+        self.pool_name = ioctx.name
+        self.name = name
+        self.snap_name = None
+        self.read_only = read_only
+        self.closed = False
+
+        if not self.state.image_exists(self.pool_name, name):
+            raise ImageNotFound("image %s/%s not found" % (self.pool_name, name))
+        self.state.delay()
+        if snapshot is not None:
+            self.set_snap(snapshot)
+
+    def _read(self):
+        return self.state.image(self.pool_name, self.name)
+
+    def _write(self):
+        if self.read_only or self.snap_name is not None:
+            raise Error("image %s is read only" % self.name)
+        return self.state.image(self.pool_name, self.name, write=True)
+
+    def set_snap(self, name):
+        try:
+            if name is not None:
+                with self._read() as image:
+                    self.state.get_snapshot(image, name)
+            self.snap_name = name
+        except SimulatorError as e:
+            _raise(e)
+
+    def size(self):
+        try:
+            with self._read() as image:
+                return self.state.get_size(image, self.snap_name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def features(self):
+        with self._read() as image:
+            return image['features']
+
+    def stat(self):
+        with self._read() as image:
+            size = self.state.get_size(image, self.snap_name)
+            obj_size = 1 << image['order']
+            parent = image['parent'] or {}
+            return {'size': size,
+                    'obj_size': obj_size,
+                    'num_objs': (size + obj_size - 1) / obj_size,
+                    'order': image['order'],
+                    'block_name_prefix': 'rbd_data.%x' % (image['seed_base'] >> 32),
+                    'parent_pool': parent.get('pool', -1),
+                    'parent_name': parent.get('image', '')}
+
+    def list_snaps(self):
+        with self._read() as image:
+            snapshots = [{'id': snapshot['id'],
+                          'size': snapshot['size'],
+                          'name': str(snapshot['name'])}
+                         for snapshot in image['snapshots']]
+        return iter(snapshots)
+
+    def create_snap(self, name):
+        try:
+            with self._write() as image:
+                self.state.create_snapshot(image, name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def remove_snap(self, name):
+        try:
+            with self._write() as image:
+                self.state.remove_snapshot(image, name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def _set_protection(self, name, protected):
+        try:
+            with self._write() as image:
+                self.state.get_snapshot(image, name)['protected'] = protected
+        except SimulatorError as e:
+            _raise(e)
+
+    def protect_snap(self, name):
+        self._set_protection(name, True)
+
+    def unprotect_snap(self, name):
+        try:
+            with self._write() as image:
+                self.state.unprotect_snapshot(image, name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def is_protected_snap(self, name):
+        with self._read() as image:
+            return self.state.get_snapshot(image, name)['protected']
+
+    def list_children(self):
+        ''' [(pool name, image name), ...] of clones of current snapshot '''
+        try:
+            return self.state.list_children(self.pool_name, self.name, self.snap_name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def flatten(self):
+        try:
+            with self._write() as image:
+                self.state.flatten(image)
+        except SimulatorError as e:
+            _raise(e)
+
+    def rollback_to_snap(self, name):
+        try:
+            with self._write() as image:
+                self.state.rollback_snapshot(image, name)
+        except SimulatorError as e:
+            _raise(e)
+
+    def resize(self, size):
+        with self._write() as image:
+            self.state.resize(image, size)
+
+    def diff_iterate(self, offset, length, from_snapshot, iterate_cb,
+                     include_parent=True, whole_object=False):
+        try:
+            with self._read() as image:
+                extents = self.state.diff(image, snap_name=self.snap_name,
+                                          from_snap=from_snapshot,
+                                          offset=offset, length=length)
+        except SimulatorError as e:
+            _raise(e)
+        for extent_offset, extent_length, exists in extents:
+            iterate_cb(extent_offset, extent_length, exists)
+
+    def read(self, offset, length, fadvise_flags=0):
+        with self._read() as image:
+            return self.state.read(image, offset, length, snap_name=self.snap_name)
+
+    def write(self, data, offset, fadvise_flags=0):
+        with self._write() as image:
+            self.state.write(image, offset, len(data), data=data)
+        return len(data)
+
+    def discard(self, offset, length):
+        with self._write() as image:
+            self.state.discard(image, offset, length)
+        return length
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
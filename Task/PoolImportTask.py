@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os, sys, time, traceback
+
+from collections import OrderedDict
+
+from Common.Constant import *
+from Common.Yaml import Yaml
+from Task.RBDImportTask import RBDImportTask
+
+# restore all RBD images of a pool from backup files.
+# RBD images are created up front, then backup files are imported by the
+# workers, higher priority and larger image first. number of import and
+# import bandwidth in each target pool are limited. progress is recorded
+# after each import, so an interrupted pool import continues where it stopped.
+class PoolImportTask(object):
+    def __init__(self, log, cluster_name, manager, progress_path,
+                 pool_concurrency=1, pool_bandwidth=0):
+        self.log = log
+        self.cluster_name = cluster_name
+        self.manager = manager
+        self.progress_path = progress_path
+
+        self.pool_concurrency = int(pool_concurrency)
+        self.pool_bandwidth = float(pool_bandwidth)    # bytes per second, 0 is unlimited
+
+        self.pools = {}      # {pool_name: Pool, ...} target pools
+        self.jobs = OrderedDict()    # {rbd_id: job, ...}
+        self.progress = None
+
+        self.completed_count = 0
+        self.failed_count = 0
+
+    def __str__(self):
+        return "pool_import_%s_images" % len(self.jobs)
+
+    def add_pool(self, pool):
+        self.pools[pool.pool_name] = pool
+
+    def add_image(self, rbd_id, pool_name, rbd_name, chain, snapshots,
+                        size, features, priority=0):
+        ''' chain is backup files to import in order, snapshots is snapshot
+            name of each backup file.
+        '''
+        job = dict()
+        job['rbd_id'] = rbd_id
+        job['pool_name'] = pool_name
+        job['rbd_name'] = rbd_name
+        job['chain'] = chain
+        job['snapshots'] = snapshots
+        job['size'] = size
+        job['features'] = features
+        job['priority'] = int(priority)
+        job['bytes'] = sum([os.path.getsize(path) for path in chain])
+        job['status'] = IMPORT_PENDING
+        job['imported'] = 0
+        job['running'] = False
+        job['error'] = None
+        self.jobs[rbd_id] = job
+
+    def _read_progress(self):
+        self.progress = Yaml(self.log, self.progress_path)
+        if not os.path.exists(self.progress_path):
+            return True
+
+        progress = self.progress.read()
+        if progress is False:
+            return False
+
+        for rbd_id, record in progress.iteritems():
+            if not self.jobs.has_key(rbd_id):
+                continue
+            job = self.jobs[rbd_id]
+            if record['target'] != "%s/%s" % (job['pool_name'], job['rbd_name']):
+                self.log.warning("import target of %s changed, ignore progress." % rbd_id)
+                continue
+            if record['status'] == IMPORT_FAILED:
+                job['status'] = IMPORT_CREATED
+            else:
+                job['status'] = record['status']
+            job['imported'] = record['imported']
+        return True
+
+    def _write_progress(self):
+        progress = OrderedDict()
+        for rbd_id, job in self.jobs.iteritems():
+            record = dict()
+            record['target'] = "%s/%s" % (job['pool_name'], job['rbd_name'])
+            record['status'] = job['status']
+            record['imported'] = job['imported']
+            record['error'] = job['error']
+            progress[rbd_id] = record
+        return self.progress.write(section_data=dict(progress), overwrite=True)
+
+    def _skip_imported_snapshots(self, job):
+        ''' an import may be done but not recorded before interruption,
+            skip backup file whose snapshot exist in target RBD image already.
+        '''
+        pool = self.pools[job['pool_name']]
+        snap_list = pool.get_snap_name_list(job['rbd_name'])
+        if snap_list is False:
+            return False
+        while job['imported'] < len(job['chain']) and \
+              job['snapshots'][job['imported']] in snap_list:
+            job['imported'] += 1
+        return True
+
+    def _next_task(self, job):
+        index = job['imported']
+        if index >= len(job['chain']):
+            return None
+
+        if self.pool_bandwidth > 0:
+            bandwidth = self.pool_bandwidth / self.pool_concurrency
+        else:
+            bandwidth = 0
+
+        if index == 0:
+            import_type = FULL
+        else:
+            import_type = DIFF
+
+        return RBDImportTask(self.cluster_name,
+                             job['pool_name'],
+                             job['rbd_name'],
+                             job['chain'][index],
+                             import_type=import_type,
+                             snap_name=job['snapshots'][index],
+                             rbd_id=job['rbd_id'],
+                             stream=True,
+                             bandwidth=bandwidth)
+
+    def estimate_seconds(self, import_bandwidth):
+        ''' estimate duration of the pool import. in each target pool, jobs are
+            assigned to the least loaded import slot, the pool import completes
+            when the last pool completes.
+        '''
+        slot_count = min(self.pool_concurrency, self.manager.worker_count)
+        if self.pool_bandwidth > 0:
+            slot_bandwidth = min(self.pool_bandwidth / slot_count, float(import_bandwidth))
+        else:
+            slot_bandwidth = float(import_bandwidth)
+
+        estimated_seconds = 0
+        for pool_name in self.pools.keys():
+            slots = [0] * slot_count
+            jobs = [job for job in self.jobs.values() if job['pool_name'] == pool_name]
+            for job in sorted(jobs, key=lambda k: k['bytes'], reverse=True):
+                i = slots.index(min(slots))
+                slots[i] += job['bytes'] / slot_bandwidth
+            estimated_seconds = max(estimated_seconds, max(slots))
+        return estimated_seconds
+
+    def create_images(self):
+        ''' create all RBD images before any import, an existing image is
+            reused only if progress record shows it was created by us.
+        '''
+        try:
+            if self._read_progress() is False:
+                self.log.error("unable to read pool import progress %s" % self.progress_path)
+                return False
+
+            for rbd_id, job in self.jobs.iteritems():
+                if job['status'] != IMPORT_PENDING:
+                    continue
+
+                pool = self.pools[job['pool_name']]
+                if not pool.create_rbd(job['rbd_name'], job['size'], job['features']):
+                    job['error'] = "unable to create rbd image"
+                    self.failed_count += 1
+                    continue
+                job['status'] = IMPORT_CREATED
+                job['error'] = None
+
+            return self._write_progress()
+        except Exception as e:
+            self.log.error("unable to create RBD images for pool import. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
+
+    def start_import(self):
+        try:
+            jobs = [job for job in self.jobs.values() if job['status'] == IMPORT_CREATED]
+            jobs = sorted(jobs, key=lambda k: (k['priority'], k['bytes']), reverse=True)
+
+            for job in jobs:
+                self._skip_imported_snapshots(job)
+
+            running_count = {}
+            for pool_name in self.pools.keys():
+                running_count[pool_name] = 0
+            in_flight = 0
+
+            while True:
+                # submit next import task of jobs, respect concurrency limit
+                # of workers and target pools
+                # ----------------------------------------
+                for job in jobs:
+                    if in_flight >= self.manager.worker_count:
+                        break
+                    if job['running'] or job['status'] != IMPORT_CREATED:
+                        continue
+                    if running_count[job['pool_name']] >= self.pool_concurrency:
+                        continue
+
+                    task = self._next_task(job)
+                    if task is None:
+                        job['status'] = IMPORT_COMPLETE
+                        self.completed_count += 1
+                        continue
+
+                    self.manager.add_task(task)
+                    job['running'] = True
+                    running_count[job['pool_name']] += 1
+                    in_flight += 1
+
+                if in_flight == 0:
+                    break
+
+                # collect finished import task
+                # ----------------------------------------
+                task = self.manager.get_finished_task()
+                job = self.jobs[task.rbd_id]
+                job['running'] = False
+                running_count[job['pool_name']] -= 1
+                in_flight -= 1
+
+                self.log.info(("receive finished task %s" % task.name, task.result))
+                if task.task_status == COMPLETE:
+                    job['imported'] += 1
+                    if job['imported'] == len(job['chain']):
+                        job['status'] = IMPORT_COMPLETE
+                        self.completed_count += 1
+                else:
+                    self.log.warning("%s is not completed." % task.name)
+                    job['status'] = IMPORT_FAILED
+                    job['error'] = str(task.error)
+                    self.failed_count += 1
+
+                self._write_progress()
+
+            self.log.info("\n%s RBD images imported.\n"
+                          "%s RBD images failed."
+                          % (self.completed_count, self.failed_count))
+            return self._write_progress()
+        except Exception as e:
+            self.log.error("unable to import RBD images. %s" % e)
+            exc_type,exc_value,exc_traceback = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_traceback, file=sys.stdout)
+            return False
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import time, datetime
+import os, time, datetime
 
 from Common.Constant import *
 from Common.BaseTask import BaseTask
@@ -31,36 +31,53 @@ class RBDExportTask(BaseTask):
                                             self.rbd_name,
                                             self.pool_name)
 
-    def _rbd_export(self):
+    def _get_export_cmd(self):
         if self.to_snap is not None:
             rbd_name = "%s@%s" % (self.rbd_name, self.to_snap)
         else:
             rbd_name = self.rbd_name
 
-        cmd = ("rbd export --no-progress "
-               "--cluster %s -p %s %s %s" %(self.cluster_name,
-                                            self.pool_name,
-                                            rbd_name,
-                                            self.export_destpath))
-        return self._exec_cmd(cmd)
+        return ['rbd', 'export', '--no-progress',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                rbd_name,
+                self.export_destpath]
 
-    def _rbd_export_diff(self):
-        if self.from_snap is not None:
-            from_snap = "--from-snap %s" % self.from_snap
-        else:
-            from_snap = ""
+    def _get_export_diff_cmd(self):
         if self.to_snap is None:
-            return False
+            return None
+
+        cmd = ['rbd', 'export-diff', '--no-progress',
+               '--cluster', self.cluster_name,
+               '-p', self.pool_name,
+               "%s@%s" % (self.rbd_name, self.to_snap)]
+        if self.from_snap is not None:
+            cmd.extend(['--from-snap', self.from_snap])
+        cmd.append(self.export_destpath)
+        return cmd
+
+    def reset(self):
+        ''' rbd export does not overwrite file left by failed export '''
+        super(RBDExportTask, self).reset()
+        if os.path.exists(self.export_destpath):
+            os.remove(self.export_destpath)
+
+    def _rbd_export(self):
+        return self._exec_cmd(self._get_export_cmd())
 
-        cmd = ("rbd export-diff --no-progress "
-               "--cluster %s -p %s %s@%s %s %s" % (self.cluster_name,
-                                                   self.pool_name,
-                                                   self.rbd_name,
-                                                   self.to_snap,
-                                                   from_snap,
-                                                   self.export_destpath))
+    def _rbd_export_diff(self):
+        cmd = self._get_export_diff_cmd()
+        if cmd is None:
+            return False
         return self._exec_cmd(cmd)
 
+    def get_command(self):
+        if self.export_type == FULL:
+            return self._get_export_cmd()
+        elif self.export_type == DIFF:
+            return self._get_export_diff_cmd()
+        return None
+
     def execute(self, worker_name=None):
         try:
             self.worker_name = worker_name
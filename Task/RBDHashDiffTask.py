@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os, time, datetime
+
+import rados
+from rbd import RBD, Image
+
+from Common.Constant import *
+from Common.DiffFile import DiffWriter
+from Common.BlockManifest import BlockManifest, get_manifest_path
+from Task.RBDExportTask import RBDExportTask
+
+# incremental export of a RBD image when the snapshot of last backup is gone
+# from the cluster. allocated blocks of the new snapshot are read and their
+# hashes are compared with the block manifest of last backup, only changed
+# blocks are written to the incremental file. cluster read is full, but
+# output is incremental. manifest of the new snapshot is written next to
+# the incremental file.
+class RBDHashDiffTask(RBDExportTask):
+    result_attrs = ('read_bytes', 'changed_bytes')
+
+    def __init__(self, cluster_name, pool_name, rbd_name, export_destpath,
+                 base_manifest_path, from_snap, to_snap,
+                 conffile='', rbd_id=None):
+        super(RBDHashDiffTask, self).__init__(cluster_name, pool_name, rbd_name,
+                                              export_destpath, export_type=DIFF,
+                                              from_snap=from_snap, to_snap=to_snap,
+                                              rbd_id=rbd_id)
+        self.base_manifest_path = base_manifest_path
+        self.conffile = conffile
+
+        self.manifest_path = get_manifest_path(os.path.dirname(export_destpath), to_snap)
+
+        self.read_bytes = 0
+        self.changed_bytes = 0
+
+        self.name = self.__str__()
+
+    def __str__(self):
+        return "hash_diff_export_%s_in_pool_%s" % (self.rbd_name, self.pool_name)
+
+    def get_command(self):
+        # not a command, executed by worker thread
+        return None
+
+    def _get_allocated_blocks(self, image, manifest):
+        allocated = set()
+        def iterate_cb(offset, length, exists):
+            if exists:
+                allocated.update(manifest.get_blocks(offset, length))
+
+        image.diff_iterate(0, manifest.image_size, None, iterate_cb)
+        return sorted(allocated)
+
+    def _write_diff(self, image, base_manifest, diff_file):
+        size = image.size()
+        manifest = BlockManifest(block_size=base_manifest.block_size, image_size=size)
+
+        # blocks of base beyond new size are cut by size record
+        base_manifest.resize(size)
+
+        writer = DiffWriter(diff_file)
+        writer.write_from_snap(self.from_snap)
+        writer.write_to_snap(self.to_snap)
+        writer.write_size(size)
+
+        allocated = set(self._get_allocated_blocks(image, manifest))
+        for index in xrange(len(manifest.hashes)):
+            offset, length = manifest.get_block_range(index)
+
+            if index in allocated:
+                data = image.read(offset, length)
+                self.read_bytes += length
+                manifest.hashes[index] = manifest.hash_data(data)
+                if self.progress_callback is not None:
+                    self.progress_callback(self.read_bytes)
+
+            if manifest.hashes[index] == base_manifest.hashes[index]:
+                continue
+
+            self.changed_bytes += length
+            if manifest.hashes[index] == manifest.zero_hash:
+                writer.write_zero(offset, length)
+            else:
+                writer.write_data(offset, data)
+
+        writer.write_end()
+        return manifest
+
+    def execute(self, worker_name=None):
+        temp_path = "%s%s" % (self.export_destpath, SYNTHETIC_TEMP_SUFFIX)
+        try:
+            self.worker_name = worker_name
+            self.start_timestamp = time.time()
+            self.task_status = EXECUTE
+            self.cmd = ("hash diff %s@%s with %s"
+                        % (self.rbd_name, self.to_snap, self.base_manifest_path))
+
+            base_manifest = BlockManifest().load(self.base_manifest_path)
+
+            cluster = rados.Rados(conffile=self.conffile)
+            cluster.connect()
+            try:
+                ioctx = cluster.open_ioctx(self.pool_name)
+                image = Image(ioctx, self.rbd_name, snapshot=self.to_snap, read_only=True)
+                try:
+                    with open(temp_path, 'wb') as diff_file:
+                        manifest = self._write_diff(image, base_manifest, diff_file)
+                        diff_file.flush()
+                        os.fsync(diff_file.fileno())
+                finally:
+                    image.close()
+                    ioctx.close()
+            finally:
+                cluster.shutdown()
+
+            os.rename(temp_path, self.export_destpath)
+            manifest.save(self.manifest_path)
+
+            self.output = ("read %s bytes, changed %s bytes"
+                           % (self.read_bytes, self.changed_bytes), 0)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+
+            return self.output
+        except Exception as e:
+            print("%s error: %s" %(self.name, e))
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.error = e
+            self.output = (str(e), 1)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+            return False
@@ -4,11 +4,112 @@ import time, datetime
 
 from Common.Constant import *
 from Common.BaseTask import BaseTask
+from Common.Throttle import Throttle
+from Common.DiffFile import DiffWriter, write_raw_as_diff, copy_stream
 
+# represent a rbd import task, import full or incremental backup file
+class RBDImportTask(BaseTask):
+    def __init__(self, cluster_name, pool_name, rbd_name, import_srcpath,
+                 import_type=FULL, snap_name=None, rbd_id=None,
+                 stream=False, bandwidth=0):
+        super(RBDImportTask, self).__init__()
 
-class RBDImportTask(BaseTask)
-    def __init__(self, cluster_name, pool_name, rbd_name, export_destpath,
-                 export_type=FULL, from_snap=None, to_snap=None, rbd_id=None):
-        super(RBDExportTask, self).__init__()
+        self.pool_name = pool_name
+        self.rbd_name = rbd_name
+        self.cluster_name = cluster_name
+        self.import_srcpath = import_srcpath
 
-        pass
+        self.import_type = import_type    # full or diff
+        self.snap_name = snap_name        # snapshot to create after full import
+        self.rbd_id = rbd_id
+
+        # stream the backup file to import-diff through this process, the RBD
+        # image must be created already. import rate is limited by bandwidth.
+        self.stream = stream
+        self.bandwidth = bandwidth
+
+        self.init_timestamp = time.time()
+        self.name = self.__str__()
+
+    def __str__(self):
+        return "%s_import_%s_in_pool_%s" % (EXPORT_TYP[self.import_type],
+                                            self.rbd_name,
+                                            self.pool_name)
+
+    def _get_import_cmd(self):
+        return ['rbd', 'import', '--no-progress',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                self.import_srcpath,
+                self.rbd_name]
+
+    def _get_snap_create_cmd(self):
+        return ['rbd', 'snap', 'create',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                "%s@%s" % (self.rbd_name, self.snap_name)]
+
+    def _get_import_diff_cmd(self, import_srcpath=None):
+        if import_srcpath is None:
+            import_srcpath = self.import_srcpath
+        return ['rbd', 'import-diff', '--no-progress',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                import_srcpath,
+                self.rbd_name]
+
+    def _rbd_import(self):
+        result = self._exec_cmd(self._get_import_cmd())
+
+        # incremental backup file starts from snapshot of the full backup,
+        # create the snapshot so import-diff is able to apply on top of it.
+        if self.snap_name is not None and self.task_status == COMPLETE:
+            result = self._exec_cmd(self._get_snap_create_cmd())
+        return result
+
+    def _rbd_import_diff(self):
+        return self._exec_cmd(self._get_import_diff_cmd())
+
+    def _rbd_import_stream(self):
+        throttle = Throttle(self.bandwidth)
+
+        def stdin_writer(stdin):
+            if self.import_type == FULL:
+                write_raw_as_diff(self.import_srcpath, DiffWriter(stdin),
+                                  to_snap=self.snap_name, throttle=throttle)
+            else:
+                copy_stream(self.import_srcpath, stdin, throttle=throttle)
+
+        return self._exec_cmd(self._get_import_diff_cmd('-'),
+                              stdin_writer=stdin_writer)
+
+    def get_command(self):
+        # stream import writes data to stdin of the command and full import
+        # with snapshot runs two commands, both are run by execute()
+        if self.stream:
+            return None
+        if self.import_type == FULL:
+            if self.snap_name is not None:
+                return None
+            return self._get_import_cmd()
+        elif self.import_type == DIFF:
+            return self._get_import_diff_cmd()
+        return None
+
+    def execute(self, worker_name=None):
+        try:
+            self.worker_name = worker_name
+            result = None
+
+            if self.stream:
+                result = self._rbd_import_stream()
+            elif self.import_type == FULL:
+                result = self._rbd_import()
+            elif self.import_type == DIFF:
+                result = self._rbd_import_diff()
+
+            return result
+        except Exception as e:
+            print("%s error: %s" %(self.name, e))
+            self.error = e
+            return False
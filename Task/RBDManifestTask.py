@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os, time, datetime
+
+import rados
+from rbd import RBD, Image
+
+from Common.Constant import *
+from Common.BaseTask import BaseTask
+from Common.DiffFile import DiffFile
+from Common.BlockManifest import BlockManifest
+
+# build block manifest of a snapshot after it is exported.
+#   full backup: hash blocks of the backup file, no data is read from ceph
+#   incremental: update manifest of the base snapshot, blocks touched by the
+#                incremental file are read from the snapshot again
+class RBDManifestTask(BaseTask):
+    result_attrs = ('read_bytes',)
+
+    def __init__(self, cluster_name, pool_name, rbd_name, snap_name, manifest_path,
+                 raw_path=None, base_manifest_path=None, diff_path=None,
+                 conffile='', rbd_id=None):
+        super(RBDManifestTask, self).__init__()
+
+        self.cluster_name = cluster_name
+        self.pool_name = pool_name
+        self.rbd_name = rbd_name
+        self.snap_name = snap_name
+        self.manifest_path = manifest_path
+
+        self.raw_path = raw_path                        # full backup file
+        self.base_manifest_path = base_manifest_path    # manifest of from snapshot
+        self.diff_path = diff_path                      # incremental file
+        self.conffile = conffile
+        self.rbd_id = rbd_id
+
+        self.read_bytes = 0
+
+        self.init_timestamp = time.time()
+        self.name = self.__str__()
+
+    def __str__(self):
+        return "manifest_%s_in_pool_%s" % (self.rbd_name, self.pool_name)
+
+    def _get_changed_blocks(self, manifest):
+        changed = set()
+        for record in DiffFile(self.diff_path).iterate():
+            if record[0] == 's':
+                manifest.resize(record[1])
+            elif record[0] in ['w', 'z']:
+                changed.update(manifest.get_blocks(record[1], record[2]))
+        # block cut by resize is read again
+        changed.update([i for i, digest in enumerate(manifest.hashes) if digest is None])
+        return sorted(changed)
+
+    def _build_from_diff(self):
+        manifest = BlockManifest().load(self.base_manifest_path)
+        changed = self._get_changed_blocks(manifest)
+        if len(changed) == 0:
+            return manifest
+
+        cluster = rados.Rados(conffile=self.conffile)
+        cluster.connect()
+        try:
+            ioctx = cluster.open_ioctx(self.pool_name)
+            image = Image(ioctx, self.rbd_name, snapshot=self.snap_name, read_only=True)
+            try:
+                for index in changed:
+                    offset, length = manifest.get_block_range(index)
+                    manifest.hashes[index] = manifest.hash_data(image.read(offset, length))
+                    self.read_bytes += length
+            finally:
+                image.close()
+                ioctx.close()
+        finally:
+            cluster.shutdown()
+        return manifest
+
+    def execute(self, worker_name=None):
+        try:
+            self.worker_name = worker_name
+            self.start_timestamp = time.time()
+            self.task_status = EXECUTE
+
+            if self.raw_path is not None:
+                self.cmd = "hash blocks of %s" % self.raw_path
+                manifest = BlockManifest()
+                manifest.build_from_raw(self.raw_path)
+            else:
+                self.cmd = ("hash blocks of %s changed by %s"
+                            % (self.base_manifest_path, self.diff_path))
+                manifest = self._build_from_diff()
+
+            manifest.save(self.manifest_path)
+
+            self.output = ("%s blocks, read %s bytes from cluster"
+                           % (len(manifest.hashes), self.read_bytes), 0)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+
+            return self.output
+        except Exception as e:
+            print("%s error: %s" %(self.name, e))
+            self.error = e
+            self.output = (str(e), 1)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+            return False
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os, time, datetime
+
+import rados
+from rbd import RBD, Image
+
+from Common.Constant import *
+from Common.DiffFile import DiffWriter
+from Common.ExportCheckpoint import ExportCheckpoint
+from Task.RBDExportTask import RBDExportTask
+
+# export a RBD snapshot with librbd in chunks instead of rbd command, output
+# is same as 'rbd export' (raw image) or 'rbd export-diff'. data is written
+# to {export destpath}.partial and checkpoint is saved regularly, if export is
+# interrupted it continues from the checkpoint next time. partial file is
+# renamed to export destpath when export is completed. if deadline is set,
+# export stops at a checkpoint when the deadline is passed.
+class RBDResumableExportTask(RBDExportTask):
+    result_attrs = ('resume_offset', 'exported_bytes', 'deadline_stopped')
+
+    def __init__(self, cluster_name, pool_name, rbd_name, export_destpath,
+                 export_type=FULL, from_snap=None, to_snap=None,
+                 conffile='', checkpoint_interval=EXPORT_CHECKPOINT_INTERVAL,
+                 chunk_size=EXPORT_CHUNK_SIZE, rbd_id=None):
+        super(RBDResumableExportTask, self).__init__(cluster_name, pool_name, rbd_name,
+                                                     export_destpath,
+                                                     export_type=export_type,
+                                                     from_snap=from_snap,
+                                                     to_snap=to_snap,
+                                                     rbd_id=rbd_id)
+        self.conffile = conffile
+        self.checkpoint_interval = int(checkpoint_interval)
+        self.chunk_size = int(chunk_size)
+
+        self.resume_offset = 0      # offset the export continued from
+        self.exported_bytes = 0
+
+        self.deadline = 0           # timestamp to stop export, 0 is no deadline
+        self.deadline_stopped = False
+
+    def get_command(self):
+        # not a command, executed by worker thread
+        return None
+
+    def _get_extents(self, image, offset, length, from_snap):
+        ''' [(offset, length, exists), ...] of the range changed since from_snap '''
+        extents = []
+        def iterate_cb(extent_offset, extent_length, exists):
+            extents.append((extent_offset, extent_length, exists))
+
+        image.diff_iterate(offset, length, from_snap, iterate_cb)
+        return extents
+
+    def _read_extent(self, image, offset, length):
+        ''' yield (offset, data) of the extent in pieces of chunk size '''
+        end = offset + length
+        while offset < end:
+            size = min(self.chunk_size, end - offset)
+            yield offset, image.read(offset, size)
+            offset += size
+
+    def _export_chunk(self, image, output_file, writer, offset, length):
+        if writer is None:
+            # raw image, unallocated range is kept as hole
+            for extent_offset, extent_length, exists in self._get_extents(image, offset, length, None):
+                if not exists:
+                    continue
+                for data_offset, data in self._read_extent(image, extent_offset, extent_length):
+                    output_file.seek(data_offset)
+                    output_file.write(data)
+                    self.exported_bytes += len(data)
+        else:
+            for extent_offset, extent_length, exists in self._get_extents(image, offset, length,
+                                                                          self.from_snap):
+                if not exists:
+                    writer.write_zero(extent_offset, extent_length)
+                    continue
+                for data_offset, data in self._read_extent(image, extent_offset, extent_length):
+                    writer.write_data(data_offset, data)
+                    self.exported_bytes += len(data)
+
+        if self.progress_callback is not None:
+            self.progress_callback(self.exported_bytes)
+
+    def _sync(self, output_file):
+        output_file.flush()
+        os.fsync(output_file.fileno())
+        return output_file.tell()
+
+    def _export(self, image, checkpoint):
+        size = image.size()
+        resumed = checkpoint.load(export_type=EXPORT_TYP[self.export_type],
+                                  from_snap=self.from_snap,
+                                  to_snap=self.to_snap,
+                                  image_size=size)
+        if resumed:
+            self.resume_offset = checkpoint.offset
+            print("%s resume from offset %s" % (self.name, checkpoint.offset))
+
+        mode = 'r+b' if resumed else 'wb'
+        with open(checkpoint.partial_path, mode) as output_file:
+            writer = None
+            if self.export_type == FULL:
+                # data written after checkpoint is dropped and written again
+                output_file.truncate(checkpoint.offset)
+                output_file.truncate(size)
+            else:
+                output_file.truncate(checkpoint.position)
+                output_file.seek(checkpoint.position)
+                writer = DiffWriter(output_file, write_header=not resumed)
+                if not resumed:
+                    if self.from_snap is not None:
+                        writer.write_from_snap(self.from_snap)
+                    writer.write_to_snap(self.to_snap)
+                    writer.write_size(size)
+
+            offset = checkpoint.offset
+            checkpoint_timestamp = time.time()
+            while offset < size:
+                length = min(self.chunk_size, size - offset)
+                self._export_chunk(image, output_file, writer, offset, length)
+                offset += length
+
+                if self.deadline != 0 and offset < size and time.time() >= self.deadline:
+                    checkpoint.save(offset, self._sync(output_file))
+                    self.deadline_stopped = True
+                    return False
+
+                if time.time() - checkpoint_timestamp >= self.checkpoint_interval:
+                    checkpoint.save(offset, self._sync(output_file))
+                    checkpoint_timestamp = time.time()
+
+            if writer is not None:
+                writer.write_end()
+            self._sync(output_file)
+
+        os.rename(checkpoint.partial_path, self.export_destpath)
+        checkpoint.remove()
+        return True
+
+    def execute(self, worker_name=None):
+        try:
+            self.worker_name = worker_name
+            self.start_timestamp = time.time()
+            self.task_status = EXECUTE
+            self.cmd = ("resumable %s export %s@%s to %s"
+                        % (EXPORT_TYP[self.export_type], self.rbd_name,
+                           self.to_snap, self.export_destpath))
+
+            checkpoint = ExportCheckpoint(self.export_destpath)
+
+            cluster = rados.Rados(conffile=self.conffile)
+            cluster.connect()
+            try:
+                ioctx = cluster.open_ioctx(self.pool_name)
+                image = Image(ioctx, self.rbd_name, snapshot=self.to_snap, read_only=True)
+                try:
+                    completed = self._export(image, checkpoint)
+                finally:
+                    image.close()
+                    ioctx.close()
+            finally:
+                cluster.shutdown()
+
+            if completed:
+                self.output = ("exported %s bytes from offset %s"
+                               % (self.exported_bytes, self.resume_offset), 0)
+            else:
+                self.output = ("stopped at deadline, checkpoint at offset %s"
+                               % checkpoint.offset, 1)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+
+            return self.output
+        except Exception as e:
+            # partial file and checkpoint are kept to resume next time
+            print("%s error: %s" %(self.name, e))
+            self.error = e
+            self.output = (str(e), 1)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+            return False
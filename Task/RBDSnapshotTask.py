@@ -7,8 +7,12 @@ from Common.BaseTask import BaseTask
 
 
 class RBDSnapshotTask(BaseTask):
+    # snapshot name is generated by worker if not given
+    result_attrs = ('snap_name', 'snap_id')
+
     def __init__(self, cluster_name, pool_name, rbd_name,
-                 action=CREATE, snap_name=None, protect=False, rbd_id=None):
+                 action=CREATE, snap_name=None, protect=False, rbd_id=None,
+                 clone_pool_name=None, clone_rbd_name=None, flatten=False):
         super(RBDSnapshotTask, self).__init__()
 
         self.cluster_name = cluster_name
@@ -19,6 +23,11 @@ class RBDSnapshotTask(BaseTask):
         self.protect = protect
         self.rbd_id = rbd_id
 
+        # destination of clone action
+        self.clone_pool_name = clone_pool_name
+        self.clone_rbd_name = clone_rbd_name
+        self.flatten = flatten
+
         self.snap_id = None
 
         self.snap_time_format = '%Y_%m_%d_%H_%M_%S'    # for generating snapshot name
@@ -32,35 +41,78 @@ class RBDSnapshotTask(BaseTask):
                                               self.pool_name)
 
     def _get_snapshot_id(self, snap_name=None):
-        cmd = "rbd snap ls --cluster %s %s/%s | grep ' %s ' | awk '{print $1}'" % (self.cluster_name,
-                                                                                   self.pool_name,
-                                                                                   self.rbd_name,
-                                                                                   self.snap_name)
-        return self._exec_cmd(cmd)
+        if snap_name is None:
+            snap_name = self.snap_name
+        cmd = ['rbd', 'snap', 'ls',
+               '--cluster', self.cluster_name,
+               "%s/%s" % (self.pool_name, self.rbd_name)]
+        result = self._exec_cmd(cmd)
+        if result is None or result[1] != 0:
+            return None
+
+        # SNAPID NAME SIZE ...
+        for line in result[0].splitlines():
+            fields = line.split()
+            if len(fields) > 1 and fields[1] == snap_name:
+                return fields[0]
+        return None
+
+    def _get_rm_cmd(self):
+        return ['rbd', 'snap', 'rm',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                "%s@%s" % (self.rbd_name, self.snap_name)]
+
+    def _get_create_cmd(self):
+        if self.snap_name is None:
+            self.snap_name = datetime.datetime.now().strftime(self.snap_time_format)
+
+        return ['rbd', 'snap', 'create',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                "%s@%s" % (self.rbd_name, self.snap_name)]
+
+    def _get_purge_cmd(self):
+        return ['rbd', 'snap', 'purge',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                self.rbd_name]
+
+    def _get_rollback_cmd(self):
+        return ['rbd', 'snap', 'rollback', '--no-progress',
+                '--cluster', self.cluster_name,
+                '-p', self.pool_name,
+                "%s@%s" % (self.rbd_name, self.snap_name)]
+
+    def _get_clone_cmd(self):
+        return ['rbd', 'clone',
+                '--cluster', self.cluster_name,
+                "%s/%s@%s" % (self.pool_name, self.rbd_name, self.snap_name),
+                "%s/%s" % (self.clone_pool_name, self.clone_rbd_name)]
+
+    def _get_flatten_cmd(self):
+        return ['rbd', 'flatten', '--no-progress',
+                '--cluster', self.cluster_name,
+                "%s/%s" % (self.clone_pool_name, self.clone_rbd_name)]
 
     def _rm_snapshot(self):
-        cmd = "rbd snap rm --cluster %s -p %s %s@%s" % (self.cluster_name,
-                                                        self.pool_name,
-                                                        self.rbd_name,
-                                                        self.snap_name)
-        return self._exec_cmd(cmd)
+        return self._exec_cmd(self._get_rm_cmd())
 
     def _create_snapshot(self):
-        if self.snap_name is None:
-            self.snap_name = datetime.datetime.now().strftime(self.snap_time_format)
-
-        cmd = "rbd snap create --cluster %s -p %s %s@%s" % (self.cluster_name,
-                                                            self.pool_name,
-                                                            self.rbd_name,
-                                                            self.snap_name)
         #cmd = "dd if=/dev/urandom of=/disk/sdb1/tmp/%s bs=1024 count=200000" % self.rbd_id
-        return self._exec_cmd(cmd)
+        return self._exec_cmd(self._get_create_cmd())
 
     def _purge_snapshot(self):
-        cmd = "rbd snap purge --cluster %s -p %s %s" % (self.cluster_name,
-                                                        self.pool_name,
-                                                        self.rbd_name)
-        return self._exec_cmd(cmd)
+        return self._exec_cmd(self._get_purge_cmd())
+
+    def _rollback_snapshot(self):
+        return self._exec_cmd(self._get_rollback_cmd())
+
+    def _clone_snapshot(self):
+        return self._exec_cmd(self._get_clone_cmd())
+
+    def _flatten_clone(self):
+        return self._exec_cmd(self._get_flatten_cmd())
 
     def _protect(self, protect):
         if protect:
@@ -68,13 +120,29 @@ class RBDSnapshotTask(BaseTask):
         else:
             protect_op = 'unprotect'
 
-        cmd = "rbd snap %s --cluster %s -p %s %s@%s" % (protect_op,
-                                                        self.cluster_name,
-                                                        self.pool_name,
-                                                        self.rbd_name,
-                                                        self.snap_name)
+        cmd = ['rbd', 'snap', protect_op,
+               '--cluster', self.cluster_name,
+               '-p', self.pool_name,
+               "%s@%s" % (self.rbd_name, self.snap_name)]
         return self._exec_cmd(cmd)
 
+    def get_command(self):
+        # protect is a second command, run by execute()
+        if self.protect and self.action in [CREATE, CLONE]:
+            return None
+
+        if self.action == CREATE:
+            return self._get_create_cmd()
+        elif self.action == REMOVE:
+            return self._get_rm_cmd()
+        elif self.action == PURGE:
+            return self._get_purge_cmd()
+        elif self.action == ROLLBACK:
+            return self._get_rollback_cmd()
+        elif self.action == CLONE:
+            return self._get_clone_cmd()
+        return None
+
     def execute(self, worker_name=None):
         try:
             self.worker_name = worker_name
@@ -89,6 +157,28 @@ class RBDSnapshotTask(BaseTask):
                 result = self._rm_snapshot()
             elif self.action == PURGE:
                 result = self._purge_snapshot()
+            elif self.action == ROLLBACK:
+                result = self._rollback_snapshot()
+            elif self.action == CLONE:
+                # snapshot must be protected before clone, the clone depends
+                # on it until flattened, backup retention skips snapshots in
+                # use. flatten copies data of the snapshot to the clone, it
+                # costs as much as rollback, so it is done only on request.
+                if self.protect:
+                    self._protect(protect=True)
+                result = self._clone_snapshot()
+                if self.flatten and self.task_status == COMPLETE:
+                    result = self._flatten_clone()
+                    if self.protect and self.task_status == COMPLETE:
+                        self._protect(protect=False)
+                        if self.task_status != COMPLETE:
+                            # other clones depend on the snapshot, keep it
+                            # protected, the clone itself is restored.
+                            unprotect_error = self.error
+                            self._verify_result(result)
+                            self.error = ("snapshot %s kept protected, %s"
+                                          % (self.snap_name, unprotect_error))
+                            self._set_result()
 
             return result
         except Exception as e:
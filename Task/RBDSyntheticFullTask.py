@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os, time, datetime
+
+from Common.Constant import *
+from Common.BaseTask import BaseTask
+from Common.DiffFile import DiffFile
+
+# build a full backup file locally from previous full backup and incremental
+# backup files, no data is read from ceph cluster.
+class RBDSyntheticFullTask(BaseTask):
+    result_attrs = ('applied_bytes',)
+
+    def __init__(self, cluster_name, pool_name, rbd_name, base_path, diff_paths,
+                 dest_path, reflink='auto', rbd_id=None):
+        super(RBDSyntheticFullTask, self).__init__()
+
+        self.cluster_name = cluster_name
+        self.pool_name = pool_name
+        self.rbd_name = rbd_name
+        self.base_path = base_path      # full backup file of previous generation
+        self.diff_paths = diff_paths    # incremental files to apply in order
+        self.dest_path = dest_path
+        self.reflink = reflink
+        self.rbd_id = rbd_id
+
+        self.temp_path = "%s%s" % (dest_path, SYNTHETIC_TEMP_SUFFIX)
+        self.applied_bytes = 0
+
+        self.init_timestamp = time.time()
+        self.name = self.__str__()
+
+    def __str__(self):
+        return "synthetic_full_%s_in_pool_%s" % (self.rbd_name, self.pool_name)
+
+    def _copy_base(self):
+        cmd = ['cp', '--sparse=always']
+        if self.reflink in ['auto', 'always']:
+            cmd.append("--reflink=%s" % self.reflink)
+        cmd.extend([self.base_path, self.temp_path])
+        return self._exec_cmd(cmd)
+
+    def _apply_diffs(self):
+        for diff_path in self.diff_paths:
+            diff_file = DiffFile(diff_path)
+            diff_file.apply_to(self.temp_path)
+            self.applied_bytes += diff_file.write_bytes + diff_file.zero_bytes
+        return True
+
+    def execute(self, worker_name=None):
+        try:
+            self.worker_name = worker_name
+            start_timestamp = time.time()
+
+            result = self._copy_base()
+            if self.task_status != COMPLETE:
+                return result
+
+            self.start_timestamp = start_timestamp
+            self._apply_diffs()
+            os.rename(self.temp_path, self.dest_path)
+
+            self.cmd = "apply %s to %s" % (self.diff_paths, self.dest_path)
+            self.output = ("applied %s bytes" % self.applied_bytes, 0)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+
+            return self.output
+        except Exception as e:
+            print("%s error: %s" %(self.name, e))
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+            self.output = (str(e), 1)
+            self.elapsed_time = self._get_elapsed_time_()
+            self._verify_result(self.output)
+            return False
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# backup chain of a generation resolved by BackupChain.
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from Common.Constant import *
+from Common.BackupChain import BackupChain
+
+
+log = logging.getLogger('test_backup_chain')
+log.addHandler(logging.NullHandler())
+
+
+class BackupChainTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.chain = BackupChain(log, self.path, 'rbd', 'image0')
+        generation_path = self.chain.get_generation_path('snap1')
+        os.makedirs(generation_path)
+
+        self.files = {}
+        for name, size in [('snap1', 16384),
+                           (self.chain.get_diff_filename('snap1', 'snap2'), 4096),
+                           (self.chain.get_diff_filename('snap2', 'snap3'), 4096),
+                           ('snap3.manifest', 100),
+                           ("%s%s" % (self.chain.get_diff_filename('snap3', 'snap4'),
+                                      EXPORT_PARTIAL_SUFFIX), 100)]:
+            self.files[name] = os.path.join(generation_path, name)
+            with open(self.files[name], 'wb') as backup_file:
+                backup_file.write('a' * size)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get_chain(self):
+        chain = self.chain.get_chain('snap1')
+        self.assertEqual(chain, [self.files['snap1'],
+                                 self.files['snap1_to_snap2'],
+                                 self.files['snap2_to_snap3']])
+        self.assertEqual(self.chain.get_chain_snapshots(chain), ['snap1', 'snap2', 'snap3'])
+        self.assertEqual(self.chain.get_last_snapshot('snap1'), 'snap3')
+
+    def test_get_chain_to_snap(self):
+        self.assertEqual(self.chain.get_chain('snap1', 'snap2'),
+                         [self.files['snap1'], self.files['snap1_to_snap2']])
+        self.assertEqual(self.chain.get_chain('snap1', 'snap1'), [self.files['snap1']])
+        self.assertFalse(self.chain.get_chain('snap1', 'snap4'))
+
+    def test_missing_full(self):
+        os.remove(self.files['snap1'])
+        self.assertFalse(self.chain.get_chain('snap1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
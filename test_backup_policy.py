@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# backup type decided by BackupPolicy from backup chain of last generation.
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from Common.Constant import *
+from Common.BackupChain import BackupChain
+from Common.BackupPolicy import BackupPolicy
+
+
+log = logging.getLogger('test_backup_policy')
+log.addHandler(logging.NullHandler())
+
+
+class BackupPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.chain = BackupChain(log, self.path, 'rbd', 'image0')
+        generation_path = self.chain.get_generation_path('snap1')
+        os.makedirs(generation_path)
+
+        self.files = {}
+        for name, size in [('snap1', 16384),
+                           (self.chain.get_diff_filename('snap1', 'snap2'), 4096),
+                           (self.chain.get_diff_filename('snap2', 'snap3'), 4096)]:
+            self.files[name] = os.path.join(generation_path, name)
+            with open(self.files[name], 'wb') as backup_file:
+                backup_file.write('a' * size)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_chain_length(self):
+        chain = self.chain.get_chain('snap1')
+        policy = BackupPolicy(log, max_chain_length=2, max_diff_ratio=0)
+        self.assertEqual(policy.decide(chain)[0], FULL)
+        policy = BackupPolicy(log, max_chain_length=3, max_diff_ratio=0)
+        self.assertEqual(policy.decide(chain)[0], DIFF)
+
+    def test_diff_ratio(self):
+        chain = self.chain.get_chain('snap1')
+        chain_info = BackupPolicy(log).get_chain_info(chain)
+        self.assertEqual((chain_info['full_bytes'], chain_info['diff_bytes']), (16384, 8192))
+        policy = BackupPolicy(log, max_chain_length=0, max_diff_ratio=0.5)
+        self.assertEqual(policy.decide(chain)[0], FULL)
+        policy = BackupPolicy(log, max_chain_length=0, max_diff_ratio=0.6)
+        self.assertEqual(policy.decide(chain)[0], DIFF)
+
+    def test_unreadable_chain(self):
+        os.remove(self.files['snap1'])
+        self.assertEqual(BackupPolicy(log).decide([self.files['snap1']])[0], FULL)
+
+
+if __name__ == '__main__':
+    unittest.main()
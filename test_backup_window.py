@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# deadline of backup window and export time estimated from throughput.
+
+import logging
+import unittest
+
+from Common.Constant import *
+from Common.BackupWindow import BackupWindow, update_throughput
+
+
+log = logging.getLogger('test_backup_window')
+log.addHandler(logging.NullHandler())
+
+
+def _rbd_info(rbd_id, backup_type=DIFF, full_size=1000, priority=0):
+    return {'id': rbd_id,
+            'backup_type': backup_type,
+            'rbd_full_size': full_size,
+            'rbd_used_size': full_size,
+            'priority': priority}
+
+
+class BackupWindowTest(unittest.TestCase):
+    def test_deadline(self):
+        window = BackupWindow(log, '06:00', margin=600, now=0)
+        self.assertTrue(0 < window.deadline <= 86400)
+        self.assertEqual(window.get_remaining_seconds(now=0), window.deadline - 600)
+        self.assertTrue(window.is_passed(now=window.deadline))
+
+    def test_estimate(self):
+        throughput = {}
+        window = BackupWindow(log, '06:00', bandwidth=100, throughput=throughput)
+        self.assertEqual(window.estimate(_rbd_info('a')), 10)
+
+        self.assertTrue(update_throughput(throughput, 'a', 1000, 1))
+        self.assertTrue(update_throughput(throughput, 'a', 1000, 10))
+        self.assertEqual(throughput['a'], 550)
+        self.assertFalse(update_throughput(throughput, 'b', 0, 10))
+        # RBD of no record is estimated by average throughput
+        self.assertEqual(window.get_throughput('b'), 550)
+
+
+if __name__ == '__main__':
+    unittest.main()
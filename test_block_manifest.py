@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# block manifest built from raw image file, saved and loaded.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from Common.BlockManifest import BlockManifest, get_manifest_path
+
+
+BLOCK_SIZE = 4096
+
+
+class BlockManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.raw_path = os.path.join(self.path, 'snap1')
+        with open(self.raw_path, 'wb') as raw_file:
+            raw_file.seek(BLOCK_SIZE)
+            raw_file.write('a' * 100)
+            raw_file.truncate(BLOCK_SIZE * 3 + 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_build_from_raw(self):
+        manifest = BlockManifest(BLOCK_SIZE)
+        manifest.build_from_raw(self.raw_path)
+        self.assertEqual(manifest.image_size, BLOCK_SIZE * 3 + 10)
+        self.assertEqual(len(manifest.hashes), 4)
+        self.assertEqual(manifest.hashes[0], manifest.zero_hash)
+        self.assertEqual(manifest.hashes[1], manifest.hash_data('a' * 100))
+        self.assertEqual(manifest.hashes[3], manifest.zero_hash)
+
+    def test_save_load(self):
+        manifest = BlockManifest(BLOCK_SIZE)
+        manifest.build_from_raw(self.raw_path)
+        manifest_path = get_manifest_path(self.path, 'snap1')
+        manifest.save(manifest_path)
+        self.assertEqual(manifest_path, os.path.join(self.path, 'snap1.manifest'))
+
+        loaded = BlockManifest().load(manifest_path)
+        self.assertEqual(loaded.block_size, BLOCK_SIZE)
+        self.assertEqual(loaded.image_size, manifest.image_size)
+        self.assertEqual(loaded.hashes, manifest.hashes)
+
+    def test_unknown_hash_not_match(self):
+        manifest = BlockManifest(BLOCK_SIZE, BLOCK_SIZE * 2)
+        manifest.resize(BLOCK_SIZE + 10)
+        self.assertEqual(manifest.hashes[-1], None)
+
+        manifest_path = get_manifest_path(self.path, 'snap1')
+        manifest.save(manifest_path)
+        loaded = BlockManifest().load(manifest_path)
+        self.assertNotEqual(loaded.hashes[-1], loaded.zero_hash)
+
+    def test_resize_grow(self):
+        manifest = BlockManifest(BLOCK_SIZE, BLOCK_SIZE)
+        manifest.resize(BLOCK_SIZE * 3)
+        self.assertEqual(manifest.hashes, [manifest.zero_hash] * 3)
+
+    def test_get_blocks(self):
+        manifest = BlockManifest(BLOCK_SIZE, BLOCK_SIZE * 4)
+        self.assertEqual(list(manifest.get_blocks(BLOCK_SIZE - 1, 2)), [0, 1])
+        self.assertEqual(list(manifest.get_blocks(0, 0)), [])
+        self.assertEqual(list(manifest.get_blocks(BLOCK_SIZE * 3, BLOCK_SIZE * 2)), [3])
+
+    def test_load_incomplete(self):
+        manifest = BlockManifest(BLOCK_SIZE)
+        manifest.build_from_raw(self.raw_path)
+        manifest_path = get_manifest_path(self.path, 'snap1')
+        manifest.save(manifest_path)
+        with open(manifest_path, 'r+b') as manifest_file:
+            manifest_file.truncate(os.path.getsize(manifest_path) - 1)
+        self.assertRaises(IOError, BlockManifest().load, manifest_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# commands run from argv list by Command, spawned by posix_spawn or by
+# subprocess if the os module has no posix_spawn.
+
+import os
+import sys
+import unittest
+
+from Common.CommandRunner import Command, run_command, command_line
+
+
+class CommandTest(unittest.TestCase):
+    def test_argv_without_shell(self):
+        command = run_command(['echo', '$HOME;', 'a b'])
+        self.assertEqual(command.return_code, 0)
+        self.assertEqual(command.stdout, '$HOME; a b\n')
+        self.assertEqual(command_line(command.argv), "echo '$HOME;' 'a b'")
+
+    def test_stdout_stderr_return_code(self):
+        command = run_command([sys.executable, '-c',
+                               "import sys; sys.stdout.write('out'); "
+                               "sys.stderr.write('err'); sys.exit(3)"])
+        self.assertEqual((command.stdout, command.stderr, command.return_code),
+                         ('out', 'err', 3))
+        self.assertIsNotNone(command.rusage)
+
+    def test_stdin_writer(self):
+        def write_stdin(stdin):
+            stdin.write('x' * 200000)
+        command = run_command(['wc', '-c'], stdin_writer=write_stdin)
+        self.assertEqual(command.stdout.strip(), '200000')
+
+    def test_env(self):
+        command = Command(['sh', '-c', 'echo $RUNNER_TEST'], env={'RUNNER_TEST': 'value',
+                                                                   'PATH': os.environ['PATH']})
+        command.run()
+        self.assertEqual(command.stdout, 'value\n')
+
+    def test_spawn_fallback(self):
+        command = run_command(['true'])
+        self.assertEqual(command.return_code, 0)
+        if hasattr(os, 'posix_spawnp'):
+            self.assertIsNone(command.process)
+        else:
+            # reaped by wait4, subprocess does not reap it again
+            self.assertEqual(command.process.returncode, 0)
+            self.assertEqual(command.process.poll(), 0)
+
+    def test_new_session(self):
+        command = Command([sys.executable, '-c', "import os; print(os.getpgid(0))"],
+                          new_session=True)
+        command.run()
+        self.assertEqual(int(command.stdout), command.pid)
+
+        command = run_command([sys.executable, '-c', "import os; print(os.getpgid(0))"])
+        self.assertEqual(int(command.stdout), os.getpgid(0))
+
+    def test_command_not_found(self):
+        command = Command(['command-not-exist-in-path'])
+        self.assertRaises(OSError, command.start)
+        self.assertEqual((command.stdout_fd, command.stderr_fd), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
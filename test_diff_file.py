@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# round trip of export-diff stream written by DiffWriter and read, applied
+# by DiffFile.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from Common.DiffFile import DiffFile, DiffWriter, write_raw_as_diff
+
+
+class DiffFileTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.diff_path = os.path.join(self.path, 'snap1_to_snap2')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write_diff(self, image_size):
+        with open(self.diff_path, 'wb') as diff_file:
+            writer = DiffWriter(diff_file)
+            writer.write_from_snap('snap1')
+            writer.write_to_snap('snap2')
+            writer.write_size(image_size)
+            writer.write_data(4096, 'a' * 100)
+            writer.write_zero(0, 10)
+            writer.write_end()
+        return writer
+
+    def test_read_header(self):
+        self._write_diff(8192)
+        self.assertEqual(DiffFile(self.diff_path).read_header(), ('snap1', 'snap2', 8192))
+
+    def test_iterate(self):
+        self._write_diff(8192)
+        records = list(DiffFile(self.diff_path).iterate())
+        self.assertEqual([record[0] for record in records], ['f', 't', 's', 'w', 'z', 'e'])
+        self.assertEqual(records[3][1:3], (4096, 100))
+        self.assertEqual(records[4], ('z', 0, 10))
+
+    def test_apply_to(self):
+        writer = self._write_diff(8192)
+        raw_path = os.path.join(self.path, 'raw')
+        with open(raw_path, 'wb') as raw_file:
+            raw_file.write('b' * 20000)
+
+        diff_file = DiffFile(self.diff_path)
+        diff_file.apply_to(raw_path)
+
+        with open(raw_path, 'rb') as raw_file:
+            data = raw_file.read()
+        self.assertEqual(len(data), 8192)
+        self.assertEqual(data[:10], '\0' * 10)
+        self.assertEqual(data[10:4096], 'b' * 4086)
+        self.assertEqual(data[4096:4196], 'a' * 100)
+        self.assertEqual(diff_file.write_bytes, writer.write_bytes)
+        self.assertEqual(diff_file.zero_bytes, writer.zero_bytes)
+
+    def test_raw_round_trip(self):
+        raw_path = os.path.join(self.path, 'raw')
+        with open(raw_path, 'wb') as raw_file:
+            raw_file.seek(65536)
+            raw_file.write('c' * 5000)
+            raw_file.truncate(131072)
+
+        with open(self.diff_path, 'wb') as diff_file:
+            write_raw_as_diff(raw_path, DiffWriter(diff_file), to_snap='snap2')
+
+        image_path = os.path.join(self.path, 'image')
+        open(image_path, 'wb').close()
+        DiffFile(self.diff_path).apply_to(image_path)
+
+        with open(raw_path, 'rb') as raw_file:
+            with open(image_path, 'rb') as image_file:
+                self.assertEqual(image_file.read(), raw_file.read())
+
+    def test_bad_header(self):
+        with open(self.diff_path, 'wb') as diff_file:
+            diff_file.write('rbd diff v2\n')
+        self.assertRaises(IOError, DiffFile(self.diff_path).read_header)
+
+    def test_truncated(self):
+        self._write_diff(8192)
+        with open(self.diff_path, 'r+b') as diff_file:
+            diff_file.truncate(os.path.getsize(self.diff_path) - 60)
+        raw_path = os.path.join(self.path, 'raw')
+        open(raw_path, 'wb').close()
+        self.assertRaises(IOError, DiffFile(self.diff_path).apply_to, raw_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# commands of tasks run by event loop, finished task contract as Manager.
+
+import logging
+import unittest
+
+from Common.Constant import *
+from Common.BaseTask import BaseTask
+from Common.EventLoopManager import EventLoopManager
+
+
+class _CommandTask(BaseTask):
+    def __init__(self, cmd):
+        super(_CommandTask, self).__init__()
+        self.command = cmd
+        self.name = ' '.join(cmd)
+
+    def get_command(self):
+        return self.command
+
+
+class EventLoopManagerTest(unittest.TestCase):
+    def setUp(self):
+        log = logging.getLogger('test_event_loop_manager')
+        log.addHandler(logging.NullHandler())
+        self.manager = EventLoopManager(log, worker_count=2)
+        self.manager.run_worker()
+
+    def tearDown(self):
+        self.manager.stop_worker()
+        self.manager.loop_thread.join(5)
+
+    def test_run_commands(self):
+        tasks = [_CommandTask(['echo', 'done']), _CommandTask(['false'])]
+        for task in tasks:
+            self.manager.add_task(task)
+
+        finished = [self.manager.get_finished_task(timeout=5) for task in tasks]
+        self.assertEqual(set(finished), set(tasks))
+        self.assertEqual(tasks[0].task_status, COMPLETE)
+        self.assertEqual(tasks[0].output[0], 'done\n')
+        self.assertEqual(tasks[1].task_status, ERROR)
+        self.assertEqual(self.manager.task_finish_count, 2)
+
+    def test_unknown_task_is_skipped(self):
+        task = _CommandTask(['true'])
+        unknown = _CommandTask(['true'])
+        unknown.task_id = 99
+        self.manager.finish_queue.put(unknown)
+        self.manager.add_task(task)
+
+        self.assertIs(self.manager.get_finished_task(), task)
+        self.assertEqual(self.manager.task_finish_count, 1)
+        self.assertIsNone(self.manager.get_finished_task(timeout=0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
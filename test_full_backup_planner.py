@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# weekday of full backup planned by FullBackupPlanner.
+
+import logging
+import unittest
+
+from Common.FullBackupPlanner import FullBackupPlanner
+
+
+log = logging.getLogger('test_full_backup_planner')
+log.addHandler(logging.NullHandler())
+
+
+class FullBackupPlannerTest(unittest.TestCase):
+    def test_balance(self):
+        planner = FullBackupPlanner(log, weekdays=[1, 2], tolerance=0)
+        plan = planner.plan({'a': 100, 'b': 60, 'c': 40})
+        self.assertEqual(plan['b'], plan['c'])
+        self.assertNotEqual(plan['a'], plan['b'])
+
+    def test_keep_last_plan(self):
+        planner = FullBackupPlanner(log, weekdays=[1, 2], tolerance=0.5)
+        last_plan = {'a': 2, 'b': 1, 'c': 1}
+        self.assertEqual(planner.plan({'a': 100, 'b': 60, 'c': 40}, last_plan), last_plan)
+
+    def test_unknown_size(self):
+        planner = FullBackupPlanner(log, weekdays=[1, 2, 3])
+        plan = planner.plan({'a': 0})
+        self.assertEqual(plan['a'], planner.get_hash_weekday('a'))
+        self.assertEqual(planner.get_hash_weekday('a'), planner.get_hash_weekday('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
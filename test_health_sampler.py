@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# concurrency of manager lowered by health of the simulated cluster, and
+# pending tasks cancelled while new tasks are paused.
+
+import logging
+import unittest
+
+from Simulator.TestCase import SimulatorTestCase, CLUSTER_NAME
+
+from Common.Constant import *
+from Common.BaseTask import BaseTask
+from Common.EventLoopManager import EventLoopManager
+from Common.HealthSampler import HealthSampler
+
+
+class _CommandTask(BaseTask):
+    def __init__(self, cmd):
+        super(_CommandTask, self).__init__()
+        self.command = cmd
+        self.name = ' '.join(cmd)
+
+    def get_command(self):
+        return self.command
+
+
+class _RecordHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class HealthSamplerTest(SimulatorTestCase):
+    def setUp(self):
+        super(HealthSamplerTest, self).setUp()
+        self.records = _RecordHandler()
+        self.log.addHandler(self.records)
+        self.manager = EventLoopManager(self.log, worker_count=2)
+        self.sampler = HealthSampler(self.log, self.manager, CLUSTER_NAME,
+                                     reduced_workers=1)
+
+    def tearDown(self):
+        self.log.removeHandler(self.records)
+        self.sampler.shutdown()
+        super(HealthSamplerTest, self).tearDown()
+
+    def test_reduce_and_recover(self):
+        self.state.set_config(pgs_by_state=[{'state_name': 'active+recovering', 'count': 8}])
+        self.sampler.check()
+        self.assertEqual(self.manager.concurrency, 1)
+
+        self.state.set_config(pgs_by_state=[{'state_name': 'active+clean', 'count': 8}])
+        for i in xrange(HEALTH_RECOVER_SAMPLES - 1):
+            self.sampler.check()
+            self.assertEqual(self.manager.concurrency, 1)
+        self.sampler.check()
+        self.assertEqual(self.manager.concurrency, 2)
+
+    def test_pause_is_logged_every_sample(self):
+        self.state.set_config(health='HEALTH_ERR')
+        self.sampler.check()
+        self.assertEqual(self.manager.concurrency, 0)
+
+        del self.records.messages[:]
+        self.sampler.check()
+        self.sampler.check()
+        self.assertEqual(len(self.records.messages), 2)
+        self.assertIn("paused by cluster health", self.records.messages[0])
+
+    def test_cancel_pending_tasks(self):
+        self.state.set_config(health='HEALTH_ERR')
+        self.sampler.check()
+        tasks = [_CommandTask(['true']), _CommandTask(['true'])]
+        for task in tasks:
+            self.manager.add_task(task)
+        self.assertIsNone(self.manager.get_finished_task(timeout=0.5))
+
+        self.assertEqual(self.manager.cancel_pending_tasks("backup window is passed"), 2)
+        for task in tasks:
+            self.assertIs(self.manager.get_finished_task(), task)
+            self.assertEqual(task.task_status, ERROR)
+            self.assertEqual(task.error, "backup window is passed")
+        self.assertEqual(self.manager.task_finish_count, 2)
+        self.assertEqual(len(self.manager.tasks), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# log file written by the process which set the logger, records of forked
+# processes received through the queue, messages formatted only if enabled.
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from multiprocessing import Process, Queue
+
+from Common.Logger import Logger, LogQueueHandler, LogQueueListener
+
+
+class _LogConfig(object):
+    def __init__(self, path, level='INFO'):
+        self.log_file = 'test.log'
+        self.log_path = path
+        self.log_level = level
+        self.log_max_bytes = 1048576
+        self.log_format_type = '3'
+        self.log_backup_count = 1
+        self.log_delay = False
+
+
+class _RecordHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class _Unformattable(object):
+    def __str__(self):
+        raise AssertionError("message of disabled level is formatted")
+
+
+def _log_in_worker(logger, index):
+    logger.info("worker %s", index)
+
+
+class LogQueueTest(unittest.TestCase):
+    def test_listener_handles_records(self):
+        queue = Queue()
+        handler = _RecordHandler()
+        listener = LogQueueListener(queue, handler)
+        listener.start()
+
+        log = logging.getLogger('LogQueueTest')
+        log.propagate = False
+        queue_handler = LogQueueHandler(queue)
+        log.addHandler(queue_handler)
+        try:
+            log.warning("value %s", {'key': object()})
+            try:
+                raise ValueError('error in worker')
+            except ValueError:
+                log.exception("failed")
+        finally:
+            log.removeHandler(queue_handler)
+
+        queue.put(None)
+        listener.join(5)
+        self.assertFalse(listener.is_alive())
+        self.assertEqual(len(handler.messages), 2)
+        self.assertTrue(handler.messages[0].startswith("value {'key': <object"))
+        self.assertEqual(handler.messages[1], "failed")
+
+
+class LoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.logger = Logger(_LogConfig(self.path))
+        self.assertTrue(self.logger.set_logger('LoggerTest_%s' % self._testMethodName))
+        self.logger.logger.propagate = False
+
+    def tearDown(self):
+        self.logger.close()
+        self.logger.logger.removeHandler(self.logger.handler)
+        shutil.rmtree(self.path)
+
+    def _read_lines(self):
+        self.logger.close()
+        with open(self.logger.file_path, 'r') as log_file:
+            return log_file.read().splitlines()
+
+    def test_forked_process_logs_through_queue(self):
+        self.logger.start_line('start')
+        workers = [Process(target=_log_in_worker, args=(self.logger, i)) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        self.logger.blank_line()
+
+        lines = self._read_lines()
+        self.assertEqual(lines[0], "****************start****************")
+        self.assertEqual(sorted(lines[1:5]), ["worker %s" % i for i in range(4)])
+        self.assertEqual(lines[5:], [''])
+
+    def test_disabled_level_is_not_formatted(self):
+        self.logger.debug(_Unformattable())
+        self.logger.debug("%s", _Unformattable())
+        self.logger.info({'key': 'value'})
+
+        self.assertEqual(self._read_lines(), ["key = value"])
+
+
+if __name__ == '__main__':
+    unittest.main()
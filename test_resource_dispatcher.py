@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# resource tag limits of ResourceDispatcher.
+
+import unittest
+
+from Common.ResourceDispatcher import ResourceDispatcher, parse_limits
+
+
+class _Task(object):
+    def __init__(self, task_id, tags):
+        self.task_id = task_id
+        self.resource_tags = tags
+
+
+class ResourceDispatcherTest(unittest.TestCase):
+    def test_parse_limits(self):
+        self.assertEqual(parse_limits("pool:*=2, class:hdd=1, dest:/backup=4,"),
+                         {'pool:*': 2, 'class:hdd': 1, 'dest:/backup': 4})
+        self.assertEqual(parse_limits(''), {})
+        self.assertRaises(ValueError, parse_limits, "pool=2")
+
+    def test_get_limit(self):
+        dispatcher = ResourceDispatcher({'pool:*': 2, 'pool:rbd': 1})
+        self.assertEqual(dispatcher.get_limit('pool:rbd'), 1)
+        self.assertEqual(dispatcher.get_limit('pool:volumes'), 2)
+        self.assertEqual(dispatcher.get_limit('class:hdd'), None)
+
+    def test_limit_per_tag(self):
+        dispatcher = ResourceDispatcher({'pool:*': 1})
+        for task_id, pool_name in [(1, 'rbd'), (2, 'rbd'), (3, 'volumes')]:
+            dispatcher.add(_Task(task_id, ['pool:%s' % pool_name]))
+
+        # second task of pool rbd waits, the task behind it is dispatched
+        self.assertEqual(dispatcher.pop_ready().task_id, 1)
+        self.assertEqual(dispatcher.pop_ready().task_id, 3)
+        self.assertEqual(dispatcher.pop_ready(), None)
+        self.assertEqual(len(dispatcher), 1)
+        self.assertEqual(dispatcher.get_running_count(), 2)
+
+        self.assertTrue(dispatcher.release(1))
+        self.assertEqual(dispatcher.pop_ready().task_id, 2)
+        self.assertFalse(dispatcher.release(1))
+
+    def test_all_tags_under_limit(self):
+        dispatcher = ResourceDispatcher({'pool:*': 2, 'dest:/backup': 1})
+        dispatcher.add(_Task(1, ['pool:rbd', 'dest:/backup']))
+        dispatcher.add(_Task(2, ['pool:rbd', 'dest:/backup']))
+        dispatcher.add(_Task(3, ['pool:rbd']))
+
+        self.assertEqual(dispatcher.pop_ready().task_id, 1)
+        self.assertEqual(dispatcher.pop_ready().task_id, 3)
+        self.assertEqual(dispatcher.pop_ready(), None)
+        dispatcher.release(3)
+        self.assertEqual(dispatcher.pop_ready(), None)
+        dispatcher.release(1)
+        self.assertEqual(dispatcher.pop_ready().task_id, 2)
+        self.assertEqual(dispatcher.counts, {'pool:rbd': 1, 'dest:/backup': 1})
+
+    def test_untagged_task(self):
+        task = _Task(1, [])
+        del task.resource_tags
+        dispatcher = ResourceDispatcher({'pool:*': 0})
+        dispatcher.add(task)
+        self.assertEqual(dispatcher.pop_ready(), task)
+
+    def test_cancel(self):
+        dispatcher = ResourceDispatcher({'pool:*': 1})
+        for task_id in [1, 2, 3]:
+            dispatcher.add(_Task(task_id, ['pool:rbd']))
+        dispatcher.pop_ready()
+
+        self.assertEqual([task.task_id for task in dispatcher.cancel()], [2, 3])
+        self.assertEqual(len(dispatcher), 0)
+        self.assertEqual(dispatcher.get_running_count(), 1)
+        self.assertEqual(dispatcher.cancel(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# restore planner and clone task against the simulated cluster
+
+import os
+import unittest
+
+from Simulator.TestCase import SimulatorTestCase, CLUSTER_NAME
+
+from Common.Constant import *
+from Common.Pool import Pool
+from Common.RestorePlanner import RestorePlanner
+from Task.RBDSnapshotTask import RBDSnapshotTask
+
+POOL_NAME = 'rbd'
+RBD_NAME = 'vm1'
+RBD_ID = 'ceph_rbd_vm1'
+SNAP_NAME = 'snap1'
+EXTENT_SIZE = 1048576
+
+CLONE_SECONDS = 5
+BANDWIDTH = 1048576
+
+
+class RestoreTestCase(SimulatorTestCase):
+    def setUp(self):
+        super(RestoreTestCase, self).setUp()
+        self.create_image(POOL_NAME, RBD_NAME, 8 * EXTENT_SIZE, [(0, 2 * EXTENT_SIZE)])
+        with self.state.image(POOL_NAME, RBD_NAME, write=True) as image:
+            self.state.create_snapshot(image, SNAP_NAME)
+        self.pool = Pool(self.log, CLUSTER_NAME, POOL_NAME)
+
+    def tearDown(self):
+        self.pool.close()
+        super(RestoreTestCase, self).tearDown()
+
+
+class RestorePlannerTest(RestoreTestCase):
+    def _plan(self, meta_backup_list=None, **kwargs):
+        planner = RestorePlanner(self.log,
+                                 os.path.join(self.path, 'backup'),
+                                 {RBD_ID: [SNAP_NAME]},
+                                 meta_backup_list or {},
+                                 BANDWIDTH, BANDWIDTH, CLONE_SECONDS)
+        return planner.plan(self.pool, RBD_ID, RBD_NAME, **kwargs)
+
+    def _candidate(self, plan, method):
+        for candidate in plan['candidates']:
+            if candidate['method'] == RESTORE_METHOD[method]:
+                return candidate
+
+    def test_in_place_requires_allow_rollback(self):
+        plan = self._plan()
+        self.assertIsNone(plan['selected'])
+        self.assertFalse(self._candidate(plan, RESTORE_ROLLBACK)['available'])
+        self.assertFalse(self._candidate(plan, RESTORE_CLONE)['available'])
+
+        plan = self._plan(allow_rollback=True)
+        self.assertEqual(plan['selected']['method'], RESTORE_METHOD[RESTORE_ROLLBACK])
+        self.assertEqual(plan['selected']['bytes'], 2 * EXTENT_SIZE)
+
+    def test_clone_is_estimated_at_clone_seconds(self):
+        plan = self._plan(target_rbd_name='vm1_restore')
+        self.assertEqual(plan['selected']['method'], RESTORE_METHOD[RESTORE_CLONE])
+        self.assertEqual(plan['selected']['estimated_seconds'], CLONE_SECONDS)
+        self.assertEqual(plan['selected']['bytes'], 0)
+
+    def test_flatten_adds_copy_of_snapshot_data(self):
+        plan = self._plan(target_rbd_name='vm1_restore', flatten=True)
+        clone = self._candidate(plan, RESTORE_CLONE)
+        self.assertEqual(clone['bytes'], 2 * EXTENT_SIZE)
+        self.assertEqual(clone['estimated_seconds'], CLONE_SECONDS + 2)
+
+    def test_import_if_snapshot_is_gone(self):
+        generation_path = os.path.join(self.path, 'backup', POOL_NAME, RBD_NAME, SNAP_NAME)
+        os.makedirs(generation_path)
+        with open(os.path.join(generation_path, SNAP_NAME), 'w') as full_file:
+            full_file.write('x' * 1024)
+        with self.state.image(POOL_NAME, RBD_NAME, write=True) as image:
+            self.state.remove_snapshot(image, SNAP_NAME)
+
+        plan = self._plan(meta_backup_list={RBD_ID: [SNAP_NAME]},
+                          target_rbd_name='vm1_restore')
+        self.assertEqual(plan['selected']['method'], RESTORE_METHOD[RESTORE_IMPORT])
+        self.assertEqual(plan['selected']['bytes'], 1024)
+
+        # import never overwrites an existing image
+        plan = self._plan(meta_backup_list={RBD_ID: [SNAP_NAME]})
+        self.assertIsNone(plan['selected'])
+
+
+class CloneTaskTest(RestoreTestCase):
+    def _clone(self, clone_rbd_name, flatten):
+        task = RBDSnapshotTask(CLUSTER_NAME, POOL_NAME, RBD_NAME,
+                               action=CLONE,
+                               snap_name=SNAP_NAME,
+                               protect=True,
+                               clone_pool_name=POOL_NAME,
+                               clone_rbd_name=clone_rbd_name,
+                               flatten=flatten)
+        task.execute()
+        return task
+
+    def _is_protected(self):
+        with self.state.image(POOL_NAME, RBD_NAME) as image:
+            return self.state.get_snapshot(image, SNAP_NAME)['protected']
+
+    def test_clone_keeps_snapshot_protected(self):
+        task = self._clone('vm1_restore', flatten=False)
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertTrue(self._is_protected())
+        self.assertTrue(self.pool.is_snap_in_use(RBD_NAME, SNAP_NAME))
+
+    def test_flatten_unprotects_snapshot(self):
+        task = self._clone('vm1_restore', flatten=True)
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertIsNone(task.error)
+        self.assertFalse(self._is_protected())
+
+    def test_flatten_keeps_snapshot_protected_for_other_clone(self):
+        self._clone('vm1_restore', flatten=False)
+        task = self._clone('vm1_restore2', flatten=True)
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertIn("kept protected", task.error)
+        self.assertEqual(task.result['Task_Error'], task.error)
+        self.assertTrue(self._is_protected())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# export stopped at deadline and continued from its checkpoint, against the
+# simulated cluster. continued export is same as export in one go.
+
+import os
+import time
+import unittest
+
+from Simulator.TestCase import SimulatorTestCase, CLUSTER_NAME
+
+from Common.Constant import *
+from Common.ExportCheckpoint import ExportCheckpoint
+from Task.RBDResumableExportTask import RBDResumableExportTask
+
+POOL_NAME = 'rbd'
+RBD_NAME = 'vm1'
+EXTENT_SIZE = 1048576
+
+
+class ResumableExportTest(SimulatorTestCase):
+    def setUp(self):
+        super(ResumableExportTest, self).setUp()
+        self.create_image(POOL_NAME, RBD_NAME, 8 * EXTENT_SIZE,
+                          [(0, 2 * EXTENT_SIZE), (5 * EXTENT_SIZE, EXTENT_SIZE)])
+        with self.state.image(POOL_NAME, RBD_NAME, write=True) as image:
+            self.state.create_snapshot(image, 'snap1')
+        self.write_image(POOL_NAME, RBD_NAME, [(EXTENT_SIZE, 10), (6 * EXTENT_SIZE, EXTENT_SIZE)])
+        with self.state.image(POOL_NAME, RBD_NAME, write=True) as image:
+            self.state.create_snapshot(image, 'snap2')
+
+    def _export(self, name, deadline=0, **kwargs):
+        task = RBDResumableExportTask(CLUSTER_NAME, POOL_NAME, RBD_NAME,
+                                      os.path.join(self.path, name),
+                                      chunk_size=EXTENT_SIZE, **kwargs)
+        task.deadline = deadline
+        task.execute()
+        return task
+
+    def _read(self, name):
+        with open(os.path.join(self.path, name), 'rb') as export_file:
+            return export_file.read()
+
+    def test_resume_full(self):
+        task = self._export('snap1', deadline=time.time() - 1, to_snap='snap1')
+        self.assertEqual(task.task_status, ERROR)
+        self.assertTrue(task.deadline_stopped)
+        self.assertFalse(os.path.exists(task.export_destpath))
+        checkpoint = ExportCheckpoint(task.export_destpath)
+        self.assertTrue(os.path.exists(checkpoint.path))
+
+        task = self._export('snap1', to_snap='snap1')
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertEqual(task.resume_offset, EXTENT_SIZE)
+        self.assertEqual(task.exported_bytes, 2 * EXTENT_SIZE)
+        self.assertFalse(os.path.exists(checkpoint.path))
+        self.assertFalse(os.path.exists(checkpoint.partial_path))
+        self.assertEqual(self._read('snap1'), self.read_image(POOL_NAME, RBD_NAME, 'snap1'))
+
+    def test_resume_diff(self):
+        for deadline in [time.time() - 1, time.time() - 1, 0]:
+            task = self._export('snap1_to_snap2', deadline=deadline, export_type=DIFF,
+                                from_snap='snap1', to_snap='snap2')
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertEqual(task.resume_offset, 2 * EXTENT_SIZE)
+
+        self._export('diff', export_type=DIFF, from_snap='snap1', to_snap='snap2')
+        self.assertEqual(self._read('snap1_to_snap2'), self._read('diff'))
+
+    def test_restart_other_export(self):
+        self._export('snap1', deadline=time.time() - 1, to_snap='snap1')
+
+        # checkpoint of snap1 is not used by export of snap2 to same path
+        task = self._export('snap1', to_snap='snap2')
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertEqual(task.resume_offset, 0)
+        self.assertEqual(self._read('snap1'), self.read_image(POOL_NAME, RBD_NAME, 'snap2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# failure classification, backoff and isolation of RetryQueue.
+
+import logging
+import unittest
+
+from Common.Constant import *
+from Common.BaseTask import BaseTask
+from Common.RetryQueue import RetryQueue
+
+
+log = logging.getLogger('test_retry_queue')
+log.addHandler(logging.NullHandler())
+
+
+def _failed_task(rbd_id, return_code=1, stderr=None):
+    task = BaseTask()
+    task.name = "export_%s" % rbd_id
+    task.rbd_id = rbd_id
+    task.task_status = ERROR
+    task.output = ('', return_code)
+    task.stderr = stderr
+    return task
+
+
+class RetryQueueTest(unittest.TestCase):
+    def test_classify(self):
+        queue = RetryQueue(log)
+        self.assertEqual(queue.classify(_failed_task('a', stderr='rbd: error opening image: '
+                                                                  '(2) No such file or directory'))[0],
+                         FAILURE_FATAL)
+        self.assertEqual(queue.classify(_failed_task('a', stderr='connect timed out'))[0],
+                         FAILURE_RETRYABLE)
+        self.assertEqual(queue.classify(_failed_task('a', return_code=-9)),
+                         (FAILURE_RETRYABLE, "killed by signal 9"))
+        self.assertEqual(queue.classify(_failed_task('a', stderr='something else'))[0],
+                         FAILURE_RETRYABLE)
+
+    def test_retry_until_max_attempts(self):
+        queue = RetryQueue(log, max_attempts=3, base_delay=0, max_delay=0)
+        task = _failed_task('a', stderr='timed out')
+        self.assertTrue(queue.fail(task, 'export'))
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.pop_due(), [task])
+        self.assertEqual(task.task_status, INITIAL)
+
+        self.assertTrue(queue.fail(_failed_task('a', stderr='timed out'), 'export'))
+        queue.pop_due()
+        self.assertFalse(queue.fail(_failed_task('a', stderr='timed out'), 'export'))
+        self.assertEqual(queue.history['a']['failures'], 1)
+        self.assertEqual(len(queue.history['a']['attempts']), 3)
+
+    def test_fatal_not_retried(self):
+        queue = RetryQueue(log)
+        self.assertFalse(queue.fail(_failed_task('a', stderr='Permission denied'), 'export'))
+        self.assertEqual(len(queue), 0)
+
+    def test_isolated(self):
+        history = {'a': {'failures': 3, 'attempts': []}}
+        queue = RetryQueue(log, history, isolate_count=3)
+        self.assertTrue(queue.is_isolated('a'))
+        self.assertFalse(queue.is_isolated('b'))
+        self.assertFalse(queue.fail(_failed_task('a', stderr='timed out'), 'export'))
+
+        queue.succeed('a', 'export')
+        self.assertFalse(queue.is_isolated('a'))
+
+    def test_backoff(self):
+        queue = RetryQueue(log, base_delay=10, max_delay=25)
+        for i in xrange(20):
+            self.assertTrue(5 <= queue.get_delay(1) <= 10)
+            self.assertTrue(10 <= queue.get_delay(2) <= 20)
+            self.assertTrue(12.5 <= queue.get_delay(5) <= 25)
+
+    def test_wait_time(self):
+        queue = RetryQueue(log, base_delay=10)
+        self.assertEqual(queue.get_wait_time(), None)
+        queue.fail(_failed_task('a', stderr='timed out'), 'export')
+        self.assertTrue(0 < queue.get_wait_time() <= 10)
+        self.assertEqual(queue.pop_due(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# backup of RBD skipped if nothing changed since last snapshot, by object
+# map of the simulated cluster. resize is a change.
+
+import os
+import unittest
+
+from Simulator.TestCase import SimulatorTestCase, CLUSTER_NAME
+
+from Common.Constant import *
+from Common.Pool import Pool
+from Common.Metafile import Metafile
+
+POOL_NAME = 'rbd'
+RBD_NAME = 'vm1'
+RBD_ID = "%s_%s_%s" % (CLUSTER_NAME, POOL_NAME, RBD_NAME)
+EXTENT_SIZE = 1048576
+
+
+class ChangedSizeTest(SimulatorTestCase):
+    def setUp(self):
+        super(ChangedSizeTest, self).setUp()
+        self.create_image(POOL_NAME, RBD_NAME, 8 * EXTENT_SIZE, [(0, EXTENT_SIZE)])
+        with self.state.image(POOL_NAME, RBD_NAME, write=True) as image:
+            self.state.create_snapshot(image, 'snap1')
+        self.pool = Pool(self.log, CLUSTER_NAME, POOL_NAME)
+
+    def tearDown(self):
+        self.pool.close()
+        super(ChangedSizeTest, self).tearDown()
+
+    def test_changed_size(self):
+        self.assertEqual(self.pool.get_changed_size(RBD_NAME, 'snap1'), 0)
+        self.write_image(POOL_NAME, RBD_NAME, [(2 * EXTENT_SIZE, 10)])
+        self.assertGreaterEqual(self.pool.get_changed_size(RBD_NAME, 'snap1'), 10)
+
+    def test_missing_snapshot(self):
+        self.assertFalse(self.pool.get_changed_size(RBD_NAME, 'snap2'))
+
+
+class SkipUnchangedBackupTest(SimulatorTestCase):
+    def setUp(self):
+        super(SkipUnchangedBackupTest, self).setUp()
+        self.create_image(POOL_NAME, RBD_NAME, 8 * EXTENT_SIZE, [(0, 2 * EXTENT_SIZE)])
+        # incremental backup every day, first one exports full as no metafile exists
+        self.config = self.write_backup_config({POOL_NAME: [RBD_NAME]},
+                                               backup_full_weekday='0',
+                                               backup_incr_weekday='1,2,3,4,5,6,7',
+                                               skip_unchanged_enable=True,
+                                               synthetic_full_enable=False,
+                                               backup_retain_count=3,
+                                               snapshot_retain_count=3)
+        self.metafile = Metafile(self.log, CLUSTER_NAME,
+                                 os.path.join(self.backup_path, CLUSTER_NAME))
+
+    def _backup(self):
+        self.assertEqual(self.run_backup(*self.config), 0)
+
+    def _export_types(self):
+        return [export_type for timestamp, export_type, output_bytes
+                in self.metafile.read(RBD_EXPORT_HISTORY)[RBD_ID]]
+
+    def _snapshots(self):
+        with self.state.image(POOL_NAME, RBD_NAME) as image:
+            return [snapshot['name'] for snapshot in image['snapshots']]
+
+    def test_skip_unchanged(self):
+        self._backup()
+        snapshots = self._snapshots()
+        self._backup()
+        self._backup()
+
+        self.assertEqual(self._export_types(), ['full'])
+        self.assertEqual(self._snapshots(), snapshots)
+        record = self.metafile.read(RBD_UNCHANGED_LIST)[RBD_ID]
+        self.assertEqual(record['count'], 2)
+        self.assertEqual(record['snapshot'], snapshots[-1])
+
+    def test_backup_changed(self):
+        self._backup()
+        self._backup()
+        self.write_image(POOL_NAME, RBD_NAME, [(3 * EXTENT_SIZE, 10)])
+        self._backup()
+
+        self.assertEqual(self._export_types(), ['full', 'diff'])
+        self.assertFalse(self.metafile.read(RBD_UNCHANGED_LIST))
+
+    def test_backup_resized(self):
+        self._backup()
+        with self.state.image(POOL_NAME, RBD_NAME, write=True) as image:
+            self.state.resize(image, 16 * EXTENT_SIZE)
+        self._backup()
+
+        self.assertEqual(self._export_types(), ['full', 'diff'])
+        self.assertEqual(len(self._snapshots()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# predicted output bytes and admission of RBDs by SpaceAdmission.
+
+import logging
+import unittest
+
+from Common.Constant import *
+from Common.SpaceAdmission import SpaceAdmission
+
+
+log = logging.getLogger('test_space_admission')
+log.addHandler(logging.NullHandler())
+
+
+def _rbd_info(rbd_id, backup_type=DIFF, full_size=1000, priority=0):
+    return {'id': rbd_id,
+            'backup_type': backup_type,
+            'rbd_full_size': full_size,
+            'rbd_used_size': full_size,
+            'priority': priority}
+
+
+class SpaceAdmissionTest(unittest.TestCase):
+    def setUp(self):
+        history = {'a': [[0, 'full', 500], [100, 'diff', 100], [200, 'diff', 50]]}
+        self.admission = SpaceAdmission(log, history, safety_factor=1)
+
+    def test_predict(self):
+        # highest change rate 1 byte per second, 100 seconds since last backup
+        self.assertEqual(self.admission.predict(_rbd_info('a'), now=300), 100)
+        self.assertEqual(self.admission.predict(_rbd_info('a', FULL), now=300), 500)
+        # no history, provisioned size
+        self.assertEqual(self.admission.predict(_rbd_info('b', FULL)), 1000)
+        self.assertEqual(self.admission.predict(_rbd_info('b')), 1000)
+
+    def test_predict_synthetic_full(self):
+        rbd_info = _rbd_info('a', FULL)
+        rbd_info['synthetic_full_base'] = ['snap1']
+        self.assertEqual(self.admission.predict(rbd_info, now=300), 600)
+
+    def test_record(self):
+        admission = SpaceAdmission(log, history_count=2)
+        for i in xrange(3):
+            admission.record('a', 'diff', i, timestamp=i)
+        admission.record('a', 'full', 10, timestamp=3)
+        self.assertEqual(admission.history['a'], [[2, 'diff', 2], [3, 'full', 10]])
+        self.assertEqual(admission.get_full_bytes('a'), 10)
+
+    def test_admit_all(self):
+        rbd_list = [_rbd_info('a'), _rbd_info('b')]
+        admitted, rejected = self.admission.admit(rbd_list, 1100, now=300)
+        self.assertEqual(admitted, rbd_list)
+        self.assertEqual(rejected, [])
+
+    def test_admit_by_priority(self):
+        rbd_list = [_rbd_info('b'), _rbd_info('c', priority=1), _rbd_info('d', full_size=10)]
+        admitted, rejected = self.admission.admit(rbd_list, 500, reclaimable_bytes=510)
+        self.assertEqual([rbd_info['id'] for rbd_info in admitted], ['c', 'd'])
+        self.assertEqual([rbd_info['id'] for rbd_info in rejected], ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
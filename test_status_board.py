@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# worker status published in StatusBoard and read by other processes.
+
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+
+from Common.Constant import *
+from Common.StatusBoard import StatusBoard, HEADER_SIZE
+
+
+class StatusBoardTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.board_path = os.path.join(self.path, 'status')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_update_read(self):
+        board = StatusBoard(2, self.board_path)
+        board.update(1, pid=123, state=RUN, task_id=5, name='Worker-1')
+
+        reader = StatusBoard(0, self.board_path, create=False)
+        self.assertEqual(reader.slot_count, 2)
+        slot_status = reader.read(1)
+        self.assertEqual((slot_status['pid'], slot_status['state'], slot_status['name']),
+                         (123, RUN, 'Worker-1'))
+        self.assertEqual(reader.read(0)['pid'], 0)
+        self.assertRaises(IndexError, reader.read, 2)
+        reader.close()
+        board.close()
+
+    def test_slot_being_updated(self):
+        board = StatusBoard(1)
+        board.update(0, pid=123)
+        # odd sequence, writer is in the middle of update
+        seq = struct.unpack_from('<I', board.mm, HEADER_SIZE)[0]
+        struct.pack_into('<I', board.mm, HEADER_SIZE, seq + 1)
+        self.assertEqual(board.read(0, retry=3), None)
+
+        struct.pack_into('<I', board.mm, HEADER_SIZE, seq + 2)
+        self.assertEqual(board.read(0)['pid'], 123)
+        board.close()
+
+    def test_not_status_board(self):
+        with open(self.board_path, 'wb') as board_file:
+            board_file.write('\0' * 64)
+        self.assertRaises(ValueError, StatusBoard, 0, self.board_path, False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# synthetic full backup built from backup chain of last generation, by task
+# and by backup of the simulated cluster.
+
+import os
+import unittest
+
+from Simulator.TestCase import SimulatorTestCase, CLUSTER_NAME
+
+from Common.Constant import *
+from Common.DiffFile import DiffWriter
+from Common.Metafile import Metafile
+from Task.RBDSyntheticFullTask import RBDSyntheticFullTask
+
+POOL_NAME = 'rbd'
+RBD_NAME = 'vm1'
+RBD_ID = "%s_%s_%s" % (CLUSTER_NAME, POOL_NAME, RBD_NAME)
+EXTENT_SIZE = 1048576
+
+
+class SyntheticFullTaskTest(SimulatorTestCase):
+    def _write_file(self, name, data):
+        path = os.path.join(self.path, name)
+        with open(path, 'wb') as backup_file:
+            backup_file.write(data)
+        return path
+
+    def _write_diff(self, name, from_snap, to_snap, size, records):
+        path = os.path.join(self.path, name)
+        with open(path, 'wb') as diff_file:
+            writer = DiffWriter(diff_file)
+            writer.write_from_snap(from_snap)
+            writer.write_to_snap(to_snap)
+            writer.write_size(size)
+            for offset, data in records:
+                writer.write_data(offset, data)
+            writer.write_end()
+        return path
+
+    def _task(self, diff_paths):
+        base_path = self._write_file('snap1', 'a' * 8192)
+        return RBDSyntheticFullTask(CLUSTER_NAME, POOL_NAME, RBD_NAME,
+                                    base_path, diff_paths,
+                                    os.path.join(self.path, 'snap3'),
+                                    reflink='never')
+
+    def test_apply_chain(self):
+        diff_paths = [self._write_diff('snap1_to_snap2', 'snap1', 'snap2', 8192,
+                                       [(0, 'b' * 100)]),
+                      self._write_diff('snap2_to_snap3', 'snap2', 'snap3', 12288,
+                                       [(50, 'c' * 100), (8192, 'd' * 10)])]
+        task = self._task(diff_paths)
+        task.execute()
+
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertEqual(task.applied_bytes, 210)
+        self.assertFalse(os.path.exists(task.temp_path))
+        with open(task.dest_path, 'rb') as full_file:
+            data = full_file.read()
+        self.assertEqual(data, 'b' * 50 + 'c' * 100 + 'a' * 8042 + 'd' * 10 + '\0' * 4086)
+
+    def test_truncated_diff(self):
+        diff_path = self._write_diff('snap1_to_snap2', 'snap1', 'snap2', 8192,
+                                     [(0, 'b' * 100)])
+        with open(diff_path, 'r+b') as diff_file:
+            diff_file.truncate(os.path.getsize(diff_path) - 60)
+        task = self._task([diff_path])
+        task.execute()
+
+        self.assertEqual(task.task_status, ERROR)
+        self.assertFalse(os.path.exists(task.temp_path))
+        self.assertFalse(os.path.exists(task.dest_path))
+
+
+class SyntheticFullBackupTest(SimulatorTestCase):
+    def setUp(self):
+        super(SyntheticFullBackupTest, self).setUp()
+        self.create_image(POOL_NAME, RBD_NAME, 8 * EXTENT_SIZE,
+                          [(0, 2 * EXTENT_SIZE), (5 * EXTENT_SIZE, EXTENT_SIZE)])
+        # full backup every day, first one exports full as no metafile exists
+        self.config = self.write_backup_config({POOL_NAME: [RBD_NAME]},
+                                               backup_full_weekday='1,2,3,4,5,6,7',
+                                               backup_incr_weekday='0',
+                                               synthetic_full_enable=True,
+                                               synthetic_full_reflink='never',
+                                               skip_unchanged_enable=False,
+                                               backup_retain_count=3,
+                                               snapshot_retain_count=3)
+        self.metafile = Metafile(self.log, CLUSTER_NAME,
+                                 os.path.join(self.backup_path, CLUSTER_NAME))
+
+    def _backup(self):
+        self.assertEqual(self.run_backup(*self.config), 0)
+        self.write_image(POOL_NAME, RBD_NAME, [(EXTENT_SIZE, EXTENT_SIZE)])
+        return self.metafile.read(RBD_BACKUP_CIRCULATION_LIST)[RBD_ID][-1]
+
+    def _read_generation(self, generation):
+        generation_path = os.path.join(self.backup_path, CLUSTER_NAME, POOL_NAME,
+                                       RBD_NAME, generation)
+        self.assertEqual(os.listdir(generation_path), [generation])
+        with open(os.path.join(generation_path, generation), 'rb') as full_file:
+            return full_file.read()
+
+    def _export_types(self):
+        return [export_type for timestamp, export_type, output_bytes
+                in self.metafile.read(RBD_EXPORT_HISTORY)[RBD_ID]]
+
+    def test_synthetic_full(self):
+        self._backup()
+        generation = self._backup()
+
+        self.assertEqual(self._read_generation(generation),
+                         self.read_image(POOL_NAME, RBD_NAME, snap_name=generation))
+        # incremental export, then full built from it
+        self.assertEqual(self._export_types(), ['full', 'diff', 'full'])
+
+    def test_regular_full_after_failed_synthetic_full(self):
+        self._backup()
+        self.metafile.initialize(CLUSTER_NAME, [RBD_FULL_EXPORT_LIST])
+        self.metafile.write(RBD_FULL_EXPORT_LIST,
+                            {RBD_ID: {'time': '', 'reason': 'unable to remove file'}},
+                            overwrite=True)
+        generation = self._backup()
+
+        self.assertEqual(self._read_generation(generation),
+                         self.read_image(POOL_NAME, RBD_NAME, snap_name=generation))
+        self.assertEqual(self._export_types(), ['full', 'full'])
+        self.assertFalse(self.metafile.read(RBD_FULL_EXPORT_LIST))
+        with open(os.path.join(self.path, 'log', 'rbd_backup.log'), 'r') as log_file:
+            self.assertIn("synthetic full failed in last backup", log_file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# TaskResult sent from worker to manager, and applied by manager to the task.
+
+import pickle
+import shutil
+import logging
+import tempfile
+import unittest
+
+from Common.Constant import *
+from Common.BaseTask import BaseTask
+from Common.TaskResult import TaskResult
+from Common.Manager import Manager
+
+
+class _Task(BaseTask):
+    result_attrs = ('applied_bytes',)
+
+    def __init__(self):
+        super(_Task, self).__init__()
+        self.applied_bytes = 0
+
+
+class TaskResultTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_pickle_round_trip(self):
+        task = _Task()
+        task.task_id = 7
+        task.task_status = COMPLETE
+        task.output = ('exported', 0)
+        task.applied_bytes = 4096
+
+        task_result = pickle.loads(pickle.dumps(TaskResult(task), pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(task_result.task_id, 7)
+
+        manager_task = _Task()
+        task_result.apply_to(manager_task)
+        self.assertEqual(manager_task.task_status, COMPLETE)
+        self.assertEqual(manager_task.output, ('exported', 0))
+        self.assertEqual(manager_task.applied_bytes, 4096)
+
+    def test_spill_output(self):
+        task = _Task()
+        task.task_id = 8
+        task.output = ('x' * 100, 1)
+        task.error = ValueError('bad value')
+
+        task_result = TaskResult(task, max_bytes=10, spill_path=self.path)
+        self.assertEqual(task_result.output, 'x' * 10)
+        self.assertEqual(task_result.output_size, 100)
+        self.assertEqual(task_result.error, 'bad value')
+        with open(task_result.spill_path, 'rb') as spill_file:
+            self.assertEqual(spill_file.read(), 'x' * 100)
+
+
+class ManagerFinishedTaskTest(unittest.TestCase):
+    def setUp(self):
+        log = logging.getLogger('test_task_result')
+        log.addHandler(logging.NullHandler())
+        self.manager = Manager(log, worker_count=1)
+
+    def _finish(self, task_id):
+        task = _Task()
+        task.task_id = task_id
+        task.task_status = COMPLETE
+        self.manager.finish_queue.put(TaskResult(task))
+
+    def test_unknown_task_id_is_skipped(self):
+        task = _Task()
+        self.manager.add_task(task)
+        self._finish(task.task_id + 1)
+        self._finish(task.task_id)
+
+        self.assertIs(self.manager.get_finished_task(), task)
+        self.assertEqual(task.task_status, COMPLETE)
+        self.assertEqual(self.manager.task_finish_count, 1)
+
+    def test_none_only_on_timeout(self):
+        self._finish(1)
+        self.assertIsNone(self.manager.get_finished_task(timeout=0.5))
+        self.assertEqual(self.manager.task_finish_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
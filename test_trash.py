@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# expired generations renamed into trash, reclaimed by background thread
+
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from Common.Constant import *
+from Common.Trash import Trash
+
+BLOCK_SIZE = 4096
+
+
+class TrashTest(unittest.TestCase):
+    def setUp(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.log.addHandler(logging.NullHandler())
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _write_generation(self, name, file_sizes):
+        generation_path = os.path.join(self.path, name)
+        os.makedirs(os.path.join(generation_path, 'sub'))
+        for i, size in enumerate(file_sizes):
+            with open(os.path.join(generation_path, 'sub', "file%s" % i), 'wb') as f:
+                f.write('x' * size)
+        return generation_path
+
+    def test_move_and_reclaim(self):
+        trash = Trash(self.log, self.path, truncate_step=BLOCK_SIZE, unlink_batch=2)
+        generation_path = self._write_generation('snap1', [10 * BLOCK_SIZE, 10, 10])
+        trash_path = trash.move(generation_path, 'snap1')
+
+        self.assertFalse(os.path.exists(generation_path))
+        self.assertTrue(os.path.isdir(trash_path))
+        self.assertEqual(trash.get_pending_count(), 1)
+        self.assertGreaterEqual(trash.get_pending_bytes(), 10 * BLOCK_SIZE)
+
+        self.assertTrue(trash.start())
+        self.assertTrue(trash.stop(wait_seconds=10))
+        self.assertEqual(trash.get_pending_count(), 0)
+        self.assertEqual(trash.get_pending_bytes(), 0)
+        self.assertEqual((trash.moved_count, trash.reclaimed_count), (1, 1))
+        self.assertGreaterEqual(trash.reclaimed_bytes, 10 * BLOCK_SIZE)
+
+    def test_reclaim_trash_of_previous_run(self):
+        Trash(self.log, self.path).move(self._write_generation('snap1', [10]), 'snap1')
+
+        trash = Trash(self.log, self.path)
+        trash.start()
+        trash.stop(wait_seconds=10)
+        self.assertEqual(trash.get_pending_count(), 0)
+        self.assertEqual(trash.reclaimed_count, 1)
+
+    def test_stop_leaves_rest_for_next_run(self):
+        # one truncate step per second takes longer than waiting to stop
+        trash = Trash(self.log, self.path, reclaim_rate=BLOCK_SIZE,
+                      truncate_step=BLOCK_SIZE)
+        trash.move(self._write_generation('snap1', [20 * BLOCK_SIZE]), 'snap1')
+        trash.start()
+        trash.stop(wait_seconds=0)
+        self.assertEqual(trash.get_pending_count(), 1)
+        self.assertEqual(trash.reclaimed_count, 0)
+
+    def test_reclaimable_bytes_by_rate(self):
+        trash = Trash(self.log, self.path, reclaim_rate=BLOCK_SIZE)
+        self.assertEqual(trash.get_reclaimable_bytes(10), 0)
+
+        trash.move(self._write_generation('snap1', [20 * BLOCK_SIZE]), 'snap1')
+        self.assertEqual(trash.get_reclaimable_bytes(10), 10 * BLOCK_SIZE)
+        self.assertEqual(trash.get_reclaimable_bytes(-1), 0)
+
+        trash.reclaim_rate = 0
+        self.assertEqual(trash.get_reclaimable_bytes(0), trash.get_pending_bytes())
+
+    def test_move_missing_path(self):
+        trash = Trash(self.log, self.path)
+        self.assertFalse(trash.move(os.path.join(self.path, 'not_exist'), 'snap1'))
+        self.assertEqual(trash.moved_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()